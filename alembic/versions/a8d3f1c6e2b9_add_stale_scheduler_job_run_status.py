@@ -0,0 +1,23 @@
+"""add STALE to schedulerjobrunstatus
+
+Revision ID: a8d3f1c6e2b9
+Revises: f2a6c8d4b1e7
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+from alembic import op
+
+revision: str = 'a8d3f1c6e2b9'
+down_revision: Union[str, None] = 'f2a6c8d4b1e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TYPE schedulerjobrunstatus ADD VALUE IF NOT EXISTS 'STALE'")
+
+
+def downgrade() -> None:
+    # PostgreSQL cannot drop an enum value, STALE rows are marked FAILED instead
+    op.execute("UPDATE backend_scheduler_job_runs SET status = 'FAILED' WHERE status = 'STALE'")
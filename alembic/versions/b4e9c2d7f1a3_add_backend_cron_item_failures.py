@@ -0,0 +1,32 @@
+"""add backend_cron_item_failures
+
+Revision ID: b4e9c2d7f1a3
+Revises: a8d3f1c6e2b9
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'b4e9c2d7f1a3'
+down_revision: Union[str, None] = 'a8d3f1c6e2b9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('backend_cron_item_failures',
+    sa.Column('cron_id', sa.String(), nullable=False),
+    sa.Column('item_id', sa.String(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('dead_lettered', sa.Boolean(), nullable=False),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['cron_id'], ['backend_crons.id'], ),
+    sa.PrimaryKeyConstraint('cron_id', 'item_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('backend_cron_item_failures')
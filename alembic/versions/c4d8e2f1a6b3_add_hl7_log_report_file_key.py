@@ -0,0 +1,54 @@
+"""add report_file_key to sgimed_hl7_logs
+
+Revision ID: c4d8e2f1a6b3
+Revises: 9f0a1b2c3d4e
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+import re
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'c4d8e2f1a6b3'
+down_revision: Union[str, None] = '9f0a1b2c3d4e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+DIGITS = re.compile(r'\d+')
+
+
+def report_file_key(report_file_id):
+    # Same as scheduler_actions.health_report.hl7.get_report_file_key at the time of this migration
+    runs = DIGITS.findall(report_file_id or '')
+    if not runs:
+        return None
+    return str(int(max(runs, key=len)))
+
+
+def upgrade() -> None:
+    op.add_column('sgimed_hl7_logs', sa.Column('report_file_key', sa.String(), nullable=True))
+
+    # Backfill existing HL7 logs
+    conn = op.get_bind()
+    last_id = ''
+    while True:
+        rows = conn.execute(
+            sa.text("SELECT id, report_file_id FROM sgimed_hl7_logs WHERE id > :last_id ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": BATCH_SIZE}
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        updates = [{"id": row[0], "key": report_file_key(row[1])} for row in rows]
+        updates = [update for update in updates if update["key"]]
+        if updates:
+            conn.execute(sa.text("UPDATE sgimed_hl7_logs SET report_file_key = :key WHERE id = :id"), updates)
+
+    op.create_index(op.f('ix_sgimed_hl7_logs_report_file_key'), 'sgimed_hl7_logs', ['report_file_key'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_sgimed_hl7_logs_report_file_key'), table_name='sgimed_hl7_logs')
+    op.drop_column('sgimed_hl7_logs', 'report_file_key')
@@ -0,0 +1,22 @@
+"""add processed_at index to backend_webhook_events
+
+Revision ID: c7f2a5e8d3b6
+Revises: b4e9c2d7f1a3
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+from alembic import op
+
+revision: str = 'c7f2a5e8d3b6'
+down_revision: Union[str, None] = 'b4e9c2d7f1a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_backend_webhook_events_processed_at'), 'backend_webhook_events', ['processed_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_backend_webhook_events_processed_at'), table_name='backend_webhook_events')
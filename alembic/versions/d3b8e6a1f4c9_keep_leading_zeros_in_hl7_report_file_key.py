@@ -0,0 +1,53 @@
+"""keep leading zeros in sgimed_hl7_logs.report_file_key
+
+Revision ID: d3b8e6a1f4c9
+Revises: c7f2a5e8d3b6
+Create Date: 2026-10-17
+
+"""
+import re
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'd3b8e6a1f4c9'
+down_revision: Union[str, None] = 'c7f2a5e8d3b6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+DIGITS = re.compile(r'\d+')
+
+
+def report_file_key(report_file_id, strip_zeros):
+    runs = DIGITS.findall(report_file_id or '')
+    if not runs:
+        return None
+    key = max(runs, key=len)
+    return str(int(key)) if strip_zeros else key
+
+
+def backfill(strip_zeros: bool) -> None:
+    # Only report file ids whose longest digit run has leading zeros change
+    conn = op.get_bind()
+    last_id = ''
+    while True:
+        rows = conn.execute(
+            sa.text("SELECT id, report_file_id, report_file_key FROM sgimed_hl7_logs WHERE id > :last_id ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": BATCH_SIZE}
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        updates = [{"id": row[0], "key": report_file_key(row[1], strip_zeros), "old_key": row[2]} for row in rows]
+        updates = [update for update in updates if update["key"] != update["old_key"]]
+        if updates:
+            conn.execute(sa.text("UPDATE sgimed_hl7_logs SET report_file_key = :key WHERE id = :id"), updates)
+
+
+def upgrade() -> None:
+    backfill(strip_zeros=False)
+
+
+def downgrade() -> None:
+    backfill(strip_zeros=True)
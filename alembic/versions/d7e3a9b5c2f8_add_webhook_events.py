@@ -0,0 +1,44 @@
+"""add backend_webhook_events
+
+Revision ID: d7e3a9b5c2f8
+Revises: c4d8e2f1a6b3
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'd7e3a9b5c2f8'
+down_revision: Union[str, None] = 'c4d8e2f1a6b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('backend_webhook_events',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('provider', sa.String(), nullable=False),
+    sa.Column('idempotency_key', sa.String(), nullable=False),
+    sa.Column('event_type', sa.String(), nullable=False),
+    sa.Column('object_reference', sa.String(), nullable=True),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('status', sa.Enum('PENDING', 'PROCESSING', 'DONE', 'FAILED', name='webhookeventstatus'), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('locked_until', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('processed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('provider', 'idempotency_key')
+    )
+    op.create_index(op.f('ix_backend_webhook_events_object_reference'), 'backend_webhook_events', ['object_reference'], unique=False)
+    op.create_index(op.f('ix_backend_webhook_events_status'), 'backend_webhook_events', ['status'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_backend_webhook_events_status'), table_name='backend_webhook_events')
+    op.drop_index(op.f('ix_backend_webhook_events_object_reference'), table_name='backend_webhook_events')
+    op.drop_table('backend_webhook_events')
+    sa.Enum('PENDING', 'PROCESSING', 'DONE', 'FAILED', name='webhookeventstatus').drop(op.get_bind())
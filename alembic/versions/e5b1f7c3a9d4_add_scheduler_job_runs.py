@@ -0,0 +1,40 @@
+"""add backend_scheduler_job_runs
+
+Revision ID: e5b1f7c3a9d4
+Revises: d7e3a9b5c2f8
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'e5b1f7c3a9d4'
+down_revision: Union[str, None] = 'd7e3a9b5c2f8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('backend_scheduler_job_runs',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('job_name', sa.String(), nullable=False),
+    sa.Column('node', sa.String(), nullable=False),
+    sa.Column('status', sa.Enum('RUNNING', 'SUCCESS', 'FAILED', name='schedulerjobrunstatus'), nullable=False),
+    sa.Column('started_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.Column('duration', sa.Float(), nullable=True),
+    sa.Column('rows_processed', sa.Integer(), nullable=False),
+    sa.Column('sgimed_calls', sa.Integer(), nullable=False),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_backend_scheduler_job_runs_job_name_started_at', 'backend_scheduler_job_runs', ['job_name', 'started_at'], unique=False)
+    op.create_index(op.f('ix_backend_scheduler_job_runs_started_at'), 'backend_scheduler_job_runs', ['started_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_backend_scheduler_job_runs_started_at'), table_name='backend_scheduler_job_runs')
+    op.drop_index('ix_backend_scheduler_job_runs_job_name_started_at', table_name='backend_scheduler_job_runs')
+    op.drop_table('backend_scheduler_job_runs')
+    sa.Enum('RUNNING', 'SUCCESS', 'FAILED', name='schedulerjobrunstatus').drop(op.get_bind())
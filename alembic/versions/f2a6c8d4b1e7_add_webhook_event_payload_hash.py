@@ -0,0 +1,25 @@
+"""add payload_hash to backend_webhook_events
+
+Revision ID: f2a6c8d4b1e7
+Revises: e5b1f7c3a9d4
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'f2a6c8d4b1e7'
+down_revision: Union[str, None] = 'e5b1f7c3a9d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('backend_webhook_events', sa.Column('payload_hash', sa.String(), nullable=True))
+    op.create_index('ix_backend_webhook_events_provider_payload_hash', 'backend_webhook_events', ['provider', 'payload_hash'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_backend_webhook_events_provider_payload_hash', table_name='backend_webhook_events')
+    op.drop_column('backend_webhook_events', 'payload_hash')
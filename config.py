@@ -183,6 +183,7 @@ ZOOM_APP_SECRET = os.getenv('ZOOM_APP_SECRET', '')
 # Supabase Credentials
 SUPABASE_URL = os.getenv('SUPABASE_URL', '')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY', '')
+SUPABASE_JWT_SECRET = os.getenv('SUPABASE_JWT_SECRET', '')
 SUPABASE_WEBHOOK_API_KEY = os.getenv('SUPABASE_WEBHOOK_API_KEY', '')
 SUPABASE_UPLOAD_BUCKET = os.getenv('SUPABASE_UPLOAD_BUCKET', '')
 SUPABASE_PRIVATE_BUCKET = os.getenv('SUPABASE_PRIVATE_BUCKET', '')
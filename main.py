@@ -1,3 +1,4 @@
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
@@ -5,6 +6,7 @@ from fastapi.responses import JSONResponse
 import sentry_sdk
 from config import ADMIN_WEB_URL, BACKEND_ENVIRONMENT, SENTRY_DSN
 from utils.fastapi import HTTPJSONException
+from utils.route_audit import check_blocking_routes
 from routers.realtime import ws_manager
 import sqlalchemy
 import os
@@ -28,6 +30,13 @@ async def lifespan(app: FastAPI):
     from config import redis_client
     
     print("🚀 Starting app lifespan...")
+    ws_manager.loop = asyncio.get_running_loop()
+    check_blocking_routes(app)
+
+    # Webhook handlers are registered by their routers, imported below
+    from services import webhook_inbox
+    webhook_inbox.start_workers()
+    print("✅ Startup: Webhook inbox workers started.")
     
     if ENABLE_REDIS:
         if redis_client:
@@ -52,7 +61,11 @@ async def lifespan(app: FastAPI):
 
     # --- SHUTDOWN LOGIC ---
     from utils.executors import shutdown_executors
+    from utils.integrations.sgimed_client import sgimed_client
+    webhook_inbox.stop_workers()
     shutdown_executors()
+    await sgimed_client.aclose()
+    sgimed_client.close()
     
     if ENABLE_REDIS:
         try:
@@ -154,6 +167,8 @@ app.include_router(admin_specialists.router, prefix="/api/admin/specialists/v1",
 
 from routers.admin import services as admin_services
 app.include_router(admin_services.router, prefix="/api/admin/services", tags=["Admin Web App (Services)"])
+from routers.admin import scheduler as admin_scheduler
+app.include_router(admin_scheduler.router, prefix="/api/admin/scheduler", tags=["Admin Web App (Scheduler)"])
 
 # Dispatch Module
 from routers.delivery import dispatch, logistic, zone
@@ -1,6 +1,7 @@
 from datetime import datetime
-from typing import Optional
-from sqlalchemy import ForeignKey
+from enum import Enum
+from typing import Any, Optional
+from sqlalchemy import ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.sql import func
 from . import Base
@@ -12,6 +13,20 @@ class CronLog(Base):
     last_modified: Mapped[datetime]
     last_page: Mapped[Optional[int]]
 
+class CronItemFailure(Base):
+    '''
+    Rows of a cron page that failed, the cron holds its checkpoint while they have attempts left
+    Rows that ran out of attempts are kept as dead letters and no longer hold the checkpoint
+    '''
+    __tablename__ = "backend_cron_item_failures"
+
+    cron_id: Mapped[str] = mapped_column(ForeignKey("backend_crons.id"), primary_key=True)
+    item_id: Mapped[str] = mapped_column(primary_key=True)
+    attempts: Mapped[int] = mapped_column(default=0)
+    dead_lettered: Mapped[bool] = mapped_column(default=False)
+    error: Mapped[Optional[str]]
+    updated_at: Mapped[datetime] = mapped_column(server_default=func.now(), onupdate=func.now())
+
 class NotificationLog(Base):
     __tablename__ = "backend_notifications"
 
@@ -33,3 +48,65 @@ class SystemConfig(Base):
     category: Mapped[str]  # For grouping related configs
     created_at: Mapped[datetime] = mapped_column(server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(server_default=func.now(), onupdate=func.now())
+
+class WebhookEventStatus(str, Enum):
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+
+class WebhookEvent(Base):
+    '''
+    Verified webhook payloads, acknowledged once stored and processed by the webhook inbox workers
+    '''
+    __tablename__ = "backend_webhook_events"
+    __table_args__ = (
+        UniqueConstraint('provider', 'idempotency_key'),
+        Index('ix_backend_webhook_events_provider_payload_hash', 'provider', 'payload_hash'),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    provider: Mapped[str]
+    idempotency_key: Mapped[str]
+    # Payload hash of providers without a delivery id, deduplicated only against unfinished events
+    payload_hash: Mapped[Optional[str]]
+    event_type: Mapped[str]
+    # Events of the same object reference are processed in the order received
+    object_reference: Mapped[Optional[str]] = mapped_column(index=True)
+    payload: Mapped[dict[str, Any]]
+    status: Mapped[WebhookEventStatus] = mapped_column(default=WebhookEventStatus.PENDING, index=True)
+    attempts: Mapped[int] = mapped_column(default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(server_default=func.now())
+    locked_until: Mapped[Optional[datetime]]
+    last_error: Mapped[Optional[str]]
+
+    created_at: Mapped[datetime] = mapped_column(server_default=func.now())
+    # Processed events are pruned by their processed time
+    processed_at: Mapped[Optional[datetime]] = mapped_column(index=True)
+
+class SchedulerJobRunStatus(str, Enum):
+    RUNNING = 'running'
+    SUCCESS = 'success'
+    FAILED = 'failed'
+    # The node running the job stopped before the run finished
+    STALE = 'stale'
+
+class SchedulerJobRun(Base):
+    '''
+    Run history of the scheduler jobs, written by the job runner
+    '''
+    __tablename__ = "backend_scheduler_job_runs"
+    # Latest runs of a job, for the overlap check and the admin job summary
+    __table_args__ = (Index('ix_backend_scheduler_job_runs_job_name_started_at', 'job_name', 'started_at'),)
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    job_name: Mapped[str]
+    # Scheduler node (host:pid) that ran the job
+    node: Mapped[str]
+    status: Mapped[SchedulerJobRunStatus] = mapped_column(default=SchedulerJobRunStatus.RUNNING)
+    started_at: Mapped[datetime] = mapped_column(server_default=func.now(), index=True)
+    finished_at: Mapped[Optional[datetime]]
+    duration: Mapped[Optional[float]] # seconds
+    rows_processed: Mapped[int] = mapped_column(default=0)
+    sgimed_calls: Mapped[int] = mapped_column(default=0)
+    error: Mapped[Optional[str]]
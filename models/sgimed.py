@@ -14,6 +14,8 @@ class HL7Log(Base):
     branch_id: Mapped[str]
     patient_id: Mapped[str] = mapped_column(index=True)
     report_file_id: Mapped[str] = mapped_column(index=True)
+    # Canonical report file id (longest digit run) matched against IncomingReport.report_file_id
+    report_file_key: Mapped[Optional[str]] = mapped_column(index=True)
     hl7_content: Mapped[str]
     last_edited: Mapped[datetime]
     created_at: Mapped[datetime]
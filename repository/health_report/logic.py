@@ -64,3 +64,170 @@ def test_generic_mapping(results, metadata):
             if lab_range[0] == '<' and val <= result: return TestConversionResult(tag=TestTags.OUT_OF_RANGE, writeup='high_writeup')
             else: return TestConversionResult(tag=TestTags.NORMAL, writeup='in_range_writeup')
 
+
+# Compiled lab ranges
+#
+# test_generic_mapping re-parses the lab range string of a test for every report.
+# The mapping table is compiled once into rules with the bounds already converted,
+# evaluate() returns the same result as test_generic_mapping for the same inputs.
+
+NO_TAG = TestConversionResult(tag=None)
+NEGATIVE = TestConversionResult(tag=TestTags.NORMAL, writeup='negative_writeup')
+POSITIVE = TestConversionResult(tag=TestTags.OUT_OF_RANGE, writeup='positive_writeup')
+IN_RANGE = TestConversionResult(tag=TestTags.NORMAL, writeup='in_range_writeup')
+LOW = TestConversionResult(tag=TestTags.OUT_OF_RANGE, writeup='low_writeup')
+HIGH = TestConversionResult(tag=TestTags.OUT_OF_RANGE, writeup='high_writeup')
+
+class FloatConverter:
+    '''
+    cfloat of a test with its float_error values converted once
+    '''
+    def __init__(self, metadata):
+        self.test_code = metadata['test_code']
+        self.lab_range = metadata['lab_range']
+        self.float_error = {k: float(v) for k, v in metadata.get('float_error', {}).items()}
+
+    def __call__(self, value):
+        try:
+            return float(value)
+        except ValueError:
+            if value[0] == '<':
+                return float(value[1:]) - 0.01
+            if value[0] == '>':
+                return float(value[1:]) + 0.01
+            if value in self.float_error:
+                return self.float_error[value]
+            raise Exception(f"Error converting {self.test_code}: '{value}' to float, Lab Range: {self.lab_range}")
+
+class NoRangeRule:
+    def evaluate(self, result, results, test):
+        return NO_TAG
+
+class UnmatchedRule:
+    # Lab ranges without a known operator are not tagged, same as test_generic_mapping
+    def evaluate(self, result, results, test):
+        return None
+
+class InvalidRule:
+    def __init__(self, lab_range, error):
+        self.message = f"Invalid lab range '{lab_range}': {error}"
+
+    def evaluate(self, result, results, test):
+        raise Exception(self.message)
+
+class CallableRule:
+    def __init__(self, func):
+        self.func = func
+
+    def evaluate(self, result, results, test):
+        return self.func(results, test.metadata)
+
+class GenderRule:
+    def __init__(self, rules: dict):
+        self.rules = rules
+
+    def evaluate(self, result, results, test):
+        return self.rules[results['GENDER'][0]].evaluate(result, results, test)
+
+class NegativeRule:
+    def evaluate(self, result, results, test):
+        result_is_zero = False
+        try:
+            result_is_zero = test.to_float(result) == 0
+        except Exception:
+            pass
+        return NEGATIVE if result == 'Neg' or result_is_zero else POSITIVE
+
+class EqualsRule:
+    def __init__(self, value: str):
+        self.value = value.lower()
+
+    def evaluate(self, result, results, test):
+        return IN_RANGE if result.lower() == self.value else HIGH
+
+class BetweenRule:
+    def __init__(self, low: float, high: float):
+        self.low = low
+        self.high = high
+
+    def evaluate(self, result, results, test):
+        value = test.to_float(result)
+        if value < self.low: return LOW
+        if value > self.high: return HIGH
+        return IN_RANGE
+
+class LowerBoundRule:
+    '''
+    '>= x' is out of range below x, '> x' is also out of range at x
+    '''
+    def __init__(self, bound: float, inclusive: bool):
+        self.bound = bound
+        self.inclusive = inclusive
+
+    def evaluate(self, result, results, test):
+        value = test.to_float(result)
+        if self.bound > value or (not self.inclusive and self.bound == value): return LOW
+        return IN_RANGE
+
+class UpperBoundRule:
+    '''
+    '<= x' is out of range above x, '< x' is also out of range at x
+    '''
+    def __init__(self, bound: float, inclusive: bool):
+        self.bound = bound
+        self.inclusive = inclusive
+
+    def evaluate(self, result, results, test):
+        value = test.to_float(result)
+        if self.bound < value or (not self.inclusive and self.bound == value): return HIGH
+        return IN_RANGE
+
+def compile_lab_range(lab_range):
+    '''
+    Rule for a lab_range of the mapping table, checked in the same order as test_generic_mapping
+    '''
+    if type(lab_range) == dict:
+        return GenderRule({gender: compile_lab_range(r) for gender, r in lab_range.items()})
+    if lab_range is None:
+        return NoRangeRule()
+    if callable(lab_range):
+        return CallableRule(lab_range)
+    try:
+        if lab_range[:4] == '=Neg':
+            return NegativeRule()
+        if '-' in lab_range:
+            low, high = lab_range.split('-')
+            return BetweenRule(float(low), float(high))
+        if lab_range[0] == '=':
+            return EqualsRule(lab_range[1:].strip())
+        if lab_range[0] in ['>', '<']:
+            inclusive = lab_range[1] == '='
+            bound = float(lab_range[2:].strip() if inclusive else lab_range[1:].strip())
+            if lab_range[0] == '>':
+                return LowerBoundRule(bound, inclusive)
+            return UpperBoundRule(bound, inclusive)
+    except (ValueError, IndexError) as e:
+        return InvalidRule(lab_range, e)
+    return UnmatchedRule()
+
+class CompiledTest:
+    '''
+    Test of a health report profile with its lab range compiled
+    '''
+    def __init__(self, metadata: dict):
+        self.metadata = metadata
+        self.test_code = metadata['test_code']
+        self.hl7_code = metadata['hl7_code']
+        self.rule = compile_lab_range(metadata['lab_range'])
+        self.to_float = FloatConverter(metadata)
+
+    def evaluate(self, results) -> TestConversionResult | None:
+        result, _, _ = results[self.hl7_code]
+        return self.rule.evaluate(result, results, self)
+
+class CompiledProfile:
+    def __init__(self, health_report_profile: dict):
+        self.profile = health_report_profile['profile'].value
+        self.description = health_report_profile.get('description') or None
+        self.tests = [CompiledTest(test_props) for test_props in health_report_profile['tests']]
+        self.hl7_codes = frozenset(test.hl7_code for test in self.tests)
@@ -1,5 +1,5 @@
 from enum import Enum
-from .logic import TestConversionResult, cfloat
+from .logic import TestConversionResult, CompiledProfile, cfloat
 from .enums import Profile, TestTags
 
 def bp_mapping(results, metadata):
@@ -833,3 +833,6 @@ health_report_profiles = [
     # },
 
 ]
+
+# Compiled once at import, used to score reports instead of test_generic_mapping
+compiled_profiles = [CompiledProfile(p) for p in health_report_profiles]
@@ -1,7 +1,6 @@
 from typing import Any
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy.orm.session import Session
 from sqlalchemy.sql.expression import UnaryExpression
 from utils.admin_query.models import AdminQuery, AdminQueryApiParams, AdminQueryColumn, AdminQueryFilter, AdminQueryModel, FrontendComponent
 from sqlalchemy import select, and_, or_, func, cast, text, String
@@ -276,7 +275,7 @@ def transform_fn(data: list[Appointment]):
 
     return rows
 
-def get_csv_response(db: Session, params: AdminQueryApiParams) -> StreamingResponse:
+def get_csv_response(params: AdminQueryApiParams) -> StreamingResponse:
     qry = AdminQuery(
         model = AdminQueryModel(
             model=AppointmentRow,
@@ -291,4 +290,4 @@ def get_csv_response(db: Session, params: AdminQueryApiParams) -> StreamingRespo
         datetime: lambda x: x.strftime('%Y-%m-%d %H:%M:%S'),
         'amount': lambda x: f"S${x:.2f}"
     }
-    return qry.get_csv_response(db, formattings)
+    return qry.get_csv_response(formattings)
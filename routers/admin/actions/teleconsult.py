@@ -4,7 +4,7 @@ from models.teleconsult import Teleconsult
 from routers.admin.teleconsult import TeleconsultAdminResp
 from routers.realtime import WSMessage, ws_manager, WSEvent
 
-async def admin_supabase_webhook_processing(payload: dict):
+def admin_supabase_webhook_processing(payload: dict):
     # Handle the payload received from Supabase realtime changes
     # print(payload)
     type = payload["type"]
@@ -37,4 +37,4 @@ async def admin_supabase_webhook_processing(payload: dict):
             doctor_name=teleconsult.doctor.name if teleconsult.doctor else ""
         )
 
-    await ws_manager.push_to_channel(WSMessage(event=WSEvent.ADMIN_TELECONSULT_UPDATE_ALL, data=resp.model_dump()))
+    ws_manager.publish(WSMessage(event=WSEvent.ADMIN_TELECONSULT_UPDATE_ALL, data=resp.model_dump()))
@@ -22,7 +22,7 @@ def webhook_send_notifications(branch_id: str, index: Optional[int]):
         for account in accounts:
             send_doctor_notification(account, f"New Queue Request ({branch.name})", "A new patient has requested to join the queue")
 
-async def admin_supabase_walkin_processing(payload: dict):
+def admin_supabase_walkin_processing(payload: dict):
     record_id = payload["record"]['id']    
     with SessionLocal() as db:
         teleconsult = db.query(WalkInQueue).filter(WalkInQueue.id == record_id).first()
@@ -42,4 +42,4 @@ async def admin_supabase_walkin_processing(payload: dict):
             status=teleconsult.status
         )
 
-    await ws_manager.push_to_channel(WSMessage(event=WSEvent.ADMIN_WALKIN_UPDATE_ALL, data=resp.model_dump()))
+    ws_manager.publish(WSMessage(event=WSEvent.ADMIN_WALKIN_UPDATE_ALL, data=resp.model_dump()))
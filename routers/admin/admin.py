@@ -5,13 +5,15 @@ from pydantic import BaseModel, EmailStr
 from sqlalchemy.orm import Session
 from utils import sg_datetime
 from utils.fastapi import CreateResp, SuccessResp
+from utils.appointment import invalidate_appointment_availability
+from services.pricing import invalidate_pricing_rules
 from models import get_db
 from models.pinnacle import Branch, PinnacleAccount, PublicHoliday
 from models.model_enums import Role
 
 from utils.fastapi import SelectOption
 from utils.integrations.sgimed import get_doctors
-from utils.supabase_auth import SupabaseUser, get_superadmin
+from utils.supabase_auth import SupabaseUser, get_superadmin, invalidate_supabase_accounts
 from config import ADMIN_WEB_URL, supabase
 from datetime import date
 
@@ -148,6 +150,7 @@ def create_account(req: CreateAccountReq, db = Depends(get_db)):
             )
             db.add(record)
         db.commit()
+        invalidate_supabase_accounts()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
@@ -169,6 +172,7 @@ def delete_accounts(params: DeleteAccountParams, db: Session = Depends(get_db)):
             errors.append(record.email)
 
     db.commit()    
+    invalidate_supabase_accounts()
     if errors:
         raise HTTPException(status_code=500, detail=f"Failed to delete the following users: {', '.join(errors)}")
 
@@ -194,7 +198,7 @@ class PublicHolidayResp(BaseModel):
     remarks: Optional[str] = None
 
 @router.get("/public_holidays", response_model=list[PublicHolidayResp])
-async def get_public_holidays(db: Session = Depends(get_db)):
+def get_public_holidays(db: Session = Depends(get_db)):
     holidays = db.query(PublicHoliday).filter(PublicHoliday.date >= sg_datetime.now().date()).all()
     return [
             PublicHolidayResp(
@@ -211,7 +215,7 @@ class PublicHolidayCreate(BaseModel):
     remarks: Optional[str] = None 
 
 @router.post("/public_holidays/upsert", response_model=CreateResp)
-async def upsert_public_holiday(req: PublicHolidayCreate, db: Session = Depends(get_db)):
+def upsert_public_holiday(req: PublicHolidayCreate, db: Session = Depends(get_db)):
     duplicate_date = db.query(PublicHoliday).filter(PublicHoliday.date == req.date, PublicHoliday.id != req.id).first()
     if duplicate_date:
         raise HTTPException(status_code=400, detail="Date already exists.")
@@ -230,6 +234,8 @@ async def upsert_public_holiday(req: PublicHolidayCreate, db: Session = Depends(
         db.add(record)
     
     db.commit()    
+    invalidate_appointment_availability()
+    invalidate_pricing_rules()
     return CreateResp(id=str(record.id))
 
 @router.delete("/public_holidays/{public_holiday_id}", response_model=SuccessResp)
@@ -240,4 +246,6 @@ def delete_public_holiday(public_holiday_id: str, db: Session = Depends(get_db))
     
     db.delete(record)
     db.commit()
+    invalidate_appointment_availability()
+    invalidate_pricing_rules()
     return SuccessResp(success=True)
\ No newline at end of file
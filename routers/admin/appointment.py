@@ -28,8 +28,9 @@ from utils.admin_query.models import AdminQueryApiParams
 from .utils import get_current_user
 from utils.fastapi import HTTPJSONException
 from utils.sg_datetime import sgtz
-from utils.pagination import Page, PaginationInput, paginate
+from utils.pagination import KeysetPaginationInput, Page, SortKey, paginate_keyset
 from utils.system_config import get_config_value
+from utils.appointment import invalidate_appointment_availability
 from config import SUPABASE_UPLOAD_BUCKET, supabase
 from .actions.appointment_queries import get_csv_response
 
@@ -1344,7 +1345,7 @@ def get_onsite_branch(onsite_id: int, db: Session = Depends(get_db)):
     )
 
 @router.put("/onsite-branches/{onsite_id}", response_model=SuccessResponse)
-async def update_onsite_branch(onsite_id: int, req: OnsiteBranchUpdate = FormDepends(OnsiteBranchUpdate), db: Session = Depends(get_db)):
+def update_onsite_branch(onsite_id: int, req: OnsiteBranchUpdate = FormDepends(OnsiteBranchUpdate), db: Session = Depends(get_db)):
     onsite_branch = db.query(AppointmentOnsiteBranch).filter(
         AppointmentOnsiteBranch.id == onsite_id
     ).first()
@@ -1408,7 +1409,7 @@ async def update_onsite_branch(onsite_id: int, req: OnsiteBranchUpdate = FormDep
     # Handle image upload if provided
     if req.image and req.image.filename:
         image_filename = f'branches/{branch.name}{osp.splitext(req.image.filename)[-1]}'
-        image_bytes = await req.image.read()
+        image_bytes = req.image.file.read()
         content_type = req.image.content_type if req.image.content_type else 'image/jpeg'
         resp = supabase.storage.from_(SUPABASE_UPLOAD_BUCKET).upload(
             file=image_bytes,
@@ -1590,7 +1591,7 @@ def get_sgimed_branches(db: Session = Depends(get_db)):
 
 # onsite branch Creation Endpoint
 @router.post("/onsite-branch", response_model=OnsiteBranchResponse)
-async def create_onsite_branch(req: OnsiteBranchCreate = FormDepends(OnsiteBranchCreate), db: Session = Depends(get_db)):
+def create_onsite_branch(req: OnsiteBranchCreate = FormDepends(OnsiteBranchCreate), db: Session = Depends(get_db)):
     """
     Creates a new branch with calendar and associated onsite branch in one operation.
     This endpoint combines branch creation, calendar creation via SGiMed API,
@@ -1643,7 +1644,7 @@ async def create_onsite_branch(req: OnsiteBranchCreate = FormDepends(OnsiteBranc
         # Handle image upload if provided
         if req.image and req.image.filename:
             image_filename = f'branches/{req.branch_name}{osp.splitext(req.image.filename)[-1]}'
-            image_bytes = await req.image.read()
+            image_bytes = req.image.file.read()
             content_type = req.image.content_type if req.image.content_type else 'image/jpeg'
             resp = supabase.storage.from_(SUPABASE_UPLOAD_BUCKET).upload(
                 file=image_bytes,
@@ -1845,6 +1846,7 @@ def _update_operating_hours(branch_id: str, req: dict, model_class, db: Session)
             db.add(operating_hour)
 
     db.commit()
+    invalidate_appointment_availability([branch_id])
 
 @router.put("/operating-hours/{branch_id}", response_model=SuccessResponse)
 def update_branch_operating_hours(
@@ -1968,6 +1970,7 @@ def create_operating_hour(req: OperatingHourCreate, db: Session = Depends(get_db
 
     db.add(operating_hour)
     db.commit()
+    invalidate_appointment_availability([str(uuid.UUID(req.branch_id))])
 
     return CreateResponse(id=str(operating_hour.id))
 
@@ -1984,8 +1987,10 @@ def delete_operating_hour(hour_id: str, db: Session = Depends(get_db)):
             status_code=404
         )
 
+    branch_id = str(operating_hour.branch_id)
     db.delete(operating_hour)
     db.commit()
+    invalidate_appointment_availability([branch_id])
     return SuccessResponse(success=True)
 
 # Branch Operating Hours Models (for pinnacle_branches_operating_hours)
@@ -2083,7 +2088,7 @@ class AppointmentStatusUpdate(BaseModel):
 # Appointment Management Endpoints
 @router.get("/appointments", response_model=Page[AppointmentListItem])
 def get_appointments(
-    pagination: PaginationInput = Depends(),
+    pagination: KeysetPaginationInput = Depends(),
     search: str | None = None,
     status: AppointmentStatus | None = None,
     branch_id: str | None = None,
@@ -2139,7 +2144,6 @@ def get_appointments(
             text("services::jsonb @> :services").params(services=f'[{{"id": "{service_group_id}"}}]')
         )
 
-    # Apply ordering before pagination
     # Determine the sort column
     sort_column = Appointment.start_datetime
     if sort_by == "created_at":
@@ -2147,15 +2151,12 @@ def get_appointments(
     elif sort_by == "start_datetime":
         sort_column = Appointment.start_datetime
 
-    # Apply sort order with null handling
-    # SQLAlchemy's nullslast() and nullsfirst() ensure consistent ordering
-    if sort_order == "asc":
-        query = query.order_by(sort_column.asc().nullslast())
-    else:
-        query = query.order_by(sort_column.desc().nullsfirst())
+    # Sort columns are non nullable, id breaks ties so the cursor order is stable
+    descending = sort_order != "asc"
+    sort_keys = [SortKey(sort_column, descending), SortKey(Appointment.id, descending)]
 
     # Use pagination utility
-    page_result = paginate(query, db, pagination)
+    page_result = paginate_keyset(query, db, pagination, sort_keys)
 
     # Transform the raw appointment data to AppointmentListItem
     appointment_items = []
@@ -2267,7 +2268,6 @@ def export_appointments(
     date_to: datetime | None = None,
     service_group_id: str | None = None,
     corporate_code: str | None = None,
-    db: Session = Depends(get_db)
 ) -> StreamingResponse:
     filters = {
         "search": search,
@@ -2281,7 +2281,6 @@ def export_appointments(
     filters = {k: v for k, v in filters.items() if v is not None}
 
     return get_csv_response(
-        db,
         params=AdminQueryApiParams(
             page=1,
             rows=None,
@@ -5,6 +5,7 @@ from models import get_db, Branch, Blockoff
 from pydantic import BaseModel
 from routers.admin.branch import CreateResponse
 from utils import sg_datetime
+from utils.appointment import invalidate_appointment_availability
 from utils.supabase_auth import SupabaseUser, get_superadmin
 from sqlalchemy.orm import Session
 from utils.fastapi import SuccessResp
@@ -79,6 +80,7 @@ def create_blockoff(req: BlockoffCreate, db: Session = Depends(get_db), user = D
     blockoff.branches = branches
     db.add(blockoff)
     db.commit()
+    invalidate_appointment_availability(req.branch_ids)
     return CreateResponse(id=str(blockoff.id))
 
 class BlockoffUpdate(BaseModel):
@@ -94,6 +96,8 @@ def update_blockoff(blockoff_id: str, req: BlockoffUpdate, db: Session = Depends
     if not blockoff:
         raise HTTPException(status_code=404, detail="Block off not found")
 
+    # Both the previous and updated branches need their availability recomputed
+    affected_branch_ids = [str(branch.id) for branch in blockoff.branches]
     if req.branch_ids:
         branches = db.query(Branch).filter(Branch.deleted == False, Branch.hidden == False, Branch.id.in_(req.branch_ids)).all()
         if not len(req.branch_ids) == len(branches):
@@ -108,7 +112,8 @@ def update_blockoff(blockoff_id: str, req: BlockoffUpdate, db: Session = Depends
         blockoff.end_time = req.end_time
     blockoff.remarks = req.remarks
     db.commit()
-    
+    invalidate_appointment_availability(affected_branch_ids + (req.branch_ids or []))
+
     return SuccessResp(success=True)
 
 @router.delete("/{blockoff_id}", response_model=SuccessResp)
@@ -116,8 +121,10 @@ def delete_blockoff(blockoff_id: str, db: Session = Depends(get_db)):
     blockoff = db.query(Blockoff).filter(Blockoff.id == blockoff_id).first()
     if not blockoff:
         raise HTTPException(status_code=404, detail="Block off not found")
+    affected_branch_ids = [str(branch.id) for branch in blockoff.branches]
     db.delete(blockoff)
     db.commit()
+    invalidate_appointment_availability(affected_branch_ids)
     return SuccessResp(success=True)
 
 class BlockOffToggleReq(BaseModel):
@@ -125,7 +132,7 @@ class BlockOffToggleReq(BaseModel):
     enable: bool
 
 @router.post("/toggle_blockoff", response_model=SuccessResp, status_code=200)
-async def toggle_block_off(req: BlockOffToggleReq, user: SupabaseUser = Depends(get_superadmin), db: Session = Depends(get_db)):
+def toggle_block_off(req: BlockOffToggleReq, user: SupabaseUser = Depends(get_superadmin), db: Session = Depends(get_db)):
     branch = db.query(Branch).filter(Branch.id == req.branch_id).first()
     if not branch:
         raise HTTPException(status_code=404, detail="Branch not found")
@@ -166,6 +173,7 @@ async def toggle_block_off(req: BlockOffToggleReq, user: SupabaseUser = Depends(
         db.add(curr_blockoff)
 
     db.commit()
+    invalidate_appointment_availability([str(branch.id)])
 
     return SuccessResp(
         success=True
@@ -11,6 +11,7 @@ from utils.integrations.sgimed import BranchRecord
 from utils.supabase_auth import get_superadmin
 from sqlalchemy.orm import Session
 from utils.integrations import sgimed
+from utils.appointment import invalidate_appointment_availability
 from utils.fastapi import HTTPJSONException
 import os.path as osp
 from config import SUPABASE_UPLOAD_BUCKET, supabase
@@ -82,7 +83,7 @@ class BranchUpdateReq(BaseModel):
     image: UploadFile | None = None
 
 @router.put("/{branch_id}", response_model=SuccessResponse)
-async def update_branch(branch_id: str, params: BranchUpdateReq = FormDepends(BranchUpdateReq), db: Session = Depends(get_db)):
+def update_branch(branch_id: str, params: BranchUpdateReq = FormDepends(BranchUpdateReq), db: Session = Depends(get_db)):
     branch = db.query(Branch).filter(Branch.id == branch_id).first()
     if not branch:
         raise HTTPException(status_code=404, detail="Branch not found")
@@ -95,7 +96,7 @@ async def update_branch(branch_id: str, params: BranchUpdateReq = FormDepends(Br
 
     if params.image and params.image.filename:
         image_filename = f'branches/{branch.name}{osp.splitext(params.image.filename)[-1]}'
-        image_bytes = await params.image.read()
+        image_bytes = params.image.file.read()
         content_type = params.image.content_type if params.image.content_type else 'image/jpeg'
         resp = supabase.storage.from_(SUPABASE_UPLOAD_BUCKET).upload(file=image_bytes, path=image_filename, file_options={"content-type": content_type, "upsert": 'true'})
         branch.image_url = supabase.storage.from_(SUPABASE_UPLOAD_BUCKET).get_public_url(image_filename)
@@ -212,7 +213,7 @@ class BranchCreateRequest(BaseModel):
     image: UploadFile | None = None
 
 @router.post("", response_model=CreateResponse)
-async def create_branch(params: BranchCreateRequest = FormDepends(BranchCreateRequest), db: Session = Depends(get_db)):
+def create_branch(params: BranchCreateRequest = FormDepends(BranchCreateRequest), db: Session = Depends(get_db)):
     # Create new branch with all provided fields
     branch = Branch(
         id=uuid.uuid4(),
@@ -233,7 +234,7 @@ async def create_branch(params: BranchCreateRequest = FormDepends(BranchCreateRe
         # Sanitize the branch name for filename
         sanitized_name = re.sub(r'[^a-zA-Z0-9_-]', '_', params.name)
         image_filename = f'branches/{sanitized_name}_{uuid.uuid4()}{osp.splitext(params.image.filename)[-1]}'
-        image_bytes = await params.image.read()
+        image_bytes = params.image.file.read()
         content_type = params.image.content_type if params.image.content_type else 'image/jpeg'
         resp = supabase.storage.from_(SUPABASE_UPLOAD_BUCKET).upload(
             file=image_bytes, 
@@ -274,6 +275,7 @@ def create_clinic_operating_hour(branch_id: str, req: BranchOperatingHourCreate,
 
     db.add(operating_hour)
     db.commit()
+    invalidate_appointment_availability([branch_id])
     return CreateResponse(id=str(operating_hour.id))
 
 @router.put("/{branch_id}/operating_hours/{operating_id}", response_model=SuccessResponse)
@@ -289,6 +291,7 @@ def update_operating_hour(branch_id: str, operating_id: int, req: BranchOperatin
     operating_hour.end_time = req.end_time
     operating_hour.cutoff_time = req.cutoff_time
     db.commit()
+    invalidate_appointment_availability([branch_id])
     return SuccessResponse(success=True)
 
 class DeleteOperatingHoursParams(BaseModel):
@@ -306,4 +309,5 @@ def delete_operating_hour(branch_id: str, params: DeleteOperatingHoursParams, db
     for row in hours:
         db.delete(row) 
     db.commit()
+    invalidate_appointment_availability([branch_id])
     return SuccessResponse(success=True)
@@ -5,6 +5,7 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import List, Optional
 from models import get_db, SGiMedInventory
 from models.payments import CorporateCode
+from services.pricing import invalidate_pricing_rules
 from utils.fastapi import SuccessResp
 from utils.supabase_auth import get_superadmin
 
@@ -78,6 +79,7 @@ def upsert_corporate_codes(req: CorporateCodeRow, db: Session = Depends(get_db))
         db.add(code)
 
     db.commit()
+    invalidate_pricing_rules()
     return SuccessResp(success=True)
 
 @router.delete('/{id}', response_model=SuccessResp)
@@ -88,6 +90,7 @@ def delete_corporate_codes(id: int, db: Session = Depends(get_db)):
 
     record.deleted = True
     db.commit()
+    invalidate_pricing_rules()
     return SuccessResp(success=True)
 
 
@@ -230,6 +233,7 @@ def upsert_corporate_codes_v2(req: CorporateCodeV2Row, db: Session = Depends(get
         db.add(code)
 
     db.commit()
+    invalidate_pricing_rules()
     return SuccessResp(success=True)
 
 @router.delete('/v2/{id}', response_model=SuccessResp)
@@ -240,4 +244,5 @@ def delete_corporate_codes_v2(id: int, db: Session = Depends(get_db)):
 
     record.deleted = True
     db.commit()
+    invalidate_pricing_rules()
     return SuccessResp(success=True)
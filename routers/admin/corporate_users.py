@@ -10,6 +10,7 @@ from fastapi.responses import StreamingResponse
 from models import get_db
 from models.corporate import CorporateUser
 from models.model_enums import SGiMedICType
+from utils.bulk_import import copy_rows, create_temp_table, get_cursor, read_csv_upload, validate_rows
 from utils.fastapi import SuccessResp
 from utils.supabase_auth import get_superadmin
 
@@ -23,7 +24,7 @@ class CsvUploadResponse(BaseModel):
     error_message: Optional[str]
 
 @router.post("/upload", response_model=CsvUploadResponse)
-async def upload_corporate_users(
+def upload_corporate_users(
     file: UploadFile = File(...),
     db: Session = Depends(get_db)
 ):
@@ -31,57 +32,57 @@ async def upload_corporate_users(
         raise HTTPException(400, "Only CSV files are allowed")
 
     # Read CSV content
-    content = await file.read()
-    csv_data = content.decode('utf-8')
-    csv_reader = csv.DictReader(io.StringIO(csv_data))
-    
-    if not csv_reader.fieldnames:
+    csv_reader = read_csv_upload(file.file)
+    try:
+        fieldnames = csv_reader.fieldnames
+    except UnicodeDecodeError:
+        raise HTTPException(400, "CSV file must be UTF-8 encoded")
+
+    if not fieldnames:
         raise HTTPException(400, "CSV file is empty or invalid")
         
     required_headers = ['ic_type', 'nric', 'code']
-    if not all(header in csv_reader.fieldnames for header in required_headers):
+    if not all(header in fieldnames for header in required_headers):
         raise HTTPException(400, "CSV must contain ic_type, nric, and code columns")
 
-    # Get unique corporate codes
-    codes = {row['code'] for row in csv_reader}
-
-    # Reset file pointer
-    csv_reader = csv.DictReader(io.StringIO(csv_data))
-    
-    # Clear existing records for these codes
-    db.query(CorporateUser).filter(CorporateUser.code.in_(codes)).delete()
-    
-    # Process records
+    # Corporate codes of every row, including failed rows, are replaced by the upload
+    codes = set()
     total_records = 0
-    successful_records = 0
     failed_records = []
-    
-    for row in csv_reader:
+
+    def validate(row: dict) -> list:
+        nonlocal total_records
         total_records += 1
+        if row['code']:
+            codes.add(row['code'])
+
+        # Validate IC type
         try:
-            # Validate IC type
-            try:
-                ic_type = SGiMedICType(row['ic_type'].upper())
-            except ValueError:
-                raise ValueError(f"Invalid IC type: {row['ic_type']}")
-
-            # Create new record
-            corporate_user = CorporateUser(
-                ic_type=ic_type,
-                nric=row['nric'].upper(),
-                code=row['code']
-            )
-            db.add(corporate_user)
-            successful_records += 1
-            
-        except Exception as e:
-            failed_records.append({
-                "row": row,
-                "error": str(e)
-            })
-    
+            ic_type = SGiMedICType(row['ic_type'].upper())
+        except (ValueError, AttributeError):
+            raise ValueError(f"Invalid IC type: {row['ic_type']}")
+        if not row['nric']:
+            raise ValueError("Missing nric")
+        if not row['code']:
+            raise ValueError("Missing code")
+        # Stored as the enum name, as SQLAlchemy does
+        return [ic_type.name, row['nric'].upper(), row['code']]
+
     try:
+        cursor = get_cursor(db)
+        create_temp_table(cursor, 'corporate_users_import', 'ic_type text, nric text, code text')
+        successful_records = copy_rows(cursor, 'corporate_users_import', ['ic_type', 'nric', 'code'], validate_rows(csv_reader, validate, failed_records))
+
+        # Clear existing records for these codes and insert the upload
+        cursor.execute('DELETE FROM corporate_users WHERE code = ANY(%s)', (list(codes),))
+        cursor.execute('''
+            INSERT INTO corporate_users (ic_type, nric, code)
+            SELECT ic_type::sgimedictype, nric, code FROM corporate_users_import
+        ''')
         db.commit()
+    except UnicodeDecodeError:
+        db.rollback()
+        raise HTTPException(400, "CSV file must be UTF-8 encoded")
     except Exception as e:
         db.rollback()
         raise HTTPException(500, f"Failed to commit changes: {str(e)}")
@@ -102,7 +103,7 @@ class CorporateUserCountResponse(BaseModel):
     counts: List[CorporateUserCount]
 
 @router.get("/", response_model=CorporateUserCountResponse)
-async def get_corporate_user_counts(db: Session = Depends(get_db)):
+def get_corporate_user_counts(db: Session = Depends(get_db)):
     # Query to count users grouped by code
     counts_query = (
         db.query(
@@ -123,7 +124,7 @@ async def get_corporate_user_counts(db: Session = Depends(get_db)):
     )
 
 @router.delete("/{code}", response_model=SuccessResp)
-async def delete_corporate_users(
+def delete_corporate_users(
     code: str,
     db: Session = Depends(get_db)
 ):
@@ -137,7 +138,7 @@ async def delete_corporate_users(
         raise HTTPException(500, f"Failed to delete corporate users: {str(e)}")
 
 @router.get("/{code}/download", response_class=StreamingResponse)
-async def download_corporate_users(
+def download_corporate_users(
     code: str,
     db: Session = Depends(get_db)
 ):
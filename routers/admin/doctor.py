@@ -4,7 +4,7 @@ from models import get_db
 from models.model_enums import Role
 from pydantic import BaseModel
 from models.pinnacle import PinnacleAccount
-from utils.supabase_auth import get_superadmin
+from utils.supabase_auth import get_superadmin, invalidate_supabase_accounts
 from sqlalchemy.orm import Session
 
 router = APIRouter(dependencies=[Depends(get_superadmin)])
@@ -20,7 +20,7 @@ class SuccessResponse(BaseModel):
     success: bool
 
 @router.post("/update", response_model=SuccessResponse)
-async def update_doctor(req: DocterUpdateReq, db: Session = Depends(get_db)):
+def update_doctor(req: DocterUpdateReq, db: Session = Depends(get_db)):
     account = db.query(PinnacleAccount).filter(PinnacleAccount.id == req.doctor_id).first()
     if not account:
         raise HTTPException(status_code=404, detail="User not found")
@@ -35,6 +35,8 @@ async def update_doctor(req: DocterUpdateReq, db: Session = Depends(get_db)):
         account.name = req.name
 
     db.commit()
+    if req.role is not None:
+        invalidate_supabase_accounts()
     return SuccessResponse(
         success=True
     )
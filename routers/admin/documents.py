@@ -9,6 +9,7 @@ from models.model_enums import DocumentStatus, DocumentType
 from models.patient import Account
 from models.pinnacle import Branch
 from utils.fastapi import SuccessResp
+from utils.pagination import KeysetPaginationInput, Page, SortKey, paginate_keyset
 from utils.supabase_auth import get_superadmin
 from sqlalchemy.orm import joinedload
 router = APIRouter(dependencies=[Depends(get_superadmin)])
@@ -28,21 +29,24 @@ class DocumentAdminResp(BaseModel):
 class DocumentAdminReq(BaseModel):
     doc_date: date | None = None
 
-@router.post('/hidden', response_model=list[DocumentAdminResp])
-def get_hidden_documents(req: DocumentAdminReq, db: Session = Depends(get_db)):
+def _hidden_documents_query(req: DocumentAdminReq, db: Session):
     db_req = db.query(Document) \
         .options(
-            joinedload(Document.account).load_only(Account.name), # Left Join
+            joinedload(Document.account).load_only(Account.name, Account.nric), # Left Join
             joinedload(Document.branch).load_only(Branch.name), # Left Join
         ) \
         .filter(
             Document.hidden == True,
+            # Documents without an account or branch are left out in SQL, so pages are filtered before paging
+            Document.account.has(),
+            Document.branch.has(),
             or_(Document.status == DocumentStatus.COMPLETE, Document.status == None)
         )
     if req.doc_date:
         db_req = db_req.filter(Document.document_date == req.doc_date)
-    documents = db_req.all()
+    return db_req
 
+def _document_admin_resp(documents: list[Document]):
     return [
         DocumentAdminResp(
             id=str(document.id),
@@ -56,9 +60,22 @@ def get_hidden_documents(req: DocumentAdminReq, db: Session = Depends(get_db)):
             document_date=document.document_date,
             last_updated=document.updated_at if document.updated_at else document.created_at
         ) 
-        for document in documents if document.account and document.branch
+        for document in documents
     ]
 
+@router.post('/hidden', response_model=list[DocumentAdminResp])
+def get_hidden_documents(req: DocumentAdminReq, db: Session = Depends(get_db)):
+    documents = _hidden_documents_query(req, db).all()
+    return _document_admin_resp(documents)
+
+@router.post('/hidden/paged', response_model=Page[DocumentAdminResp])
+def get_hidden_documents_paged(req: DocumentAdminReq, pagination: KeysetPaginationInput = Depends(), db: Session = Depends(get_db)):
+    page = paginate_keyset(
+        _hidden_documents_query(req, db), db, pagination,
+        [SortKey(Document.document_date, descending=True), SortKey(Document.id, descending=True)]
+    )
+    return Page[DocumentAdminResp](pager=page.pager, data=_document_admin_resp(page.data))
+
 class UpdateHiddenDocumentReq(BaseModel):
     id: str
 
@@ -1,18 +1,18 @@
 from datetime import date, datetime, timedelta
-from io import StringIO
-import csv
+from itertools import chain, groupby
 import json
 import logging
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import StreamingResponse
-from sqlalchemy import and_
+from sqlalchemy import and_, select
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 
 from models import get_db, Account, HealthReport, HealthReportProfile, IncomingReport, Measurement
 from utils.supabase_auth import get_superadmin
 from utils import sg_datetime
+from utils.export import csv_response, stream_csv, stream_query
 from repository.health_report.mapping import health_report_profiles
 from services.health_report import generate_health_report_pdf
 from scheduler_actions.sgimed_health_report_updates import generate_health_reports, _update_measurements_cron
@@ -44,7 +44,7 @@ class HealthReportListRequest(BaseModel):
     nrics: Optional[str] = None  # Comma-separated NRICs (e.g., "SxxxA,SxxxB")
 
 @router.post("/list", response_model=HealthReportListResponse)
-async def get_health_reports(
+def get_health_reports(
     request: HealthReportListRequest,
     page: int = Query(1, ge=1),
     limit: int = Query(50, ge=1, le=100),
@@ -133,8 +133,78 @@ async def get_health_reports(
         limit=limit
     )
 
+# Profile columns of the health report CSV export, followed by every test code
+CSV_PROFILE_COLUMNS = [
+    'clinical_assessment',
+    'haematology',
+    'renal_profile',
+    'diabetic_panel',
+    'liver_panel',
+    'lipid_panel',
+    'cardiac_risk_panel',
+    'thyroid_function_test',
+    'bone_joint_profile',
+    'hepatitis_profile',
+    'tumour_markers',
+    'anaemia_profile',
+    'std_screen',
+    'others',
+    'hormonal_profile',
+    'urine_analysis',
+    'stool_analysis',
+]
+
+def _health_report_csv_rows(rows, csv_cols: list[str]):
+    '''
+    One CSV row per report from the report rows joined with their profiles, ordered by report
+    Test results are pivoted into the test code columns as each profile row is read
+    '''
+    # Some test codes are in more than one profile, each of their columns gets the value
+    column_index: dict[str, list[int]] = {}
+    for i, col in enumerate(csv_cols):
+        column_index.setdefault(col, []).append(i)
+    for _, report_rows in groupby(rows, key=lambda row: row.sgimed_hl7_id):
+        row = next(report_rows)
+        row_data = [''] * len(csv_cols)
+        row_data[0] = row.sgimed_patient_id
+        row_data[1] = row.patient_nric or ''
+        row_data[2] = row.patient_name or ''
+        row_data[3] = sg_datetime.sg(row.sgimed_report_file_date).strftime('%Y-%m-%d %H:%M:%S')
+        row_data[4] = 'Yes' if row.disclaimer_accepted_at else 'No'
+
+        # Parse report summary for profile tags
+        try:
+            report_summary = json.loads(row.report_summary)
+            for profile in report_summary.get('profiles', []):
+                profile_id = profile.get('profile_id')
+                tag_id = profile.get('tag_id')
+                for i in column_index.get(profile_id, []):
+                    row_data[i] = tag_id
+        except Exception:
+            pass
+
+        for profile_row in chain([row], report_rows):
+            if profile_row.profile_report is None:
+                continue
+            try:
+                detail_report = json.loads(profile_row.profile_report)
+                for result in detail_report.get('results', []):
+                    test_code = result.get('test_code')
+                    value = result.get('value', '')
+
+                    # Clean up value (remove units if present)
+                    if ' ' in str(value):
+                        value = str(value).split(' ')[0]
+
+                    for i in column_index.get(test_code, []):
+                        row_data[i] = value
+            except Exception:
+                pass
+
+        yield row_data
+
 @router.get("/export/csv")
-async def export_health_reports_csv(
+def export_health_reports_csv(
     start_date: date,
     end_date: date,
     db: Session = Depends(get_db)
@@ -144,27 +214,35 @@ async def export_health_reports_csv(
     # Date range
     start_datetime = sg_datetime.midnight(start_date)
     end_datetime = sg_datetime.midnight(end_date) + timedelta(days=1)
-    
-    # Query reports with patient details
-    results = db.query(
-        HealthReport,
+    date_filter = and_(
+        HealthReport.sgimed_report_file_date >= start_datetime,
+        HealthReport.sgimed_report_file_date < end_datetime
+    )
+
+    if not db.query(HealthReport.sgimed_hl7_id).filter(date_filter).first():
+        raise HTTPException(status_code=404, detail="No health reports found for the specified date range")
+
+    # Reports with patient details and their profiles, one row per profile, streamed in report order
+    stmt = select(
+        HealthReport.sgimed_hl7_id,
+        HealthReport.sgimed_patient_id,
+        HealthReport.sgimed_report_file_date,
+        HealthReport.disclaimer_accepted_at,
+        HealthReport.report_summary,
         Account.nric.label('patient_nric'),
-        Account.name.label('patient_name')
+        Account.name.label('patient_name'),
+        HealthReportProfile.report.label('profile_report'),
     ).outerjoin(
         Account, Account.sgimed_patient_id == HealthReport.sgimed_patient_id
-    ).filter(
-        and_(
-            HealthReport.sgimed_report_file_date >= start_datetime,
-            HealthReport.sgimed_report_file_date < end_datetime
-        )
+    ).outerjoin(
+        HealthReportProfile, HealthReportProfile.sgimed_hl7_id == HealthReport.sgimed_hl7_id
+    ).where(
+        date_filter
     ).order_by(
-        HealthReport.sgimed_report_file_date.asc()
-    ).all()
-    
-    if not results:
-        raise HTTPException(status_code=404, detail="No health reports found for the specified date range")
-    
-    # Prepare CSV columns
+        HealthReport.sgimed_report_file_date.asc(),
+        HealthReport.sgimed_hl7_id.asc()
+    )
+
     csv_cols = [
         # Patient Details
         'patient_id',
@@ -172,92 +250,17 @@ async def export_health_reports_csv(
         'patient_name',
         'report_date',
         'disclaimer_accepted',
-        # Profiles
-        'clinical_assessment',
-        'haematology',
-        'renal_profile',
-        'diabetic_panel',
-        'liver_panel',
-        'lipid_panel',
-        'cardiac_risk_panel',
-        'thyroid_function_test',
-        'bone_joint_profile',
-        'hepatitis_profile',
-        'tumour_markers',
-        'anaemia_profile',
-        'std_screen',
-        'others',
-        'hormonal_profile',
-        'urine_analysis',
-        'stool_analysis',
-    ] + [
+    ] + CSV_PROFILE_COLUMNS + [
         test['test_code']
         for profile in health_report_profiles
         for test in profile['tests']
     ]
-    
-    # Create CSV in memory
-    output = StringIO()
-    writer = csv.DictWriter(output, fieldnames=csv_cols)
-    writer.writeheader()
-    
-    # Process each report
-    for report, nric, name in results:
-        row_data = {
-            'patient_id': report.sgimed_patient_id,
-            'nric': nric or '',
-            'patient_name': name or '',
-            'report_date': sg_datetime.sg(report.sgimed_report_file_date).strftime('%Y-%m-%d %H:%M:%S'),
-            'disclaimer_accepted': 'Yes' if report.disclaimer_accepted_at else 'No'
-        }
-        
-        # Parse report summary for profile tags
-        try:
-            report_summary = json.loads(report.report_summary)
-            for profile in report_summary.get('profiles', []):
-                profile_id = profile.get('profile_id')
-                tag_id = profile.get('tag_id')
-                if profile_id in csv_cols:
-                    row_data[profile_id] = tag_id
-        except Exception:
-            pass
-        
-        # Get profile details
-        profile_details = db.query(HealthReportProfile).filter(
-            HealthReportProfile.sgimed_hl7_id == report.sgimed_hl7_id
-        ).all()
-        
-        for profile_detail in profile_details:
-            try:
-                detail_report = json.loads(profile_detail.report)
-                for result in detail_report.get('results', []):
-                    test_code = result.get('test_code')
-                    value = result.get('value', '')
-                    
-                    # Clean up value (remove units if present)
-                    if ' ' in str(value):
-                        value = str(value).split(' ')[0]
-                    
-                    if test_code in csv_cols:
-                        row_data[test_code] = value
-            except Exception:
-                pass
-        
-        writer.writerow(row_data)
-    
-    # Prepare for streaming
-    output.seek(0)
-    
+
     filename = f"health_reports_{start_date}_{end_date}.csv"
-    
-    return StreamingResponse(
-        output,
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
+    return csv_response(stream_csv(csv_cols, _health_report_csv_rows(stream_query(stmt), csv_cols)), filename)
 
 @router.get("/export/pdf/{sgimed_hl7_id}")
-async def export_health_report_pdf(
+def export_health_report_pdf(
     sgimed_hl7_id: str,
     db: Session = Depends(get_db)
 ):
@@ -321,7 +324,7 @@ class RegenerateHealthReportResponse(BaseModel):
 
 
 @router.get("/measurements/{nric}", response_model=MeasurementsListResponse)
-async def get_measurements_by_nric(
+def get_measurements_by_nric(
     nric: str,
     db: Session = Depends(get_db)
 ):
@@ -366,7 +369,7 @@ async def get_measurements_by_nric(
 
 
 @router.post("/measurements/{nric}/update", response_model=UpdateMeasurementsResponse)
-async def update_measurements_by_nric(
+def update_measurements_by_nric(
     nric: str,
     db: Session = Depends(get_db)
 ):
@@ -404,7 +407,7 @@ async def update_measurements_by_nric(
 
 
 @router.post("/{nric}/regenerate", response_model=RegenerateHealthReportResponse)
-async def regenerate_health_report_by_nric(
+def regenerate_health_report_by_nric(
     nric: str,
     db: Session = Depends(get_db)
 ):
@@ -4,6 +4,7 @@ from typing import List, Optional
 from sqlalchemy.orm import Session
 
 from models import get_db, StAndrew
+from utils.bulk_import import copy_rows, create_temp_table, get_cursor
 from .utils import get_current_user
 
 router = APIRouter()
@@ -25,47 +26,50 @@ class MigrantWorkerBase(BaseModel):
     termination_date: Optional[str] = None
     handphone_no: Optional[str] = None
 
-def migrant_workers_dict(migrant_workers):
-    migrant_workers_dict = {}
-    keys_in_base = MigrantWorkerBase.__annotations__.keys()
-
-    for worker in migrant_workers:
-        worker_dict = {}
-        for key in keys_in_base:
-            if hasattr(worker, key):
-                worker_dict[key] = getattr(worker, key)
-                
-        migrant_workers_dict[worker.nric] = worker_dict
-
-    return migrant_workers_dict
+MIGRANT_WORKER_COLUMNS = list(MigrantWorkerBase.model_fields.keys())
+
+def copy_migrant_workers(cursor, migrant_workers: List[MigrantWorkerBase]) -> int:
+    '''
+    COPY migrant workers into the migrant_workers_import temp table, the last row of an nric wins
+    '''
+    unique_workers = { worker.nric: worker for worker in migrant_workers }
+    create_temp_table(cursor, 'migrant_workers_import', f'LIKE {StAndrew.__tablename__}')
+    return copy_rows(
+        cursor,
+        'migrant_workers_import',
+        MIGRANT_WORKER_COLUMNS,
+        ([getattr(worker, col) for col in MIGRANT_WORKER_COLUMNS] for worker in unique_workers.values())
+    )
 
 @router.post("/migrant-workers-options")
-async def migrant_workers_options(migrant_worker: List[MigrantWorkerBase], current_user = Depends(get_current_user), db = Depends(get_db)): 
-    current_workers = migrant_workers_dict(db.query(StAndrew).all())
-    uploaded_workers = migrant_workers_dict(migrant_worker)
-
+def migrant_workers_options(migrant_worker: List[MigrantWorkerBase], current_user = Depends(get_current_user), db = Depends(get_db)): 
+    cursor = get_cursor(db)
+    copy_migrant_workers(cursor, migrant_worker)
+
+    # Compare every column of the uploaded and current workers in the database
+    table = StAndrew.__tablename__
+    current_cols = ', '.join(f'current.{col}' for col in MIGRANT_WORKER_COLUMNS)
+    uploaded_cols = ', '.join(f'uploaded.{col}' for col in MIGRANT_WORKER_COLUMNS)
+    cursor.execute(f'''
+        SELECT
+            CASE WHEN current.nric IS NULL THEN 'INSERT' WHEN uploaded.nric IS NULL THEN 'DELETE' ELSE 'UPDATE' END,
+            COALESCE(uploaded.nric, current.nric)
+        FROM {table} AS current
+        FULL OUTER JOIN migrant_workers_import AS uploaded ON uploaded.nric = current.nric
+        WHERE current.nric IS NULL OR uploaded.nric IS NULL OR ROW({current_cols}) IS DISTINCT FROM ROW({uploaded_cols})
+    ''')
     res = {
         "INSERT": [],
         "UPDATE": [],
         "DELETE": [],
         "total_num_rows": 0
     }
+    for action, nric in cursor.fetchall():
+        res[action].append(nric)
 
-    common_workers = set(current_workers.keys()) & set(uploaded_workers.keys())
-
-    for nric in common_workers:
-        if current_workers[nric] != uploaded_workers[nric]:
-            res['UPDATE'].append(nric)  
-
-    new_workers = set(uploaded_workers.keys()) - set(current_workers.keys())
-    for nric in new_workers:
-        res['INSERT'].append(nric)
-
-    removed_workers = set(current_workers.keys()) - set(uploaded_workers.keys())
-    for nric in removed_workers:
-        res['DELETE'].append(nric)
-
-    res['total_num_rows'] = len(current_workers)
+    cursor.execute(f'SELECT count(*) FROM {table}')
+    res['total_num_rows'] = cursor.fetchone()[0]
+    db.rollback()
 
     return res
 
@@ -75,30 +79,23 @@ class MigrantWorkerUpload(BaseModel):
     UPDATE: Optional[List[MigrantWorkerBase]] = None
     DELETE: Optional[List[str]] = None
 
-def migrant_worker_insert(migrant_workers: List[MigrantWorkerBase], db: Session):
-    db.add_all([StAndrew(**worker.model_dump()) for worker in migrant_workers])
-
-def migrant_worker_update(migrant_workers: List[MigrantWorkerBase], db: Session):
-    rows = db.query(StAndrew).filter(StAndrew.nric.in_([mw.nric for mw in migrant_workers])).delete()
-    print(f"Rows Deleted: {rows}")
-    db.add_all([StAndrew(**worker.model_dump()) for worker in migrant_workers])
-
-def migrant_worker_delete(migrant_workers_nric: List[str], db: Session):    
-    rows = db.query(StAndrew).filter(StAndrew.nric.in_(migrant_workers_nric)).delete()
-    print(f"Rows Deleted: {rows}")
-
 @router.post("/migrant-workers-publish")
-async def publish_migrant_workers(migrant_worker_options: MigrantWorkerUpload, current_user = Depends(get_current_user), db = Depends(get_db)): 
-    handlers = {
-        "INSERT": migrant_worker_insert,
-        "UPDATE": migrant_worker_update,
-        "DELETE": migrant_worker_delete
-    }
+def publish_migrant_workers(migrant_worker_options: MigrantWorkerUpload, current_user = Depends(get_current_user), db = Depends(get_db)): 
+    table = StAndrew.__tablename__
     try:
-        for key, handler in handlers.items():
-            items = getattr(migrant_worker_options, key)
-            if items:
-                handler(items, db)
+        cursor = get_cursor(db)
+        # Updated workers are replaced, inserted workers must not exist yet
+        removed_nrics = [worker.nric for worker in migrant_worker_options.UPDATE or []] + (migrant_worker_options.DELETE or [])
+        if removed_nrics:
+            cursor.execute(f'DELETE FROM {table} WHERE nric = ANY(%s)', (removed_nrics,))
+            print(f"Rows Deleted: {cursor.rowcount}")
+
+        workers = (migrant_worker_options.INSERT or []) + (migrant_worker_options.UPDATE or [])
+        if workers:
+            copy_migrant_workers(cursor, workers)
+            columns = ', '.join(MIGRANT_WORKER_COLUMNS)
+            cursor.execute(f'INSERT INTO {table} ({columns}) SELECT {columns} FROM migrant_workers_import')
+            print(f"Rows Inserted: {cursor.rowcount}")
         
         db.commit()
         return { "success": True }
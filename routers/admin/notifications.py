@@ -1,11 +1,15 @@
+from enum import Enum
+import logging
+from uuid import uuid4
 from pydantic import BaseModel
 from sqlalchemy import or_
-from sqlalchemy.orm import Session
-from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session, selectinload
+from fastapi import APIRouter, Depends, HTTPException
 from models import get_db
 from models.patient import Account, AccountFirebase
-from utils.fastapi import SuccessResp
-from utils.notifications import send_patient_notification
+from utils import redis_cache
+from utils.executors import notification_executor
+from utils.notifications import PushNotification, send_patient_notifications
 from utils.supabase_auth import get_superadmin
 
 router = APIRouter(dependencies=[Depends(get_superadmin)])
@@ -46,15 +50,54 @@ class NotificationReq(BaseModel):
     title: str
     message: str
 
-@router.post('/send')
+class NotificationJobStatus(str, Enum):
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+class NotificationJobResp(BaseModel):
+    success: bool = True
+    job_id: str
+    status: NotificationJobStatus
+    total: int = 0 # Push tokens to send to
+    processed: int = 0
+    sent: int = 0
+
+NOTIFICATION_JOB_TTL = 86400 # 1 day
+
+def _save_job(job: NotificationJobResp):
+    redis_cache.set_json(f"notification_job:{job.job_id}", job.model_dump(mode='json'), ttl=NOTIFICATION_JOB_TTL)
+
+def run_notification_job(job: NotificationJobResp, notifications: list[PushNotification]):
+    def on_progress(processed: int, total: int, sent: int):
+        job.processed, job.total, job.sent = processed, total, sent
+        _save_job(job)
+
+    try:
+        send_patient_notifications(notifications, on_progress)
+        job.status = NotificationJobStatus.COMPLETED
+    except Exception as e:
+        logging.error(f"Notification Job {job.job_id} failed: {e}", exc_info=True)
+        job.status = NotificationJobStatus.FAILED
+    _save_job(job)
+
+@router.post('/send', response_model=NotificationJobResp)
 def send_notification(req: NotificationReq, db: Session = Depends(get_db)):
-    users = db.query(Account).filter(Account.id.in_(req.ids)).all()
-    for i, user in enumerate(users):
-        # TODO: Issue it as background task or make it async
-        send_patient_notification(
-            user,
-            req.title,
-            req.message,
-        )
-
-    return SuccessResp(success=True)
+    users = db.query(Account).options(selectinload(Account.firebase_auths)).filter(Account.id.in_(req.ids)).all()
+    notifications = [PushNotification.from_account(user, req.title, req.message) for user in users]
+
+    job = NotificationJobResp(
+        job_id=str(uuid4()),
+        status=NotificationJobStatus.RUNNING,
+        total=sum(len(notification.push_tokens) for notification in notifications),
+    )
+    _save_job(job)
+    notification_executor.submit(run_notification_job, job, notifications)
+    return job
+
+@router.get('/send/{job_id}', response_model=NotificationJobResp)
+def get_notification_job(job_id: str):
+    job = redis_cache.get_json(f"notification_job:{job_id}")
+    if not job:
+        raise HTTPException(status_code=404, detail="Notification job not found")
+    return NotificationJobResp.model_validate(job)
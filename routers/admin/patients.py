@@ -1,31 +1,19 @@
 from enum import Enum
 import json
-import math
-from typing import Self
 from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel, model_validator
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from models import get_db
 from models.patient import Account
 from models.redis_models import RedisLoginState
 from utils.fastapi import SuccessResp
+from utils.pagination import KeysetPaginationInput, Pager, SortKey, paginate_keyset
 from utils.integrations.sgimed import update_patient_data
 from utils.supabase_auth import get_superadmin
 from config import redis_client
 
 router = APIRouter(dependencies=[Depends(get_superadmin)])
 
-class Pager(BaseModel):
-    p: int = 1
-    rows: int
-    n: int = 20
-    pages: int = 0
-    
-    @model_validator(mode='after')
-    def check_passwords_match(self) -> Self:
-        self.pages = math.ceil(self.rows / self.n)
-        return self
-
 class PatientDetailsDiff(BaseModel):
     user_id: str
     sgimed_patient_id: str
@@ -38,15 +26,13 @@ class PatientDiffResp(BaseModel):
     data: list[PatientDetailsDiff]
 
 @router.get('/diff', response_model=PatientDiffResp)
-def get_patient_diffs(page: int = 1, db: Session = Depends(get_db)):
+def get_patient_diffs(pagination: KeysetPaginationInput = Depends(), db: Session = Depends(get_db)):
     qry = db.query(Account).filter(Account.sgimed_diff != None)
-    pager = Pager(p=page, rows=qry.count())
-    offset = (pager.p - 1) * pager.n
-    limit = pager.n
-    accounts = qry.order_by(Account.created_at).offset(offset).limit(limit).all()
+    page = paginate_keyset(qry, db, pagination, [SortKey(Account.created_at), SortKey(Account.id)])
+    accounts: list[Account] = page.data
 
     return PatientDiffResp(
-        pager=pager,
+        pager=page.pager,
         data=[
             PatientDetailsDiff(
                 user_id=str(acc.id),
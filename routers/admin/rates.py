@@ -5,6 +5,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from models import get_db
 from models.payments import DynamicPricing
 from models.sgimed import SGiMedInventory
+from services.pricing import invalidate_pricing_rules
 from utils.fastapi import SuccessResp
 from utils.supabase_auth import get_superadmin
 
@@ -225,12 +226,14 @@ def upsert_dynamic_rates(req: DynamicPricingRow, db: Session = Depends(get_db)):
         db.add(pricing)
 
     db.commit()
+    invalidate_pricing_rules()
     return SuccessResp(success=True)
 
 @router.delete('/{id}', response_model=SuccessResp)
 def delete_dynamic_rates(id: int, db: Session = Depends(get_db)):
     rows = db.query(DynamicPricing).filter(DynamicPricing.id == id).delete()
     db.commit()
+    invalidate_pricing_rules()
     if not rows:
         raise HTTPException(status_code=404, detail="Dynamic pricing record not found")
     return SuccessResp(success=True)
@@ -1,5 +1,6 @@
 import asyncio
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, WebSocketException, status
+from fastapi.concurrency import run_in_threadpool
 
 from models import SessionLocal
 from models.model_enums import VisitType
@@ -9,15 +10,15 @@ from routers.realtime import ws_manager
 
 router = APIRouter()
 
-
+def pinnacle_account_exists(supabase_uid: str) -> bool:
+    with SessionLocal() as db:
+        return db.query(PinnacleAccount.id).filter(PinnacleAccount.supabase_uid == supabase_uid).first() is not None
 
 @router.websocket("/teleconsult/ws")
 async def teleconsult_websocket(id: str, date: date, websocket: WebSocket):
-    with SessionLocal() as db:
-        user = db.query(PinnacleAccount).filter(PinnacleAccount.supabase_uid == id).first()
-        if not user:
-            raise WebSocketException(status.WS_1008_POLICY_VIOLATION, "Invalid Request")
-        
+    if not await run_in_threadpool(pinnacle_account_exists, id):
+        raise WebSocketException(status.WS_1008_POLICY_VIOLATION, "Invalid Request")
+
     await ws_manager.connect_admin(websocket, id, date, VisitType.TELECONSULT)
 
     try:
@@ -31,11 +32,9 @@ async def teleconsult_websocket(id: str, date: date, websocket: WebSocket):
 
 @router.websocket("/walkin/ws")
 async def walkin_websocket(id: str, date: date, websocket: WebSocket):
-    with SessionLocal() as db:
-        user = db.query(PinnacleAccount).filter(PinnacleAccount.supabase_uid == id).first()
-        if not user:
-            raise WebSocketException(status.WS_1008_POLICY_VIOLATION, "Invalid Request")
-        
+    if not await run_in_threadpool(pinnacle_account_exists, id):
+        raise WebSocketException(status.WS_1008_POLICY_VIOLATION, "Invalid Request")
+
     await ws_manager.connect_admin(websocket, id, date, VisitType.WALKIN)
 
     try:
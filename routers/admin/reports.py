@@ -1,58 +1,47 @@
 from datetime import date, timedelta
-from io import StringIO
-import csv
+from itertools import chain
+from typing import Iterable
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-from models import get_db
+from sqlalchemy import select
 from models.payments import PaymentMethod, PaymentProvider, PaymentReconciliation, PaymentType
 from utils.supabase_auth import get_superadmin
 from utils import sg_datetime
+from utils.export import csv_response, stream_csv, stream_query
 
 router = APIRouter(dependencies=[Depends(get_superadmin)])
 
 def convert_sqlalchemy_to_csv(
-    db_results: list,
+    model,
+    db_results: Iterable,
     header_mapping: dict = {},
     header_exclusions: list = [],
     filename: str = "export.csv",
     content_render: dict = {}
 ):
-    # Handle empty result set
-    if not db_results:
+    # Handle empty result set, the first row is read before streaming so the error can still be returned
+    db_results = iter(db_results)
+    first_result = next(db_results, None)
+    if first_result is None:
         raise HTTPException(status_code=500, detail="No data to export")
 
-    # Create a string buffer to write CSV
-    output = StringIO()
-    writer = csv.writer(output)
-
-    # Write headers (using first object's attributes)
-    first_result = db_results[0]
     headers = [
         column.name
-        for column in first_result.__table__.columns
+        for column in model.__table__.columns
         if column.name not in header_exclusions
     ]
-    writer.writerow([header_mapping.get(header, header) for header in headers])
-
-    # Write data rows
-    for result in db_results:
-        row = [
+    rows = (
+        [
             content_render.get(header, lambda x: x)(getattr(result, header))
             for header in headers
         ]
-        writer.writerow(row)
-
-    # Prepare for streaming
-    output.seek(0)
-
-    return StreamingResponse(
-        output,
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+        for result in chain([first_result], db_results)
+    )
+    return csv_response(
+        stream_csv([header_mapping.get(header, header) for header in headers], rows),
+        filename
     )
 
-def download_reconciliation_csv(db: Session, records: list[PaymentReconciliation], csv_filename: str):
+def download_reconciliation_csv(records: Iterable[PaymentReconciliation], csv_filename: str):
     header_mapping = {
         "payment_id": "Transaction ID",
         "payment_type": "Transaction Category",
@@ -91,6 +80,7 @@ def download_reconciliation_csv(db: Session, records: list[PaymentReconciliation
     ]
 
     return convert_sqlalchemy_to_csv(
+        PaymentReconciliation,
         records,
         header_mapping,
         header_exclusions,
@@ -99,13 +89,13 @@ def download_reconciliation_csv(db: Session, records: list[PaymentReconciliation
     )
 
 @router.get("/reconciliation")
-async def export_reconciliation_report(start_date: date, end_date: date, db: Session = Depends(get_db)):
-    records = db.query(PaymentReconciliation) \
+def export_reconciliation_report(start_date: date, end_date: date):
+    stmt = select(PaymentReconciliation) \
         .order_by(PaymentReconciliation.completed_at.asc()) \
         .filter(
             PaymentReconciliation.completed_at >= sg_datetime.midnight(start_date),
             PaymentReconciliation.completed_at < sg_datetime.midnight(end_date) + timedelta(days=1)
-        ) \
-        .all()
+        )
+    records = stream_query(stmt, scalars=True)
 
-    return download_reconciliation_csv(db, records, csv_filename=f'{start_date}-{end_date}_reconciliation_report.csv')
+    return download_reconciliation_csv(records, csv_filename=f'{start_date}-{end_date}_reconciliation_report.csv')
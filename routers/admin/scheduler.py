@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Query
+from pydantic import BaseModel
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from models import get_db
+from models.backend import SchedulerJobRun, SchedulerJobRunStatus
+from utils.pagination import KeysetPaginationInput, Page, SortKey, paginate_keyset
+from utils.supabase_auth import get_superadmin
+
+router = APIRouter(dependencies=[Depends(get_superadmin)])
+
+class SchedulerJobRunResponse(BaseModel):
+    id: int
+    job_name: str
+    node: str
+    status: SchedulerJobRunStatus
+    started_at: datetime
+    finished_at: Optional[datetime]
+    duration: Optional[float]
+    rows_processed: int
+    sgimed_calls: int
+    error: Optional[str]
+
+    model_config = {"from_attributes": True}
+
+@router.get("/runs", response_model=Page[SchedulerJobRunResponse])
+def get_scheduler_job_runs(
+    job_name: Optional[str] = None,
+    status: Optional[SchedulerJobRunStatus] = None,
+    pagination: KeysetPaginationInput = Depends(),
+    db: Session = Depends(get_db)
+):
+    """Get the run history of the scheduler jobs, latest first"""
+    query = db.query(SchedulerJobRun)
+    if job_name:
+        query = query.filter(SchedulerJobRun.job_name == job_name)
+    if status:
+        query = query.filter(SchedulerJobRun.status == status)
+
+    page = paginate_keyset(
+        query, db, pagination,
+        [SortKey(SchedulerJobRun.started_at, descending=True), SortKey(SchedulerJobRun.id, descending=True)]
+    )
+    return Page[SchedulerJobRunResponse](pager=page.pager, data=[SchedulerJobRunResponse.model_validate(run) for run in page.data])
+
+class SchedulerJobSummary(BaseModel):
+    job_name: str
+    last_run: SchedulerJobRunResponse
+    runs: int
+    failures: int
+    avg_duration: Optional[float]
+    max_duration: Optional[float]
+    rows_processed: int
+    sgimed_calls: int
+
+@router.get("/jobs", response_model=List[SchedulerJobSummary])
+def get_scheduler_jobs(hours: int = Query(24, ge=1, le=24 * 30), db: Session = Depends(get_db)):
+    """Get the last run of every scheduler job and its run statistics over the last hours"""
+    since = func.now() - timedelta(hours=hours)
+    stats = db.query(
+        SchedulerJobRun.job_name,
+        func.count(SchedulerJobRun.id),
+        func.count(case((SchedulerJobRun.status.in_([SchedulerJobRunStatus.FAILED, SchedulerJobRunStatus.STALE]), 1))),
+        func.avg(SchedulerJobRun.duration),
+        func.max(SchedulerJobRun.duration),
+        func.coalesce(func.sum(SchedulerJobRun.rows_processed), 0),
+        func.coalesce(func.sum(SchedulerJobRun.sgimed_calls), 0),
+    ).filter(SchedulerJobRun.started_at > since).group_by(SchedulerJobRun.job_name).all()
+    stats_dict = { row[0]: row[1:] for row in stats }
+
+    # Run ids increase with their start time
+    last_run_ids = select(func.max(SchedulerJobRun.id)).group_by(SchedulerJobRun.job_name)
+    last_runs = db.query(SchedulerJobRun) \
+        .filter(SchedulerJobRun.id.in_(last_run_ids)) \
+        .order_by(SchedulerJobRun.job_name) \
+        .all()
+
+    summaries = []
+    for run in last_runs:
+        runs, failures, avg_duration, max_duration, rows_processed, sgimed_calls = stats_dict.get(run.job_name, (0, 0, None, None, 0, 0))
+        summaries.append(SchedulerJobSummary(
+            job_name=run.job_name,
+            last_run=SchedulerJobRunResponse.model_validate(run),
+            runs=runs,
+            failures=failures,
+            avg_duration=float(avg_duration) if avg_duration is not None else None,
+            max_duration=max_duration,
+            rows_processed=rows_processed,
+            sgimed_calls=sgimed_calls,
+        ))
+    return summaries
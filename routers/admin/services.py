@@ -262,7 +262,7 @@ def get_one(
 
 
 @router.post("/", response_model=ServiceResponse)
-async def create(
+def create(
     specialisation_id: int = Form(...),
     service_name: str = Form(...),
     clinic_name: str = Form(...),
@@ -313,7 +313,7 @@ async def create(
     if image and image.filename:
         sanitized_name = re.sub(r'[^a-zA-Z0-9_-]', '_', service_name)
         filename = f'services/{sanitized_name}_{uuid.uuid4()}{osp.splitext(image.filename)[-1]}'
-        bytes_data = await image.read()
+        bytes_data = image.file.read()
         ctype = image.content_type if image.content_type else 'image/jpeg'
         supabase.storage.from_(SUPABASE_UPLOAD_BUCKET).upload(
             file=bytes_data, path=filename, file_options={"content-type": ctype, "upsert": "true"}
@@ -324,7 +324,7 @@ async def create(
     if clinic_logo and clinic_logo.filename:
         sanitized_name = re.sub(r'[^a-zA-Z0-9_-]', '_', service_name)
         filename = f'services/{sanitized_name}_logo_{uuid.uuid4()}{osp.splitext(clinic_logo.filename)[-1]}'
-        bytes_data = await clinic_logo.read()
+        bytes_data = clinic_logo.file.read()
         ctype = clinic_logo.content_type if clinic_logo.content_type else 'image/jpeg'
         supabase.storage.from_(SUPABASE_UPLOAD_BUCKET).upload(
             file=bytes_data, path=filename, file_options={"content-type": ctype, "upsert": "true"}
@@ -335,7 +335,7 @@ async def create(
     if banner_image and banner_image.filename:
         sanitized_name = re.sub(r'[^a-zA-Z0-9_-]', '_', service_name)
         filename = f'services/{sanitized_name}_banner_{uuid.uuid4()}{osp.splitext(banner_image.filename)[-1]}'
-        bytes_data = await banner_image.read()
+        bytes_data = banner_image.file.read()
         ctype = banner_image.content_type if banner_image.content_type else 'image/jpeg'
         supabase.storage.from_(SUPABASE_UPLOAD_BUCKET).upload(
             file=bytes_data, path=filename, file_options={"content-type": ctype, "upsert": "true"}
@@ -378,7 +378,7 @@ async def create(
 
 
 @router.patch("/{service_id}", response_model=ServiceResponse)
-async def update(
+def update(
     service_id: int,
     specialisation_id: Optional[int] = Form(None),
     service_name: str = Form(""),
@@ -432,7 +432,7 @@ async def update(
         current_name = service_name if service_name else record.service_name
         sanitized_name = re.sub(r'[^a-zA-Z0-9_-]', '_', current_name)
         filename = f'services/{sanitized_name}_{uuid.uuid4()}{osp.splitext(image.filename)[-1]}'
-        bytes_data = await image.read()
+        bytes_data = image.file.read()
         ctype = image.content_type if image.content_type else 'image/jpeg'
         supabase.storage.from_(SUPABASE_UPLOAD_BUCKET).upload(
             file=bytes_data, path=filename, file_options={"content-type": ctype, "upsert": "true"}
@@ -443,7 +443,7 @@ async def update(
         current_name = service_name if service_name else record.service_name
         sanitized_name = re.sub(r'[^a-zA-Z0-9_-]', '_', current_name)
         filename = f'services/{sanitized_name}_logo_{uuid.uuid4()}{osp.splitext(clinic_logo.filename)[-1]}'
-        bytes_data = await clinic_logo.read()
+        bytes_data = clinic_logo.file.read()
         ctype = clinic_logo.content_type if clinic_logo.content_type else 'image/jpeg'
         supabase.storage.from_(SUPABASE_UPLOAD_BUCKET).upload(
             file=bytes_data, path=filename, file_options={"content-type": ctype, "upsert": "true"}
@@ -454,7 +454,7 @@ async def update(
         current_name = service_name if service_name else record.service_name
         sanitized_name = re.sub(r'[^a-zA-Z0-9_-]', '_', current_name)
         filename = f'services/{sanitized_name}_banner_{uuid.uuid4()}{osp.splitext(banner_image.filename)[-1]}'
-        bytes_data = await banner_image.read()
+        bytes_data = banner_image.file.read()
         ctype = banner_image.content_type if banner_image.content_type else 'image/jpeg'
         supabase.storage.from_(SUPABASE_UPLOAD_BUCKET).upload(
             file=bytes_data, path=filename, file_options={"content-type": ctype, "upsert": "true"}
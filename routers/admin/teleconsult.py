@@ -3,7 +3,6 @@ from pydantic import BaseModel
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import select, func, text
 from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import StreamingResponse
 from models import get_db
 from models.document import Document
 from models.model_enums import PatientType, TeleconsultStatus
@@ -16,9 +15,8 @@ from utils import sg_datetime
 from utils.fastapi import SuccessResp
 from utils.integrations.sgimed import fetch_invoice_details, get_invoice_by_visit_id, update_queue_instructions
 from utils.supabase_auth import get_admin_or_superadmin
+from utils.export import csv_response, stream_csv, stream_query
 from datetime import date, datetime, timedelta
-import csv
-import io
 
 router = APIRouter(dependencies=[Depends(get_admin_or_superadmin)])
 
@@ -168,7 +166,7 @@ class UntagDoctorParams(BaseModel):
     id: str
 
 @router.post('/untag_doctor', response_model=SuccessResp)
-async def untag_doctor(req: UntagDoctorParams, db: Session = Depends(get_db)):
+def untag_doctor(req: UntagDoctorParams, db: Session = Depends(get_db)):
     updated = db.query(Teleconsult) \
         .filter(Teleconsult.id == req.id) \
         .update({Teleconsult.doctor_id: None})
@@ -189,24 +187,10 @@ def update_status(req: UpdateStatusParams, db: Session = Depends(get_db)):
     db.commit()
     return SuccessResp(success=bool(updated))
 
-class TeleconsultReportResp(BaseModel):
-    patient_name: str
-    patient_id: str
-    teleconsult_date: Optional[date] = None
-    duration: Optional[str] = None
-    doctor_name: Optional[str] = None
-    status: str
-    checkin_time: datetime
-    teleconsult_start_time: Optional[datetime] = None
-    teleconsult_join_time: Optional[datetime] = None
-    teleconsult_end_time: Optional[datetime] = None
-    checkout_time: Optional[datetime] = None
-
 @router.get('/report')
 def get_teleconsult_report(
     start_date: date = Query(..., description="Start date for checkin time filter"),
     end_date: date = Query(..., description="End date for checkin time filter"),
-    db: Session = Depends(get_db)
 ):
     """
     Get teleconsult report with patient, doctor, timing information.
@@ -249,75 +233,44 @@ def get_teleconsult_report(
     # Order by checkin_time
     stmt = stmt.order_by(Teleconsult.checkin_time.asc())
 
-    # Execute the query
-    result = db.execute(stmt)
-    rows = result.fetchall()
-
-    # Convert rows to response model
-    teleconsult_reports = []
-    for row in rows:
-        # Format duration as string if it exists
-        duration_str = None
-        if row.duration:
-            total_seconds = int(row.duration.total_seconds())
-            hours = total_seconds // 3600
-            minutes = (total_seconds % 3600) // 60
-            seconds = total_seconds % 60
-            duration_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-
-        teleconsult_reports.append(TeleconsultReportResp(
-            patient_name=row.patient_name or "",
-            patient_id=row.patient_id or "",
-            teleconsult_date=row.teleconsult_date,
-            duration=duration_str,
-            doctor_name=row.doctor_name,
-            status=row.status.value if row.status else "",
-            checkin_time=row.checkin_time,
-            teleconsult_start_time=row.teleconsult_start_time,
-            teleconsult_join_time=row.teleconsult_join_time,
-            teleconsult_end_time=row.teleconsult_end_time,
-            checkout_time=row.checkout_time
-        ))
-
-    # Create CSV in memory
-    output = io.StringIO()
-    writer = csv.DictWriter(
-        output,
-        fieldnames=[
-            'patient_name', 'patient_id', 'teleconsult_date', 'duration',
-            'doctor_name', 'status', 'checkin_time', 'teleconsult_start_time',
-            'teleconsult_join_time', 'teleconsult_end_time', 'checkout_time'
+    def format_duration(duration: Optional[timedelta]):
+        if not duration:
+            return ''
+        total_seconds = int(duration.total_seconds())
+        hours = total_seconds // 3600
+        minutes = (total_seconds % 3600) // 60
+        seconds = total_seconds % 60
+        return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+    def format_time(value: Optional[datetime]):
+        return str(value) if value else ''
+
+    headers = [
+        'patient_name', 'patient_id', 'teleconsult_date', 'duration',
+        'doctor_name', 'status', 'checkin_time', 'teleconsult_start_time',
+        'teleconsult_join_time', 'teleconsult_end_time', 'checkout_time'
+    ]
+    # Rows are streamed from a server side cursor straight into the CSV
+    rows = (
+        [
+            row.patient_name or "",
+            row.patient_id or "",
+            str(row.teleconsult_date) if row.teleconsult_date else '',
+            format_duration(row.duration),
+            row.doctor_name or '',
+            row.status.value if row.status else "",
+            str(row.checkin_time),
+            format_time(row.teleconsult_start_time),
+            format_time(row.teleconsult_join_time),
+            format_time(row.teleconsult_end_time),
+            format_time(row.checkout_time),
         ]
+        for row in stream_query(stmt)
     )
-    writer.writeheader()
-
-    for report in teleconsult_reports:
-        writer.writerow({
-            'patient_name': report.patient_name,
-            'patient_id': report.patient_id,
-            'teleconsult_date': str(report.teleconsult_date) if report.teleconsult_date else '',
-            'duration': report.duration or '',
-            'doctor_name': report.doctor_name or '',
-            'status': report.status,
-            'checkin_time': str(report.checkin_time),
-            'teleconsult_start_time': str(report.teleconsult_start_time) if report.teleconsult_start_time else '',
-            'teleconsult_join_time': str(report.teleconsult_join_time) if report.teleconsult_join_time else '',
-            'teleconsult_end_time': str(report.teleconsult_end_time) if report.teleconsult_end_time else '',
-            'checkout_time': str(report.checkout_time) if report.checkout_time else ''
-        })
-
-    # Get CSV content and reset position
-    output.seek(0)
 
     # Create filename with date range
     start_str = start_date.strftime('%Y%m%d')
     end_str = end_date.strftime('%Y%m%d')
     filename = f"teleconsult_report_{start_str}_to_{end_str}.csv"
 
-    return StreamingResponse(
-        io.BytesIO(output.getvalue().encode()),
-        media_type='text/csv',
-        headers={
-            "Content-Disposition": f"attachment; filename={filename}"
-        }
-    )
+    return csv_response(stream_csv(headers, rows), filename)
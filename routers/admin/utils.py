@@ -1,13 +1,13 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jwt.exceptions import ExpiredSignatureError, PyJWTError, InvalidTokenError
-from config import supabase
+from utils.supabase_auth import verify_supabase_token
 import logging
 
 auth_scheme = HTTPBearer()
 logger = logging.getLogger(__name__)
 
-async def get_current_user(token: HTTPAuthorizationCredentials = Depends(auth_scheme)):
+def get_current_user(token: HTTPAuthorizationCredentials = Depends(auth_scheme)):
     """
     Validate the JWT token from the Authorization header.
     Returns user info if valid, raises 401 if expired or invalid.
@@ -19,18 +19,11 @@ async def get_current_user(token: HTTPAuthorizationCredentials = Depends(auth_sc
                 detail="No token provided",
             )
         
-        user = supabase.auth.get_user(token.credentials)
-        if user is None:
-            logger.warning("Supabase returned None for user - token may be invalid or expired")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token is invalid or has expired. Please log in again.",
-            )
+        supabase_uid = verify_supabase_token(token.credentials)
 
         # TODO: Check the user metadata to determine if the user is an admin or doctor
 
-        user_obj = user.user
-        return {"user_id": user_obj.id}
+        return {"user_id": supabase_uid}
         
     except HTTPException:
         # Re-raise HTTPExceptions as-is
@@ -30,6 +30,7 @@ from utils.supabase_s3 import (
 )
 from config import SGIMED_MEDICATION_ITEM_TYPE, SUPABASE_PRIVATE_BUCKET
 from utils.excel import create_excel_with_styled_header
+from utils.export import iter_file
 from routers.delivery.typings.delivery import TeleconsultDeliveryFamily, DriverFetchingResponse, UpdateBulkTeleconsultDeliveryStatusRequest
 from routers.delivery.actions.zone import (
     RetrievePinnacleZoneResponse,
@@ -587,7 +588,7 @@ def update_teleconsult_delivery(request: UpdateTeleconsultDeliveryRequest, db: S
     db.commit()
     return SuccessResp(success=True)
 
-async def dispatch_update_teleconsult_delivery_status_action(request: DispatchUpdateTeleconsultDeliveryStatusRequest, user: SupabaseUser, db: Session, file: UploadFile | None = None):
+def dispatch_update_teleconsult_delivery_status_action(request: DispatchUpdateTeleconsultDeliveryStatusRequest, user: SupabaseUser, db: Session, file: UploadFile | None = None):
     teleconsult_delivery = (
         db.query(TeleconsultDelivery)
         .filter(TeleconsultDelivery.id == request.id)
@@ -614,7 +615,7 @@ async def dispatch_update_teleconsult_delivery_status_action(request: DispatchUp
         if not file:
             logging.error(f"Delivery note file was not provided for teleconsult delivery {teleconsult_delivery.id}")
         else:
-            delivery_note_key = await upload_delivery_note_action(teleconsult_delivery, file)
+            delivery_note_key = upload_delivery_note_action(teleconsult_delivery, file)
 
     teleconsult_deliveries = (
         get_grouping_teleconsult_deliveries_by_delivery_object_for_updating(
@@ -649,9 +650,9 @@ async def dispatch_update_teleconsult_delivery_status_action(request: DispatchUp
     db.commit()
     return SuccessResp(success=True)
 
-async def upload_delivery_note_action(teleconsult_delivery: TeleconsultDelivery, file: UploadFile):
+def upload_delivery_note_action(teleconsult_delivery: TeleconsultDelivery, file: UploadFile):
     key = f"delivery_note/{teleconsult_delivery.id}.pdf"
-    file_bytes = await file.read()
+    file_bytes = file.file.read()
     upload_pdf(SUPABASE_PRIVATE_BUCKET, key, file_bytes)
 
     return key
@@ -678,6 +679,9 @@ def logistic_download_delivery_note_by_date_action(date: date, db: Session):
             TeleconsultDelivery.delivery_date == date,
             TeleconsultDelivery.is_delivery_note_exists == True,
         )
+        .options(
+            joinedload(TeleconsultDelivery.patient_account).load_only(Account.sgimed_patient_given_id, Account.name),
+        )
         .all()
     )
 
@@ -738,7 +742,7 @@ def logistic_export_delivery_sheet_action(db: Session, date: Optional[date] = No
         "Zone",
     ]
 
-    data_rows = [
+    data_rows = (
         [
             delivery.combined_queue_number,
             delivery.combined_sgimed_patient_id,
@@ -754,8 +758,8 @@ def logistic_export_delivery_sheet_action(db: Session, date: Optional[date] = No
             delivery.zone.value.title() + (" - Zone F" if delivery.is_migrant_area and delivery.is_migrant else ''),
         ]
         for delivery in teleconsult_deliveries
-    ]
-    excel_buffer = create_excel_with_styled_header(headers, data_rows)
+    )
+    excel_buffer = create_excel_with_styled_header(headers, data_rows, write_only=True)
 
     # Generate Excel File Name
     filename: str = ''
@@ -764,7 +768,7 @@ def logistic_export_delivery_sheet_action(db: Session, date: Optional[date] = No
     filename += f'delivery_sheet_{selected_date.strftime("%Y-%m-%d")}.xlsx' if selected_date else 'upcoming_delivery_sheet.xlsx'
 
     return StreamingResponse(
-        excel_buffer,
+        iter_file(excel_buffer),
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         headers={"Content-Disposition": f"attachment; filename={filename}"},
     )
@@ -819,7 +823,7 @@ def logistic_export_end_day_report_action(date: date, db: Session):
         "Delivery Time",
     ]
 
-    data_rows = [
+    data_rows = (
         [
             delivery.combined_queue_number,
             delivery.combined_sgimed_patient_id,
@@ -844,12 +848,12 @@ def logistic_export_end_day_report_action(date: date, db: Session):
             ),
         ]
         for delivery in teleconsult_deliveries
-    ]
+    )
 
-    excel_buffer = create_excel_with_styled_header(headers, data_rows)
+    excel_buffer = create_excel_with_styled_header(headers, data_rows, write_only=True)
 
     return StreamingResponse(
-        excel_buffer,
+        iter_file(excel_buffer),
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         headers={
             "Content-Disposition": f"attachment; filename=end_day_report_{date}.xlsx"
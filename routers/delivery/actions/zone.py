@@ -1,3 +1,6 @@
+import time
+from threading import Lock
+from typing import Optional
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
 from models.delivery import DeliveryZone
@@ -10,6 +13,7 @@ from routers.delivery.typings.zone import (
 from models.delivery import PinnacleZone
 from collections import defaultdict
 from pydantic import BaseModel
+from utils.redis_cache import bump_version, get_versions
 
 def group_sector_codes_into_ranges(codes: set[str]) -> list[str]:
     # Convert to sorted list of integers
@@ -114,23 +118,46 @@ def _generate_retrieve_pinnacle_zone_response(zone: PinnacleZone | None):
         is_migrant_area=zone.is_migrant_area if zone else False,
     )
 
-def retrieve_pinnacle_zone_by_sector_codes(sector_codes: list[str], db: Session):
-    uniq_sector_codes = list(set(sector_codes))
-    records = db.query(PinnacleZone) \
-        .filter(PinnacleZone.sector_code.in_(uniq_sector_codes)) \
-        .all()
-    records_dict = {zone.sector_code: zone for zone in records}
+# Sector code -> zone index of the (at most 82) sector codes, loaded once per process
+# edit_pinnacle_zone bumps the version so every worker reloads the index on its next lookup
+ZONE_INDEX_VERSION_KEY = 'delivery_zone_index:version'
+# Other workers pick up edits on the next version check, the max age bounds staleness when Redis is down
+ZONE_INDEX_MAX_AGE = 300 # 5 mins
+_zone_index_lock = Lock()
+_zone_index: dict[str, RetrievePinnacleZoneResponse] = {}
+_zone_index_version: Optional[int] = None
+_zone_index_loaded_at = 0.0
+
+def get_pinnacle_zone_index(db: Session) -> dict[str, RetrievePinnacleZoneResponse]:
+    '''
+    Retrieve the sector code to zone index, reloaded from the database once per version bump or ZONE_INDEX_MAX_AGE
+    '''
+    global _zone_index, _zone_index_version, _zone_index_loaded_at
+    # Version is read before loading, an edit committed while loading bumps it again for the next lookup
+    version = get_versions(ZONE_INDEX_VERSION_KEY)[0]
+    with _zone_index_lock:
+        if _zone_index_version == version and time.monotonic() - _zone_index_loaded_at < ZONE_INDEX_MAX_AGE:
+            return _zone_index
+
+    records = db.query(PinnacleZone).all()
+    index = {zone.sector_code: _generate_retrieve_pinnacle_zone_response(zone) for zone in records}
+    with _zone_index_lock:
+        _zone_index = index
+        _zone_index_version = version
+        _zone_index_loaded_at = time.monotonic()
+    return index
+
+def invalidate_pinnacle_zone_index():
+    bump_version(ZONE_INDEX_VERSION_KEY)
 
+def retrieve_pinnacle_zone_by_sector_codes(sector_codes: list[str], db: Session):
+    zone_index = get_pinnacle_zone_index(db)
     return {
-        sector_code: _generate_retrieve_pinnacle_zone_response(records_dict.get(sector_code)) for sector_code in sector_codes
+        sector_code: zone_index.get(sector_code) or _generate_retrieve_pinnacle_zone_response(None) for sector_code in sector_codes
     }
 
 def retrieve_pinnacle_zone_by_sector_code(sector_code: str, db: Session):
-    record = db.query(PinnacleZone) \
-        .filter(PinnacleZone.sector_code == sector_code) \
-        .first()
-
-    return _generate_retrieve_pinnacle_zone_response(record)
+    return get_pinnacle_zone_index(db).get(sector_code) or _generate_retrieve_pinnacle_zone_response(None)
 
 def edit_pinnacle_zone(request: EditPinnacleZoneRequest, db: Session):
     for code in request.sector_code_list + request.sector_code_without_service + request.migrant_area_code_list:
@@ -212,5 +239,6 @@ def edit_pinnacle_zone(request: EditPinnacleZoneRequest, db: Session):
         db.delete(zone)
 
     db.commit()
+    invalidate_pinnacle_zone_index()
 
     return SuccessResp(success=True)
@@ -9,7 +9,7 @@ from routers.delivery.actions.delivery import dispatch_get_teleconsult_delivery_
 router = APIRouter(dependencies=[Depends(get_dispatch_or_logistic_or_superadmin)])
 
 @router.get("/", response_model=list[TeleconsultDeliveryResponse])
-async def dispatch_read_teleconsult_delivery_routes(db: Session = Depends(get_db)):
+def dispatch_read_teleconsult_delivery_routes(db: Session = Depends(get_db)):
     try:
         return dispatch_get_teleconsult_delivery_objects(db=db)
     except HTTPException as e:
@@ -19,7 +19,7 @@ async def dispatch_read_teleconsult_delivery_routes(db: Session = Depends(get_db
 
 
 @router.put("/update_delivery_status", response_model=SuccessResp)
-async def dispatch_update_teleconsult_delivery_status_route(
+def dispatch_update_teleconsult_delivery_status_route(
     request_json: str = Form(...),
     file: UploadFile | None = None,
     user: SupabaseUser = Depends(get_dispatch_or_logistic_or_superadmin),
@@ -35,7 +35,7 @@ async def dispatch_update_teleconsult_delivery_status_route(
     """
     try:
         request = DispatchUpdateTeleconsultDeliveryStatusRequest.model_validate_json(request_json)
-        return await dispatch_update_teleconsult_delivery_status_action(request, user, db, file)
+        return dispatch_update_teleconsult_delivery_status_action(request, user, db, file)
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -9,14 +9,14 @@ from utils.fastapi import SuccessResp
 router = APIRouter(dependencies=[Depends(get_admin_or_superadmin)])
 
 @router.get("/", response_model=GetPinnacleZonesResponse)
-async def get_pinnacle_zones_route(db: Session = Depends(get_db)):
+def get_pinnacle_zones_route(db: Session = Depends(get_db)):
     try:
         return get_pinnacle_zones(db=db)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @router.put("/edit", response_model=SuccessResp)
-async def edit_pinnacle_zone_route(request: EditPinnacleZoneRequest, db: Session = Depends(get_db)):
+def edit_pinnacle_zone_route(request: EditPinnacleZoneRequest, db: Session = Depends(get_db)):
     try:
         return edit_pinnacle_zone(request, db=db)
     except HTTPException as e:
@@ -14,7 +14,7 @@ class SuccessResponse(BaseModel):
     success: bool
 
 @router.post("/token")
-async def register_expo_token(req: PushTokenReq, user: SupabaseUser = Depends(get_doctor_or_superadmin), db: Session = Depends(get_db)):
+def register_expo_token(req: PushTokenReq, user: SupabaseUser = Depends(get_doctor_or_superadmin), db: Session = Depends(get_db)):
     account = db.query(PinnacleAccount).filter(PinnacleAccount.id == user.id, PinnacleAccount.deleted == False).first()
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
@@ -32,7 +32,7 @@ async def register_expo_token(req: PushTokenReq, user: SupabaseUser = Depends(ge
     return SuccessResponse(success=True)
 
 @router.delete("/token")
-async def remove_expo_token(token: str, user: SupabaseUser = Depends(get_doctor_or_superadmin), db: Session = Depends(get_db)):
+def remove_expo_token(token: str, user: SupabaseUser = Depends(get_doctor_or_superadmin), db: Session = Depends(get_db)):
     account = db.query(PinnacleAccount).filter(PinnacleAccount.id == user.id, PinnacleAccount.deleted == False).first()
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
@@ -1,7 +1,7 @@
 import asyncio
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, WebSocketException, status
-from models import SessionLocal
-from models.pinnacle import PinnacleAccount
+from fastapi.concurrency import run_in_threadpool
+from routers.admin.realtime import pinnacle_account_exists
 from routers.realtime import ws_manager
 
 router = APIRouter()
@@ -10,11 +10,9 @@ router = APIRouter()
 @router.websocket("/teleconsult/ws")
 async def teleconsult_websocket(id: str, websocket: WebSocket):
     print("Activity Websocket Connected. User UID: ", id)
-    with SessionLocal() as db:
-        user = db.query(PinnacleAccount).filter(PinnacleAccount.supabase_uid == id).first()
-        if not user:
-            raise WebSocketException(status.WS_1008_POLICY_VIOLATION, "Invalid Request")
-        
+    if not await run_in_threadpool(pinnacle_account_exists, id):
+        raise WebSocketException(status.WS_1008_POLICY_VIOLATION, "Invalid Request")
+
     await ws_manager.connect_doctor(websocket, id)
 
     try:
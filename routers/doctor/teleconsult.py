@@ -19,11 +19,11 @@ router = APIRouter(dependencies=[Depends(get_doctor_or_superadmin)])
 
 # Teleconsult Endponts
 @router.get("/teleconsults/ongoing", response_model=Optional[TeleconsultResponse])
-async def read_ongoing_teleconsult(current_user: SupabaseUser = Depends(get_doctor_or_superadmin), db: Session = Depends(get_db)):
+def read_ongoing_teleconsult(current_user: SupabaseUser = Depends(get_doctor_or_superadmin), db: Session = Depends(get_db)):
     return get_teleconsult_with_doctor_id(db, current_user.id)
 
 @router.get("/teleconsults", response_model=list[TeleconsultResponse])
-async def read_teleconsults(current_user: SupabaseUser = Depends(get_doctor_or_superadmin), db: Session = Depends(get_db)):
+def read_teleconsults(current_user: SupabaseUser = Depends(get_doctor_or_superadmin), db: Session = Depends(get_db)):
     account = db.query(PinnacleAccount).filter(PinnacleAccount.id == current_user.id).first()
     if not account or 'appstore' in account.email:
         return []
@@ -37,7 +37,7 @@ def read_ended_teleconsults_with_doctor_id(date: date, current_user: SupabaseUse
 test_record = 'test-teleconsult-record'
 
 @router.get("/teleconsults/{id}", response_model=TeleconsultResponse)
-async def read_teleconsults_by_id(id: str, db: Session = Depends(get_db)):
+def read_teleconsults_by_id(id: str, db: Session = Depends(get_db)):
     if id == test_record:
         return TeleconsultResponse(
             id=test_record,
@@ -118,11 +118,11 @@ def create_video_token(teleconsult_id: str):
     )
 
 @router.get("/start-test-session", response_model=VideoResp)
-async def start_test_session():
+def start_test_session():
     return create_video_token("test")
 
 @router.post("/start-session", response_model=VideoResp)
-async def start_session(request: TeleconsultRequest, background_tasks: BackgroundTasks, current_user: SupabaseUser = Depends(get_doctor_or_superadmin), db: Session = Depends(get_db)):
+def start_session(request: TeleconsultRequest, background_tasks: BackgroundTasks, current_user: SupabaseUser = Depends(get_doctor_or_superadmin), db: Session = Depends(get_db)):
     # Test record - skip all validation and database operations
     if request.teleconsult_id == test_record:
         return create_video_token(test_record)
@@ -161,7 +161,7 @@ async def start_session(request: TeleconsultRequest, background_tasks: Backgroun
 
 
 @router.post("/resume-session", response_model=VideoResp)
-async def resume_session(request: TeleconsultRequest, current_user: SupabaseUser = Depends(get_doctor_or_superadmin), db: Session = Depends(get_db)):
+def resume_session(request: TeleconsultRequest, current_user: SupabaseUser = Depends(get_doctor_or_superadmin), db: Session = Depends(get_db)):
     record = db.query(Teleconsult).filter(Teleconsult.id == request.teleconsult_id).first()
     if not record:
         raise HTTPException(status_code=404, detail="Teleconsult not found")
@@ -176,7 +176,7 @@ async def resume_session(request: TeleconsultRequest, current_user: SupabaseUser
     return create_video_token(session_name)
 
 @router.post("/leave-session", response_model=SuccessResp)
-async def leave_session(request: TeleconsultRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def leave_session(request: TeleconsultRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     record = db.query(Teleconsult).filter(Teleconsult.id == request.teleconsult_id, Teleconsult.status == TeleconsultStatus.CONSULT_START).first()
     if not record:
         raise HTTPException(status_code=404, detail="Teleconsult not found")
@@ -190,7 +190,7 @@ async def leave_session(request: TeleconsultRequest, background_tasks: Backgroun
     return SuccessResp(success=True)
 
 @router.post("/end-session", response_model=SuccessResp)
-async def end_session(request: TeleconsultRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def end_session(request: TeleconsultRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     record = db.query(Teleconsult).filter(Teleconsult.id == request.teleconsult_id, Teleconsult.status == TeleconsultStatus.CONSULT_START).first()
     if not record:
         raise HTTPException(status_code=404, detail="Teleconsult not found")
@@ -210,7 +210,7 @@ async def end_session(request: TeleconsultRequest, background_tasks: BackgroundT
     return SuccessResp(success=True)
 
 @router.post("/cancel-session", response_model=SuccessResp)
-async def cancel_session(request: TeleconsultRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def cancel_session(request: TeleconsultRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     record = db.query(Teleconsult).filter(Teleconsult.id == request.teleconsult_id, Teleconsult.status == TeleconsultStatus.CONSULT_START).first()
     if not record:
         raise HTTPException(status_code=404, detail="Teleconsult not found")
@@ -230,7 +230,7 @@ class ElapsedTimeResp(BaseModel):
     elapsed_time: int
 
 @router.get("/elapsed-time/{id}", response_model=ElapsedTimeResp)
-async def get_elapsed_time(id: str, db: Session = Depends(get_db)):
+def get_elapsed_time(id: str, db: Session = Depends(get_db)):
     record = db.query(Teleconsult).filter(
         or_(Teleconsult.id == id, Teleconsult.group_id == id),
         Teleconsult.status == TeleconsultStatus.CONSULT_START,
@@ -10,7 +10,7 @@ from models.walkin import WalkInQueue
 from utils import sg_datetime
 from utils.integrations.sgimed import cancel_pending_queue, get_queue_status, get_visit_id, get_walkin_queues, update_queue_instructions
 from utils.notifications import send_patient_notification
-from routers.realtime import WSEvent, WSMessage, ws_manager
+from services.activity import activity_record_changed, invalidate_activity, publish_activity_update
 from sqlalchemy.orm import Session
 
 def get_grouped_walkins(db: Session, record: WalkInQueue, user: Optional[Account] = None):
@@ -55,7 +55,7 @@ def get_walkin_queues_numbers(queues: list[WalkInQueue], status: WalkinQueueStat
 
     return queue_number
 
-async def walkin_queue_update(visit_id: str):
+def walkin_queue_update(visit_id: str):
     # # Ignore for now. Queue that is called, 
     # update_queue_instructions(visit_id, WalkinQueueStatus.CONSULT_START.value)
     branch_id, curr_queue_number, first_five_visit_ids = get_walkin_queues(visit_id)
@@ -71,6 +71,9 @@ async def walkin_queue_update(visit_id: str):
 
     records = db.query(WalkInQueue).filter(WalkInQueue.sgimed_visit_id.in_(first_five_visit_ids)).all()
     group_ids_sent = []
+    # Accounts of the queues with a new queue status, updated once committed
+    changed_account_ids: set[str] = set()
+    changed_owner_ids: set[str] = set()
     for record in records:
         if record:
             if WalkinNotifications.FIVE_PATIENTS_BEFORE.value not in record.notifications_sent:
@@ -81,10 +84,7 @@ async def walkin_queue_update(visit_id: str):
                     group_ids_sent.append(record.group_id)
                 
                 account_id = str(record.account_id if not record.created_by else record.created_by)
-                await ws_manager.push_to_channel(WSMessage(
-                        id=account_id, 
-                        event=WSEvent.PATIENT_ACTIVITY_UPDATE
-                    ))
+                changed_owner_ids.add(account_id)
                 
                 user = db.query(Account).filter(Account.id == account_id).first()
                 if user:
@@ -98,16 +98,29 @@ async def walkin_queue_update(visit_id: str):
                 # Update the group of walkins that notification has been sent
                 for queue in get_grouped_walkins(db, record):
                     queue.notifications_sent = queue.notifications_sent + [WalkinNotifications.FIVE_PATIENTS_BEFORE.value]
+                    changed_account_ids.update(str(id) for id in [queue.account_id, queue.created_by] if id)
                 db.commit()    
         else:
             logging.info(f"Walkin queue not found for visit_id: {visit_id}. Most likely is in patient visit")
 
+    # Only patients in today's queue of the branch see the current queue number
+    queue_owner_ids: set[str] = set()
+    if branch:
+        queue_owners = db.query(WalkInQueue.account_id, WalkInQueue.created_by).filter(
+                WalkInQueue.branch_id == branch.id,
+                WalkInQueue.status.in_([WalkinQueueStatus.PENDING, WalkinQueueStatus.CHECKED_IN, WalkinQueueStatus.CONSULT_START]),
+                WalkInQueue.created_at > sg_datetime.midnight(),
+            ).all()
+        queue_owner_ids = set(str(created_by or account_id) for account_id, created_by in queue_owners)
+
     db.commit()
     db.close()
-    # TODO: Instead of updating all, should only update those that are in a walk in queue
-    await ws_manager.push_to_channel(WSMessage(event=WSEvent.PATIENT_ACTIVITY_UPDATE_ALL))
 
-async def walkin_queue_number_update(visit_id: str):
+    versions = invalidate_activity(changed_account_ids)
+    for account_id in queue_owner_ids | changed_owner_ids:
+        publish_activity_update(account_id, versions.get(account_id), branch_queue_number=curr_queue_number)
+
+def walkin_queue_number_update(visit_id: str):
     resp = get_queue_status(visit_id)
     curr_queue_number = resp['queue_no']
     with SessionLocal() as db:
@@ -118,10 +131,7 @@ async def walkin_queue_number_update(visit_id: str):
         record.queue_number = curr_queue_number
         db.commit()
         account_id = str(record.account_id if not record.created_by else record.created_by)
-        await ws_manager.push_to_channel(WSMessage(
-                id=account_id, 
-                event=WSEvent.PATIENT_ACTIVITY_UPDATE
-            ))
+        activity_record_changed(record.account_id, record.created_by)
         
         user = db.query(Account).filter(Account.id == account_id).first()
         if user:
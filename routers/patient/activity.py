@@ -10,6 +10,7 @@ from models.teleconsult import Teleconsult
 from models.walkin import WalkInQueue
 from routers.patient.actions.walkin import get_grouped_walkins, get_walkin_queues_numbers, get_walkin_queues_status
 from routers.patient.utils import validate_firebase_token, validate_user
+from services.activity import get_activity_snapshot
 from sqlalchemy.orm import Session
 
 from utils import sg_datetime
@@ -55,6 +56,7 @@ class ActivityDetail(BaseModel):
 
 class ActivityResp(BaseModel):
     activity: Optional[ActivityDetail] = None
+    version: Optional[int] = None # Compared with the version pushed on the activity websocket
 
 def get_active_activity(db: Session, user: Account, visit_type: Optional[VisitType] = None):
     ids = user.get_linked_account_ids()
@@ -109,4 +111,13 @@ def get_active_activity(db: Session, user: Account, visit_type: Optional[VisitTy
 @router.get("/", response_model=ActivityResp)
 def get_activity(firebase_uid = Depends(validate_firebase_token), db: Session = Depends(get_db)):
     user = validate_user(db, firebase_uid)
-    return ActivityResp(activity=get_active_activity(db, user))
+
+    def build_activity():
+        activity = get_active_activity(db, user)
+        return activity.model_dump(mode='json') if activity else None
+
+    version, activity = get_activity_snapshot(user, build_activity)
+    return ActivityResp(
+        activity=ActivityDetail.model_validate(activity) if activity else None,
+        version=version
+    )
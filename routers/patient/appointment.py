@@ -20,7 +20,7 @@ from utils.integrations.sgimed_appointment import update_appointment_start_datet
 from utils import sg_datetime
 from utils.sg_datetime import sg, sgtz
 from utils.fastapi import SuccessResp
-from utils.appointment import get_appointment_operating_hours, get_appointment_booked_slots, get_available_slots, clear_operating_hours_cache
+from utils.appointment import get_cached_appointment_slot_grid, get_appointment_booked_slots, get_available_slots
 from dateutil.relativedelta import relativedelta
 from repository.payments import create_appointment_payment, get_default_payment
 from .teleconsult_family import DocumentDict
@@ -539,17 +539,16 @@ def get_appointment_timings(req: GetAppointmentTimingsReq, db: Session = Depends
         raise Exception("Branch not found")
 
     # Get Available Appointment Slots
-    available_slots, appt_operating_hours_discrete_max_bookings, max_appts_per_session = get_appointment_operating_hours(db, branch, start_date, end_date)
-    available_slots = set(filter(lambda x: x >= start_date and x <= end_date, available_slots))
-    if len(available_slots) == 0:
+    slot_grid = get_cached_appointment_slot_grid(db, branch, start_date, end_date)
+    if not slot_grid.is_open.any():
         return GetAppointmentTimingsResp(
             min_date=min_date,
             max_date=max_date,
             timings=[]
         )
-    booked_slots = get_appointment_booked_slots(db, branch, start_date, end_date, available_slots, appt_operating_hours_discrete_max_bookings, max_appts_per_session)
+    booked_slots = get_appointment_booked_slots(db, branch, slot_grid)
     max_date_with_time = max_date.replace(hour=23, minute=59, second=59)
-    start_timings = get_available_slots(available_slots - booked_slots, service_duration)
+    start_timings = get_available_slots(slot_grid, booked_slots, service_duration)
     start_timings = [timing for timing in start_timings if timing > min_date and timing < max_date_with_time]
 
     return GetAppointmentTimingsResp(
@@ -818,9 +817,6 @@ def confirm_appointment(appointment_id: str, db: Session = Depends(get_db)):
 
     appointment_success_webhook(db, appt=appt)
     
-    # Clear cache to ensure admin panel reflects updated slot availability
-    clear_operating_hours_cache()
-    
     return ConfirmAppointmentResp(
         id=str(appt.id),
     )
@@ -1091,9 +1087,6 @@ def cancel_appointment(id: str, db: Session = Depends(get_db), user: Account = D
                 )
         appt.status = AppointmentStatus.CANCELLED
     db.commit()
-    
-    # Clear cache to ensure admin panel reflects freed up slots
-    clear_operating_hours_cache()
 
 class GetRescheduleAppointmentTimingsReq(BaseModel):
     curr_date: date
@@ -1183,7 +1176,4 @@ def reschedule_appointment(id: str, req: RescheduleAppointmentReq, db: Session =
         appt.start_datetime = appt.start_datetime + time_diff
     db.commit()
     
-    # Clear cache to ensure admin panel reflects updated slot availability
-    clear_operating_hours_cache()
-    
     return SuccessResp(success=True)
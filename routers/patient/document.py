@@ -204,7 +204,7 @@ def validate_edocs_access(db: Session, user: Account):
         )
 
 @router.post('/validate_code', response_model=SuccessResp)
-async def validate_code(req: DownloadDocumentReq, firebase_uid = Depends(validate_firebase_token), db: Session = Depends(get_db)):
+def validate_code(req: DownloadDocumentReq, firebase_uid = Depends(validate_firebase_token), db: Session = Depends(get_db)):
     user = validate_user(db, firebase_uid)
     validate_edocs_access(db, user)
     # Check if user.sgimed_patient_id is valid, if not, reset it
@@ -379,7 +379,7 @@ def check_family_access(db: Session, user: Account, doc_patient_id: str):
     return True
 
 @router.get('/health_report/{report_id}')
-async def get_health_report(report_id: str, user: Account = Depends(validate_user), db: Session = Depends(get_db)):
+def get_health_report(report_id: str, user: Account = Depends(validate_user), db: Session = Depends(get_db)):
     '''
     Get health report from SGiMed
     '''
@@ -401,7 +401,7 @@ async def get_health_report(report_id: str, user: Account = Depends(validate_use
     )
 
 @router.get("/{document_id}")
-async def download_document(document_id: str, code: str, user: Account = Depends(validate_user), db: Session = Depends(get_db)):
+def download_document(document_id: str, code: str, user: Account = Depends(validate_user), db: Session = Depends(get_db)):
     '''
     Download document from SGiMed
     '''
@@ -442,7 +442,7 @@ class DocumentHTMLResp(BaseModel):
     html: str
 
 @router.get("/{document_id}/html", response_model=DocumentHTMLResp)
-async def get_document_html(document_id: str, code: str, firebase_uid = Depends(validate_firebase_token), db: Session = Depends(get_db)):
+def get_document_html(document_id: str, code: str, firebase_uid = Depends(validate_firebase_token), db: Session = Depends(get_db)):
     user = validate_user(db, firebase_uid)    
     validate_edocs_access(db, user)
     doc_db = get_document_db(db, user, code, document_id)
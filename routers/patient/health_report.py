@@ -100,7 +100,7 @@ def get_report(db: Session, user: Account, req: HealthReportRequest, ignore_disc
     return report
 
 @router.post("/report/disclaimer/accept", response_model=SuccessResp)
-async def accept_disclaimer(req: HealthReportRequest, user = Depends(validate_user), db: Session = Depends(get_db)):    
+def accept_disclaimer(req: HealthReportRequest, user = Depends(validate_user), db: Session = Depends(get_db)):    
     report = get_report(db, user, req, ignore_disclaimer=True)
     report.disclaimer_accepted_at = sg_datetime.now()
     db.commit()
@@ -143,7 +143,7 @@ class ProfileReportJSON(BaseModel):
     lab_report_id: str
 
 @router.post("/report", response_model=ReportSummaryResp)
-async def get_report_summary(req: HealthReportRequest, user = Depends(validate_user), db: Session = Depends(get_db)):    
+def get_report_summary(req: HealthReportRequest, user = Depends(validate_user), db: Session = Depends(get_db)):    
     report = get_report(db, user, req)
     report_json = ReportSummaryJSON.model_validate_json(report.report_summary)
     
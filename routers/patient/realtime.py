@@ -1,13 +1,34 @@
 import asyncio
 import logging
+from typing import Optional
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, WebSocketException, status
+from fastapi.concurrency import run_in_threadpool
 from models import SessionLocal
 from models.payments import Payment, PaymentStatus
 from routers.patient.utils import validate_user
-from routers.realtime import ws_manager
+from routers.realtime import ACTIVITY_PROTOCOL_TEXT, ws_manager
 
 router = APIRouter()
 
+def get_payment_status(payment_id: str) -> Optional[tuple[PaymentStatus, Optional[str]]]:
+    '''
+    Returns the payment status and the teleconsult id once paid, None if the payment does not exist
+    '''
+    # Open a new session to check the payment status and close after. Required if not websockets hold the database connection and overflows it.
+    with SessionLocal() as db:
+        payment = db.query(Payment).filter(Payment.payment_id == payment_id).first()
+        if not payment:
+            return None
+        success = payment.status == PaymentStatus.PAYMENT_SUCCESS
+        return payment.status, str(payment.teleconsults[0].id) if success else None
+
+def get_activity_user_id(firebase_uid: str) -> Optional[str]:
+    with SessionLocal() as db:
+        try:
+            return str(validate_user(db, firebase_uid).id)
+        except Exception:
+            return None
+
 @router.websocket("/teleconsult/payment/ws")
 async def prepayment_websocket(payment_id: str, websocket: WebSocket):
     await websocket.accept()
@@ -15,20 +36,18 @@ async def prepayment_websocket(payment_id: str, websocket: WebSocket):
     try:
         prev_sent_status = None
         while True:
-            # Open a new session to check the payment status and close after. Required if not websockets hold the database connection and overflows it.
-            with SessionLocal() as db:
-                payment = db.query(Payment).filter(Payment.payment_id == payment_id).first()
-                if not payment:
-                    raise WebSocketException(status.WS_1008_POLICY_VIOLATION, "Payment not found")
-                
-                if payment.status != prev_sent_status:
-                    logging.info(f"Payment Status Changed Payment ID: {payment_id}, Status: {payment.status}")
-                    success = payment.status == PaymentStatus.PAYMENT_SUCCESS
-                    await websocket.send_json({
-                        "id": str(payment.teleconsults[0].id) if success else None,
-                        "status": payment.status.value
-                    })
-                    prev_sent_status = payment.status
+            payment = await run_in_threadpool(get_payment_status, payment_id)
+            if not payment:
+                raise WebSocketException(status.WS_1008_POLICY_VIOLATION, "Payment not found")
+
+            payment_status, teleconsult_id = payment
+            if payment_status != prev_sent_status:
+                logging.info(f"Payment Status Changed Payment ID: {payment_id}, Status: {payment_status}")
+                await websocket.send_json({
+                    "id": teleconsult_id,
+                    "status": payment_status.value
+                })
+                prev_sent_status = payment_status
 
             # Sleep 2 seconds before checking again
             await asyncio.sleep(2)
@@ -36,14 +55,12 @@ async def prepayment_websocket(payment_id: str, websocket: WebSocket):
         pass
 
 @router.websocket("/activity/ws")
-async def activity_websocket(id: str, websocket: WebSocket):
-    with SessionLocal() as db:
-        try:
-            user = validate_user(db, id)
-        except Exception:
-            raise WebSocketException(status.WS_1008_POLICY_VIOLATION, "Invalid Request")
+async def activity_websocket(id: str, websocket: WebSocket, protocol: int = ACTIVITY_PROTOCOL_TEXT):
+    user_id = await run_in_threadpool(get_activity_user_id, id)
+    if not user_id:
+        raise WebSocketException(status.WS_1008_POLICY_VIOLATION, "Invalid Request")
 
-    await ws_manager.connect_patient_activity(str(user.id), websocket)
+    await ws_manager.connect_patient_activity(user_id, websocket, protocol)
 
     try:
         while True:
@@ -52,6 +69,6 @@ async def activity_websocket(id: str, websocket: WebSocket):
             except asyncio.TimeoutError:
                 pass
     except WebSocketDisconnect:
-        ws_manager.disconnect_patient_activity(str(user.id))
+        ws_manager.disconnect_patient_activity(user_id)
     except RuntimeError:
         logging.warning(f'RuntimeError: Patient WS State {websocket.application_state}')
\ No newline at end of file
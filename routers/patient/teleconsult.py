@@ -3,6 +3,7 @@ from datetime import datetime, timedelta, time as dt_time
 import logging
 from typing import Any, Optional
 from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import json
 from sse_starlette import EventSourceResponse
@@ -19,9 +20,10 @@ from routers.patient.actions.teleconsult_flow_backend import prepayment_success_
 from services.visits import DocumentHtml, get_invoice_document_html, get_mc_document_html
 from utils import sg_datetime
 from utils.fastapi import SuccessResp, ExceptionCode, HTTPJSONException
+from utils.firebase_auth import get_account_id
 from utils.stripe import fetch_payment_sheet, generate_stripe_paynow_link
 from .actions import teleconsult_utils
-from .utils import session_manager, validate_firebase_token, validate_user
+from .utils import SSE_HEARTBEAT_INTERVAL, session_manager, validate_firebase_token, validate_user
 from services.teleconsult import combine_breakdown_with_gst, fetch_prepayment_rate, get_corporate_membership, PaymentBreakdown
 
 router = APIRouter(dependencies=[Depends(validate_firebase_token)])
@@ -190,7 +192,7 @@ class CreatePrepaymentReq(BaseModel):
     collection_method: Optional[CollectionMethod] = None
 
 @router.post('/prepayment/create', response_model=dict)
-async def create_prepayment(
+def create_prepayment(
     params: CreatePrepaymentReq,
     user: Account = Depends(validate_user),
     db: Session = Depends(get_db)
@@ -314,11 +316,11 @@ async def create_prepayment(
 
 @router.get('/payment/cancel')
 def cancel_pending_payments(firebase_uid = Depends(validate_firebase_token), db: Session = Depends(get_db)):
-    record = db.query(AccountFirebase).filter(AccountFirebase.firebase_uid == firebase_uid).first()
-    if not record:
+    account_id = get_account_id(db, firebase_uid)
+    if not account_id:
         raise HTTPException(status_code=403, detail="Invalid user")
     
-    payments = db.query(Payment).filter(Payment.account_id == record.account.id, Payment.status == PaymentStatus.PAYMENT_CREATED).all()
+    payments = db.query(Payment).filter(Payment.account_id == account_id, Payment.status == PaymentStatus.PAYMENT_CREATED).all()
     for payment in payments:
         payment.status = PaymentStatus.PAYMENT_CANCELED
     print(f"Canceling payments: {len(payments)}")
@@ -458,26 +460,35 @@ def get_teleconsult_resp(db: Session, account_id: str, teleconsult_id: Optional[
 
 # This endpoint is just for getting teleconsult record
 @router.get('/details', response_model=TeleconsultResp)
-async def get_details(id: Optional[str] = None, firebase_uid = Depends(validate_firebase_token), db: Session = Depends(get_db)):
-    record = db.query(AccountFirebase).filter(AccountFirebase.firebase_uid == firebase_uid).first()
-    if not record:
+def get_details(id: Optional[str] = None, firebase_uid = Depends(validate_firebase_token), db: Session = Depends(get_db)):
+    account_id = get_account_id(db, firebase_uid)
+    if not account_id:
         raise HTTPException(status_code=403, detail="Invalid user")
     
-    resp = get_teleconsult_resp(db, str(record.account.id), id)
+    resp = get_teleconsult_resp(db, account_id, id)
     if not resp:
         raise HTTPException(status_code=404, detail="Teleconsult not found")
     
     return resp
 
+def get_sse_account_id(firebase_uid: str) -> str:
+    with SessionLocal() as db:
+        account_id = get_account_id(db, firebase_uid)
+    if not account_id:
+        raise HTTPException(status_code=403, detail="Invalid user")
+    return account_id
+
+def get_sse_teleconsult(account_id: str) -> dict:
+    with SessionLocal() as db:
+        resp = get_teleconsult_resp(db, account_id)
+    return {
+        "teleconsult": None if not resp else json.loads(resp.model_dump_json())
+    }
+
 # This endpoint is for listening to the most recent record of teleconsult
 @router.get("/sse")
 async def get_status(id: Optional[str] = None, firebase_uid = Depends(validate_firebase_token)):
-    account_id = None
-    with SessionLocal() as db:
-        record = db.query(AccountFirebase).filter(AccountFirebase.firebase_uid == firebase_uid).first()
-        if not record:
-            raise HTTPException(status_code=403, detail="Invalid user")
-        account_id = str(record.account.id)
+    account_id = await run_in_threadpool(get_sse_account_id, firebase_uid)
 
     # # Either get teleconsult with an ID or the latest record with checked in
     # teleconsult = None
@@ -501,21 +512,17 @@ async def get_status(id: Optional[str] = None, firebase_uid = Depends(validate_f
         session_id, queue = session_manager.add_client(account_id)
         try:
             while True:
-                with SessionLocal() as db:
-                    resp = get_teleconsult_resp(db, account_id)
-
-                sse_resp = {
-                    "teleconsult": None if not resp else json.loads(resp.model_dump_json())
-                }
+                sse_resp = await run_in_threadpool(get_sse_teleconsult, account_id)
                 yield {
                     "data": json.dumps(sse_resp)
                 }
                 # Queue is just to block until when a new message is received
                 message = await queue.get()
-        except asyncio.CancelledError:
-            session_manager.delete_client(id, session_id)
+        finally:
+            session_manager.delete_client(account_id, session_id)
 
-    return EventSourceResponse(connect_queue(account_id))
+    # Ping keeps idle connections open through proxies and detects disconnected clients
+    return EventSourceResponse(connect_queue(account_id), ping=SSE_HEARTBEAT_INTERVAL)
     
 class CancelParams(BaseModel):
     id: str
@@ -30,7 +30,7 @@ from utils.fastapi import SuccessResp
 from utils.sg_datetime import sg
 from utils.system_config import TeleconsultWarningMessage, get_delivery_require_branch_picker, get_teleconsult_warning_message, get_telemed_app_branch
 from utils import sg_datetime
-from services.teleconsult import combine_breakdown_with_gst, fetch_prepayment_rate, PaymentBreakdown, PaymentTotal
+from services.teleconsult import combine_breakdown_with_gst, fetch_prepayment_rates, PaymentBreakdown, PaymentTotal
 from utils.supabase_s3 import SignedURLResponse
 from routers.delivery.actions.delivery import retrieve_delivery_note_action_with_signed_url
 
@@ -63,8 +63,7 @@ def get_rate(req: PrepaymentRateReq, user: Account = Depends(validate_user), db:
     is_pcp = False
     rate_code = None
     subtotals: list[PaymentTotal] = []
-    for patient in patients:
-        is_pcp, _rate_code, subtotal = fetch_prepayment_rate(db, patient.nric, req.code)
+    for is_pcp, _rate_code, subtotal in fetch_prepayment_rates(db, [patient.nric for patient in patients], req.code):
         if _rate_code == req.code:
             rate_code = _rate_code
         # if is_pcp and req.family_ids:
@@ -247,11 +246,12 @@ def join_queue(req: JoinQueueReq, user: Account = Depends(validate_user), db: Se
     teleconsults: list[Teleconsult] = []
     rates: list[PaymentTotal] = []
     rate_code = None
+    prepayment_rates = fetch_prepayment_rates(db, [patient.nric for patient in patients], req.code)
     for ind, patient in enumerate(patients):
         # Update Account Allergy
         patient.allergy = req.allergies.get(str(patient.id), None) if patient.id != user.id else req.user_allergy
         # Create new teleconsult record
-        is_pcp, rate_code, subtotal = fetch_prepayment_rate(db, patient.nric, req.code)
+        is_pcp, rate_code, subtotal = prepayment_rates[ind]
         payment_total = combine_breakdown_with_gst([subtotal])
         rates.append(payment_total)
         # # PCP accounts are assigned to a specific branch. All others are assigned to selected branch
@@ -670,11 +670,12 @@ def add_family(req: AddFamilyReq, user: Account = Depends(validate_user), db: Se
     teleconsults = []
     rates = []
     rate_code = None
+    prepayment_rates = fetch_prepayment_rates(db, [patient.nric for patient in patients], q.corporate_code)
     for i, patient in enumerate(patients):
         # Update Account Allergy
         patient.allergy = req.patient_ids_allergies.get(str(patient.id), None)
         # Create new teleconsult record
-        is_pcp, rate_code, subtotal = fetch_prepayment_rate(db, patient.nric, q.corporate_code)
+        is_pcp, rate_code, subtotal = prepayment_rates[i]
         payment_total = combine_breakdown_with_gst([subtotal])
         rates.append(payment_total)
         # Create Record
@@ -853,7 +854,7 @@ def get_mc(id: str, user: Account = Depends(validate_user), db: Session = Depend
     return get_mc_document_html(record.invoices[0].mc_html)
 
 @router.get("/delivery_note", response_model=SignedURLResponse)
-async def retrieve_delivery_note_route(id: str, user: Account = Depends(validate_user), db: Session = Depends(get_db)):
+def retrieve_delivery_note_route(id: str, user: Account = Depends(validate_user), db: Session = Depends(get_db)):
     try:
         teleconsult = db.query(Teleconsult).filter(
             Teleconsult.id == id,
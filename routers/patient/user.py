@@ -358,7 +358,7 @@ def fetch_address(firebase_uid = Depends(validate_firebase_token), db: Session =
     )
 
 @router.post('/address')
-async def update_address(params: AddressParams, firebase_uid = Depends(validate_firebase_token), db: Session = Depends(get_db)):
+def update_address(params: AddressParams, firebase_uid = Depends(validate_firebase_token), db: Session = Depends(get_db)):
     user = validate_user(db, firebase_uid)
     account_ids = [str(user.id)] + user.get_linked_account_ids()
     accounts = db.query(Account).filter(Account.id.in_(account_ids)).all()
@@ -387,7 +387,7 @@ async def update_address(params: AddressParams, firebase_uid = Depends(validate_
         teleconsult.address = accounts[0].get_address()
 
     db.commit()
-    await ws_manager.push_to_channel(WSMessage(event=WSEvent.PATIENT_ACTIVITY_UPDATE, id=str(user.id)))
+    ws_manager.publish(WSMessage(event=WSEvent.PATIENT_ACTIVITY_UPDATE, id=str(user.id)))
     return SuccessResponse(success=True)
 
 # class PaymentMethodParams(BaseModel):
@@ -2,23 +2,23 @@ import asyncio
 import logging
 import uuid
 from fastapi import Depends, HTTPException
-from firebase_admin import auth
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 import sentry_sdk
 from sqlalchemy.orm import Session
-from models import Account, get_db, get_user
+from models import Account, get_db
+from utils.firebase_auth import get_account_id, verify_id_token
 
 auth_scheme = HTTPBearer()
 def validate_firebase_token(token: HTTPAuthorizationCredentials = Depends(auth_scheme)):
     try:
-        decoded_token = auth.verify_id_token(token.credentials)
-        return decoded_token['uid']
+        return verify_id_token(token.credentials)
     except Exception as e:
         logging.error(f"Error validating token: {e}")
         raise HTTPException(status_code=403, detail="Invalid token")
 
 def validate_user(db: Session = Depends(get_db), firebase_uid: str = Depends(validate_firebase_token)) -> Account:
-    user = get_user(db, firebase_uid)
+    account_id = get_account_id(db, firebase_uid)
+    user = db.get(Account, account_id) if account_id else None
     if not user:
         logging.error(f"Firebase UID not found in AccountFirebase: {firebase_uid}")
         raise HTTPException(status_code=403, detail="Invalid user")
@@ -36,21 +36,25 @@ def validate_user(db: Session = Depends(get_db), firebase_uid: str = Depends(val
 #     return decorator
 
 # SessionManager for Supabase Webhook
+# Wake-ups arrive through the realtime broadcaster channel, so every uvicorn worker routes them to its own SSE clients
+SSE_HEARTBEAT_INTERVAL = 15 # seconds
+
 class SessionManager:
     def __init__(self):
-        self.clients = {}
+        self.clients: dict[str, dict[str, asyncio.Queue]] = {}
         
-    def add_client(self, user_id):
+    def add_client(self, user_id: str):
         # Generate a Random Unique ID
         session_id = str(uuid.uuid4())
         if user_id not in self.clients:
             self.clients[user_id] = {}
             
-        queue = asyncio.Queue()
+        # Queue only signals that the record changed, a pending wake-up covers any further updates
+        queue = asyncio.Queue(maxsize=1)
         self.clients[user_id][session_id] = queue
         return session_id, queue
 
-    def delete_client(self, user_id, session_id):
+    def delete_client(self, user_id: str, session_id: str):
         if user_id not in self.clients:
             print("Error: User not found in clients")
             return
@@ -65,13 +69,22 @@ class SessionManager:
             print("Deleting Only One Session")
             del self.clients[user_id][session_id]
 
-    def send_message(self, user_id, message):
-        print(f"Sending Message to {user_id}")
-        if user_id in self.clients:
-            print(f"Sending to {len(self.clients[user_id].keys())} clients")
-            for queue in self.clients[user_id].values():
-                queue.put_nowait(message)
-        else:
-            print(f"Client {user_id} not found")
+    def _notify(self, queue: asyncio.Queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            pass
+
+    def send_message(self, user_id: str, message):
+        if user_id not in self.clients:
+            return
+        print(f"Sending Message to {user_id}, {len(self.clients[user_id].keys())} clients")
+        for queue in list(self.clients[user_id].values()):
+            self._notify(queue, message)
+
+    def send_message_all(self, message):
+        for sessions in list(self.clients.values()):
+            for queue in list(sessions.values()):
+                self._notify(queue, message)
 
 session_manager = SessionManager()
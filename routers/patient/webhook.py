@@ -1,12 +1,13 @@
+import json
 import logging
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from pydantic import BaseModel
 import jwt
 from stripe._error import SignatureVerificationError
 
 from config import STRIPE_WEBHOOK_SECRET, SGIMED_WEBHOOK_PUBLIC_KEY, SUPABASE_WEBHOOK_API_KEY, stripe
-from models import Payment, PaymentMethod, get_db, PaymentStatus
+from models import Payment, PaymentMethod, SessionLocal, get_db, PaymentStatus
 from models.payments import PaymentType
 from routers.admin.actions.teleconsult import admin_supabase_webhook_processing
 from routers.admin.actions.walkins import admin_supabase_walkin_processing, webhook_send_notifications
@@ -18,6 +19,8 @@ from .actions.teleconsult_flow_backend import postpayment_success_webhook, prepa
 from sqlalchemy.orm import Session
 from routers.realtime import ws_manager, WSMessage, WSEvent
 from services.appointment import appointment_success_webhook
+from services import webhook_inbox
+from services.activity import activity_record_changed
 
 router = APIRouter()
 
@@ -82,10 +85,26 @@ def stripe_checkout_session_completed(db: Session, event: dict):
         elif payments[0].payment_type == PaymentType.APPOINTMENT:
             appointment_success_webhook(db, payments)
 
+async def get_raw_body(request: Request) -> bytes:
+    # Read in the event loop so the handler itself can run in the threadpool
+    return await request.body()
+
+def process_stripe_event(event: dict):
+    with SessionLocal() as db:
+        # Card
+        if event['type'] == 'charge.succeeded':    
+            stripe_charge_succeeded(db, event)
+        # PayNow
+        elif event['type'] == 'checkout.session.completed':
+            stripe_checkout_session_completed(db, event)
+        else:
+            # Handle the event
+            print('Unhandled event type {}'.format(event['type']))
+            print(event)
+
 @router.post('/stripe')
-async def webhook(request: Request, db: Session = Depends(get_db)):
+def webhook(request: Request, payload: bytes = Depends(get_raw_body), db: Session = Depends(get_db)):
     event = None
-    payload = await request.body()
     sig_header = request.headers.get('stripe-signature')
 
     try:
@@ -97,16 +116,11 @@ async def webhook(request: Request, db: Session = Depends(get_db)):
         # Invalid signature
         raise e
 
-    # Card
-    if event['type'] == 'charge.succeeded':    
-        stripe_charge_succeeded(db, event)
-    # PayNow
-    elif event['type'] == 'checkout.session.completed':
-        stripe_checkout_session_completed(db, event)
-    else:
-        # Handle the event
-        print('Unhandled event type {}'.format(event['type']))
-        print(event)
+    # Processed by the webhook inbox, Stripe retries carry the same event id
+    event_json = json.loads(payload)
+    event_object = event_json['data']['object']
+    object_reference = event_object.get('payment_intent') or event_object.get('id')
+    webhook_inbox.enqueue(db, 'stripe', event['id'], event['type'], object_reference, event_json)
 
     return {
         "success": True
@@ -118,47 +132,53 @@ def validate_supabase_webhook_token(token: HTTPAuthorizationCredentials = Depend
     if token.credentials != SUPABASE_WEBHOOK_API_KEY:
         raise HTTPException(status_code=403, detail="Invalid token")
 
-@router.post("/supabase/teleconsults")
-async def supabase_teleconsults_webhook(payload: dict, webhook = Depends(validate_supabase_webhook_token)):
-    # print(f"Payload Teleconsults Received: {payload}. Ignoring")
-    # return {"success": True}
-    print(f"Payload Received: {payload}")
+def process_supabase_teleconsult(payload: dict):
     type = payload["type"]
     record = payload["record"]
     # Patient Websocket Updates
-    await ws_manager.push_to_channel(WSMessage(
-            id=record['created_by'] if record.get('created_by', None) else record["account_id"], 
-            event=WSEvent.PATIENT_ACTIVITY_UPDATE
-        ))
+    activity_record_changed(record["account_id"], record.get('created_by'))
     # Doctor Websocket Updates
     message = doctor_supabase_webhook_processing(payload)
     if message:
-        await ws_manager.push_to_channel(WSMessage(event=WSEvent.DOCTOR_TELECONSULT_UPDATE_ALL, data=message))
+        ws_manager.publish(WSMessage(event=WSEvent.DOCTOR_TELECONSULT_UPDATE_ALL, data=message))
     # Admin 
-    await admin_supabase_webhook_processing(payload)
-    return {"message": "Received"}
+    admin_supabase_webhook_processing(payload)
 
-@router.post("/supabase/walkins")
-async def supabase_walkins_webhook(payload: dict, webhook = Depends(validate_supabase_webhook_token)):
-    # print(f"Payload Walkin Received: {payload}. Ignoring")
+def enqueue_supabase_payload(db: Session, provider: str, payload: dict):
+    record = payload.get("record") or payload.get("old_record") or {}
+    object_reference = str(record["id"]) if record.get("id") else None
+    # Row payloads carry no delivery id and repeat when a row returns to the same state
+    webhook_inbox.enqueue_unkeyed(db, provider, payload.get("type", ""), object_reference, payload)
+
+@router.post("/supabase/teleconsults")
+def supabase_teleconsults_webhook(payload: dict, webhook = Depends(validate_supabase_webhook_token), db: Session = Depends(get_db)):
+    # print(f"Payload Teleconsults Received: {payload}. Ignoring")
     # return {"success": True}
-    '''
-    Handles the changes 
-    '''
     print(f"Payload Received: {payload}")
+    enqueue_supabase_payload(db, 'supabase_teleconsults', payload)
+    return {"message": "Received"}
+
+def process_supabase_walkin(payload: dict):
     type = payload["type"]
     record = payload["record"]
 
     # Update patient app on any changes to the record
-    await ws_manager.push_to_channel(WSMessage(
-            id=record['created_by'] if record.get('created_by', None) else record["account_id"],
-            event=WSEvent.PATIENT_ACTIVITY_UPDATE
-        ))
+    activity_record_changed(record["account_id"], record.get('created_by'))
     # Send notifications to all doctors with notifications on that a new patient has joined the queue
     if type == 'INSERT':
         webhook_send_notifications(record["branch_id"], record['index'])
     # Admin 
-    await admin_supabase_walkin_processing(payload)
+    admin_supabase_walkin_processing(payload)
+
+@router.post("/supabase/walkins")
+def supabase_walkins_webhook(payload: dict, webhook = Depends(validate_supabase_webhook_token), db: Session = Depends(get_db)):
+    # print(f"Payload Walkin Received: {payload}. Ignoring")
+    # return {"success": True}
+    '''
+    Handles the changes 
+    '''
+    print(f"Payload Received: {payload}")
+    enqueue_supabase_payload(db, 'supabase_walkins', payload)
     return {"message": "Received"}
 
 
@@ -173,29 +193,22 @@ async def validate_sgimed_token(params: SGiMedWebhookRequest):
     # except Exception:
     #     raise HTTPException(status_code=403, detail="Could not validate token")
 
-@router.post("/sgimed")
-async def sgimed_webhook(background_tasks: BackgroundTasks, payload: dict = Depends(validate_sgimed_token)):
-    # print(f"SGiMed Payload Received: {payload}. Ignoring")
-    # return {"success": True}
-    '''
-    Webhook call from SGiMed when there are changes to the queue.
-    '''
-    print(f"SGiMed Webhook: {payload}")
+def process_sgimed_event(payload: dict):
     # {'event': 'invoice.finalized', 'object_reference': '17171306466674117'}}
     if payload['data']['event'] == 'invoice.finalized':
         invoice_id = payload['data']['object_reference']
         invoice_details = fetch_invoice_details(invoice_id)
         if invoice_details:
             details = invoice_details.model_dump()
-            background_tasks.add_task(teleconsult_invoice_billed_webhook, **details)
-            background_tasks.add_task(walkin_invoice_billed_webhook, **details)
+            teleconsult_invoice_billed_webhook(**details)
+            walkin_invoice_billed_webhook(**details)
     elif payload['data']['event'] == 'visit.queue_called':
         # Only visit_id provided in the payload
         visit_id = payload['data']['object_reference']
-        await walkin_queue_update(visit_id)
+        walkin_queue_update(visit_id)
     elif payload['data']['event'] == 'visit.queue_number_changed':
         visit_id = payload['data']['object_reference']
-        await walkin_queue_number_update(visit_id)
+        walkin_queue_number_update(visit_id)
     elif payload['data']['event'] == 'pending_queue.updated':
         pending_queue_id = payload['data']['object_reference']
         pending_walkin_queue_update(pending_queue_id, accepted=True)
@@ -214,4 +227,23 @@ async def sgimed_webhook(background_tasks: BackgroundTasks, payload: dict = Depe
     else:
         logging.info(f"Unhandled event: {payload}")
 
+@router.post("/sgimed")
+def sgimed_webhook(params: SGiMedWebhookRequest, payload: dict = Depends(validate_sgimed_token), db: Session = Depends(get_db)):
+    # print(f"SGiMed Payload Received: {payload}. Ignoring")
+    # return {"success": True}
+    '''
+    Webhook call from SGiMed when there are changes to the queue.
+    Processed by the webhook inbox. The claims repeat for every event of an object, the token is
+    signed per delivery so a redelivered token is the duplicate
+    '''
+    print(f"SGiMed Webhook: {payload}")
+    data = payload.get('data') or {}
+    idempotency_key = str(payload['jti']) if payload.get('jti') else webhook_inbox.payload_key(params.token)
+    webhook_inbox.enqueue(db, 'sgimed', idempotency_key, data.get('event', ''), data.get('object_reference'), payload)
+
     return {"success": True}
+
+webhook_inbox.register_handler('stripe', process_stripe_event)
+webhook_inbox.register_handler('supabase_teleconsults', process_supabase_teleconsult)
+webhook_inbox.register_handler('supabase_walkins', process_supabase_walkin)
+webhook_inbox.register_handler('sgimed', process_sgimed_event)
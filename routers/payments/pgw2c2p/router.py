@@ -8,7 +8,7 @@ from config import PAYMENT_2C2P_MERCHANT_ID, PAYMENT_2C2P_CURRENCY_CODE
 import uuid
 from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
-from models import get_db
+from models import SessionLocal, get_db
 from models.payments import Payment, PaymentMethod, PaymentStatus, PaymentTransaction, PaymentType
 from routers.patient.utils import validate_firebase_token, validate_user
 from routers.payments.pgw2c2p.pgw_models import PGWPaymentInquiryResponse, PGWWebhookResp
@@ -17,6 +17,7 @@ from utils.fastapi import SuccessResp
 from sqlalchemy.orm import Session
 from .helpers import call_2c2p_api, jwt_decode_payload
 from services.appointment import appointment_success_webhook
+from services import webhook_inbox
 
 # Router
 router = APIRouter()
@@ -129,54 +130,61 @@ class PGWPaymentRespCodes(str, Enum):
     SUCCESS = '0000'
     TOKENIZATION_SUCCESS = '4200'
 
+def process_2c2p_webhook(payload_dict: dict):
+    payload = PGWWebhookResp(**payload_dict)
+    with SessionLocal() as db:
+        record = db.query(PaymentTransaction).filter(PaymentTransaction.invoice_num == payload.invoiceNo).first()
+        if not record:
+            logging.error(f"2C2P Webhook: Payment transaction not found in db: {payload}")
+        else:
+            record.webhook = payload.model_dump()
+            if payload.respCode in [PGWPaymentRespCodes.SUCCESS, PGWPaymentRespCodes.TOKENIZATION_SUCCESS]:
+                record.status = PaymentStatus.PAYMENT_SUCCESS
+            else:
+                # logging.error(f"2C2P Webhook: Payment failed. Invoice No: {payload.invoiceNo}")
+                record.status = PaymentStatus.PAYMENT_FAILED
+            db.commit()
+
+        # Save Payment Token to DB
+        if record and payload.respCode == PGWPaymentRespCodes.TOKENIZATION_SUCCESS:
+            save_payment_token_to_db(db, str(record.account_id), payload)
+            # Trigger Webhooks for payment success. Similar to Stripe Webhook.
+        
+        # Navigate User to Teleconsult Screen
+        if record and payload.respCode == PGWPaymentRespCodes.SUCCESS:
+            payments = db.query(Payment).where(
+                    Payment.payment_id == payload.invoiceNo,
+                    Payment.payment_method == PaymentMethod.CARD_2C2P
+                ).all()
+            if not payments:
+                logging.error(f"2C2P Webhook Record not found. Invoice No: {payload.invoiceNo}")
+                return
+
+            for payment in payments:
+                payment.status = PaymentStatus.PAYMENT_SUCCESS
+            db.commit()
+            
+            if payments[0].payment_type == PaymentType.PREPAYMENT:
+                prepayment_success_webhook(db, payments)
+            elif payments[0].payment_type == PaymentType.POSTPAYMENT:
+                postpayment_success_webhook(db, payments)
+            elif payments[0].payment_type == PaymentType.APPOINTMENT:
+                appointment_success_webhook(db, payments)
+
 @router.post("/webhook", response_model=SuccessResp)
-async def handle_2c2p_webhook(req: Payment2C2PWebhookPayload, key: str = Query(...), db: Session = Depends(get_db)):
+def handle_2c2p_webhook(req: Payment2C2PWebhookPayload, key: str = Query(...), db: Session = Depends(get_db)):
     '''
     2C2P Admin Panel: Redirect API - Backend return URL
+    Processed by the webhook inbox. The payload carries no delivery id, a redelivery is ignored while the first is pending
     '''
     payload = jwt_decode_payload(req.payload)
     payload = PGWWebhookResp(**payload)
-    
-    record = db.query(PaymentTransaction).filter(PaymentTransaction.invoice_num == payload.invoiceNo).first()
-    if not record:
-        logging.error(f"2C2P Webhook: Payment transaction not found in db: {payload}")
-    else:
-        record.webhook = payload.model_dump()
-        if payload.respCode in [PGWPaymentRespCodes.SUCCESS, PGWPaymentRespCodes.TOKENIZATION_SUCCESS]:
-            record.status = PaymentStatus.PAYMENT_SUCCESS
-        else:
-            # logging.error(f"2C2P Webhook: Payment failed. Invoice No: {payload.invoiceNo}")
-            record.status = PaymentStatus.PAYMENT_FAILED
-        db.commit()
-
-    # Save Payment Token to DB
-    if record and payload.respCode == PGWPaymentRespCodes.TOKENIZATION_SUCCESS:
-        save_payment_token_to_db(db, str(record.account_id), payload)
-        # Trigger Webhooks for payment success. Similar to Stripe Webhook.
-    
-    # Navigate User to Teleconsult Screen
-    if record and payload.respCode == PGWPaymentRespCodes.SUCCESS:
-        payments = db.query(Payment).where(
-                Payment.payment_id == payload.invoiceNo,
-                Payment.payment_method == PaymentMethod.CARD_2C2P
-            ).all()
-        if not payments:
-            logging.error(f"2C2P Webhook Record not found. Invoice No: {payload.invoiceNo}")
-            return SuccessResp(success=False)
-
-        for payment in payments:
-            payment.status = PaymentStatus.PAYMENT_SUCCESS
-        db.commit()
-        
-        if payments[0].payment_type == PaymentType.PREPAYMENT:
-            prepayment_success_webhook(db, payments)
-        elif payments[0].payment_type == PaymentType.POSTPAYMENT:
-            postpayment_success_webhook(db, payments)
-        elif payments[0].payment_type == PaymentType.APPOINTMENT:
-            appointment_success_webhook(db, payments)
+    webhook_inbox.enqueue_unkeyed(db, '2c2p', payload.respCode, payload.invoiceNo, payload.model_dump())
 
     return SuccessResp(success=True)
 
+webhook_inbox.register_handler('2c2p', process_2c2p_webhook)
+
 # class PaymentTransactionPayload(BaseModel):
 #     paymentToken: str
 #     clientID: str
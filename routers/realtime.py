@@ -4,7 +4,7 @@ from enum import Enum
 import json
 import logging
 from typing import Callable, Optional
-from fastapi import WebSocket, WebSocketDisconnect
+from fastapi import WebSocket, WebSocketDisconnect, status
 from pydantic import BaseModel
 
 from config import REDIS_HOST, REDIS_PORT
@@ -13,14 +13,15 @@ from routers.admin.teleconsult import TeleconsultAdminResp
 from broadcaster import Broadcast
 
 from routers.admin.walkin import WalkinAdminResp
+from routers.patient.utils import session_manager
 from utils.sg_datetime import sg
 
 BROADCASTER_URL = f'redis://{REDIS_HOST}:{REDIS_PORT}'
 BROADCASTER_CHANNEL = 'realtime'
 
 class WSEvent(Enum):
-    PATIENT_ACTIVITY_UPDATE = "patient_activity_update" # Require id
-    PATIENT_ACTIVITY_UPDATE_ALL = "patient_activity_update_all" # Update all patients for walkin queue number update
+    PATIENT_ACTIVITY_UPDATE = "patient_activity_update" # Require id, data is only sent to apps on ACTIVITY_PROTOCOL_JSON
+    PATIENT_ACTIVITY_UPDATE_ALL = "patient_activity_update_all" # Update all patients, prefer targeted PATIENT_ACTIVITY_UPDATE
     DOCTOR_TELECONSULT_UPDATE_ALL = "doctor_teleconsult_update_all" # Update all doctors for teleconsult queue number update
     ADMIN_TELECONSULT_UPDATE_ALL = "admin_teleconsult_update_all" # Update all admins for teleconsult queue number update
     ADMIN_WALKIN_UPDATE_ALL = "admin_walkin_update_all" # Update all admins for walkin queue number update
@@ -30,98 +31,214 @@ class WSMessage(BaseModel):
     event: WSEvent
     data: dict = {}
 
+# Patient activity socket protocols, the app opts in with the protocol query param. Released apps only handle
+# the "update" text and re-fetch their activity
+ACTIVITY_PROTOCOL_TEXT = 1
+# {"type": "activity_update", "v": 2, ...data}, data carries the activity version so the app can skip stale re-fetches
+ACTIVITY_PROTOCOL_JSON = 2
+ACTIVITY_UPDATE_TYPE = "activity_update"
+
+# Messages buffered per socket before it is considered a slow consumer and dropped
+WS_SEND_QUEUE_SIZE = 100
+WS_SEND_TIMEOUT = 5 # seconds
+
+class WSSender:
+    '''
+    Bounded outgoing queue drained by a task per socket, so a slow socket never blocks a broadcast
+    The socket is dropped once the queue is full or a send takes longer than WS_SEND_TIMEOUT
+    '''
+    def __init__(self, ws: WebSocket, on_drop: Callable[[WebSocket], None]):
+        self.ws = ws
+        self.on_drop = on_drop
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+        self.task = asyncio.create_task(self._run())
+
+    def send(self, text: str):
+        try:
+            self.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            logging.warning(f"WS send queue full, dropping slow connection. Client: {self.ws.client}")
+            self.on_drop(self.ws)
+
+    async def _run(self):
+        while True:
+            text = await self.queue.get()
+            try:
+                await asyncio.wait_for(self.ws.send_text(text), WS_SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                logging.warning(f"WS send timed out, dropping slow connection. Client: {self.ws.client}")
+                self.on_drop(self.ws)
+                return
+            except (WebSocketDisconnect, RuntimeError):
+                self.on_drop(self.ws)
+                return
+
+    def close(self):
+        self.task.cancel()
+
+def dump_json(data: dict) -> str:
+    # Same encoding as WebSocket.send_json
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
 class ConnectionManager:
     broadcaster = Broadcast(BROADCASTER_URL)
     
     def __init__(self):
         self.activity_connections: dict[str, WebSocket] = {}
+        self.activity_protocols: dict[WebSocket, int] = {}
         self.doctor_connections: dict[WebSocket, dict] = {}
         self.admin_connections: dict[WebSocket, dict] = {}
+        self.senders: dict[WebSocket, WSSender] = {}
+        # Event loop of the app, set on startup so handlers running in the threadpool can publish
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
         
     async def listen(self):
         subscribe_n_listen_task = asyncio.create_task(self.listen_to_channel(room_id=BROADCASTER_CHANNEL))
         wait_for_subscribe_task = asyncio.create_task(asyncio.sleep(1))  # 1 Second delay
         await asyncio.wait([subscribe_n_listen_task, wait_for_subscribe_task], return_when=asyncio.FIRST_COMPLETED)
 
-    async def send_patient_update(self, id: str):
-        if id not in self.activity_connections:
-            return
+    def add_sender(self, ws: WebSocket, disconnect_func: Callable[[WebSocket], None]):
+        self.senders[ws] = WSSender(ws, disconnect_func)
 
-        try:
-            await self.activity_connections[id].send_text("update")
-        except (WebSocketDisconnect, RuntimeError):
-            self.disconnect_patient_activity(id)
+    def remove_sender(self, ws: WebSocket):
+        self.activity_protocols.pop(ws, None)
+        sender = self.senders.pop(ws, None)
+        if sender:
+            sender.close()
 
-    async def send_doctor_update(self, ws: WebSocket, data: dict):
-        try:
-            await ws.send_json(data)
-        except (WebSocketDisconnect, RuntimeError):
-            self.disconnect_doctor(ws)
+    def drop(self, ws: WebSocket):
+        '''
+        Close a socket that cannot keep up, its endpoint loop then receives the disconnect
+        '''
+        self.remove_sender(ws)
+        asyncio.create_task(self._close(ws))
 
-    async def send_update(self, ws: WebSocket, data: dict, disconnect_func: Callable):
+    async def _close(self, ws: WebSocket):
         try:
-            await ws.send_json(data)
-        except (WebSocketDisconnect, RuntimeError):
-            disconnect_func(ws)
+            await asyncio.wait_for(ws.close(code=status.WS_1013_TRY_AGAIN_LATER), WS_SEND_TIMEOUT)
+        except Exception:
+            pass
+
+    def send_patient_update(self, id: str, data: Optional[dict] = None):
+        '''
+        Send "update" to the patient, or the data as a versioned message if their app opted in
+        '''
+        ws = self.activity_connections.get(id)
+        sender = self.senders.get(ws) if ws else None
+        if not sender:
+            return
+        if data and self.activity_protocols.get(ws) == ACTIVITY_PROTOCOL_JSON:
+            sender.send(dump_json({ "type": ACTIVITY_UPDATE_TYPE, "v": ACTIVITY_PROTOCOL_JSON, **data }))
+        else:
+            sender.send("update")
+
+    def broadcast(self, connections: list[WebSocket], text: str):
+        for ws in connections:
+            sender = self.senders.get(ws)
+            if sender:
+                sender.send(text)
+
+    def broadcast_admin(self, type: VisitType, event_date: date, data: str):
+        '''
+        Admins viewing the date of the record receive it, the rest receive an empty update
+        Each payload is serialized once for the whole audience
+        '''
+        audiences: dict[bool, list[WebSocket]] = { True: [], False: [] }
+        for ws, metadata in list(self.admin_connections.items()):
+            if metadata["type"] == type:
+                audiences[metadata["date"] == event_date].append(ws)
+        self.broadcast(audiences[True], data)
+        self.broadcast(audiences[False], dump_json({}))
 
     async def push_to_channel(self, message: WSMessage):
         logging.info(f"Publish WS event: {message}")
         try:
             await self.broadcaster.publish(channel=BROADCASTER_CHANNEL, message=message.model_dump_json())
         except Exception as e:
-            logging.warning(f"WS broadcaster unavailable, skipping realtime push: {e}")
+            # Without Redis, only clients connected to this worker can be reached
+            logging.warning(f"WS broadcaster unavailable, pushing to local connections only: {e}")
+            await self.handle_message(message)
+
+    def publish(self, message: WSMessage):
+        '''
+        Push to the channel from sync code running in the threadpool
+        The publish is scheduled on the app event loop and not waited for
+        '''
+        if self.loop is None or self.loop.is_closed():
+            logging.warning(f"WS event loop not available, dropping event: {message}")
+            return
+        asyncio.run_coroutine_threadsafe(self.push_to_channel(message), self.loop)
 
     async def listen_to_channel(self, room_id: str):
         async with self.broadcaster.subscribe(channel=room_id) as subscriber:
             async for event in subscriber: # type: ignore
                 logging.info(f"Received WS event: {event.message}")
-                msg = WSMessage.model_validate_json(event.message)
-                # continue
-                # Handle Patient Activity Update
-                if msg.id and msg.event == WSEvent.PATIENT_ACTIVITY_UPDATE:
-                    await self.send_patient_update(msg.id)
-                elif msg.event == WSEvent.PATIENT_ACTIVITY_UPDATE_ALL:
-                    for id in list(self.activity_connections.keys()):
-                        await self.send_patient_update(id)
-                elif msg.event == WSEvent.DOCTOR_TELECONSULT_UPDATE_ALL:
-                    for ws in list(self.doctor_connections.keys()):
-                        await self.send_doctor_update(ws, msg.data)
-                elif msg.event == WSEvent.ADMIN_TELECONSULT_UPDATE_ALL:
-                    resp = TeleconsultAdminResp.model_validate(msg.data)
-                    for ws, metadata in list(self.admin_connections.items()):
-                        if metadata["type"] != VisitType.TELECONSULT:
-                            continue
-                        data = {} if sg(resp.checkin_time).date() != metadata["date"] else json.loads(resp.model_dump_json())
-                        await self.send_update(ws, data, self.disconnect_admin)
-                elif msg.event == WSEvent.ADMIN_WALKIN_UPDATE_ALL:
-                    resp = WalkinAdminResp.model_validate(msg.data)
-                    for ws, metadata in list(self.admin_connections.items()):
-                        if metadata["type"] != VisitType.WALKIN:
-                            continue
-                        data = {} if sg(resp.created_at).date() != metadata["date"] else json.loads(resp.model_dump_json())
-                        await self.send_update(ws, data, self.disconnect_admin)
-                else:
+                try:
+                    msg = WSMessage.model_validate_json(event.message)
+                except ValueError:
                     logging.error(f"Unknown event: {event.message}")
+                    continue
+                await self.handle_message(msg)
 
-    async def connect_patient_activity(self, id: str, ws: WebSocket):
+    async def handle_message(self, msg: WSMessage):
+        '''
+        Route a channel message to the websocket and SSE clients connected to this worker
+        '''
+        # Handle Patient Activity Update
+        if msg.id and msg.event == WSEvent.PATIENT_ACTIVITY_UPDATE:
+            session_manager.send_message(msg.id, msg.event.value)
+            self.send_patient_update(msg.id, msg.data)
+        elif msg.event == WSEvent.PATIENT_ACTIVITY_UPDATE_ALL:
+            session_manager.send_message_all(msg.event.value)
+            self.broadcast(list(self.activity_connections.values()), "update")
+        elif msg.event == WSEvent.DOCTOR_TELECONSULT_UPDATE_ALL:
+            self.broadcast(list(self.doctor_connections.keys()), dump_json(msg.data))
+        elif msg.event == WSEvent.ADMIN_TELECONSULT_UPDATE_ALL:
+            resp = TeleconsultAdminResp.model_validate(msg.data)
+            self.broadcast_admin(VisitType.TELECONSULT, sg(resp.checkin_time).date(), resp.model_dump_json())
+        elif msg.event == WSEvent.ADMIN_WALKIN_UPDATE_ALL:
+            resp = WalkinAdminResp.model_validate(msg.data)
+            self.broadcast_admin(VisitType.WALKIN, sg(resp.created_at).date(), resp.model_dump_json())
+        else:
+            logging.error(f"Unknown event: {msg}")
+        # Let the senders drain before the next event, subscriber reads do not yield when messages are pending
+        await asyncio.sleep(0)
+
+    async def connect_patient_activity(self, id: str, ws: WebSocket, protocol: int = ACTIVITY_PROTOCOL_TEXT):
         await ws.accept()
+        if id in self.activity_connections:
+            self.remove_sender(self.activity_connections[id])
         self.activity_connections[id] = ws
+        self.activity_protocols[ws] = protocol
+        self.add_sender(ws, lambda _ws: self.drop_patient_activity(id, _ws))
     
     def disconnect_patient_activity(self, id: str):
         try:
-            del self.activity_connections[id]
+            self.remove_sender(self.activity_connections.pop(id))
         except KeyError:
             logging.warning(f"WS Patient Connection not found. User ID: {id}")
+
+    def drop_patient_activity(self, id: str, ws: WebSocket):
+        # Only remove the entry if the patient has not reconnected on a new socket
+        if self.activity_connections.get(id) is ws:
+            del self.activity_connections[id]
+        self.drop(ws)
     
     async def connect_doctor(self, ws: WebSocket, id: str):
         await ws.accept()
         self.doctor_connections[ws] = { "id": id }
+        self.add_sender(ws, self.drop_doctor)
     
     def disconnect_doctor(self, ws: WebSocket):
+        self.remove_sender(ws)
         try:
             del self.doctor_connections[ws]
         except Exception:
             logging.warning("WS Doctor Connection not found.")    
+
+    def drop_doctor(self, ws: WebSocket):
+        self.doctor_connections.pop(ws, None)
+        self.drop(ws)
     
     async def connect_admin(self, ws: WebSocket, id: str, date: date, type: VisitType):
         await ws.accept()
@@ -130,11 +247,17 @@ class ConnectionManager:
             "date": date,
             "type": type
         }
+        self.add_sender(ws, self.drop_admin)
 
     def disconnect_admin(self, ws: WebSocket):
+        self.remove_sender(ws)
         try:
             del self.admin_connections[ws]
         except Exception:
             logging.warning("WS Admin Connection not found.")
 
+    def drop_admin(self, ws: WebSocket):
+        self.admin_connections.pop(ws, None)
+        self.drop(ws)
+
 ws_manager = ConnectionManager()
@@ -134,7 +134,7 @@ def get_one(
 
 
 @router.post("/", response_model=SpecialisationResponse)
-async def create(
+def create(
     name: str = Form(...),
     slug: str = Form(...),
     description: str = Form(""),
@@ -155,7 +155,7 @@ async def create(
     if icon and icon.filename:
         sanitized_name = re.sub(r'[^a-zA-Z0-9_-]', '_', slug)
         icon_filename = f'specialisations/icons/{sanitized_name}_{uuid.uuid4()}{osp.splitext(icon.filename)[-1]}'
-        icon_bytes = await icon.read()
+        icon_bytes = icon.file.read()
         content_type = icon.content_type if icon.content_type else 'image/jpeg'
         
         supabase.storage.from_(SUPABASE_UPLOAD_BUCKET).upload(
@@ -169,7 +169,7 @@ async def create(
     if banner and banner.filename:
         sanitized_name = re.sub(r'[^a-zA-Z0-9_-]', '_', slug)
         banner_filename = f'specialisations/banners/{sanitized_name}_{uuid.uuid4()}{osp.splitext(banner.filename)[-1]}'
-        banner_bytes = await banner.read()
+        banner_bytes = banner.file.read()
         content_type = banner.content_type if banner.content_type else 'image/jpeg'
         
         supabase.storage.from_(SUPABASE_UPLOAD_BUCKET).upload(
@@ -196,7 +196,7 @@ async def create(
 
 
 @router.patch("/{specialisation_id}", response_model=SpecialisationResponse)
-async def update(
+def update(
     specialisation_id: int,
     name: str = Form(""),
     slug: str = Form(""),
@@ -216,7 +216,7 @@ async def update(
     if icon and icon.filename:
         sanitized_name = re.sub(r'[^a-zA-Z0-9_-]', '_', slug or record.slug)
         icon_filename = f'specialisations/icons/{sanitized_name}_{uuid.uuid4()}{osp.splitext(icon.filename)[-1]}'
-        icon_bytes = await icon.read()
+        icon_bytes = icon.file.read()
         content_type = icon.content_type if icon.content_type else 'image/jpeg'
         
         supabase.storage.from_(SUPABASE_UPLOAD_BUCKET).upload(
@@ -230,7 +230,7 @@ async def update(
     if banner and banner.filename:
         sanitized_name = re.sub(r'[^a-zA-Z0-9_-]', '_', slug or record.slug)
         banner_filename = f'specialisations/banners/{sanitized_name}_{uuid.uuid4()}{osp.splitext(banner.filename)[-1]}'
-        banner_bytes = await banner.read()
+        banner_bytes = banner.file.read()
         content_type = banner.content_type if banner.content_type else 'image/jpeg'
         
         supabase.storage.from_(SUPABASE_UPLOAD_BUCKET).upload(
@@ -56,7 +56,7 @@ def get_one(specialist_id: int, db: Session = Depends(get_db)):
 
 
 @router.post("/", response_model=SpecialistResponse)
-async def create(
+def create(
     specialisation_id: int = Form(...),
     title: str = Form(""),
     name: str = Form(...),
@@ -112,7 +112,7 @@ async def create(
         # Sanitize the specialist name for filename
         sanitized_name = re.sub(r'[^a-zA-Z0-9_-]', '_', name)
         image_filename = f'specialists/{sanitized_name}_{uuid.uuid4()}{osp.splitext(image.filename)[-1]}'
-        image_bytes = await image.read()
+        image_bytes = image.file.read()
         content_type = image.content_type if image.content_type else 'image/jpeg'
         
         resp = supabase.storage.from_(SUPABASE_UPLOAD_BUCKET).upload(
@@ -127,7 +127,7 @@ async def create(
     if clinic_logo and clinic_logo.filename:
         sanitized_name = re.sub(r'[^a-zA-Z0-9_-]', '_', name)
         filename = f'specialists/{sanitized_name}_logo_{uuid.uuid4()}{osp.splitext(clinic_logo.filename)[-1]}'
-        bytes_data = await clinic_logo.read()
+        bytes_data = clinic_logo.file.read()
         ctype = clinic_logo.content_type if clinic_logo.content_type else 'image/jpeg'
         supabase.storage.from_(SUPABASE_UPLOAD_BUCKET).upload(
             file=bytes_data, path=filename, file_options={"content-type": ctype, "upsert": "true"}
@@ -138,7 +138,7 @@ async def create(
     if banner_image and banner_image.filename:
         sanitized_name = re.sub(r'[^a-zA-Z0-9_-]', '_', name)
         filename = f'specialists/{sanitized_name}_banner_{uuid.uuid4()}{osp.splitext(banner_image.filename)[-1]}'
-        bytes_data = await banner_image.read()
+        bytes_data = banner_image.file.read()
         ctype = banner_image.content_type if banner_image.content_type else 'image/jpeg'
         supabase.storage.from_(SUPABASE_UPLOAD_BUCKET).upload(
             file=bytes_data, path=filename, file_options={"content-type": ctype, "upsert": "true"}
@@ -184,7 +184,7 @@ async def create(
 
 
 @router.patch("/{specialist_id}", response_model=SpecialistResponse)
-async def update(
+def update(
     specialist_id: int,
     specialisation_id: Optional[int] = Form(None),
     title: str = Form(""),
@@ -241,7 +241,7 @@ async def update(
         current_name = name if name else record.name
         sanitized_name = re.sub(r'[^a-zA-Z0-9_-]', '_', current_name)
         image_filename = f'specialists/{sanitized_name}_{uuid.uuid4()}{osp.splitext(image.filename)[-1]}'
-        image_bytes = await image.read()
+        image_bytes = image.file.read()
         content_type = image.content_type if image.content_type else 'image/jpeg'
         
         resp = supabase.storage.from_(SUPABASE_UPLOAD_BUCKET).upload(
@@ -256,7 +256,7 @@ async def update(
         current_name = name if name else record.name
         sanitized_name = re.sub(r'[^a-zA-Z0-9_-]', '_', current_name)
         filename = f'specialists/{sanitized_name}_logo_{uuid.uuid4()}{osp.splitext(clinic_logo.filename)[-1]}'
-        bytes_data = await clinic_logo.read()
+        bytes_data = clinic_logo.file.read()
         ctype = clinic_logo.content_type if clinic_logo.content_type else 'image/jpeg'
         supabase.storage.from_(SUPABASE_UPLOAD_BUCKET).upload(
             file=bytes_data, path=filename, file_options={"content-type": ctype, "upsert": "true"}
@@ -267,7 +267,7 @@ async def update(
         current_name = name if name else record.name
         sanitized_name = re.sub(r'[^a-zA-Z0-9_-]', '_', current_name)
         filename = f'specialists/{sanitized_name}_banner_{uuid.uuid4()}{osp.splitext(banner_image.filename)[-1]}'
-        bytes_data = await banner_image.read()
+        bytes_data = banner_image.file.read()
         ctype = banner_image.content_type if banner_image.content_type else 'image/jpeg'
         supabase.storage.from_(SUPABASE_UPLOAD_BUCKET).upload(
             file=bytes_data, path=filename, file_options={"content-type": ctype, "upsert": "true"}
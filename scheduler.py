@@ -14,6 +14,7 @@ from models.walkin import WalkInQueue
 from routers.patient.actions.walkin import pending_walkin_queue_update
 from scheduler_actions.appointment_updates import send_appointment_notifications
 from scheduler_actions.sgimed_updates import load_cron_log, update_delivery_method_cron, update_documents_cron, update_invoices_cron, update_mcs_cron, update_patient_profiles_cron
+from scheduler_actions.health_report.process import start_profile_executor
 from scheduler_actions.sgimed_health_report_updates import generate_health_reports, update_hl7_logs_cron, update_incoming_reports_cron, update_measurements_cron
 from scheduler_actions.sgimed_appointment_updates import update_appointments_cron
 from scheduler_actions.sgimed_sync import update_inventory_details_cron, update_inventory_sync_cron, update_appointment_types_sync_cron
@@ -21,6 +22,12 @@ from scheduler_actions.yuu_updates import retry_failed_transactions, send_yuu_tr
 from services.reconciliation import process_reconciliation
 from utils import sg_datetime
 from scheduler_actions.delivery_updates import hide_expired_delivery_note_action
+from scheduler_actions.job_runner import JobRunner, prune_job_runs
+from services.webhook_inbox import prune_webhook_events
+from utils.run_metrics import add_rows
+
+# Health report workers are forked before Sentry and the scheduler start their threads
+start_profile_executor()
 
 sentry_sdk.init(
     dsn=SENTRY_DSN,
@@ -38,8 +45,10 @@ sentry_sdk.init(
 # scheduler = AsyncIOScheduler(jobstores=jobstores, timezone='Asia/Singapore') 
 # scheduler = BackgroundScheduler(timezone='Asia/Singapore') 
 scheduler = BlockingScheduler(timezone='Asia/Singapore')
+# Jobs run under Postgres leases and are recorded in the run history, so several scheduler nodes can run
+jobs = JobRunner(scheduler)
 
-@scheduler.scheduled_job('interval', minutes=30)
+@jobs.scheduled_job('interval', minutes=30)
 def scheduled_payment_reconciliation():
     with SessionLocal() as db:
         cron_log = load_cron_log(db, 'reconciliation_cron')
@@ -53,7 +62,7 @@ def scheduled_payment_reconciliation():
         db.commit()
 
 # This is a scheduled job that will run every 5 minutes.
-@scheduler.scheduled_job('interval', minutes=5)
+@jobs.scheduled_job('interval', minutes=5)
 def scheduled_clear_pending_queues():
     print("Scheduler: Scheduled to run every 1 minute to clear any pending queues past 30 minutes")
     with SessionLocal() as db:
@@ -61,35 +70,30 @@ def scheduled_clear_pending_queues():
                 WalkInQueue.status == WalkinQueueStatus.PENDING,
                 WalkInQueue.created_at < sg_datetime.now() - timedelta(minutes=30)
             ).all()
+        add_rows(len(records))
 
         for record in records:
             pending_walkin_queue_update(record.sgimed_pending_queue_id, False, cancel_sgimed=True)
             print(f"Rejected {record.sgimed_pending_queue_id}. Created Time: {record.created_at}, Curr Time: {sg_datetime.now()}")
 
 # This is a scheduled job that will run every 1 minutes.
-@scheduler.scheduled_job('interval', minutes=1)
+@jobs.scheduled_job('interval', minutes=1)
 def scheduled_sgimed_updates():
-    print("Scheduler: Scheduled to run every 1 minute to clear any pending queues past 30 minutes")
-    start_time = time.time()
+    print("Scheduler: Scheduled to run every 1 minute to update SGiMed patients, documents, invoices and MCs")
     with SessionLocal() as db:
         update_patient_profiles_cron(db)
         update_documents_cron(db)
         visit_ids_processed = update_invoices_cron(db)
         update_mcs_cron(db, visit_ids_processed)
 
-    print(f"Time Taken: {time.time() - start_time:.2f} seconds")
-
-@scheduler.scheduled_job('interval', minutes=1)
+@jobs.scheduled_job('interval', minutes=1)
 def scheduled_sgimed_appointment_updates():
     print("Scheduler: Scheduled to run every 1 minute to update sgimed appointments")
-    start_time = time.time()
     with SessionLocal() as db:
         update_appointments_cron(db)
-        
-    print(f"Time Taken: {time.time() - start_time:.2f} seconds")
 
 # TODO: Profile and Invoice Polling (Half Daily)
-@scheduler.scheduled_job('cron', day_of_week='mon-sun', hour=0, minute=0, second=0)  # Decorator for scheduling the job
+@jobs.scheduled_job('cron', day_of_week='mon-sun', hour=0, minute=0, second=0)  # Decorator for scheduling the job
 def scheduled_clear_midnight_teleconsults():  # Function to be executed at the scheduled time
     print(f"Scheduler: Running at midnight to convert any missed/cancelled teleconsults to checked out {sg_datetime.now()}") 
 
@@ -101,6 +105,7 @@ def scheduled_clear_midnight_teleconsults():  # Function to be executed at the s
                 Teleconsult.status.in_((TeleconsultStatus.CANCELLED, TeleconsultStatus.MISSED)),
                 Teleconsult.created_at < curr_time
             ).all()
+        add_rows(len(records))
         
         for record in records:
             print(f"{record.id}: {record.status}, {record.created_at}")
@@ -126,7 +131,7 @@ def scheduled_clear_midnight_teleconsults():  # Function to be executed at the s
         db.commit()
 
 # This is the scheduler to manage delivery note expiry
-@scheduler.scheduled_job('interval', days=1)
+@jobs.scheduled_job('interval', days=1)
 def scheduled_delivery_note_expiry():
     print(f"Scheduler: Running to hide expired delivery notes {sg_datetime.now()} every one day")
     with SessionLocal() as db:
@@ -134,14 +139,14 @@ def scheduled_delivery_note_expiry():
         print(f"Scheduler: Hidden expired delivery notes {sg_datetime.now()} successfully")
 
 # This is the scheduler to manage change of delivery method
-@scheduler.scheduled_job('interval', minutes=1)
+@jobs.scheduled_job('interval', minutes=1)
 def scheduled_delivery_method_change():
     print(f"Scheduler: Running to change delivery method {sg_datetime.now()} every minute")
     with SessionLocal() as db:
         update_delivery_method_cron(db)        
         print(f"Scheduler: Changed delivery method {sg_datetime.now()} successfully")
 
-@scheduler.scheduled_job('interval', minutes=45)
+@jobs.scheduled_job('interval', minutes=45)
 def scheduled_update_health_report_logs():
     print(f"Scheduler: Running to update Health Report (HL7, Incoming Reports) logs {sg_datetime.now()}")
     with SessionLocal() as db:
@@ -149,13 +154,13 @@ def scheduled_update_health_report_logs():
         update_incoming_reports_cron(db)
         update_measurements_cron(db)
 
-@scheduler.scheduled_job('cron', day_of_week='mon-sun', hour=1, minute=0, second=0)
+@jobs.scheduled_job('cron', day_of_week='mon-sun', hour=1, minute=0, second=0)
 def scheduled_process_health_reports():
     print(f"Scheduler: Running to process health reports {sg_datetime.now()}")
     with SessionLocal() as db:
         generate_health_reports(db)
 
-@scheduler.scheduled_job('interval', minutes=5)
+@jobs.scheduled_job('interval', minutes=5)
 def scheduled_inventory_sync():
     print(f"Scheduler: Running inventory sync from SGiMed {sg_datetime.now()}")
     start_time = time.time()
@@ -166,28 +171,38 @@ def scheduled_inventory_sync():
 
     print(f"Inventory and appointment types sync completed. Time taken: {time.time() - start_time:.2f} seconds")
 
-@scheduler.scheduled_job('cron', day=1, hour=0, minute=0, second=0)  # Decorator for scheduling the job
+@jobs.scheduled_job('cron', day=1, hour=0, minute=0, second=0)  # Decorator for scheduling the job
 def scheduled_send_yuu_transacion_refunds():
     print(f"Scheduler: Running to send Yuu transaction refunds {sg_datetime.now()}")
     with SessionLocal() as db:
         send_yuu_transacion_refunds(db)
 
-@scheduler.scheduled_job('interval', hours=1)
+@jobs.scheduled_job('interval', hours=1)
 def scheduled_retry_failed_transactions():
     print(f"Scheduler: Running to retry failed transactions {sg_datetime.now()}")
     with SessionLocal() as db:
         retry_failed_transactions(db)
 
-@scheduler.scheduled_job('interval', hours=1)
+@jobs.scheduled_job('interval', hours=1)
 def scheduled_send_notifications():
     print(f"Scheduler: Running to send 1 day before appointment notifications {sg_datetime.now()}")
     with SessionLocal() as db:
         send_appointment_notifications(db)
 
+@jobs.scheduled_job('cron', day_of_week='mon-sun', hour=3, minute=0, second=0)
+def scheduled_prune_job_runs():
+    print(f"Scheduler: Running to prune the scheduler run history {sg_datetime.now()}")
+    prune_job_runs()
+
+@jobs.scheduled_job('cron', day_of_week='mon-sun', hour=3, minute=30, second=0)
+def scheduled_prune_webhook_events():
+    print(f"Scheduler: Running to prune processed webhook events {sg_datetime.now()}")
+    prune_webhook_events()
+
 # import tracemalloc
 # tracemalloc.start()
 
-# @scheduler.scheduled_job('cron', second='*/5')  # Decorator for scheduling the job
+# @jobs.scheduled_job('cron', second='*/5')  # Decorator for scheduling the job
 # def take_memory_snapshot():  # Function to be executed at the scheduled time
 #     current, peak = tracemalloc.get_traced_memory()
 #     print('Current and peak memory usage: {} {}'.format(current / 1048576, peak / 1048576))
@@ -1,11 +1,11 @@
 from sqlalchemy import or_
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from models import Appointment, Account
 from models.model_enums import AppointmentStatus
 from repository.appointment import get_grouped_appointments
 from utils import sg_datetime
 from datetime import timedelta
-from utils.notifications import send_patient_notification
+from utils.notifications import PushNotification, send_patient_notifications
 from utils.integrations.sgimed_appointment import update_appointment_status
 import logging
 
@@ -20,23 +20,38 @@ def send_appointment_notifications(db: Session):
             ~Appointment.notifications_sent.any('appt_1_day_reminder'), # type: ignore
         ).all()
 
+    accounts = db.query(Account) \
+        .options(selectinload(Account.firebase_auths)) \
+        .filter(Account.id.in_({ appt.created_by for appt in appts })) \
+        .all()
+    accounts = { str(account.id): account for account in accounts }
+
+    notifications: list[PushNotification] = []
+    notified_appts: list[Appointment] = []
     for appt in appts:
-        account = db.get(Account, appt.created_by)
+        account = accounts.get(str(appt.created_by))
         if not account:
             logging.error(f"Appointment {appt.id} has no account {appt.created_by}")
             continue
         
         # Send Notification to Primary User
-        send_patient_notification(
+        notifications.append(PushNotification.from_account(
             account, 
             "Appointment Reminder", 
             "This is a reminder that you have an appointment scheduled for " + sg_datetime.sg(appt.start_datetime).strftime("%I:%M %p") + " tomorrow at " + appt.branch['name']
-        )
+        ))
+        notified_appts.append(appt)
+
+    if not notifications:
+        return
+
+    send_patient_notifications(notifications)
+    for appt in notified_appts:
         appt.notifications_sent = appt.notifications_sent + ['appt_1_day_reminder']
-        db.commit()
+    db.commit()
 
-        appts = get_grouped_appointments(db, appt)
-        for appt in appts:
-            # Update on SGiMed Appointment Informed. It can be None because primary appointment is not created on SGiMed.
-            if appt.sgimed_appointment_id:
-                update_appointment_status(appt.sgimed_appointment_id, is_informed=True)
+    for appt in notified_appts:
+        # Update on SGiMed Appointment Informed. It can be None because primary appointment is not created on SGiMed.
+        for grouped_appt in get_grouped_appointments(db, appt):
+            if grouped_appt.sgimed_appointment_id:
+                update_appointment_status(grouped_appt.sgimed_appointment_id, is_informed=True)
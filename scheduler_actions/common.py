@@ -1,9 +1,26 @@
-from models import CronLog
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import logging
+from typing import Optional
+from models import CronItemFailure, CronLog
 from sqlalchemy.orm import Session
 from datetime import datetime
 from utils import sg_datetime
 from utils.integrations.sgimed import get
 
+# Pages fetched per cron run, restricted for endpoints where each row requires further SGiMed calls
+DEFAULT_MAX_PAGES = 20
+MAX_PAGES_PER_RUN = {
+    '/order/mc': 1,
+    # Details of the changed invoices are fetched by INVOICE_DETAIL_WORKERS through the shared rate limiter, and
+    # unchanged invoices cost no further calls. A failed invoice holds the checkpoint, so every page of the run is retried
+    '/invoice': 5,
+}
+# Runs a failing row holds the checkpoint for, before it is dead-lettered and the cron moves past it
+MAX_ITEM_ATTEMPTS = 5
+# Concurrent page requests, SGiMed rate limits are applied by the shared client
+PAGE_WORKERS = 4
+
 def load_cron_log(db: Session, id: str):
     record = db.query(CronLog).filter(CronLog.id == id).first()
     if not record:
@@ -14,40 +31,98 @@ def load_cron_log(db: Session, id: str):
     return record
 
 class CronLogAPI:
-    def __init__(self, db: Session, cron_id: str, endpoint, **kwargs):
+    def __init__(self, db: Session, cron_id: str, endpoint, max_pages: Optional[int] = None, **kwargs):
         self.db = db
         self.cron_log = load_cron_log(db, cron_id)
         modified_since = self.cron_log.last_modified
         last_page = self.cron_log.last_page if self.cron_log.last_page else 1
         self.start_time = sg_datetime.now()
-        self.data, self.next_page = fetch_updates_by_time_and_page(endpoint, modified_since, last_page, **kwargs)
+        self.data, self.next_page = fetch_updates_by_time_and_page(endpoint, modified_since, last_page, max_pages, **kwargs)
+
+    def commit(self, failed: Optional[dict[str, str]] = None, succeeded: Optional[list[str]] = None) -> bool:
+        '''
+        Save the checkpoint, returns False if it is held for failed rows that have attempts left
+        failed maps the id of each failed row to its error, succeeded rows clear their previous failures
+        '''
+        if succeeded:
+            self.db.query(CronItemFailure).filter(
+                CronItemFailure.cron_id == self.cron_log.id,
+                CronItemFailure.item_id.in_(succeeded)
+            ).delete(synchronize_session=False)
+        if failed and not self._record_failures(failed):
+            self.db.commit()
+            return False
 
-    def commit(self):
         if self.next_page:
             self.cron_log.last_page = self.next_page
         else:
             self.cron_log.last_modified = self.start_time.replace(tzinfo=None)
             self.cron_log.last_page = None
         self.db.commit()
+        return True
+
+    def _record_failures(self, failed: dict[str, str]) -> bool:
+        '''
+        Count an attempt for each failed row, returns True once every failed row is dead-lettered
+        '''
+        cron_id = self.cron_log.id
+        records = {
+            record.item_id: record for record in
+            self.db.query(CronItemFailure).filter(CronItemFailure.cron_id == cron_id, CronItemFailure.item_id.in_(list(failed.keys()))).all()
+        }
+        retrying = []
+        for item_id, error in failed.items():
+            record = records.get(item_id)
+            if not record:
+                record = CronItemFailure(cron_id=cron_id, item_id=item_id, attempts=0, dead_lettered=False)
+                self.db.add(record)
+            if record.dead_lettered:
+                continue
+            record.attempts += 1
+            record.error = error
+            if record.attempts >= MAX_ITEM_ATTEMPTS:
+                record.dead_lettered = True
+                logging.error(f"Cron {cron_id}: {item_id} failed {record.attempts} times, skipped. Error: {error}")
+            else:
+                retrying.append(item_id)
+        if retrying:
+            logging.error(f"Cron {cron_id}: Failed rows {retrying}, the checkpoint is held for the next run")
+        return not retrying
 
-def fetch_updates_by_time_and_page(endpoint: str, modified_since: datetime, page: int, **kwargs):
-    # Start with Page 1
+def fetch_updates_by_time_and_page(endpoint: str, modified_since: datetime, page: int, max_pages: Optional[int] = None, **kwargs):
+    '''
+    Fetch pages of rows modified since modified_since, starting at page
+    Page 1 is read first to get the pager, the remaining pages are fetched concurrently.
+    Returns the rows of the contiguous pages fetched and the next page to resume from, None once all pages are read
+    '''
     modified_since_str = modified_since.strftime("%Y-%m-%d %H:%M:%S")
-    print(f"Fetching {endpoint}, {modified_since}, page {page}")
-    resp = get(endpoint, { "modified_since": modified_since_str, "page": page, **kwargs })
+    def fetch_page(p: int):
+        print(f"Fetching {endpoint}, {modified_since}, page {p}")
+        return get(endpoint, { "modified_since": modified_since_str, "page": p, **kwargs })
+
+    resp = fetch_page(page)
     updated_rows = resp['data']
-    # Restrict these endpoints to only 1 pages
-    max_pages = 1 if endpoint in ['/order/mc', '/invoice'] else 5
-    last_page = page
     # Only apply to appointment types API since it does not have pager
     if 'pager' not in resp:
         return updated_rows, None
-    
-    # More than Page 1, If pages more than 5, only take 5 pages to prevent overload
-    for i in range(page + 1, min(resp['pager']['pages'] + 1, page + max_pages)):
-        print(f"Fetching {endpoint}, {modified_since}, page {i}")
-        resp = get(endpoint, { "modified_since": modified_since_str, "page": i, **kwargs })
-        updated_rows += resp['data']
-        last_page = i
-
-    return updated_rows, last_page + 1 if last_page < resp['pager']['pages'] else None
+
+    total_pages = resp['pager']['pages']
+    max_pages = max_pages or MAX_PAGES_PER_RUN.get(endpoint, DEFAULT_MAX_PAGES)
+    pages = list(range(page + 1, min(total_pages + 1, page + max_pages)))
+    last_page = page
+    if pages:
+        with ThreadPoolExecutor(max_workers=min(PAGE_WORKERS, len(pages)), thread_name_prefix="sgimed_pager") as executor:
+            # Run each page in a copy of the job's context so its SGiMed calls count towards the run
+            futures = [executor.submit(contextvars.copy_context().run, fetch_page, p) for p in pages]
+            # Only keep contiguous pages, the checkpoint resumes from the first page that failed
+            for p, future in zip(pages, futures):
+                try:
+                    updated_rows += future.result()['data']
+                    last_page = p
+                except Exception as e:
+                    logging.error(f"Failed to fetch {endpoint} page {p}, resuming from this page next run. {e}")
+                    for pending in futures:
+                        pending.cancel()
+                    return updated_rows, p
+
+    return updated_rows, last_page + 1 if last_page < total_pages else None
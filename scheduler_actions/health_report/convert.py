@@ -12,11 +12,11 @@ from hl7apy.consts import VALIDATION_LEVEL
 from hl7apy.core import ElementList
 from hl7apy.parser import parse_segment
 import re
+from .hl7 import UnsupportedSegment, split_segment, get_field, get_report_file_key
 
 import json
 from tqdm import tqdm
-from repository.health_report.mapping import health_report_profiles
-from repository.health_report.logic import test_generic_mapping
+from repository.health_report.mapping import compiled_profiles
 from repository.health_report.enums import TestTags, ProfileReportResp, TestResult, ProfileHeader
 from decimal import Decimal
 
@@ -67,122 +67,260 @@ def main():
 
 
 def get_report_measurements(db: Session, report: IncomingReport):
-    # Ensure report_file_id is not None since it is using a like query match
-    if not report.report_file_id:
-        logging.error(f"Incoming Report {report.id}: report_file_id not found")
-        return None, None
-    # Ensure report_file_id is 7 characters long, but do not interrupt logic
-    if not len(report.report_file_id) == 7:
-        logging.error(f"Incoming Report {report.id}: report_file_id '{report.report_file_id}' length is not 7")
-
+    return get_reports_measurements(db, [report]).get(report.id, (None, None))
+
+def find_report_hl7_ids(db: Session, reports: list[IncomingReport]) -> dict[str, str]:
+    '''
+    Latest HL7 log id of each report with the same NRIC
+    Matched on the indexed report_file_key, then on a report_file_id containing the report's file id
+    Key matches must also contain the report's file id, so they never match more than the substring match
+    '''
     # Incoming Reports are only processed upon Completion. Thus, HL7 should always exists, if not it means report is not to be processed
     # 1. Failed: report_id format in HL7 changes
     # hl7 = db.query(HL7Log).filter(HL7Log.report_file_id == report.report_file_id).order_by(HL7Log.created_at.desc()).first()
+    #    Now matched on the canonical report_file_key extracted at ingest
     # 2. Failed: report_id in HL7 is different from incoming report
-    hl7 = db.query(HL7Log).filter(
-        HL7Log.nric == report.nric, 
-        HL7Log.report_file_id.like(f'%{report.report_file_id}%')
-    ).order_by(HL7Log.created_at.desc()).first()
+    #    Kept as the fallback, HL7Log.report_file_id.like(f'%{report.report_file_id}%') for the reports the key does not match
     # 3. Given HL7Log.created_at timing is usually aligned with IncomingReport.file_date, take 1 day difference
     # start_date = report.file_date - timedelta(hours=12)
     # end_date = report.file_date + timedelta(hours=12)
-    # hl7 = db.query(HL7Log).filter(
-    #     HL7Log.nric == report.nric,
-    #     HL7Log.created_at >= start_date,
-    #     HL7Log.created_at <= end_date,
-    # ).order_by(HL7Log.created_at.desc()).first()
-    if not hl7:
-        return None, None
+    hl7_ids = {}
+    report_keys = { report.id: get_report_file_key(report.report_file_id) for report in reports }
+    keys = set(key for key in report_keys.values() if key)
+    if keys:
+        latest = {}
+        rows = db.query(HL7Log.id, HL7Log.nric, HL7Log.report_file_id, HL7Log.report_file_key).filter(
+            HL7Log.report_file_key.in_(keys)
+        ).order_by(HL7Log.created_at.desc()).all()
+        for row in rows:
+            latest.setdefault((row.nric, row.report_file_key), []).append(row)
+        for report in reports:
+            for row in latest.get((report.nric, report_keys[report.id]), []):
+                if report.report_file_id and report.report_file_id in (row.report_file_id or ''):
+                    hl7_ids[report.id] = row.id
+                    break
+
+    unmatched = [report for report in reports if report.id not in hl7_ids]
+    if not unmatched:
+        return hl7_ids
+
+    candidates: dict[str, list] = {}
+    rows = db.query(HL7Log.id, HL7Log.nric, HL7Log.report_file_id).filter(
+        HL7Log.nric.in_(set(report.nric for report in unmatched))
+    ).order_by(HL7Log.created_at.desc()).all()
+    for row in rows:
+        candidates.setdefault(row.nric, []).append(row)
+
+    for report in unmatched:
+        for row in candidates.get(report.nric, []):
+            if report.report_file_id in (row.report_file_id or ''):
+                logging.info(f"Incoming Report {report.id}: report_file_id '{report.report_file_id}' matched HL7 {row.id} '{row.report_file_id}' by substring")
+                hl7_ids[report.id] = row.id
+                break
+    return hl7_ids
+
+def get_reports_measurements(db: Session, reports: list[IncomingReport]) -> dict[str, tuple[HL7Log | None, dict | None]]:
+    '''
+    HL7 log and test results of each report, keyed by report id, (None, None) if the report cannot be processed
+    HL7 logs, accounts and measurements are loaded with one query each for all the reports
+    Reports that fail to convert are logged and left out
+    '''
+    results = {}
+    valid_reports = []
+    for report in reports:
+        # Ensure report_file_id is not None since it is using a like query match
+        if not report.report_file_id:
+            logging.error(f"Incoming Report {report.id}: report_file_id not found")
+            results[report.id] = (None, None)
+            continue
+        # Ensure report_file_id is 7 characters long, but do not interrupt logic
+        if not len(report.report_file_id) == 7:
+            logging.error(f"Incoming Report {report.id}: report_file_id '{report.report_file_id}' length is not 7")
+        valid_reports.append(report)
+    if not valid_reports:
+        return results
+
+    hl7_ids = find_report_hl7_ids(db, valid_reports)
+    hl7s = { hl7.id: hl7 for hl7 in db.query(HL7Log).filter(HL7Log.id.in_(set(hl7_ids.values()))).all() } if hl7_ids else {}
 
     # Convert HL7 to JSON
-    patient_details_json = hl7_to_json(hl7.hl7_content)
-    if 'GENDER' not in patient_details_json:
-        account = db.query(Account).filter(Account.nric == report.nric).first()
-        if account:
-            if account.gender == SGiMedGender.MALE:
-                patient_details_json['GENDER'] = 'M'
-            elif account.gender == SGiMedGender.FEMALE:
-                patient_details_json['GENDER'] = 'F'
-            logging.info(f"Incoming Report {report.id}: Gender not found in HL7. Using Account Gender: {patient_details_json['GENDER']}")
-
-    if 'GENDER' not in patient_details_json:
-        logging.error(f"Incoming Report {report.id}: Gender not found in HL7. STOPPED generating Health Repor")
-        return None, None
-
-    patient_id = hl7.patient_id
-
-    # Get Measurements from Database
-    measurements_list = db.query(Measurement).filter(
-        Measurement.patient_id == patient_id,
-        # Measurement date should be within +-3 days of report file date
-        Measurement.measurement_date > report.file_date - timedelta(days=30),
-        Measurement.measurement_date < report.file_date + timedelta(days=3)
-    ).order_by(Measurement.measurement_date.asc()).all()
-    if measurements_list:
-        measurements = get_patient_measurement(patient_id, measurements_list)
-        patient_details_json.update(measurements)
-
-    return hl7, patient_details_json
+    patient_details = {}
+    for report in valid_reports:
+        hl7 = hl7s.get(hl7_ids.get(report.id, ''))
+        if not hl7:
+            results[report.id] = (None, None)
+            continue
+        try:
+            patient_details[report.id] = (hl7, hl7_to_json(hl7.hl7_content))
+        except Exception as e:
+            logging.error(f"Incoming Report {report.id}: Failed to convert HL7 {hl7.id}. {e}")
+
+    # Account gender for HL7s without one
+    missing_gender = set(report.nric for report in valid_reports if report.id in patient_details and 'GENDER' not in patient_details[report.id][1])
+    genders = {}
+    if missing_gender:
+        for nric, gender in db.query(Account.nric, Account.gender).filter(Account.nric.in_(missing_gender)).all():
+            genders.setdefault(nric, gender)
+
+    # Measurements of every patient within the widest window, narrowed per report below
+    measurement_reports = [report for report in valid_reports if report.id in patient_details]
+    patient_measurements: dict[str, list[Measurement]] = {}
+    if measurement_reports:
+        rows = db.query(Measurement).filter(
+            Measurement.patient_id.in_(set(patient_details[report.id][0].patient_id for report in measurement_reports)),
+            Measurement.measurement_date > min(report.file_date for report in measurement_reports) - timedelta(days=30),
+            Measurement.measurement_date < max(report.file_date for report in measurement_reports) + timedelta(days=3)
+        ).order_by(Measurement.measurement_date.asc()).all()
+        for row in rows:
+            patient_measurements.setdefault(row.patient_id, []).append(row)
+
+    for report in measurement_reports:
+        hl7, patient_details_json = patient_details[report.id]
+        try:
+            if 'GENDER' not in patient_details_json:
+                gender = genders.get(report.nric)
+                if gender:
+                    if gender == SGiMedGender.MALE:
+                        patient_details_json['GENDER'] = 'M'
+                    elif gender == SGiMedGender.FEMALE:
+                        patient_details_json['GENDER'] = 'F'
+                    logging.info(f"Incoming Report {report.id}: Gender not found in HL7. Using Account Gender: {patient_details_json['GENDER']}")
+
+            if 'GENDER' not in patient_details_json:
+                logging.error(f"Incoming Report {report.id}: Gender not found in HL7. STOPPED generating Health Repor")
+                results[report.id] = (None, None)
+                continue
+
+            patient_id = hl7.patient_id
+
+            # Measurement date should be within -30 / +3 days of report file date
+            start_date = report.file_date - timedelta(days=30)
+            end_date = report.file_date + timedelta(days=3)
+            measurements_list = [
+                row for row in patient_measurements.get(patient_id, [])
+                if start_date < row.measurement_date < end_date
+            ]
+            if measurements_list:
+                measurements = get_patient_measurement(patient_id, measurements_list)
+                patient_details_json.update(measurements)
+
+            results[report.id] = (hl7, patient_details_json)
+        except Exception as e:
+            logging.error(f"Incoming Report {report.id}: Failed to get measurements. {e}")
+
+    return results
 
 def hl7_to_json(hl7_text: str):
     hl7_json = {}
     for seg in hl7_text.split("\n"):
         if not seg: continue
-        segment = parse_segment(seg, validation_level=VALIDATION_LEVEL.TOLERANT)
-        data: ElementList = segment.children
-
-        if 'PID_8' in data.indexes: # type: ignore
-            gender = data.indexes['PID_8'][0].value # type: ignore
-            hl7_json['GENDER'] = [gender, None, None]
-            continue
-        
-        if segment.name == "OBR":
-            data: ElementList = segment.children
-            package_name = data.indexes['OBR_4'][0].value # type: ignore
-
-            # ─────────────────────────────────────────────────────────────────
-            # FIX B: Removed the `startswith('0^')` guard and `[:7]` slice.
-            #
-            # BEFORE:
-            #   if package_name.startswith('0^'):
-            #       hl7_json['PROFILE'].append(package_name[:7])
-            #
-            # WHY IT WAS BROKEN:
-            #   Pathlab PARC1/PARC2 OBR segments have OBR_4 values that do
-            #   NOT start with '0^' (e.g. "PARC1^PARC1 Profile^").
-            #   So the PROFILE list was never populated for these patients.
-            #   generate_profile_output() then hit the check:
-            #     if 'PROFILE' not in test_results: → "No OBR test profile found"
-            #   and aborted the entire report silently.
-            #
-            #   The [:7] slice also discarded the human-readable label,
-            #   keeping only e.g. "0^PARC2" instead of the full name.
-            #
-            # FIX:
-            #   Capture every OBR_4 value unconditionally (all OBR segments
-            #   represent a panel/section header and are safe to store).
-            #   Store the full value so downstream code has the complete label.
-            # ─────────────────────────────────────────────────────────────────
-            if 'PROFILE' not in hl7_json:
-                hl7_json['PROFILE'] = []
-            hl7_json['PROFILE'].append(package_name)  # full value, no truncation
-            continue
-
-        if 'OBX_3' not in data.indexes: # type: ignore
-            continue
+        try:
+            add_segment(hl7_json, seg)
+        except UnsupportedSegment:
+            add_segment_hl7apy(hl7_json, seg)
+    return hl7_json
 
-        test_key = data.indexes['OBX_3'][0].value # type: ignore
-        value = data.indexes['OBX_5'][0].value # type: ignore
-        unit = data.indexes['OBX_6'][0].value if 'OBX_6' in data.indexes else None # type: ignore
-        lab_range = data.indexes['OBX_7'][0].value if 'OBX_7' in data.indexes else None # type: ignore
+def hl7_to_json_hl7apy(hl7_text: str):
+    '''
+    hl7_to_json parsing every segment with hl7apy, kept as the reference for the fast parser
+    '''
+    hl7_json = {}
+    for seg in hl7_text.split("\n"):
+        if not seg: continue
+        add_segment_hl7apy(hl7_json, seg)
+    return hl7_json
 
-        match = re.match(r'^.+\^.+\^', test_key)
-        if match:
-            test_key = match.group()
-        test_key = HL7_CODE_ALIASES.get(test_key, test_key)
+def add_test_result(hl7_json: dict, test_key: str, value, unit, lab_range):
+    match = re.match(r'^.+\^.+\^', test_key)
+    if match:
+        test_key = match.group()
+    test_key = HL7_CODE_ALIASES.get(test_key, test_key)
+
+    hl7_json[test_key] = [value, unit, lab_range]
+
+def add_segment(hl7_json: dict, seg: str):
+    '''
+    Fast path of add_segment_hl7apy, raises UnsupportedSegment before any change to hl7_json
+    '''
+    name, fields = split_segment(seg, 8)
+    if name == 'PID':
+        gender = get_field(fields, 8)
+        if gender is not None:
+            hl7_json['GENDER'] = [gender, None, None]
+        return
+
+    if name == 'OBR':
+        package_name = get_field(fields, 4, composite=True)
+        if package_name is None:
+            # hl7apy path raises on the missing OBR_4
+            raise UnsupportedSegment(name)
+        if 'PROFILE' not in hl7_json:
+            hl7_json['PROFILE'] = []
+        hl7_json['PROFILE'].append(package_name)
+        return
+
+    if name != 'OBX':
+        return
+    test_key = get_field(fields, 3, composite=True)
+    if test_key is None:
+        return
+    value = get_field(fields, 5)
+    if value is None:
+        raise UnsupportedSegment(name)
+    unit = get_field(fields, 6, composite=True)
+    lab_range = get_field(fields, 7)
+    add_test_result(hl7_json, test_key, value, unit, lab_range)
+
+def add_segment_hl7apy(hl7_json: dict, seg: str):
+    segment = parse_segment(seg, validation_level=VALIDATION_LEVEL.TOLERANT)
+    data: ElementList = segment.children
+
+    if 'PID_8' in data.indexes: # type: ignore
+        gender = data.indexes['PID_8'][0].value # type: ignore
+        hl7_json['GENDER'] = [gender, None, None]
+        return
+    
+    if segment.name == "OBR":
+        data: ElementList = segment.children
+        package_name = data.indexes['OBR_4'][0].value # type: ignore
 
-        hl7_json[test_key] = [value, unit, lab_range]
-    return hl7_json
+        # ─────────────────────────────────────────────────────────────────
+        # FIX B: Removed the `startswith('0^')` guard and `[:7]` slice.
+        #
+        # BEFORE:
+        #   if package_name.startswith('0^'):
+        #       hl7_json['PROFILE'].append(package_name[:7])
+        #
+        # WHY IT WAS BROKEN:
+        #   Pathlab PARC1/PARC2 OBR segments have OBR_4 values that do
+        #   NOT start with '0^' (e.g. "PARC1^PARC1 Profile^").
+        #   So the PROFILE list was never populated for these patients.
+        #   generate_profile_output() then hit the check:
+        #     if 'PROFILE' not in test_results: → "No OBR test profile found"
+        #   and aborted the entire report silently.
+        #
+        #   The [:7] slice also discarded the human-readable label,
+        #   keeping only e.g. "0^PARC2" instead of the full name.
+        #
+        # FIX:
+        #   Capture every OBR_4 value unconditionally (all OBR segments
+        #   represent a panel/section header and are safe to store).
+        #   Store the full value so downstream code has the complete label.
+        # ─────────────────────────────────────────────────────────────────
+        if 'PROFILE' not in hl7_json:
+            hl7_json['PROFILE'] = []
+        hl7_json['PROFILE'].append(package_name)  # full value, no truncation
+        return
+
+    if 'OBX_3' not in data.indexes: # type: ignore
+        return
+
+    test_key = data.indexes['OBX_3'][0].value # type: ignore
+    value = data.indexes['OBX_5'][0].value # type: ignore
+    unit = data.indexes['OBX_6'][0].value if 'OBX_6' in data.indexes else None # type: ignore
+    lab_range = data.indexes['OBX_7'][0].value if 'OBX_7' in data.indexes else None # type: ignore
+
+    add_test_result(hl7_json, test_key, value, unit, lab_range)
 
 class SGiMedMeasurementType(BaseModel):
     id: str
@@ -313,23 +451,27 @@ def normalise_hl7_aliases(test_results):
 def generate_profile_output(report_id, test_results):
     test_results = normalise_hl7_aliases(test_results)
     profile_reports = []
-    for health_report_profile in health_report_profiles:
-        
-        profile = health_report_profile['profile'].value
+    for compiled_profile in compiled_profiles:
+        # Skip profiles without any of their tests in the report
+        if compiled_profile.hl7_codes.isdisjoint(test_results):
+            continue
+
+        profile = compiled_profile.profile
         mapped_results = []
-        for test_props in health_report_profile['tests']:
-            hl7_code = test_props['hl7_code']
+        for test in compiled_profile.tests:
+            hl7_code = test.hl7_code
             if hl7_code not in test_results:
                 continue
 
             try:
-                mapping_result = test_generic_mapping(test_results, metadata=test_props)
+                mapping_result = test.evaluate(test_results)
             except Exception as e:
                 print(f"Error mapping {hl7_code}: {e}")
                 continue
 
+            test_props = test.metadata
             test_value, unit, lab_range = test_results[hl7_code]
-            title = test_props['test_code']
+            title = test.test_code
             if unit is None: unit = test_props.get('units', None)
             if lab_range is None: lab_range = test_props.get('lab_range', None)
             if type(lab_range) == dict:
@@ -375,7 +517,7 @@ def generate_profile_output(report_id, test_results):
         #         section heading (e.g. "Kidney Profile") is stored directly
         #         in the JSON — no lookup needed in the frontend/PDF renderer.
         # ─────────────────────────────────────────────────────────────────────
-        description = health_report_profile.get('description') or None
+        description = compiled_profile.description
 
         profile_report = ProfileReportResp(
             profile_id=profile.id,
@@ -0,0 +1,140 @@
+"""
+Lightweight HL7 v2 field splitter for lab messages
+
+hl7apy builds a full element tree for every segment, while health reports only read a handful
+of fields (MSH_10, PID_8, OBR_4, OBX_3, OBX_5, OBX_6, OBX_7). Segments are split on the default
+encoding characters up to the last field needed, and a field is returned as hl7apy reports its
+.value. Anything outside the plain cases (escapes, repetitions, subcomponents, unusual segment
+names) raises UnsupportedSegment so the caller can parse that segment with hl7apy instead.
+"""
+import logging
+import re
+from functools import lru_cache
+from typing import Optional
+from hl7apy.consts import VALIDATION_LEVEL
+from hl7apy.parser import parse_segment
+
+FIELD_SEPARATOR = '|'
+COMPONENT_SEPARATOR = '^'
+# Repetition, escape and subcomponent characters, hl7apy rewrites or nests these
+SPECIAL_CHARACTERS = ('~', '\\', '&')
+# Components of a CE field (OBX_3, OBX_6, OBR_4)
+CE_COMPONENTS = 6
+DIGITS = re.compile(r'\d+')
+
+class UnsupportedSegment(Exception):
+    '''
+    Segment cannot be split without hl7apy
+    '''
+    pass
+
+@lru_cache(maxsize=256)
+def is_valid_segment_name(name: str) -> bool:
+    # hl7apy rejects unknown segment names, checked once per name
+    try:
+        parse_segment(name, validation_level=VALIDATION_LEVEL.TOLERANT)
+        return True
+    except Exception:
+        return False
+
+def split_segment(line: str, last_field: int) -> tuple[str, list[str]]:
+    '''
+    Segment name and fields, where fields[n] is field n of the segment (e.g. OBX_5 for n = 5)
+    Fields after last_field are left unsplit in the last element
+    '''
+    line = line.rstrip('\r')
+    name = line[:3]
+    if line[3:4] != FIELD_SEPARATOR or '\r' in line or not name.isupper() or not is_valid_segment_name(name):
+        raise UnsupportedSegment(name)
+
+    if name == 'MSH':
+        # MSH_1 is the field separator itself, MSH_2 the encoding characters
+        return name, [name, FIELD_SEPARATOR] + line[4:].split(FIELD_SEPARATOR, last_field - 1)
+    return name, line.split(FIELD_SEPARATOR, last_field + 1)
+
+def get_field(fields: list[str], index: int, composite: bool = False) -> Optional[str]:
+    '''
+    Value of a field like hl7apy's segment.children.indexes[name][0].value, None if the field is absent
+    Composite fields (CE) drop blank trailing components, other fields must be a single component
+    '''
+    if index >= len(fields):
+        return None
+    value = fields[index]
+    if not value.strip():
+        return None
+    if any(char in value for char in SPECIAL_CHARACTERS):
+        raise UnsupportedSegment(value)
+    if COMPONENT_SEPARATOR not in value:
+        return value
+    if not composite:
+        raise UnsupportedSegment(value)
+
+    components = value.split(COMPONENT_SEPARATOR)
+    if len(components) > CE_COMPONENTS:
+        raise UnsupportedSegment(value)
+    components = [component if component.strip() else '' for component in components]
+    while components and not components[-1]:
+        components.pop()
+    return COMPONENT_SEPARATOR.join(components)
+
+def get_message_control_id(hl7_text: str) -> Optional[str]:
+    '''
+    MSH_10 of a message, which holds the lab report file id, None if absent
+    '''
+    first_line = hl7_text.split('\n', 1)[0]
+    try:
+        name, fields = split_segment(first_line, 10)
+        if name != 'MSH':
+            return None
+        return get_field(fields, 10)
+    except UnsupportedSegment:
+        seg = parse_segment(first_line)
+        if 'MSH_10' in seg.children.indexes: # type: ignore
+            return seg.children.indexes['MSH_10'][0].value # type: ignore
+        return None
+
+def get_report_file_key(report_file_id: Optional[str]) -> Optional[str]:
+    '''
+    Canonical report file id, the longest run of digits kept as is, None if there are no digits
+    e.g. 'PL1234567-01' -> '1234567', the incoming report file name holds the same number
+    Leading zeros are kept so a key match is never looser than the report_file_id substring match
+    '''
+    runs = DIGITS.findall(report_file_id or '')
+    if not runs:
+        return None
+    return max(runs, key=len)
+
+def benchmark(limit: int = 1000):
+    '''
+    Compare hl7_to_json with the hl7apy parser over stored HL7 logs, checking the outputs match
+    '''
+    import time
+    from models import SessionLocal, HL7Log
+    from .convert import hl7_to_json, hl7_to_json_hl7apy
+
+    with SessionLocal() as db:
+        contents = [row[0] for row in db.query(HL7Log.hl7_content).order_by(HL7Log.created_at.desc()).limit(limit)]
+
+    mismatches = 0
+    timings = {}
+    for label, parser in [('hl7apy', hl7_to_json_hl7apy), ('fast', hl7_to_json)]:
+        outputs = []
+        start = time.perf_counter()
+        for content in contents:
+            try:
+                outputs.append(parser(content))
+            except Exception as e:
+                outputs.append(type(e))
+        timings[label] = (time.perf_counter() - start, outputs)
+
+    for content, expected, actual in zip(contents, timings['hl7apy'][1], timings['fast'][1]):
+        if expected != actual:
+            mismatches += 1
+            logging.error(f"HL7 parser mismatch: {content.split(chr(10), 1)[0]}")
+
+    hl7apy_time, fast_time = timings['hl7apy'][0], timings['fast'][0]
+    print(f"Parsed {len(contents)} HL7 logs: hl7apy {hl7apy_time:.2f}s, fast {fast_time:.2f}s "
+          f"({hl7apy_time / max(fast_time, 1e-9):.1f}x), {mismatches} mismatches")
+
+if __name__ == "__main__":
+    benchmark()
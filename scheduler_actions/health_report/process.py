@@ -1,7 +1,11 @@
 import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Optional
 from tqdm import tqdm
-from repository.health_report.mapping import health_report_profiles
-from repository.health_report.logic import test_generic_mapping
+from repository.health_report.mapping import compiled_profiles
 from repository.health_report.enums import TestTags, ProfileReportResp, TestResult, ProfileHeader
 from decimal import Decimal
 
@@ -19,7 +23,7 @@ def main():
     with open('input/processed_reports.json', 'r') as f:
         processed_reports = json.load(f)
 
-    patient_profiles = {}
+    reports = []
     for report_id, patient_details in tqdm(processed_reports.items()):
         report_id = patient_details['report']['id']
         if report_id not in patient_measurements:
@@ -31,9 +35,12 @@ def main():
             print(f"{report_id}: No OBR test profile found")
             continue
         # print(f"{report_id}: Supported {test_results['PROFILE'][0]}")
-        output = generate_profile_output(report_id, test_results)
+        reports.append((report_id, test_results))
 
-        patient_profiles[report_id] = [json.loads(row.model_dump_json()) for row in output]
+    patient_profiles = {
+        report_id: [json.loads(row.model_dump_json()) for row in output]
+        for report_id, output in generate_profile_outputs(reports).items()
+    }
 
     with open('output/patient_profiles.json', 'w') as f:
         json.dump(patient_profiles, f, indent=4)
@@ -52,23 +59,27 @@ def normalise_hl7_aliases(test_results):
 def generate_profile_output(report_id, test_results):
     test_results = normalise_hl7_aliases(test_results)
     profile_reports = []
-    for health_report_profile in health_report_profiles:
-        
-        profile = health_report_profile['profile'].value
+    for compiled_profile in compiled_profiles:
+        # Skip profiles without any of their tests in the report
+        if compiled_profile.hl7_codes.isdisjoint(test_results):
+            continue
+
+        profile = compiled_profile.profile
         mapped_results = []
-        for test_props in health_report_profile['tests']:
-            hl7_code = test_props['hl7_code']
+        for test in compiled_profile.tests:
+            hl7_code = test.hl7_code
             if hl7_code not in test_results:
                 continue
 
             try:
-                mapping_result = test_generic_mapping(test_results, metadata=test_props)
+                mapping_result = test.evaluate(test_results)
             except Exception as e:
                 print(f"Error mapping {hl7_code}: {e}")
                 continue
 
+            test_props = test.metadata
             test_value, unit, lab_range = test_results[hl7_code]
-            title = test_props['test_code']
+            title = test.test_code
             if unit is None: unit = test_props.get('units', None)
             if lab_range is None: lab_range = test_props.get('lab_range', None)
             if type(lab_range) == dict:
@@ -120,5 +131,63 @@ def generate_profile_output(report_id, test_results):
 
     return profile_reports
 
+def generate_profile_outputs(reports: Iterable[tuple[str, dict]]) -> dict[str, list[ProfileReportResp]]:
+    '''
+    Profile outputs of many reports in one pass over the compiled profiles, keyed by report id
+    Reports that fail to score are logged and left out
+    '''
+    outputs = {}
+    for report_id, test_results in reports:
+        try:
+            outputs[report_id] = generate_profile_output(report_id, test_results)
+        except Exception as e:
+            logging.error(f"Error generating profile output for report {report_id}: {e}")
+    return outputs
+
+# Scoring is CPU bound, smaller batches are not worth the round trip to a worker process
+PROFILE_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
+MIN_PARALLEL_REPORTS = 50
+
+_profile_executor: Optional[ProcessPoolExecutor] = None
+
+def start_profile_executor():
+    '''
+    Fork the profile workers, call at scheduler start before any other thread is started
+    Forking from a job thread can deadlock a worker on a lock held by another thread. Spawned or forkserver
+    workers re-import the scheduler's __main__, which starts the scheduler, so the pool is forked once up front
+    '''
+    global _profile_executor
+    if PROFILE_WORKERS < 2 or _profile_executor:
+        return
+    executor = ProcessPoolExecutor(max_workers=PROFILE_WORKERS, mp_context=multiprocessing.get_context('fork'))
+    # Fork workers are all started on the first submit
+    executor.submit(int).result()
+    _profile_executor = executor
+
+def profile_executor() -> Optional[ProcessPoolExecutor]:
+    '''
+    Process pool for generate_profile_outputs_parallel, None if it was not started or on single core hosts
+    '''
+    return _profile_executor
+
+def generate_profile_outputs_parallel(executor: Optional[ProcessPoolExecutor], reports: list[tuple[str, dict]]) -> dict[str, list[ProfileReportResp]]:
+    '''
+    generate_profile_outputs split across the executor's workers
+    Falls back to scoring in this process for small batches or a broken pool
+    '''
+    if executor is None or len(reports) < MIN_PARALLEL_REPORTS:
+        return generate_profile_outputs(reports)
+
+    batch_size = -(-len(reports) // PROFILE_WORKERS)
+    batches = [reports[i:i + batch_size] for i in range(0, len(reports), batch_size)]
+    outputs = {}
+    try:
+        for batch_outputs in executor.map(generate_profile_outputs, batches):
+            outputs.update(batch_outputs)
+    except Exception as e:
+        logging.error(f"Profile workers failed, scoring {len(reports)} reports in process. {e}")
+        return generate_profile_outputs(reports)
+    return outputs
+
 if __name__ == "__main__":
     main()
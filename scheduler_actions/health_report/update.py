@@ -9,7 +9,10 @@ sgtz = pytz.timezone("Asia/Singapore")
 # def sg(dt: datetime):
 #     return dt.replace(tzinfo=pytz.utc).astimezone(sgtz)
 
-def save_health_report_to_db(db: Session, hl7_id: str, report_id: str, patient_id: str, report_created_at: datetime, patient_profiles: list[ProfileReportResp]):
+def build_health_report_records(hl7_id: str, report_id: str, patient_id: str, report_created_at: datetime, patient_profiles: list[ProfileReportResp]):
+    '''
+    Profile, report and document records of a health report, not yet added to the session
+    '''
     # for report_id, patient_details in tqdm(processed_reports.items()):
     #     if report_id not in patient_measurements_dict:
     #         continue
@@ -95,6 +98,11 @@ def save_health_report_to_db(db: Session, hl7_id: str, report_id: str, patient_i
         updated_at=report_created_at.replace(tzinfo=pytz.utc),
     )
 
+    return profile_records, report_record, doc
+
+def save_health_report_to_db(db: Session, hl7_id: str, report_id: str, patient_id: str, report_created_at: datetime, patient_profiles: list[ProfileReportResp]):
+    profile_records, report_record, doc = build_health_report_records(hl7_id, report_id, patient_id, report_created_at, patient_profiles)
+
     db.query(Document).filter(Document.sgimed_document_id == hl7_id).delete()
     db.query(HealthReportProfile).filter(HealthReportProfile.sgimed_hl7_id == hl7_id).delete()
     db.query(HealthReport).filter(or_(HealthReport.sgimed_hl7_id == hl7_id, HealthReport.sgimed_report_id == report_id)).delete()
@@ -117,4 +125,30 @@ def save_health_report_to_db(db: Session, hl7_id: str, report_id: str, patient_i
     
     db.commit()
 
-    return doc, report_record
\ No newline at end of file
+    return doc, report_record
+
+def save_health_reports_to_db(db: Session, entries: list[tuple[str, str, str, datetime, list[ProfileReportResp]]]):
+    '''
+    save_health_report_to_db for many reports with one delete per table and a batched insert
+    entries are (hl7_id, report_id, patient_id, report_created_at, patient_profiles), the caller commits
+    Returns the (doc, report_record) of each entry keyed by hl7_id
+    '''
+    # Later entries replace earlier ones for the same HL7, as with saving them one at a time
+    entries = list({ entry[0]: entry for entry in entries }.values())
+    if not entries:
+        return {}
+    hl7_ids = [entry[0] for entry in entries]
+    report_ids = [entry[1] for entry in entries]
+
+    db.query(Document).filter(Document.sgimed_document_id.in_(hl7_ids)).delete(synchronize_session=False)
+    db.query(HealthReportProfile).filter(HealthReportProfile.sgimed_hl7_id.in_(hl7_ids)).delete(synchronize_session=False)
+    db.query(HealthReport).filter(or_(HealthReport.sgimed_hl7_id.in_(hl7_ids), HealthReport.sgimed_report_id.in_(report_ids))).delete(synchronize_session=False)
+
+    saved = {}
+    for entry in entries:
+        profile_records, report_record, doc = build_health_report_records(*entry)
+        db.add_all(profile_records)
+        db.add(report_record)
+        db.add(doc)
+        saved[entry[0]] = (doc, report_record)
+    return saved
@@ -0,0 +1,205 @@
+"""
+Job runner for the scheduler, safe to run on several scheduler nodes
+
+- Each run holds a Postgres advisory lock per job slot on its own connection. A job runs on at most
+  max_concurrency nodes at once, and a node that dies releases its locks with its connection
+- Every node fires every job, a node skips the run when another node started it within the
+  job's interval, so two nodes split the jobs between them instead of running each twice
+- Runs missed while the job was still running are coalesced into a single run
+- Each run has its own SGiMed rate budget, so one job's worker pools cannot starve the other jobs
+- Runs are recorded in backend_scheduler_job_runs with their duration, rows processed, SGiMed calls and error.
+  RUNNING rows left by a node that died are marked STALE by the next node to take the lease
+"""
+import hashlib
+import logging
+import os
+import socket
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Callable, Iterator, Optional
+from apscheduler.schedulers.base import BaseScheduler
+from sqlalchemy import delete, exists, func, select, text, update
+from models import SessionLocal, engine
+from models.backend import SchedulerJobRun, SchedulerJobRunStatus
+from utils import run_metrics
+from utils.integrations.sgimed_client import sgimed_client
+
+NODE = f"{socket.gethostname()}:{os.getpid()}"
+# Runs started on another node within the job's interval less this tolerance are not repeated
+RUN_GAP_TOLERANCE = 5 # seconds
+# Cron jobs fire at the same time on every node
+CRON_RUN_GAP = 60 # seconds
+MISFIRE_GRACE_TIME = 60 # seconds
+MAX_ERROR_LENGTH = 2000
+RUN_HISTORY_DAYS = 30
+
+def _lock_key(job_name: str, slot: int) -> int:
+    # Stable across processes, unlike hash()
+    digest = hashlib.sha256(f"scheduler:{job_name}:{slot}".encode()).digest()
+    return int.from_bytes(digest[:8], 'big', signed=True)
+
+def _held_slots(conn, job_name: str, slots: list[int]) -> int:
+    '''
+    Number of the job's slots locked by other sessions, read from pg_locks without taking the locks
+    '''
+    held = 0
+    for slot in slots:
+        key = _lock_key(job_name, slot)
+        # A bigint advisory key is split into classid (high 32 bits) and objid (low 32 bits)
+        held += conn.execute(text(
+            "SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' AND granted AND objsubid = 1 "
+            "AND classid = CAST(:classid AS oid) AND objid = CAST(:objid AS oid) AND pid <> pg_backend_pid()"
+        ), {"classid": (key >> 32) & 0xFFFFFFFF, "objid": key & 0xFFFFFFFF}).scalar()
+    return held
+
+def _mark_stale_runs(job_name: str, running_elsewhere: int):
+    '''
+    Mark the job's RUNNING rows as STALE, except the latest running_elsewhere rows of the nodes still holding a slot
+    A node that dies releases its lease without finishing its run
+    '''
+    with SessionLocal() as db:
+        live_run_ids = select(SchedulerJobRun.id) \
+            .where(SchedulerJobRun.job_name == job_name, SchedulerJobRun.status == SchedulerJobRunStatus.RUNNING) \
+            .order_by(SchedulerJobRun.started_at.desc()) \
+            .limit(running_elsewhere)
+        result = db.execute(update(SchedulerJobRun).where(
+            SchedulerJobRun.job_name == job_name,
+            SchedulerJobRun.status == SchedulerJobRunStatus.RUNNING,
+            SchedulerJobRun.id.not_in(live_run_ids),
+        ).values(
+            status=SchedulerJobRunStatus.STALE,
+            finished_at=func.now(),
+            error="Node stopped before the run finished",
+        ))
+        db.commit()
+        if result.rowcount:
+            logging.warning(f"Scheduler: Marked {result.rowcount} run(s) of {job_name} as stale")
+
+@contextmanager
+def job_lease(job_name: str, max_concurrency: int = 1) -> Iterator[bool]:
+    '''
+    Take one of the job's max_concurrency advisory locks, yields False when every slot is taken
+    The connection is in autocommit so the lease never holds a transaction open
+    '''
+    conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+    try:
+        for slot in range(max_concurrency):
+            key = _lock_key(job_name, slot)
+            if not conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": key}).scalar():
+                continue
+            try:
+                _mark_stale_runs(job_name, _held_slots(conn, job_name, [other for other in range(max_concurrency) if other != slot]))
+            except Exception as e:
+                logging.error(f"Scheduler: Failed to mark stale runs of {job_name}. {e}")
+            try:
+                yield True
+            finally:
+                try:
+                    conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+                except Exception as e:
+                    # A broken connection has lost its locks, do not return it to the pool
+                    logging.error(f"Scheduler: Failed to release lease of {job_name}. {e}")
+                    conn.invalidate()
+            return
+        yield False
+    finally:
+        conn.close()
+
+def _start_run(job_name: str, min_gap: float) -> Optional[int]:
+    '''
+    Record the run, returns None if the job was already started within min_gap seconds
+    '''
+    with SessionLocal() as db:
+        if min_gap > 0:
+            recent = db.scalar(select(exists().where(
+                SchedulerJobRun.job_name == job_name,
+                SchedulerJobRun.started_at > func.now() - timedelta(seconds=min_gap),
+            )))
+            if recent:
+                return None
+        run = SchedulerJobRun(job_name=job_name, node=NODE, status=SchedulerJobRunStatus.RUNNING)
+        db.add(run)
+        db.commit()
+        return run.id
+
+def _finish_run(run_id: int, duration: float, metrics: run_metrics.RunMetrics, error: Optional[str]):
+    with SessionLocal() as db:
+        db.execute(update(SchedulerJobRun).where(SchedulerJobRun.id == run_id).values(
+            status=SchedulerJobRunStatus.FAILED if error else SchedulerJobRunStatus.SUCCESS,
+            finished_at=func.now(),
+            duration=duration,
+            rows_processed=metrics.rows_processed,
+            sgimed_calls=metrics.sgimed_calls,
+            error=error[:MAX_ERROR_LENGTH] if error else None,
+        ))
+        db.commit()
+
+def run_job(job_name: str, func: Callable[[], object], max_concurrency: int = 1, min_gap: float = 0):
+    '''
+    Run a job under its lease and record the run
+    '''
+    with job_lease(job_name, max_concurrency) as acquired:
+        if not acquired:
+            print(f"Scheduler: {job_name} is already running on {max_concurrency} node(s), skipped")
+            return
+        run_id = _start_run(job_name, min_gap)
+        if run_id is None:
+            print(f"Scheduler: {job_name} was already run by another node, skipped")
+            return
+
+        start_time = time.monotonic()
+        error = None
+        with run_metrics.track() as metrics, sgimed_client.rate_budget():
+            try:
+                func()
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                duration = time.monotonic() - start_time
+                try:
+                    _finish_run(run_id, duration, metrics, error)
+                except Exception as e:
+                    logging.error(f"Scheduler: Failed to record run {run_id} of {job_name}. {e}")
+                print(f"Scheduler: {job_name} {'failed' if error else 'completed'} in {duration:.2f} seconds. Rows: {metrics.rows_processed}, SGiMed calls: {metrics.sgimed_calls}")
+
+def prune_job_runs(days: int = RUN_HISTORY_DAYS):
+    '''
+    Delete the run history older than days
+    '''
+    with SessionLocal() as db:
+        result = db.execute(delete(SchedulerJobRun).where(SchedulerJobRun.started_at < func.now() - timedelta(days=days)))
+        db.commit()
+        run_metrics.add_rows(result.rowcount)
+
+def _run_gap(trigger: str, trigger_args: dict) -> float:
+    if trigger == 'interval':
+        interval = timedelta(**{k: v for k, v in trigger_args.items() if k in ('weeks', 'days', 'hours', 'minutes', 'seconds')})
+        return max(interval.total_seconds() - RUN_GAP_TOLERANCE, 0)
+    return CRON_RUN_GAP
+
+class JobRunner:
+    '''
+    Registers scheduler jobs to run through run_job, used like scheduler.scheduled_job
+    '''
+    def __init__(self, scheduler: BaseScheduler):
+        self.scheduler = scheduler
+
+    def scheduled_job(self, trigger: str, max_concurrency: int = 1, **trigger_args):
+        def decorator(func: Callable[[], object]):
+            job_name = func.__name__
+            min_gap = _run_gap(trigger, trigger_args)
+            self.scheduler.add_job(
+                run_job,
+                trigger,
+                args=[job_name, func, max_concurrency, min_gap],
+                id=job_name,
+                name=job_name,
+                coalesce=True,
+                max_instances=max_concurrency,
+                misfire_grace_time=MISFIRE_GRACE_TIME,
+                **trigger_args,
+            )
+            return func
+        return decorator
@@ -5,6 +5,7 @@ from models import SGiMedAppointment
 from .common import CronLogAPI
 from utils.integrations.sgimed_appointment_enums import GetSgimedAppointmentResp
 from utils.appointment import compute_time_changes, update_time_changes
+from utils.run_metrics import add_rows
 
 def update_appointments_cron(db: Session):
     cron = CronLogAPI(db, 'sgimed_appointments_cron', '/appointment')
@@ -65,4 +66,5 @@ def update_appointments_cron(db: Session):
     if time_changes:
         update_time_changes(db, time_changes)
     cron.commit()
+    add_rows(updated_cnt + created_cnt)
     print(f"Appointment Cron: {cron.cron_log.last_modified}, page {cron.cron_log.last_page}. Updated {updated_cnt}, Created {created_cnt}")
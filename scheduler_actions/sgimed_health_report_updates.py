@@ -1,17 +1,18 @@
 import logging
 from .common import CronLogAPI
 from utils.integrations.sgimed import get
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from datetime import datetime
 from utils.system_config import get_config_value
-from utils.notifications import send_patient_notification
-from models import HL7Log, IncomingReport, Document, Measurement, Account
+from utils.notifications import PushNotification, send_patient_notifications
+from utils.executors import notification_executor
+from models import HL7Log, IncomingReport, Document, Measurement, Account, SessionLocal
 from repository.health_report import TestTags
 import re
-from .health_report.convert import get_report_measurements
-from .health_report.process import generate_profile_output
-from .health_report.update import save_health_report_to_db
-from hl7apy.parser import parse_segment
+from .health_report.convert import get_reports_measurements
+from .health_report.process import generate_profile_outputs_parallel, profile_executor
+from .health_report.update import save_health_report_to_db, save_health_reports_to_db
+from .health_report.hl7 import get_message_control_id, get_report_file_key
 
 default_hl7_supported_profiles = [
     '^PLHS1','^PLHS2','^PLHS3','^PLHS4','^PLHS5','^PLHS6','^PLHS7','^PLHS8','^PLHS9', # - PLHS1-9
@@ -69,9 +70,7 @@ def update_hl7_logs_cron(db: Session):
         # Extract Report File ID from hl7_content
         report_file_id = ''
         try:
-            seg = parse_segment(row['hl7_content'].split('\n')[0])
-            if 'MSH_10' in seg.children.indexes: # type: ignore
-                report_file_id = seg.children.indexes['MSH_10'][0].value # type: ignore
+            report_file_id = get_message_control_id(row['hl7_content']) or ''
         except Exception:
             logging.error(f'HL7 log {row["id"]} failed to parse report_file_id')
 
@@ -83,6 +82,7 @@ def update_hl7_logs_cron(db: Session):
             branch_id=row['branch_id'],
             patient_id=patient_id,
             report_file_id=report_file_id,
+            report_file_key=get_report_file_key(report_file_id),
             hl7_content=row['hl7_content'],
             last_edited=row['last_edited'],
             created_at=row['created_at']
@@ -235,56 +235,140 @@ def update_measurements_cron(db: Session, data = None):
     cron.commit()
     print(f"Measurement Cron: {cron.cron_log.last_modified}, page {cron.cron_log.last_page}. Created {created_cnts}, Duplicates {duplicate_cnts}, Existing {existing_cnts}")
 
-def generate_health_reports(db: Session):
-    reports = db.query(IncomingReport).filter(
-        # Default Settings
-        IncomingReport.status == 'completed',
-        IncomingReport.health_report_generated == None,
-    ).all()
+# Reports are generated a chunk at a time, each chunk loaded, scored and saved in one transaction
+REPORT_CHUNK_SIZE = 200
 
-    report_cnts = 0
-    for report in reports:
-        try:
-            # Convert HL7, Measurements into JSON Format
-            hl7, measurements = None, None
-            if report.vendor == 'PathLab':
-                hl7, measurements = get_report_measurements(db, report)
-            if not hl7 or not measurements:
-                report.health_report_generated = False
-                db.commit()
-                continue
+def _pending_report_chunks(db: Session):
+    # Keyset paging by id, reports left pending after an error are not fetched again in the same run
+    last_id = ''
+    while True:
+        reports = db.query(IncomingReport).filter(
+            # Default Settings
+            IncomingReport.status == 'completed',
+            IncomingReport.health_report_generated == None,
+            IncomingReport.id > last_id,
+        ).order_by(IncomingReport.id).limit(REPORT_CHUNK_SIZE).all()
+        if not reports:
+            return
+        last_id = reports[-1].id
+        yield reports
 
-            # Process Measurements into Health Reports JSON
-            profiles = generate_profile_output(report.id, measurements)
-
-            # Save / Update into Database
-            doc, report_record = save_health_report_to_db(
-                db,
-                hl7.id,
-                report.id,
-                report.patient_id,
-                report.file_date,
-                profiles
-            )
-            
-            # Send Patient Notification
+def _health_report_notification(user: Account, profiles: list) -> PushNotification:
+    result_tags = [profile.overalls[0].tag_id for profile in profiles]
+    msg = 'Your laboratory and health reports are ready for viewing. Please click "My Reports" to access.'
+    if TestTags.OUT_OF_RANGE.value.id in result_tags or TestTags.BORDERLINE.value.id in result_tags:
+        msg = 'Your laboratory and health reports are ready for viewing. Please click "My Reports" to access. Note: Some of your test results are out of the reference range. You are encouraged to consult the doctor for further medical advice.'
+    return PushNotification.from_account(user, "Health Report Uploaded", msg)
+
+def _send_health_report_notifications(notifications: list[tuple[str, PushNotification]]):
+    '''
+    Send the health report notifications, each document is marked as notified once Expo accepted its notification
+    '''
+    document_ids = { id(notification): document_id for document_id, notification in notifications }
+    def on_sent(sent: list[PushNotification]):
+        with SessionLocal() as db:
+            db.query(Document) \
+                .filter(Document.id.in_([document_ids[id(notification)] for notification in sent])) \
+                .update({ Document.notification_sent: True }, synchronize_session=False)
+            db.commit()
+    send_patient_notifications([notification for _, notification in notifications], on_sent=on_sent)
+
+def _save_health_reports(db: Session, ready: list, skipped: list[IncomingReport], users: dict[str, Account]) -> tuple[int, list[tuple[str, PushNotification]]]:
+    '''
+    Save the scored reports of a chunk in one transaction, falling back to one report at a time if the batch fails
+    Returns the number of reports saved and the push notification of each saved document
+    '''
+    notifications = []
+    try:
+        for report in skipped:
+            report.health_report_generated = False
+        saved = save_health_reports_to_db(db, [
+            (hl7.id, report.id, report.patient_id, report.file_date, profiles)
+            for report, hl7, profiles in ready
+        ])
+        for report, hl7, profiles in ready:
             # Check if user has an account and notification token
-            user = db.query(Account).filter(Account.sgimed_patient_id == hl7.patient_id).first()
+            user = users.get(hl7.patient_id)
             if user:
-                result_tags = [profile.overalls[0].tag_id for profile in profiles]
-                msg = 'Your laboratory and health reports are ready for viewing. Please click "My Reports" to access.'
-                if TestTags.OUT_OF_RANGE.value.id in result_tags or TestTags.BORDERLINE.value.id in result_tags:
-                    msg = 'Your laboratory and health reports are ready for viewing. Please click "My Reports" to access. Note: Some of your test results are out of the reference range. You are encouraged to consult the doctor for further medical advice.'
-                send_patient_notification(user, "Health Report Uploaded", msg)
-                doc.notification_sent = True
+                notifications.append((saved[hl7.id][0], _health_report_notification(user, profiles)))
+            report.health_report_generated = True
+        db.commit()
+        return len(ready), [(str(doc.id), notification) for doc, notification in notifications]
+    except Exception as e:
+        logging.error(f"Error saving {len(ready)} health reports, saving one at a time: {e}")
+        db.rollback()
+
+    for report in skipped:
+        report.health_report_generated = False
+    db.commit()
 
+    saved_cnts = 0
+    notifications = []
+    for report, hl7, profiles in ready:
+        try:
+            doc, _ = save_health_report_to_db(db, hl7.id, report.id, report.patient_id, report.file_date, profiles)
+            user = users.get(hl7.patient_id)
+            if user:
+                notification = _health_report_notification(user, profiles)
             report.health_report_generated = True
-            if report_cnts % 100 == 0:
-                db.commit()
-            report_cnts += 1
+            db.commit()
+            saved_cnts += 1
+            if user:
+                notifications.append((str(doc.id), notification))
         except Exception as e:
             logging.error(f"Error generating health report for report {report.id}: {e}")
+            db.rollback()
+    return saved_cnts, notifications
+
+def generate_health_reports(db: Session):
+    '''
+    Generate the health reports of completed incoming reports, a chunk at a time:
+    1. HL7 logs, accounts and measurements of the chunk are loaded with set-based queries
+    2. Profiles are scored in a process pool
+    3. Reports are saved in one transaction and their push notifications queued for the notification sender
+    '''
+    report_cnts = 0
+    executor = profile_executor()
+    for reports in _pending_report_chunks(db):
+        pathlab_reports = [report for report in reports if report.vendor == 'PathLab']
+        # Convert HL7, Measurements into JSON Format
+        measurements = get_reports_measurements(db, pathlab_reports)
+
+        ready = []
+        skipped = []
+        for report in reports:
+            hl7, report_measurements = None, None
+            if report.vendor == 'PathLab':
+                if report.id not in measurements:
+                    # Failed to convert, left pending for the next run
+                    continue
+                hl7, report_measurements = measurements[report.id]
+            if not hl7 or not report_measurements:
+                skipped.append(report)
+                continue
+            ready.append((report, hl7, report_measurements))
+
+        # Process Measurements into Health Reports JSON
+        outputs = generate_profile_outputs_parallel(executor, [(report.id, report_measurements) for report, _, report_measurements in ready])
+        ready = [(report, hl7, outputs[report.id]) for report, hl7, _ in ready if report.id in outputs]
+        if not ready:
+            for report in skipped:
+                report.health_report_generated = False
             db.commit()
+            continue
+
+        users = {}
+        patient_ids = set(hl7.patient_id for _, hl7, _ in ready)
+        for user in db.query(Account).options(selectinload(Account.firebase_auths)).filter(Account.sgimed_patient_id.in_(patient_ids)).all():
+            users[user.sgimed_patient_id] = user
+
+        # Save / Update into Database
+        saved_cnts, notifications = _save_health_reports(db, ready, skipped, users)
+        report_cnts += saved_cnts
+
+        # Send Patient Notifications
+        if notifications:
+            notification_executor.submit(_send_health_report_notifications, notifications)
+        print(f"Health reports: Generated {report_cnts} so far, {len(notifications)} notifications queued")
 
     print(f"Generated {report_cnts} health reports")
-    db.commit()
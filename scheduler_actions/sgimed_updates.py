@@ -1,9 +1,10 @@
 from datetime import timedelta
 import logging
-from sqlalchemy import or_
+from typing import Optional
+from sqlalchemy import literal, or_, select, union_all
 from models.corporate import CorpAuthorisation, CorporateAuth, CorporateUser
 from models.document import Document, DocumentTypeSGiMed
-from models.model_enums import CollectionMethod, DocumentType, DocumentStatus, TeleconsultStatus
+from models.model_enums import CollectionMethod, DocumentType, DocumentStatus, TeleconsultStatus, VisitType
 from models.delivery import DeliveryStatus
 from routers.delivery.actions.delivery import get_delivery_date, teleconsult_delivery_object_handler
 from models.patient import Account, YuuTransactionLog
@@ -13,8 +14,9 @@ from models.teleconsult import Teleconsult
 from models.walkin import WalkInQueue
 from routers.patient.actions.teleconsult_flow_backend import teleconsult_invoice_billed_webhook
 from utils import sg_datetime
-from utils.integrations.sgimed import check_mc_exists, compare_patient, fetch_invoice_details, get_document_updates, get_mc_updates, get_patient_data, get_patient_profile_updates, get_queue_updates, update_payments, update_queue_instructions
-from sqlalchemy.orm import Session
+from utils.run_metrics import add_rows
+from utils.integrations.sgimed import InvoiceDetails, check_mc_exists, compare_patient, fetch_invoices_details, get_document_updates, get_mc_updates, get_patient_data, get_patient_profile_updates, get_queue_updates, update_payments, update_queue_instructions
+from sqlalchemy.orm import Session, selectinload
 from datetime import datetime
 from utils.integrations.sgimed_documents import SGiMedDocument, SGiMedInvoice, SGiMedInvoiceStatus, SGiMedMC
 from utils.notifications import send_patient_notification
@@ -26,6 +28,7 @@ def update_patient_profiles_cron(db: Session):
     data = get_patient_profile_updates(modified_since)
 
     print(f"Patient Cron: {len(data)} records")
+    add_rows(len(data))
     last_edited = None
     for row in data:
         last_edited = row['last_edited']
@@ -61,6 +64,7 @@ def update_documents_cron(db: Session):
 
     data = cron.data
     print(f"Document Cron: {len(data)} records")
+    add_rows(len(data))
     data = [SGiMedDocument(**row) for row in data]
     update_files_into_documents(db, data)
     cron.commit()
@@ -68,6 +72,7 @@ def update_documents_cron(db: Session):
 def check_for_refunds(db: Session, invoice_dict: dict):
     '''
     Track refunds for invoices
+    Refunds are committed on their own, so a later failure on the invoice does not roll them back
     '''
     invoice_id = invoice_dict['id']
     invoice_payments = [ row for row in invoice_dict['invoice_payments'] if row['total'] < 0]
@@ -112,6 +117,23 @@ def check_for_refunds(db: Session, invoice_dict: dict):
             }
             db.commit()
 
+def get_visit_links(db: Session, visit_ids: list[str]) -> dict[str, VisitType]:
+    '''
+    Resolve which SGiMed visits are linked to a Teleconsult or WalkInQueue record in a single query
+    Teleconsult takes precedence if a visit is linked to both
+    '''
+    if not visit_ids:
+        return {}
+    stmt = union_all(
+        select(WalkInQueue.sgimed_visit_id, literal(VisitType.WALKIN.value)).where(WalkInQueue.sgimed_visit_id.in_(visit_ids)),
+        select(Teleconsult.sgimed_visit_id, literal(VisitType.TELECONSULT.value)).where(Teleconsult.sgimed_visit_id.in_(visit_ids)),
+    )
+    links: dict[str, VisitType] = {}
+    for visit_id, visit_type in db.execute(stmt).all():
+        if links.get(visit_id) != VisitType.TELECONSULT:
+            links[visit_id] = VisitType(visit_type)
+    return links
+
 def update_invoices_cron(db: Session) -> list[str]:
     cron = CronLogAPI(db, 'invoice_cron', '/invoice')
     if len(cron.data) == 0:
@@ -136,71 +158,79 @@ def update_invoices_cron(db: Session) -> list[str]:
     # Fetch visit ids, and relevant Teleconsult and WalkinQueue records
     invoice_dict: dict[str, SGiMedInvoice] = { x.id: x for x in data }
     invoice_ids = list(invoice_dict.keys())
-    invoices = db.query(Invoice).filter(Invoice.id.in_(invoice_ids)).all()
-    logging.info(f"Invoice Cron. Invoice IDs: {len(invoice_ids)}, Invoices: {len(invoices)}. Modified Since: {cron.cron_log.last_modified}, Last Page: {cron.cron_log.last_page}")
+    invoices = db.query(Invoice) \
+        .options(selectinload(Invoice.teleconsults).selectinload(Teleconsult.payments)) \
+        .filter(Invoice.id.in_(invoice_ids)).all()
+    visit_links = get_visit_links(db, list({ x.visit.id for x in data }))
+    logging.info(f"Invoice Cron. Invoice IDs: {len(invoice_ids)}, Invoices: {len(invoices)}, Linked Visits: {len(visit_links)}. Modified Since: {cron.cron_log.last_modified}, Last Page: {cron.cron_log.last_page}")
 
     # For missing invoices, call the finalise invoice webhook
     missing_invoices = set(invoice_ids) - set([str(invoice.id) for invoice in invoices])
     logging.info(f"Invoice Cron. Missing Invoices Cron: {len(missing_invoices)}. Modified Since: {cron.cron_log.last_modified}, Last Page: {cron.cron_log.last_page}")
 
-    processed_missing_invoices = []
+    # Skip any missing invoices that are not linked to Teleconsult
+    fetch_missing_ids = []
     for invoice_id in missing_invoices:
-        # Skip any records that are not linked to Teleconsult
-        teleconsult_id = db.query(Teleconsult.id).filter(Teleconsult.sgimed_visit_id == invoice_dict[invoice_id].visit.id).first()
-        if not teleconsult_id:
+        if visit_links.get(invoice_dict[invoice_id].visit.id) != VisitType.TELECONSULT:
             print("Skipping as not linked to Teleconsult record")
             continue
-        print(f"Invoice Cron: Invoice, Fetching {invoice_dict[invoice_id].visit.id}")
-        invoice_details = fetch_invoice_details(invoice_id)
-        if invoice_details:
-            check_for_refunds(db, invoice_details.invoice_dict)
-            details = invoice_details.model_dump()
-            teleconsult_invoice_billed_webhook(**details)
-        processed_missing_invoices.append(invoice_id)
+        fetch_missing_ids.append(invoice_id)
 
-    invoice_ids_processed = []
+    # Skip any existing invoices that are not linked to Teleconsult and Walkin, or have no changes
+    changed_invoices: list[Invoice] = []
     for invoice in invoices:
-        # Skip any records that are not linked to Teleconsult and Walkin
-        teleconsult_id = db.query(Teleconsult.id).filter(Teleconsult.sgimed_visit_id == invoice_dict[invoice.id].visit.id).first()
-        if not teleconsult_id:
-            walkin_id = db.query(WalkInQueue.id).filter(WalkInQueue.sgimed_visit_id == invoice_dict[invoice.id].visit.id).first()
-            if not walkin_id:
-                print(f"Invoice Cron: Visit ID: {invoice_dict[invoice.id].visit.id} skipped as not linked to Teleconsult or Walkin record")
-                continue
-        if invoice.id in processed_missing_invoices:
-            print(f"Invoice Cron: {invoice.id} processed from missing invoices")
+        sgimed_invoice = invoice_dict[str(invoice.id)]
+        if sgimed_invoice.visit.id not in visit_links:
+            print(f"Invoice Cron: Visit ID: {sgimed_invoice.visit.id} skipped as not linked to Teleconsult or Walkin record")
             continue
-        if invoice.sgimed_last_edited == invoice_dict[str(invoice.id)].last_edited:
+        if invoice.sgimed_last_edited == sgimed_invoice.last_edited:
             logging.info(f"Invoice {invoice.id} has no changes")
             continue
+        changed_invoices.append(invoice)
+
+    # Fetch all invoice details for the page concurrently
+    fetch_ids = fetch_missing_ids + [str(invoice.id) for invoice in changed_invoices]
+    print(f"Invoice Cron: Fetching {len(fetch_ids)} invoice details")
+    add_rows(len(fetch_ids))
+    details_dict = fetch_invoices_details(fetch_ids)
+
+    # The checkpoint is held for invoices that failed until they run out of attempts, the page is read again on the next run
+    failed: dict[str, str] = { invoice_id: "Failed to fetch invoice details" for invoice_id in fetch_ids if not details_dict[invoice_id] }
+    succeeded: list[str] = []
+    for invoice_id in fetch_missing_ids:
+        invoice_details = details_dict[invoice_id]
+        if not invoice_details:
+            continue
+        try:
+            check_for_refunds(db, invoice_details.invoice_dict)
+            details = invoice_details.model_dump()
+            teleconsult_invoice_billed_webhook(**details)
+        except Exception as e:
+            db.rollback()
+            logging.error(f"Invoice Cron: Failed to save billed invoice {invoice_id}. {e}")
+            failed[invoice_id] = f"{type(e).__name__}: {e}"
+            continue
+        succeeded.append(invoice_id)
 
-        print(f"Invoice Cron: Invoice, Fetching {invoice_dict[invoice.id].visit.id}")
-        invoice_details = fetch_invoice_details(str(invoice.id))
+    invoice_ids_processed = []
+    for invoice in changed_invoices:
+        invoice_id = str(invoice.id)
+        invoice_details = details_dict[invoice_id]
         if not invoice_details:
-            logging.error(f"Failed to fetch invoice details for {invoice.id}")
             continue
-        check_for_refunds(db, invoice_details.invoice_dict)
-        invoice.invoice_html = invoice_details.invoice_html
-        invoice.mc_html = invoice_details.mc_html
-        invoice.items = invoice_details.items
-        invoice.prescriptions = invoice_details.prescriptions
-        invoice.amount = invoice_details.invoice_dict['total']
-        invoice.sgimed_last_edited = invoice_details.invoice_dict['last_edited']
-        
-        # Updating Teleconsult Logic
-        if invoice.teleconsults:
-            teleconsult = invoice.teleconsults[0]
-            # Update total and balance if changed on invoice
-            teleconsult.total = invoice_details.invoice_dict['total']
-            paid_amt = round(sum([p.payment_amount for p in teleconsult.get_successful_payments()]), 2)
-            if invoice_details.invoice_dict['patient_outstanding'] > paid_amt:
-                teleconsult.balance = invoice_details.invoice_dict['patient_outstanding'] - paid_amt
-            else:
-                teleconsult.balance = 0.0
-
-            # Updating to checked out if patient_outstanding is $0
-            if teleconsult.balance == 0 and teleconsult.status == TeleconsultStatus.OUTSTANDING:
-                teleconsult.complete(db)
+        # Each invoice is saved with its checkout transition, so a failure only rolls back that invoice
+        try:
+            teleconsult = update_invoice_from_details(db, invoice, invoice_details)
+        except Exception as e:
+            db.rollback()
+            logging.error(f"Invoice Cron: Failed to update invoice {invoice_id}. {e}")
+            failed[invoice_id] = f"{type(e).__name__}: {e}"
+            continue
+        invoice_ids_processed.append(invoice_id)
+
+        if teleconsult:
+            # The checkout is committed, notifying SGiMed is not retried by the next run
+            try:
                 teleconsult_delivery_object_handler(teleconsult, db)
                 if teleconsult.sgimed_visit_id:
                     # Send payment information to SGiMed when transitioning from OUTSTANDING to CHECKED_OUT
@@ -208,14 +238,49 @@ def update_invoices_cron(db: Session) -> list[str]:
                     update_queue_instructions(teleconsult.sgimed_visit_id, teleconsult.status.value)
                 else:
                     logging.error(f"Teleconsult {teleconsult.id} has no sgimed_visit_id")
+            except Exception as e:
+                db.rollback()
+                logging.error(f"Invoice Cron: Failed to complete checkout of teleconsult {teleconsult.id}. {e}")
 
-        invoice_ids_processed.append(str(invoice.id))
-        db.commit()
-
-    cron.commit()
+    if not cron.commit(failed, succeeded + invoice_ids_processed):
+        logging.error(f"Invoice Cron: Failed to update invoices {list(failed.keys())}, page will be retried. Modified Since: {cron.cron_log.last_modified}, Last Page: {cron.cron_log.last_page}")
     # Log visit_ids updated. Those visit_ids that overlap with MC updates can be safely ignored
     return [invoice_dict[invoice_id].visit.id for invoice_id in invoice_ids_processed]
 
+def update_invoice_from_details(db: Session, invoice: Invoice, invoice_details: InvoiceDetails) -> Optional[Teleconsult]:
+    '''
+    Save the invoice details and check out its teleconsult once the balance is $0
+    Returns the teleconsult if it was checked out
+    '''
+    check_for_refunds(db, invoice_details.invoice_dict)
+    invoice.invoice_html = invoice_details.invoice_html
+    invoice.mc_html = invoice_details.mc_html
+    invoice.items = invoice_details.items
+    invoice.prescriptions = invoice_details.prescriptions
+    invoice.amount = invoice_details.invoice_dict['total']
+    invoice.sgimed_last_edited = invoice_details.invoice_dict['last_edited']
+
+    # Updating Teleconsult Logic
+    if not invoice.teleconsults:
+        db.commit()
+        return None
+
+    teleconsult = invoice.teleconsults[0]
+    # Update total and balance if changed on invoice
+    teleconsult.total = invoice_details.invoice_dict['total']
+    paid_amt = round(sum([p.payment_amount for p in teleconsult.get_successful_payments()]), 2)
+    if invoice_details.invoice_dict['patient_outstanding'] > paid_amt:
+        teleconsult.balance = invoice_details.invoice_dict['patient_outstanding'] - paid_amt
+    else:
+        teleconsult.balance = 0.0
+
+    # Updating to checked out if patient_outstanding is $0, complete commits the invoice with the checkout
+    if teleconsult.balance == 0 and teleconsult.status == TeleconsultStatus.OUTSTANDING:
+        teleconsult.complete(db)
+        return teleconsult
+    db.commit()
+    return None
+
 def update_mcs_cron(db: Session, visit_ids_processed: list[str]):
     '''
     This endpoint will have order_item_id when MC is added, edited, or voided. When MC is edited, invoice does not trigger a change.
@@ -226,6 +291,7 @@ def update_mcs_cron(db: Session, visit_ids_processed: list[str]):
     # Inclusive of voided MCs
     data = [SGiMedMC(**row) for row in data]
     update_mcs_into_documents(db, data)
+    add_rows(len(data))
     
     # Remove voided MCs
     data = [row for row in data if not row.is_void]
@@ -476,6 +542,7 @@ def update_delivery_method_cron(db: Session):
 
     for cron in crons:
         queues = cron.data
+        add_rows(len(queues))
         if queues:
             delivery_to_pickup_handler(db, queues)
             pickup_to_delivery_handler(db, queues)
@@ -0,0 +1,69 @@
+"""
+Per-account patient activity snapshots
+
+GET /api/activity is served from a snapshot cached under the activity versions of the user and their
+linked accounts. When a teleconsult or walk-in row changes, the versions of the accounts on the row are
+bumped and the new version is pushed to the row's owner only, instead of every connected patient
+re-fetching their activity.
+"""
+import logging
+from typing import Any, Callable, Iterable, Optional
+from models.patient import Account
+from routers.realtime import WSEvent, WSMessage, ws_manager
+from utils import sg_datetime
+from utils.redis_cache import bump_version, get_json, get_versions, set_json
+
+ACTIVITY_VERSION_KEY = 'patient_activity:version'
+# Versions cover changes made through the app, the expiry bounds staleness from a missed row webhook
+ACTIVITY_SNAPSHOT_TTL = 600 # 10 mins
+
+def _version_key(account_id: str):
+    return f'{ACTIVITY_VERSION_KEY}:{account_id}'
+
+def get_activity_snapshot(user: Account, build: Callable[[], Optional[dict]]) -> tuple[int, Optional[dict]]:
+    '''
+    Returns the user's activity version and activity, build is only called when the snapshot is not cached
+    '''
+    account_ids = user.get_linked_account_ids()
+    versions = get_versions(*[_version_key(account_id) for account_id in account_ids])
+    # Walk-ins are only active on the day, a new day starts a new snapshot
+    versions_part = ','.join(f'{account_id}={version}' for account_id, version in zip(account_ids, versions))
+    key = f'patient_activity:{sg_datetime.now().date()}:{versions_part}'
+
+    cached = get_json(key)
+    if cached is None:
+        cached = { "activity": build() }
+        set_json(key, cached, ACTIVITY_SNAPSHOT_TTL)
+    return versions[0], cached["activity"]
+
+def invalidate_activity(account_ids: Iterable[Optional[Any]]) -> dict[str, int]:
+    '''
+    Bump the activity versions of the accounts, returns the new version of each account
+    Call after the change is committed, a snapshot built before the commit would be cached under the new version
+    '''
+    return {
+        account_id: bump_version(_version_key(account_id))
+        for account_id in set(str(account_id) for account_id in account_ids if account_id)
+    }
+
+def publish_activity_update(account_id: str, version: Optional[int] = None, **data):
+    '''
+    Push an activity update to the account's patient app
+    Apps on the "update" text protocol only receive "update", the data is for apps that opted in to ACTIVITY_PROTOCOL_JSON
+    '''
+    payload: dict[str, Any] = dict(data)
+    if version is not None:
+        payload["version"] = version
+    ws_manager.publish(WSMessage(id=account_id, event=WSEvent.PATIENT_ACTIVITY_UPDATE, data=payload))
+
+def activity_record_changed(account_id: Optional[Any], created_by: Optional[Any] = None):
+    '''
+    Invalidate the activity of a teleconsult or walk-in row's accounts and update its owner's app
+    The owner is the account that created the row for family members, otherwise the patient
+    '''
+    owner_id = str(created_by or account_id or '')
+    if not owner_id:
+        logging.error(f"Activity: Record without account changed. Account ID: {account_id}, Created By: {created_by}")
+        return
+    versions = invalidate_activity([account_id, created_by])
+    publish_activity_update(owner_id, versions[owner_id])
@@ -0,0 +1,165 @@
+"""
+In-memory pricing rules for teleconsult rates
+
+Dynamic rates, corporate codes and public holidays are compiled into an immutable snapshot,
+shared by every quote until an admin edit bumps the version key or the snapshot expires.
+Each rate key is expanded into a table of the minutes of the day, so a quote is a list index
+instead of a query and a re-parse of the "0800-1800" timings.
+"""
+import logging
+import time
+from datetime import date, datetime, timedelta
+from threading import Lock
+from typing import Optional
+from pydantic import BaseModel
+from models import SessionLocal, CorporateCode, DynamicPricing
+from models.pinnacle import PublicHoliday
+from utils import redis_cache, sg_datetime
+
+PRICING_VERSION_KEY = 'pricing_rules_version'
+# Other workers pick up edits on the next version check, the max age bounds staleness when Redis is down
+RULES_MAX_AGE = 300 # 5 mins
+MINUTES_PER_DAY = 24 * 60
+
+class DynamicRate(BaseModel):
+    corporate_codes: dict[str, list[str]]
+    sgimed_consultation_inventory_ids: list[str]
+
+class PricingCode(BaseModel):
+    id: str
+    code: str
+    allow_user_input: bool
+    inventory_ids: list[str]
+    priority_index: int
+
+def parse_timing(timing: Optional[str]) -> Optional[tuple[int, int]]:
+    '''
+    Minutes of the day covered by a "HHMM-HHMM" timing, end exclusive, None if malformed
+    '''
+    if not timing or '-' not in timing:
+        return None
+    time_parts = timing.split('-')
+    if len(time_parts) != 2 or not all(part.strip().isdigit() for part in time_parts):
+        return None
+    start_time, end_time = int(time_parts[0]), int(time_parts[1])
+    return (start_time // 100) * 60 + start_time % 100, (end_time // 100) * 60 + end_time % 100
+
+class RateTable:
+    '''
+    Rates of a rate key (e.g. MON-FRI) indexed by minute of the day
+    Overlapping timings resolve to the first row, like the sequential scan they replace
+    '''
+    def __init__(self, rate_key: str, rows: list[DynamicPricing]):
+        self.rate_key = rate_key
+        self.rates = [DynamicRate(
+            corporate_codes=row.corporate_codes or {},
+            sgimed_consultation_inventory_ids=row.sgimed_consultation_inventory_ids or []
+        ) for row in rows]
+        self.fallback = f"{rows[0].date} {rows[0].timing}"
+        self.slots: list[Optional[int]] = [None] * MINUTES_PER_DAY
+        for index, row in reversed(list(enumerate(rows))):
+            interval = parse_timing(row.timing)
+            if interval is None:
+                continue
+            start, end = max(interval[0], 0), min(interval[1], MINUTES_PER_DAY)
+            if start < end:
+                self.slots[start:end] = [index] * (end - start)
+
+        gaps = self.slots.count(None)
+        if gaps:
+            logging.warning(f"Dynamic pricing '{rate_key}' does not cover {gaps} minutes of the day, these use {self.fallback}")
+
+    def get(self, current_datetime: datetime) -> DynamicRate:
+        index = self.slots[current_datetime.hour * 60 + current_datetime.minute]
+        if index is None:
+            logging.error(f"No timing row found for datetime {current_datetime.strftime('%Y-%m-%d %H:%M')}. "
+                        f"Using first timing row for rate_key '{self.rate_key}': {self.fallback}")
+            index = 0
+        return self.rates[index]
+
+class PricingRules:
+    '''
+    Immutable snapshot of payment_dynamic_rates, payment_corporate_codes and public holidays
+    '''
+    def __init__(self, rate_rows: list[DynamicPricing], codes: list[CorporateCode], holidays: list[date]):
+        rows_by_key: dict[str, list[DynamicPricing]] = {}
+        for row in rate_rows:
+            rows_by_key.setdefault(row.date, []).append(row)
+        self.tables = { rate_key: RateTable(rate_key, rows) for rate_key, rows in rows_by_key.items() }
+        self.codes = {
+            code.code: PricingCode(
+                id=str(code.id),
+                code=code.code,
+                allow_user_input=code.allow_user_input,
+                inventory_ids=code.sgimed_consultation_inventory_ids or [],
+                priority_index=code.priority_index,
+            )
+            for code in codes
+        }
+        self.holidays = frozenset(holidays)
+
+    def rate_key(self, current_datetime: datetime) -> str:
+        '''
+        Rate key priority PH > SAT/SUN > MON-FRI
+        '''
+        if current_datetime.date() in self.holidays:
+            return 'PH'
+        current_day = ['MON','TUE','WED','THU','FRI','SAT','SUN'][current_datetime.weekday()]
+        return 'MON-FRI' if current_day in ['MON','TUE','WED','THU','FRI'] else current_day
+
+    def get_rate(self, current_datetime: datetime) -> DynamicRate:
+        rate_key = self.rate_key(current_datetime)
+        table = self.tables.get(rate_key)
+        if not table:
+            raise ValueError(
+                f"No dynamic pricing configuration found for datetime {current_datetime.strftime('%Y-%m-%d %H:%M')}. "
+                f"Expected timing rows for rate_key '{rate_key}' but none exist in payment_dynamic_rates table. "
+                f"Please ensure dynamic pricing is properly configured for this time period."
+            )
+        return table.get(current_datetime)
+
+    def highest_priority_code(self, memberships: list[str]) -> Optional[PricingCode]:
+        codes = [self.codes[membership] for membership in memberships if membership in self.codes]
+        if not codes:
+            return None
+        return min(codes, key=lambda code: (code.priority_index, int(code.id)))
+
+def load_pricing_rules() -> PricingRules:
+    with SessionLocal() as db:
+        rate_rows = db.query(DynamicPricing).order_by(DynamicPricing.id).all()
+        codes = db.query(CorporateCode).filter(CorporateCode.deleted == False).all()
+        # Past holidays are never quoted, yesterday is kept for snapshots taken before midnight
+        holidays = db.query(PublicHoliday.date).filter(
+            PublicHoliday.date >= sg_datetime.now().date() - timedelta(days=1)
+        ).all()
+        return PricingRules(rate_rows, codes, [row[0] for row in holidays])
+
+_rules_lock = Lock()
+_rules: Optional[PricingRules] = None
+_rules_version: Optional[int] = None
+_rules_loaded_at = 0.0
+
+def get_pricing_rules() -> PricingRules:
+    '''
+    Current pricing rules, reloaded once per version bump or RULES_MAX_AGE
+    '''
+    global _rules, _rules_version, _rules_loaded_at
+    version, = redis_cache.get_versions(PRICING_VERSION_KEY)
+    rules = _rules
+    if rules is not None and _rules_version == version and time.monotonic() - _rules_loaded_at < RULES_MAX_AGE:
+        return rules
+
+    with _rules_lock:
+        # Another thread may have reloaded while waiting for the lock
+        if _rules is not None and _rules_version == version and time.monotonic() - _rules_loaded_at < RULES_MAX_AGE:
+            return _rules
+        _rules = load_pricing_rules()
+        _rules_version = version
+        _rules_loaded_at = time.monotonic()
+        return _rules
+
+def invalidate_pricing_rules():
+    '''
+    Reload the pricing rules after dynamic rate, corporate code or public holiday writes
+    '''
+    redis_cache.bump_version(PRICING_VERSION_KEY)
@@ -2,12 +2,14 @@ from collections import OrderedDict
 import logging
 from datetime import datetime
 from typing import Optional, List
-from cachetools import TTLCache, LRUCache, cached
+from cachetools import TTLCache, cached
 from pydantic import BaseModel
+from sqlalchemy import exists, false, func, select
 from sqlalchemy.orm import Session
-from models import SessionLocal, Account, AccountYuuLink, CorporateUser, CorporateCode, DynamicPricing, SGiMedInventory
-from models.pinnacle import PublicHoliday
-from services.user import user_is_pcp
+from models import SessionLocal, Account, AccountYuuLink, CorporateUser, SGiMedInventory
+from models.pinnacle import StAndrew
+from services.pricing import PricingRules, get_pricing_rules
+from services.user import record_is_pcp
 from config import SGIMED_GST_RATE
 from utils import  sg_datetime
 
@@ -27,10 +29,6 @@ class Membership(BaseModel):
     code: str
     inventory_ids: List[str]
 
-class DynamicRate(BaseModel):
-    corporate_codes: dict[str, List[str]]
-    sgimed_consultation_inventory_ids: List[str]
-
 def fetch_prepayment_rate(db: Session, nric: str, user_code: Optional[str] = None):
     """
     Calculate prepayment rate based on priority system with timing overrides
@@ -45,179 +43,122 @@ def fetch_prepayment_rate(db: Session, nric: str, user_code: Optional[str] = Non
     8. Group similar line items and compute subtotal (without GST)
     9. Return PCP status, corporate code, and payment breakdown
     """
-    account = db.query(Account).filter(Account.nric == nric).first()
-    if not account:
-        raise Exception("Account not found")
-
-    current_datetime = sg_datetime.now()
-
-    # Step 1: Get timing row from payment_dynamic_rates based on current datetime
-    timing_row = get_dynamic_pricing_row(current_datetime.replace(second=0, microsecond=0))
-    membership = get_corporate_membership(str(account.id), user_code)
-    inventory_ids = timing_row.sgimed_consultation_inventory_ids
-
-    if membership:
-        if membership.id in timing_row.corporate_codes:
-            inventory_ids = timing_row.corporate_codes[membership.id]
-        else:
-            inventory_ids = membership.inventory_ids
-    
-    subtotal = get_payment_breakdown(tuple(inventory_ids))
-
-    is_pcp = bool(membership and membership.code == 'PCP')
-    return_code = membership.code if membership else None
-    return is_pcp, return_code, subtotal
-
+    return fetch_prepayment_rates(db, [nric], user_code)[0]
 
-@cached(cache=LRUCache(maxsize=32))
-def get_dynamic_pricing_row(current_datetime: datetime) -> DynamicRate:
+def fetch_prepayment_rates(db: Session, nrics: list[str], user_code: Optional[str] = None):
     """
-    Get current timing row from payment_dynamic_rates based on datetime
-    
-    1. Determine rate_key priority (PH > specific date > SAT/SUN > MON-FRI)
-    2. Check for public holidays and set rate_key to 'PH'
-    3. Handle weekend rates (SAT/SUN) and weekday rates (MON-FRI)
-    4. Get all timing rows for the determined rate_key
-    5. Find timing row that matches current time range (e.g., 0800-1800)
-    6. Return matching timing row or fallback to first available row
+    fetch_prepayment_rate for several patients (e.g. family members), in the order of nrics
+    Memberships of every patient are resolved in a single query
     """
-    current_day = ['MON','TUE','WED','THU','FRI','SAT','SUN'][current_datetime.weekday()]
-    current_time = current_datetime.time().hour * 100 + current_datetime.time().minute
+    rules = get_pricing_rules()
+    memberships = resolve_memberships(db, rules, Account.nric.in_(nrics), user_code)
+    accounts = {}
+    for account_id, nric, membership in memberships:
+        accounts.setdefault(nric, membership)
 
-    # Step 1: Determine rate_key priority MON-FRI, SAT, SUN, PH
-    rate_key = 'MON-FRI' if current_day in ['MON','TUE','WED','THU','FRI'] else current_day
-    
-    with SessionLocal() as db:
-        holiday = db.query(PublicHoliday.date).filter(PublicHoliday.date == current_datetime.date()).first()
-        if holiday:
-            rate_key = 'PH'
+    # Step 1: Get timing row from payment_dynamic_rates based on current datetime
+    timing_row = rules.get_rate(sg_datetime.now())
+    rates = []
+    for nric in nrics:
+        if nric not in accounts:
+            raise Exception("Account not found")
+        membership = accounts[nric]
+        inventory_ids = timing_row.sgimed_consultation_inventory_ids
 
-        # Step 2: Get all timing rows for the determined rate_key
-        timing_rows = db.query(DynamicPricing).filter(DynamicPricing.date == rate_key).all()
-        
-        # Step 3: Find the matching timing range
-        for timing_row in timing_rows:
-            # Parse timing range (e.g., "0800-1800")
-            if timing_row.timing and '-' in timing_row.timing:
-                time_parts = timing_row.timing.split('-')
-                if len(time_parts) == 2:
-                    start_time = int(time_parts[0])
-                    end_time = int(time_parts[1])
-                    
-                    # Check if current time falls within this range
-                    if start_time <= current_time < end_time:
-                        return DynamicRate(
-                            corporate_codes=timing_row.corporate_codes,
-                            sgimed_consultation_inventory_ids=timing_row.sgimed_consultation_inventory_ids
-                        )
+        if membership:
+            if membership.id in timing_row.corporate_codes:
+                inventory_ids = timing_row.corporate_codes[membership.id]
+            else:
+                inventory_ids = membership.inventory_ids
 
-        # Step 4: Fallback - return first timing row for the rate_key if no range matches
-        if timing_rows:
-            logging.error(f"No timing row found for datetime {current_datetime.strftime('%Y-%m-%d %H:%M')}. "
-                        f"Expected timing rows for rate_key '{rate_key}' but none exist in payment_dynamic_rates table. "
-                        f"Using first timing row: {timing_rows[0].date} {timing_rows[0].timing}")
-            return DynamicRate(
-                corporate_codes=timing_rows[0].corporate_codes,
-                sgimed_consultation_inventory_ids=timing_rows[0].sgimed_consultation_inventory_ids
-            )
+        subtotal = get_payment_breakdown(tuple(inventory_ids))
 
-    # No timing rows found for any rate key
-    raise ValueError(
-        f"No dynamic pricing configuration found for datetime {current_datetime.strftime('%Y-%m-%d %H:%M')}. "
-        f"Expected timing rows for rate_key '{rate_key}' but none exist in payment_dynamic_rates table. "
-        f"Please ensure dynamic pricing is properly configured for this time period."
-    )
+        is_pcp = bool(membership and membership.code == 'PCP')
+        return_code = membership.code if membership else None
+        rates.append((is_pcp, return_code, subtotal))
+    return rates
 
-# @cached(cache=TTLCache(maxsize=1024, ttl=60))
 def get_corporate_membership(account_id: str, user_code: Optional[str] = None) -> Optional[Membership]:
     """
     Detect all corporate memberships for a user
     Returns Membership object with highest priority code
+    """
+    with SessionLocal() as db:
+        memberships = resolve_memberships(db, get_pricing_rules(), Account.id == account_id, user_code)
+    if not memberships:
+        logging.error(f"Account with ID '{account_id}' not found in patient_accounts table")
+        return None
+    return memberships[0][2]
+
+def resolve_memberships(db: Session, rules: PricingRules, account_filter, user_code: Optional[str] = None) -> list[tuple[str, str, Optional[Membership]]]:
+    """
+    Highest priority membership of each account matching account_filter, as (account_id, nric, membership)
     
     1. Check PCP membership from pinnacle_sa_records table
     2. Check Yuu membership from patient_account_yuu_links (primary user only)
     3. Get all corporate memberships from corporate_users table
     4. Validate user input codes (INS, etc.) with access restrictions
     5. Return highest priority membership or None
-    """
-    memberships = []
     
-    with SessionLocal() as db:
-        account = db.query(Account).filter(Account.id == account_id).first()
-        if not account:
-            logging.error(f"Account with ID '{account_id}' not found in patient_accounts table")
-            return None
-        
-        # Check PCP membership
-        if user_is_pcp(db, account.nric):
+    Steps 1-4 are read in a single query, codes and priorities come from the pricing rules
+    """
+    user_code = user_code.upper() if user_code else None
+    corporate_codes = select(func.array_agg(CorporateUser.code)).where(
+        CorporateUser.nric == Account.nric
+    ).scalar_subquery()
+    has_yuu_link = exists().where(
+        AccountYuuLink.account_id == Account.id,
+        AccountYuuLink.deleted == False
+    )
+    # A user code is restricted to specific NRICs if it has any corporate users
+    code_restricted = exists().where(CorporateUser.code == user_code) if user_code else false()
+
+    rows = db.execute(
+        select(
+            Account.id,
+            Account.nric,
+            Account.mobile_number,
+            StAndrew,
+            has_yuu_link.label('has_yuu_link'),
+            corporate_codes.label('corporate_codes'),
+            code_restricted.label('code_restricted'),
+        )
+        .outerjoin(StAndrew, StAndrew.nric == Account.nric)
+        .where(account_filter)
+    ).all()
+
+    results = []
+    for row in rows:
+        memberships = []
+        if record_is_pcp(row.StAndrew):
             memberships.append('PCP')
-        
-        # Check Yuu membership (primary user only)
-        if account.mobile_number:  # Primary user, not a dependent
-            yuu_link = db.query(AccountYuuLink).filter(
-                AccountYuuLink.account_id == account.id,
-                AccountYuuLink.deleted == False
-            ).first()
-            if yuu_link:
-                memberships.append('YUU')
-        
-        # Check Corporate User membership
-        corporate_memberships = db.query(CorporateUser.code).filter(
-            CorporateUser.nric == account.nric
-        ).all()
-        memberships += [r[0] for r in corporate_memberships]
-        
-        # Check for user_code (user input codes like INS, etc.)
+        # Yuu membership is for the primary user only, not dependents
+        if row.mobile_number and row.has_yuu_link:
+            memberships.append('YUU')
+        memberships += row.corporate_codes or []
+
         if user_code:
-            # Check if user_code exists in payment_corporate_codes and is valid for user input
-            corporate_code_record = db.query(CorporateCode).filter(
-                CorporateCode.code == user_code.upper(),
-                CorporateCode.deleted == False,
-                CorporateCode.allow_user_input == True
-            ).first()
-            
-            if corporate_code_record:
-                # Check if this corporate code is restricted to specific NRICs
-                has_restricted_user = db.query(CorporateUser.code).filter(
-                    CorporateUser.code == user_code.upper()
-                ).first()
-                
-                if has_restricted_user:
-                    # Code is restricted - check if user NRIC is in the allowed list
-                    user_authorized = db.query(CorporateUser).filter(
-                        CorporateUser.code == user_code.upper(),
-                        CorporateUser.nric == account.nric
-                    ).first()
-                    
-                    if user_authorized:
-                        # User is authorized for this restricted code
-                        memberships.append(user_code.upper())
-                    # If not authorized, code is not added to memberships
-                else:
-                    # No restrictions - code has open access, add to memberships
-                    memberships.append(user_code.upper())
+            user_code_record = rules.codes.get(user_code)
+            # Restricted codes are only valid if the NRIC is in the allowed list
+            if user_code_record and user_code_record.allow_user_input and (not row.code_restricted or user_code in (row.corporate_codes or [])):
+                memberships.append(user_code)
 
+        membership = None
         if memberships:
-            # Get highest priority corporate code
-            corporate_code = db.query(CorporateCode).filter(
-                CorporateCode.deleted == False,
-                CorporateCode.code.in_(memberships)
-            ).order_by(CorporateCode.priority_index).first()
-            
-            if not corporate_code:
+            corporate_code = rules.highest_priority_code(memberships)
+            if corporate_code:
+                membership = Membership(
+                    id=corporate_code.id,
+                    code=corporate_code.code,
+                    inventory_ids=corporate_code.inventory_ids
+                )
+            else:
                 logging.error(
                     f"No active corporate code found for memberships {memberships}. "
                     f"Corporate codes may be deleted or missing from payment_corporate_codes table."
                 )
-                return None
-
-            return Membership(
-                id=str(corporate_code.id), 
-                code=corporate_code.code, 
-                inventory_ids=corporate_code.sgimed_consultation_inventory_ids
-            )
-
-    return None
+        results.append((str(row.id), row.nric, membership))
+    return results
 
 @cached(cache=TTLCache(maxsize=1024, ttl=60))
 def get_payment_breakdown(inventory_ids: tuple[str, ...]) -> PaymentTotal:
@@ -4,6 +4,7 @@ from sqlalchemy.orm import Session
 from datetime import timedelta
 from datetime import datetime as sg_datetime
 import logging
+from typing import Optional
 
 def is_test_user(user: Account):
     return user.mobile_number in ['81611147', '89998107', '89992001']
@@ -20,8 +21,15 @@ def user_is_pcp(db: Session, nric: str):
     # results = supabase.table(SA_TABLE).select('*').eq('nric', nric).limit(1).execute()
     record = db.query(StAndrew).filter(StAndrew.nric == nric).first()
     print(f"Finding Record: {nric} {record}")
+    return record_is_pcp(record)
+
+def record_is_pcp(record: Optional[StAndrew]):
+    '''
+    PCP status of an already loaded St Andrew record, see user_is_pcp
+    '''
     if not record:
         return False
+    nric = record.nric
 
     # Date Format String
     date_format = '%d/%m/%Y'
@@ -0,0 +1,239 @@
+"""
+Durable inbox for provider webhooks (SGiMed, Stripe, 2C2P, Supabase)
+
+Endpoints verify the request, store the payload with an idempotency key and return straight away.
+Worker threads claim stored events one at a time with FOR UPDATE SKIP LOCKED and run the provider's handler:
+- A provider retry of a stored event is acknowledged without being stored or processed again. Payloads
+  without a delivery id are only ignored while an identical payload is still waiting to be processed
+- Events of the same object reference run one at a time, in the order received
+- Failed events are retried with backoff up to MAX_ATTEMPTS, events claimed by a worker that
+  died (e.g. a redeploy) are picked up again once their lock expires
+- Done and failed events are deleted by the scheduler after EVENT_RETENTION_DAYS, payloads hold patient data
+"""
+import hashlib
+import json
+import logging
+import threading
+import uuid
+from datetime import timedelta
+from typing import Any, Callable, Optional
+from sqlalchemy import and_, delete, exists, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, aliased
+from models import SessionLocal
+from models.backend import WebhookEvent, WebhookEventStatus
+from utils.run_metrics import add_rows
+
+INBOX_WORKERS = 4
+# Events processed by a worker before it looks at the stop flag, each event is claimed just before it runs
+CLAIM_BATCH_SIZE = 20
+# Workers also poll for retries and for events stored by other app workers
+POLL_INTERVAL = 5 # seconds
+LOCK_TIMEOUT = 300 # 5 mins, an event still processing after this is assumed lost
+MAX_ATTEMPTS = 8
+RETRY_BACKOFF = 15 # seconds, doubled after every attempt
+MAX_RETRY_BACKOFF = 3600 # 1 hour
+# Identical unkeyed payloads received within this window are ignored while the first is unfinished
+DEDUPE_WINDOW = 300 # 5 mins
+EVENT_RETENTION_DAYS = 30
+# Rows deleted per statement when pruning, so the delete does not hold locks for long
+PRUNE_BATCH_SIZE = 5000
+
+WebhookHandler = Callable[[dict], Any]
+_handlers: dict[str, WebhookHandler] = {}
+
+def register_handler(provider: str, handler: WebhookHandler):
+    '''
+    Handler called with the stored payload of the provider's events, raising marks the event for a retry
+    '''
+    _handlers[provider] = handler
+
+def payload_key(payload: Any) -> str:
+    '''
+    Hash of a verified payload or raw token
+    '''
+    if not isinstance(payload, (str, bytes)):
+        payload = json.dumps(payload, sort_keys=True, default=str)
+    if isinstance(payload, str):
+        payload = payload.encode()
+    return hashlib.sha256(payload).hexdigest()
+
+def _insert_event(db: Session, provider: str, idempotency_key: str, event_type: str, object_reference: Optional[str], payload: dict, payload_hash: Optional[str] = None) -> bool:
+    stmt = insert(WebhookEvent).values(
+        provider=provider,
+        idempotency_key=idempotency_key,
+        payload_hash=payload_hash,
+        event_type=event_type,
+        object_reference=object_reference,
+        payload=payload,
+        status=WebhookEventStatus.PENDING,
+        attempts=0,
+    ).on_conflict_do_nothing(index_elements=['provider', 'idempotency_key'])
+    return db.execute(stmt).rowcount > 0
+
+def enqueue(db: Session, provider: str, idempotency_key: str, event_type: str, object_reference: Optional[str], payload: dict) -> bool:
+    '''
+    Store a verified webhook payload for processing, returns False if the event was already received
+    The idempotency key must identify the delivery (e.g. the provider's event id), not its content
+    '''
+    created = _insert_event(db, provider, idempotency_key, event_type, object_reference, payload)
+    db.commit()
+    if created:
+        _wake_up.set()
+    else:
+        logging.info(f"Webhook Inbox: Duplicate {provider} event {idempotency_key}, ignored")
+    return created
+
+def enqueue_unkeyed(db: Session, provider: str, event_type: str, object_reference: Optional[str], payload: dict, window: int = DEDUPE_WINDOW) -> bool:
+    '''
+    Store a payload of a provider without a delivery id, returns False if it was ignored as a duplicate
+    The same payload may legitimately be sent again (e.g. a row updated back to the same state), so it is
+    only ignored while an identical event received within window seconds is still waiting to be processed
+    '''
+    payload_hash = payload_key(payload)
+    # Serialise identical deliveries so two concurrent requests cannot both pass the check
+    db.execute(select(func.pg_advisory_xact_lock(func.hashtext(f"webhook:{provider}:{payload_hash}"))))
+    duplicate = db.scalar(select(exists().where(
+        WebhookEvent.provider == provider,
+        WebhookEvent.payload_hash == payload_hash,
+        WebhookEvent.status.in_([WebhookEventStatus.PENDING, WebhookEventStatus.PROCESSING]),
+        WebhookEvent.created_at > func.now() - timedelta(seconds=window),
+    )))
+    created = False
+    if not duplicate:
+        created = _insert_event(db, provider, uuid.uuid4().hex, event_type, object_reference, payload, payload_hash)
+    db.commit()
+    if created:
+        _wake_up.set()
+    else:
+        logging.info(f"Webhook Inbox: Duplicate {provider} payload {payload_hash} still pending, ignored")
+    return created
+
+class ClaimedEvent:
+    def __init__(self, id: int, provider: str, event_type: str, attempts: int, payload: dict):
+        self.id = id
+        self.provider = provider
+        self.event_type = event_type
+        self.attempts = attempts
+        self.payload = payload
+
+def _claim_event(db: Session) -> Optional[ClaimedEvent]:
+    '''
+    Claim the next event, its lease of LOCK_TIMEOUT only starts when it is about to be processed
+    '''
+    earlier = aliased(WebhookEvent)
+    # An earlier event of the same object that is not finished holds back the later ones
+    blocked = exists().where(
+        earlier.provider == WebhookEvent.provider,
+        earlier.object_reference == WebhookEvent.object_reference,
+        earlier.id < WebhookEvent.id,
+        earlier.status.in_([WebhookEventStatus.PENDING, WebhookEventStatus.PROCESSING]),
+    )
+    claimable = select(WebhookEvent.id).where(
+        WebhookEvent.status.in_([WebhookEventStatus.PENDING, WebhookEventStatus.PROCESSING]),
+        WebhookEvent.next_attempt_at <= func.now(),
+        (WebhookEvent.status == WebhookEventStatus.PENDING) | (WebhookEvent.locked_until < func.now()),
+        ~blocked,
+    ).order_by(WebhookEvent.id).limit(1).with_for_update(skip_locked=True)
+
+    row = db.execute(
+        update(WebhookEvent).where(WebhookEvent.id.in_(claimable.scalar_subquery())).values(
+            status=WebhookEventStatus.PROCESSING,
+            attempts=WebhookEvent.attempts + 1,
+            locked_until=func.now() + timedelta(seconds=LOCK_TIMEOUT),
+        ).returning(
+            WebhookEvent.id, WebhookEvent.provider, WebhookEvent.event_type, WebhookEvent.attempts, WebhookEvent.payload
+        ).execution_options(synchronize_session=False)
+    ).first()
+    db.commit()
+    return ClaimedEvent(*row) if row else None
+
+def _process_event(db: Session, event: ClaimedEvent):
+    handler = _handlers.get(event.provider)
+    try:
+        if handler is None:
+            raise ValueError(f"No handler registered for provider {event.provider}")
+        handler(event.payload)
+        values: dict[str, Any] = { "status": WebhookEventStatus.DONE, "processed_at": func.now(), "last_error": None }
+    except Exception as e:
+        logging.error(f"Webhook Inbox: {event.provider} event {event.id} ({event.event_type}) failed on attempt {event.attempts}. {e}", exc_info=True)
+        if event.attempts >= MAX_ATTEMPTS:
+            values = { "status": WebhookEventStatus.FAILED, "processed_at": func.now(), "last_error": str(e) }
+        else:
+            backoff = min(RETRY_BACKOFF * 2 ** (event.attempts - 1), MAX_RETRY_BACKOFF)
+            values = { "status": WebhookEventStatus.PENDING, "next_attempt_at": func.now() + timedelta(seconds=backoff), "last_error": str(e) }
+
+    # Only the claim that is still current may finish the event, an expired lease may have been reclaimed
+    db.execute(update(WebhookEvent).where(and_(
+        WebhookEvent.id == event.id,
+        WebhookEvent.status == WebhookEventStatus.PROCESSING,
+        WebhookEvent.attempts == event.attempts,
+    )).values(locked_until=None, **values).execution_options(synchronize_session=False))
+    db.commit()
+
+def process_pending_events(limit: int = CLAIM_BATCH_SIZE) -> int:
+    '''
+    Claim and process up to limit events one at a time, returns the number of events processed
+    '''
+    processed = 0
+    with SessionLocal() as db:
+        while processed < limit and not _stop.is_set():
+            event = _claim_event(db)
+            if event is None:
+                break
+            _process_event(db, event)
+            processed += 1
+    return processed
+
+_wake_up = threading.Event()
+_stop = threading.Event()
+_workers: list[threading.Thread] = []
+
+def _run_worker():
+    while not _stop.is_set():
+        # Cleared before claiming, so an event stored while claiming wakes the next wait
+        _wake_up.clear()
+        try:
+            if process_pending_events():
+                continue
+        except Exception as e:
+            logging.error(f"Webhook Inbox: Failed to process events. {e}", exc_info=True)
+        _wake_up.wait(POLL_INTERVAL)
+
+def start_workers(count: int = INBOX_WORKERS):
+    '''
+    Start the inbox worker threads, called once on app startup
+    '''
+    if _workers:
+        return
+    _stop.clear()
+    for i in range(count):
+        worker = threading.Thread(target=_run_worker, name=f"webhook_inbox_{i}", daemon=True)
+        worker.start()
+        _workers.append(worker)
+
+def stop_workers(timeout: float = 30):
+    '''
+    Stop the workers after their current events, unfinished events are picked up after a restart
+    '''
+    _stop.set()
+    _wake_up.set()
+    for worker in _workers:
+        worker.join(timeout)
+    _workers.clear()
+
+def prune_webhook_events(days: int = EVENT_RETENTION_DAYS):
+    '''
+    Delete done and failed events processed more than days ago
+    '''
+    with SessionLocal() as db:
+        while True:
+            batch = select(WebhookEvent.id).where(
+                WebhookEvent.status.in_([WebhookEventStatus.DONE, WebhookEventStatus.FAILED]),
+                WebhookEvent.processed_at < func.now() - timedelta(days=days),
+            ).limit(PRUNE_BATCH_SIZE)
+            result = db.execute(delete(WebhookEvent).where(WebhookEvent.id.in_(batch)))
+            db.commit()
+            add_rows(result.rowcount)
+            if result.rowcount < PRUNE_BATCH_SIZE:
+                break
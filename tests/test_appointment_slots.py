@@ -0,0 +1,261 @@
+"""
+Parity tests for the appointment slot grid:
+  - get_appointment_slot_grid opens the same slots with the same limits as the previous set based computation
+  - get_appointment_booked_slots and get_available_slots give the same timings on randomized schedules,
+    holidays, blockoffs, booking counts and session limits
+  - SlotGrid.window and the JSON round trip keep the same slots
+
+The previous implementation is kept below as the reference. Queries are answered from generated rows,
+only the booked count threshold is evaluated, the other filters hold for the generated rows by construction.
+
+Run with:
+    python -m pytest tests/test_appointment_slots.py -v
+"""
+import sys
+import os
+import math
+import operator
+import random
+import uuid
+from datetime import date, datetime, time, timedelta
+from types import SimpleNamespace
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm.attributes import InstrumentedAttribute  # noqa: E402
+from models import OperatingHour, PublicHoliday, Blockoff, AppointmentBranchOperatingHours, AppointmentCount  # noqa: E402
+from models.appointment import Appointment  # noqa: E402
+from models.model_enums import DayOfWeek  # noqa: E402
+from utils.appointment import DISCRETE_TIME_INTERVAL, MOCK_DATE, SlotGrid, get_appointment_booked_slots, get_appointment_slot_grid, get_available_slots  # noqa: E402
+from utils.sg_datetime import sgtz  # noqa: E402
+
+DURATIONS = [0, 15, 20, 30, 45, 60, 90]
+
+
+class FakeQuery:
+    def __init__(self, entities: tuple, rows: list):
+        self.entities = entities
+        self.rows = rows
+
+    def filter(self, *criteria):
+        for criterion in criteria:
+            left = getattr(criterion, 'left', None)
+            if getattr(left, 'key', None) == 'count' and getattr(left, 'table', None) is AppointmentCount.__table__:
+                assert criterion.operator is operator.ge
+                self.rows = [row for row in self.rows if row.count >= criterion.right.value]
+        return self
+
+    def options(self, *args):
+        return self
+
+    def group_by(self, *args):
+        return self
+
+    def all(self):
+        if not isinstance(self.entities[0], InstrumentedAttribute) or self.entities[0] is Appointment.start_datetime:
+            return self.rows
+        return [tuple(getattr(row, entity.key) for entity in self.entities) for row in self.rows]
+
+
+class FakeSession:
+    def __init__(self, tables: dict):
+        self.tables = tables
+
+    def query(self, *entities):
+        entity = entities[0]
+        model = entity.class_ if isinstance(entity, InstrumentedAttribute) else entity
+        return FakeQuery(entities, list(self.tables[model]))
+
+
+# Previous implementation, with Appointment.branch['id'].as_string() as .astext is not available on the JSON column
+def reference_discrete(start_dt: datetime, end_dt: datetime, interval: int) -> list[datetime]:
+    start_dt_interval = start_dt - timedelta(minutes=start_dt.minute % interval, seconds=start_dt.second, microseconds=start_dt.microsecond)
+    discrete_times = []
+    while start_dt_interval < end_dt:
+        discrete_times.append(start_dt_interval)
+        start_dt_interval += timedelta(minutes=interval)
+    return discrete_times
+
+def reference_operating_hours(db, branch, start_date: datetime, end_date: datetime):
+    branch_discrete: dict[DayOfWeek, list[datetime]] = {}
+    for row in db.query(OperatingHour).filter(OperatingHour.branch_id == branch.id).all():
+        start_time = sgtz.localize(datetime.combine(MOCK_DATE, row.start_time))
+        end_time = sgtz.localize(datetime.combine(MOCK_DATE, row.end_time)) - timedelta(minutes=row.cutoff_time)
+        branch_discrete.setdefault(row.day, []).extend(reference_discrete(start_time, end_time, DISCRETE_TIME_INTERVAL))
+
+    appt_discrete: dict[DayOfWeek, list[datetime]] = {}
+    appt_max_bookings: dict[DayOfWeek, list[tuple[datetime, int]]] = {}
+    appt_max_per_session: dict[DayOfWeek, list[tuple[datetime, int | None]]] = {}
+    for row in db.query(AppointmentBranchOperatingHours).filter(AppointmentBranchOperatingHours.branch_id == branch.id).all():
+        start_time = sgtz.localize(datetime.combine(MOCK_DATE, row.start_time))
+        end_time = sgtz.localize(datetime.combine(MOCK_DATE, row.end_time)) - timedelta(minutes=row.cutoff_time)
+        discrete_times = reference_discrete(start_time, end_time, DISCRETE_TIME_INTERVAL)
+        appt_discrete.setdefault(row.day, []).extend(discrete_times)
+        appt_max_bookings.setdefault(row.day, []).extend((t, row.max_bookings) for t in discrete_times)
+        appt_max_per_session.setdefault(row.day, []).extend((t, row.max_appointments_per_session) for t in discrete_times)
+    for day in appt_discrete:
+        if day not in branch_discrete:
+            appt_discrete[day] = []
+            continue
+        appt_discrete[day] = list(set(appt_discrete[day]) & set(branch_discrete[day]))
+
+    public_holidays = [row[0] for row in db.query(PublicHoliday.date).all()]
+    blockoffs_dict: dict[date, list[datetime]] = {}
+    for row in db.query(Blockoff).all():
+        blockoffs_dict.setdefault(row.date, []).extend(reference_discrete(
+            sgtz.localize(datetime.combine(row.date, row.start_time)),
+            sgtz.localize(datetime.combine(row.date, row.end_time)),
+            DISCRETE_TIME_INTERVAL
+        ))
+
+    hours_discrete: set[datetime] = set()
+    max_bookings: dict[datetime, int] = {}
+    max_per_session: dict[datetime, int] = {}
+    current_date = start_date
+    while current_date <= end_date:
+        curr_day = DayOfWeek[current_date.strftime("%A").upper()]
+        if current_date.date() in public_holidays:
+            curr_day = DayOfWeek.PUBLIC_HOLIDAY
+        hours = appt_discrete.get(curr_day, None)
+        if hours is None:
+            current_date += timedelta(days=1)
+            continue
+        hours = set(sgtz.localize(datetime.combine(current_date, hour.time())) for hour in hours)
+        blockoffs = blockoffs_dict.get(current_date.date(), None)
+        if blockoffs:
+            hours -= set(blockoffs)
+        hours_discrete.update(hours)
+        max_bookings.update({
+            sgtz.localize(datetime.combine(current_date, t.time())): value
+            for t, value in appt_max_bookings[curr_day]
+            if sgtz.localize(datetime.combine(current_date, t.time())) in hours
+        })
+        max_per_session.update({
+            sgtz.localize(datetime.combine(current_date, t.time())): value
+            for t, value in appt_max_per_session[curr_day]
+            if value is not None and sgtz.localize(datetime.combine(current_date, t.time())) in hours
+        })
+        current_date += timedelta(days=1)
+    return hours_discrete, max_bookings, max_per_session
+
+def reference_booked_slots(db, branch, available_slots: set[datetime], max_bookings: dict[datetime, int], max_per_session: dict[datetime, int]):
+    booked_slots = db.query(AppointmentCount).filter(AppointmentCount.count >= min(max_bookings.values())).all()
+    require_max_bookings_check = len(set(max_bookings.values())) > 1
+    full = set()
+    for row in booked_slots:
+        if row.time not in available_slots:
+            continue
+        if require_max_bookings_check and row.count < max_bookings[row.time]:
+            continue
+        full.add(row.time)
+    if max_per_session:
+        for slot_dt, count in db.query(Appointment.start_datetime).all():
+            if slot_dt in available_slots and slot_dt in max_per_session and count >= max_per_session[slot_dt]:
+                full.add(slot_dt)
+    return full
+
+def reference_available_slots(timings: set[datetime], duration_mins: int) -> list[datetime]:
+    interval = timedelta(minutes=DISCRETE_TIME_INTERVAL)
+    slots_needed = math.ceil(duration_mins / DISCRETE_TIME_INTERVAL)
+    return [
+        start_time for start_time in sorted(timings)
+        if all(start_time + interval * i in timings for i in range(1, slots_needed))
+    ]
+
+
+def random_time(rng: random.Random) -> time:
+    # Mostly on the slot interval, sometimes off it to cover rounding
+    minute = rng.choice([0, 15, 30, 45]) if rng.random() < 0.8 else rng.randrange(60)
+    return time(rng.randrange(6, 23), minute)
+
+def random_hours(rng: random.Random):
+    start = random_time(rng)
+    end = random_time(rng) if rng.random() < 0.1 else (datetime.combine(MOCK_DATE, start) + timedelta(minutes=rng.randrange(30, 9 * 60, 15))).time()
+    if end < start:
+        end = time(23, 59)
+    return start, end
+
+def random_schedule(rng: random.Random, start: date, days: int):
+    branch = SimpleNamespace(id=uuid.uuid4(), sgimed_branch_id='B1', sgimed_calendar_id='C1')
+    dates = [start + timedelta(days=i) for i in range(days)]
+    operating_hours, appointment_hours = [], []
+    for day in DayOfWeek:
+        for _ in range(rng.choice([0, 1, 1, 2])):
+            start_time, end_time = random_hours(rng)
+            operating_hours.append(SimpleNamespace(day=day, start_time=start_time, end_time=end_time, cutoff_time=rng.choice([0, 0, 15, 30, 60])))
+        for _ in range(rng.choice([0, 1, 1, 2, 3])):
+            start_time, end_time = random_hours(rng)
+            appointment_hours.append(SimpleNamespace(
+                day=day, start_time=start_time, end_time=end_time, cutoff_time=rng.choice([0, 0, 15, 45]),
+                max_bookings=rng.randrange(1, 5),
+                max_appointments_per_session=rng.choice([None, None, 1, 2, 3]),
+            ))
+    rng.shuffle(operating_hours)
+    holidays = [SimpleNamespace(date=d) for d in rng.sample(dates, min(rng.randrange(0, 3), len(dates)))]
+    blockoffs = []
+    for _ in range(rng.randrange(0, 6)):
+        start_time, end_time = random_hours(rng)
+        blockoffs.append(SimpleNamespace(date=rng.choice(dates), start_time=start_time, end_time=end_time))
+
+    def random_slot():
+        slot = sgtz.localize(datetime.combine(rng.choice(dates), time(rng.randrange(6, 24), rng.choice([0, 15, 30, 45]))))
+        return slot + timedelta(minutes=7) if rng.random() < 0.05 else slot
+    counts = {random_slot(): rng.randrange(0, 6) for _ in range(rng.randrange(0, 80))}
+    appointment_counts = {random_slot(): rng.randrange(1, 5) for _ in range(rng.randrange(0, 40))}
+    db = FakeSession({
+        OperatingHour: operating_hours,
+        AppointmentBranchOperatingHours: appointment_hours,
+        PublicHoliday: holidays,
+        Blockoff: blockoffs,
+        AppointmentCount: [SimpleNamespace(time=t, count=c) for t, c in counts.items()],
+        Appointment: list(appointment_counts.items()),
+    })
+    return db, branch
+
+
+def test_random_schedule_parity():
+    rng = random.Random(2)
+    for case in range(150):
+        days = rng.randrange(1, 35)
+        start = date(2025, 1, 1) + timedelta(days=rng.randrange(365))
+        db, branch = random_schedule(rng, start, days)
+        start_date = sgtz.localize(datetime.combine(start, time.min))
+        end_date = sgtz.localize(datetime.combine(start + timedelta(days=days - 1), time(23, 59, 59)))
+
+        hours, max_bookings, max_per_session = reference_operating_hours(db, branch, start_date, end_date)
+        grid = get_appointment_slot_grid(db, branch, start_date, end_date)
+        open_indexes = grid.is_open.nonzero()[0]
+        assert set(grid.slot_times(open_indexes)) == hours, case
+        for index, slot in zip(open_indexes, grid.slot_times(open_indexes)):
+            assert grid.max_bookings[index] == max_bookings[slot], (case, slot)
+            assert grid.max_per_session[index] == max_per_session.get(slot, -1), (case, slot)
+        if not hours:
+            continue
+
+        booked = get_appointment_booked_slots(db, branch, grid)
+        reference_booked = reference_booked_slots(db, branch, hours, max_bookings, max_per_session)
+        assert set(grid.slot_times(booked.nonzero()[0])) == reference_booked, case
+        for duration in DURATIONS:
+            assert get_available_slots(grid, booked, duration) == reference_available_slots(hours - reference_booked, duration), (case, duration)
+
+
+def test_window_and_json_parity():
+    rng = random.Random(7)
+    for case in range(50):
+        start = date(2025, 1, 1) + timedelta(days=rng.randrange(365))
+        db, branch = random_schedule(rng, start, 31)
+        start_date = sgtz.localize(datetime.combine(start, time.min))
+        end_date = sgtz.localize(datetime.combine(start + timedelta(days=30), time(23, 59, 59)))
+        hours, _, _ = reference_operating_hours(db, branch, start_date, end_date)
+        grid = SlotGrid.from_json(get_appointment_slot_grid(db, branch, start_date, end_date).to_json())
+
+        window_start = start_date + timedelta(minutes=rng.randrange(0, 10 * 24 * 60))
+        window_end = window_start + timedelta(minutes=rng.randrange(0, 15 * 24 * 60))
+        window = grid.window(window_start, window_end)
+        expected = set(slot for slot in hours if window_start <= slot <= window_end)
+        assert set(window.slot_times(window.is_open.nonzero()[0])) == expected, case
+
+
+if __name__ == "__main__":
+    test_random_schedule_parity()
+    test_window_and_json_parity()
+    print("All tests passed")
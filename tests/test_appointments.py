@@ -168,7 +168,7 @@ def test_sgimed_update_appointment_status_multiple_params(mock_get, mock_put):
     assert put_call_data['is_cancelled'] == False, "is_cancelled should remain unchanged"
 
 @patch('scheduler_actions.appointment_updates.update_appointment_status')
-@patch('scheduler_actions.appointment_updates.send_patient_notification')
+@patch('scheduler_actions.appointment_updates.send_patient_notifications')
 def test_send_appointment_notifications(mock_send_notification, mock_update_status, db: Session):
     '''
     Test send_appointment_notifications with various appointment records to ensure it only 
@@ -372,24 +372,25 @@ def test_send_appointment_notifications(mock_send_notification, mock_update_stat
     # Verify that only eligible appointments triggered notifications
     # Note: 3 appointments pass SQL filters (2 valid + no_sgimed), past is now excluded
     # Only 2 actually send notifications (no_sgimed_appointment gets logged error and skipped)
-    assert mock_send_notification.call_count == 2, f"Expected 2 notification calls, got {mock_send_notification.call_count}"
+    assert mock_send_notification.call_count == 1, f"Expected notifications to be sent in 1 batch, got {mock_send_notification.call_count}"
     assert mock_update_status.call_count == 2, f"Expected 2 status updates, got {mock_update_status.call_count}"
     
     # Verify notification parameters for eligible appointments
-    notification_calls = mock_send_notification.call_args_list
-    
-    # First call should be for valid_appointment
-    first_call_args = notification_calls[0][0]
-    assert first_call_args[0] == primary_account, "First notification should be sent to primary account"
-    assert first_call_args[1] == "Appointment Reminder", "Title should be 'Appointment Reminder'"
-    assert "appointment scheduled for" in first_call_args[2], "Message should contain appointment details"
-    assert "Main Clinic" in first_call_args[2], "Message should contain branch name"
-    
-    # Second call should be for none_index_appointment  
-    second_call_args = notification_calls[1][0]
-    assert second_call_args[0] == secondary_account, "Second notification should be sent to secondary account"
-    assert second_call_args[1] == "Appointment Reminder", "Title should be 'Appointment Reminder'"
-    assert "Branch Clinic" in second_call_args[2], "Message should contain branch name"
+    notifications = mock_send_notification.call_args[0][0]
+    assert len(notifications) == 2, f"Expected 2 notifications, got {len(notifications)}"
+    
+    # First notification should be for valid_appointment
+    first_notification = notifications[0]
+    assert first_notification.account_id == str(primary_account.id), "First notification should be sent to primary account"
+    assert first_notification.title == "Appointment Reminder", "Title should be 'Appointment Reminder'"
+    assert "appointment scheduled for" in first_notification.message, "Message should contain appointment details"
+    assert "Main Clinic" in first_notification.message, "Message should contain branch name"
+    
+    # Second notification should be for none_index_appointment  
+    second_notification = notifications[1]
+    assert second_notification.account_id == str(secondary_account.id), "Second notification should be sent to secondary account"
+    assert second_notification.title == "Appointment Reminder", "Title should be 'Appointment Reminder'"
+    assert "Branch Clinic" in second_notification.message, "Message should contain branch name"
     
     # Verify SGiMed status updates
     status_update_calls = mock_update_status.call_args_list
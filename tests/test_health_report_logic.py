@@ -0,0 +1,100 @@
+"""
+Parity tests for the compiled lab ranges:
+  - every test of health_report_profiles scores the same as test_generic_mapping
+  - lab range strings compile to the expected rules
+
+Run with:
+    python -m pytest tests/test_health_report_logic.py -v
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from repository.health_report.mapping import health_report_profiles, compiled_profiles  # noqa: E402
+from repository.health_report.logic import (  # noqa: E402
+    test_generic_mapping as generic_mapping,
+    compile_lab_range,
+    CompiledTest,
+    BetweenRule,
+    EqualsRule,
+    InvalidRule,
+    LowerBoundRule,
+    NegativeRule,
+    UpperBoundRule,
+)
+from repository.health_report.enums import TestTags  # noqa: E402
+
+SAMPLE_VALUES = [
+    'Neg', 'neg', 'Negative', 'Pos', '0', '0.0', '-1', '1', '3.4', '5.2', '12.2', '90', '1000',
+    '<0.5', '>100', '*', 'Reactive', 'Non-reactive', 'abc', '10-20', '60-80',
+]
+
+
+def _score(func, results, metadata):
+    try:
+        result = func(results, metadata)
+    except Exception:
+        return 'error'
+    if result is None:
+        return None
+    return (result.tag, result.writeup)
+
+
+def _bound_values(lab_range):
+    # Values at and around every number in the lab range
+    values = []
+    ranges = lab_range.values() if isinstance(lab_range, dict) else [lab_range]
+    for r in ranges:
+        if not isinstance(r, str):
+            continue
+        for part in r.replace('-', ' ').replace('<', ' ').replace('>', ' ').replace('=', ' ').split():
+            try:
+                bound = float(part)
+            except ValueError:
+                continue
+            values += [str(bound - 0.01), str(bound), str(bound + 0.01)]
+    return values
+
+
+def test_compiled_profiles_match_generic_mapping():
+    checked = 0
+    for profile, compiled_profile in zip(health_report_profiles, compiled_profiles):
+        assert compiled_profile.profile == profile['profile'].value
+        for metadata, test in zip(profile['tests'], compiled_profile.tests):
+            for value in SAMPLE_VALUES + _bound_values(metadata['lab_range']):
+                for gender in ['M', 'F']:
+                    results = {metadata['hl7_code']: [value, None, None], 'GENDER': [gender, None, None]}
+                    expected = _score(generic_mapping, results, metadata)
+                    actual = _score(lambda r, _m: test.evaluate(r), results, metadata)
+                    assert actual == expected, f"{metadata['test_code']} {metadata['lab_range']!r} {value!r} {gender}"
+                    checked += 1
+    assert checked > 0
+
+
+def test_compile_lab_range_rules():
+    assert isinstance(compile_lab_range('=Neg'), NegativeRule)
+    assert isinstance(compile_lab_range('=Negative'), NegativeRule)
+    assert isinstance(compile_lab_range('136 - 145'), BetweenRule)
+    assert isinstance(compile_lab_range('=Clear'), EqualsRule)
+    assert isinstance(compile_lab_range('>=90'), LowerBoundRule)
+    assert isinstance(compile_lab_range('< 5.2'), UpperBoundRule)
+    assert isinstance(compile_lab_range('1-2-3'), InvalidRule)
+
+
+def test_strict_and_inclusive_bounds():
+    def score(lab_range, value):
+        test = CompiledTest({'test_code': 'Test', 'hl7_code': 'T^Test', 'lab_range': lab_range})
+        return test.evaluate({'T^Test': [value, None, None]})
+
+    assert score('< 5.2', '5.2').writeup == 'high_writeup'
+    assert score('<= 5.2', '5.2').tag == TestTags.NORMAL
+    assert score('> 1.0', '1.0').writeup == 'low_writeup'
+    assert score('>= 1.0', '1.0').tag == TestTags.NORMAL
+    assert score('< 5.2', '<5.2').tag == TestTags.NORMAL
+
+
+if __name__ == "__main__":
+    test_compiled_profiles_match_generic_mapping()
+    test_compile_lab_range_rules()
+    test_strict_and_inclusive_bounds()
+    print("All tests passed")
@@ -0,0 +1,149 @@
+"""
+Parity tests for the fast HL7 parser:
+  - hl7_to_json gives the same JSON as hl7_to_json_hl7apy for lab messages, edge cases and random segments
+  - get_message_control_id reads MSH_10 like hl7apy
+  - get_report_file_key matches HL7 report file ids to incoming report file names
+
+Run with:
+    python -m pytest tests/test_hl7_parser.py -v
+
+Benchmark over the stored HL7 logs:
+    python -m scheduler_actions.health_report.hl7
+"""
+import sys
+import os
+import random
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hl7apy.parser import parse_segment  # noqa: E402
+from scheduler_actions.health_report.convert import hl7_to_json, hl7_to_json_hl7apy  # noqa: E402
+from scheduler_actions.health_report.hl7 import get_message_control_id, get_report_file_key  # noqa: E402
+
+LAB_MESSAGE = "\n".join([
+    "MSH|^~\\&|PATHLAB|PATHLAB|SGIMED|PINNACLE|20240301083000||ORU^R01|1234567|P|2.3",
+    "PID|1||S1234567A||TAN^AH KOW||19800101|M|||1 MAIN ST^^SINGAPORE",
+    "ORC|RE|ORD123|1234567",
+    "OBR|1|ORD123|1234567|0^PLHS1^Health Screen^|||20240301080000",
+    "OBX|1|NM|14647-2 ^Total Cholesterol^^LN|1|5.5|mmol/L|< 5.2|H|||F",
+    "OBX|2|NM|14646-4 ^HDL-Cholesterol^^LN|1|1.2|mmol/L|> 1.0||||F",
+    "OBX|3|NM|CA^Calcium^|1|2.30|mmol/L|2.08-2.65||||F",
+    "OBX|4|ST|RGLU^Random Blood Glucose^|1|<0.5|mmol/L|||||F",
+    "OBX|5|ST|HBSAG^HBsAg|1|Non-reactive||=Non-reactive||||F",
+    "OBX|6|ST|EPITH^EPITH|1|0-5|/HPF|||||F\r",
+    "NTE|1||Fasting sample",
+    "OBR|2|ORD124|1234568|PARC1^PARC1 Profile^|||20240301080000",
+    "OBX|7|NM|98979-8 ^eGFR^^LN|1|  95 |mL/min/1.73m2|>=90||||F",
+    "",
+])
+
+EDGE_SEGMENTS = [
+    "PID|1||S1234567A||TAN||19800101||||",
+    "PID|1|||||||F^Female",
+    "PID|1|||||||M~F",
+    "OBR|1|||",
+    "OBR|1|||A~B",
+    "OBR|1|||X^ ^Y^ ^",
+    "OBX|1|ST|X^Y^|1|a\\T\\b",
+    "OBX|1|ST|X^Y^|1|a\\b",
+    "OBX|1|ST|X^Y^|1||u",
+    "OBX|1|ST|X^Y^|1| |u",
+    "OBX|1|ST|X^Y^|1|\"\"|u",
+    "OBX|1|ST|X^Y^|1|5~6|u",
+    "OBX|1|ST|X^Y^|1|5^6^7|u",
+    "OBX|1|ST|X^Y^|1|5|u&v&|a&&b",
+    "OBX|1|ST|X^Y^|1|5|a^b^c^d^e^f^g^h",
+    "OBX|1|ST|X^Y^|1|5|^|~^",
+    "OBX|1|ST| ^X|1|5",
+    "OBX|1|ST|^^|1|5",
+    "OBX|1|ST||1|5",
+    "OBX|1|ST|X^Y",
+    "OBX|1|ST|X^Y^|1|5|u\r\r",
+    "OBX|1|ST|X^Y^|1|5|u\rOBX|2",
+    "OBX|1|ST|X^Y^|1|5|u|\t",
+    "OBX|1|ST|X^Y^|1|5|\xa0|1-2",
+    "OBX|1|ST|X^Y|1|5|u|1-2|" + "|" * 30 + "z",
+    "obx|1|ST|X^Y|1|5",
+    "OBXX|1|ST|X^Y|1|5",
+    "OBX |1|ST|X^Y|1|5",
+    "OBX",
+    "ZZ1|x",
+    "NTE|1||comment",
+    "ABC|1",
+    " OBX|1|ST|X^Y|1|5",
+    "  ",
+]
+
+ALPHABET = ['a', 'B', '1', '.', ' ', '-', '<', '>', '=', '|', '^', '~', '&', '\\', '\t', '\r', '"', '\xa0']
+
+
+def _parse(parser, text):
+    try:
+        return parser(text)
+    except Exception as e:
+        return type(e)
+
+
+def _assert_parity(text):
+    assert _parse(hl7_to_json, text) == _parse(hl7_to_json_hl7apy, text), repr(text)
+
+
+def test_lab_message_parity():
+    assert hl7_to_json(LAB_MESSAGE) == hl7_to_json_hl7apy(LAB_MESSAGE)
+    hl7_json = hl7_to_json(LAB_MESSAGE)
+    assert hl7_json['GENDER'] == ['M', None, None]
+    assert hl7_json['PROFILE'] == ['0^PLHS1^Health Screen', 'PARC1^PARC1 Profile']
+    assert hl7_json['14647-2 ^Total Cholesterol^^'] == ['5.5', 'mmol/L', '< 5.2']
+    assert hl7_json['2000-8  ^Calcium^'] == ['2.30', 'mmol/L', '2.08-2.65']
+
+
+def test_edge_segment_parity():
+    for segment in EDGE_SEGMENTS:
+        _assert_parity(segment)
+        _assert_parity(LAB_MESSAGE + segment)
+
+
+def test_random_segment_parity():
+    rng = random.Random(7)
+    for _ in range(3000):
+        name = rng.choice(['PID', 'OBR', 'OBX', 'OBX', 'OBX', 'NTE'])
+        fields = [''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 6))) for _ in range(rng.randint(0, 10))]
+        _assert_parity('|'.join([name] + fields))
+
+
+def test_message_control_id():
+    def reference(text):
+        seg = parse_segment(text.split('\n')[0])
+        if 'MSH_10' in seg.children.indexes:
+            return seg.children.indexes['MSH_10'][0].value
+        return None
+
+    messages = [
+        LAB_MESSAGE,
+        "MSH|^~\\&|A|B|C|D|2024||ORU^R01|AB^CD|P",
+        "MSH|^~\\&|A|B|C|D|2024||ORU^R01||P",
+        "MSH|^~\\&|A|B",
+        "PID|1||S1234567A",
+    ]
+    for message in messages:
+        assert get_message_control_id(message) == reference(message), repr(message)
+    assert get_message_control_id(LAB_MESSAGE) == '1234567'
+
+
+def test_report_file_key():
+    # Incoming report file ids are taken from Pathlab-<name>-<digits>.pdf, leading zeros are kept
+    assert get_report_file_key('1234567') == '1234567'
+    assert get_report_file_key('01234567') == '01234567'
+    assert get_report_file_key('0012345') != get_report_file_key('12345')
+    assert get_report_file_key('PL1234567-01') == '1234567'
+    assert get_report_file_key(get_message_control_id(LAB_MESSAGE)) == '1234567'
+    assert get_report_file_key('') is None
+    assert get_report_file_key(None) is None
+
+
+if __name__ == "__main__":
+    test_lab_message_parity()
+    test_edge_segment_parity()
+    test_random_segment_parity()
+    test_message_control_id()
+    test_report_file_key()
+    print("All tests passed")
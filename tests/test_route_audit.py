@@ -0,0 +1,24 @@
+from main import app
+from utils.route_audit import find_blocking_calls, find_blocking_calls_in
+
+def test_no_blocking_calls_in_async_routes():
+    '''
+    Given: All routes registered on the app
+    When: Coroutine endpoints and dependencies are scanned
+    Then: None of them make sync DB, SGiMed or Supabase calls on the event loop
+    '''
+    assert find_blocking_calls(app) == []
+
+async def _blocking_handler(db):
+    from models import SessionLocal
+    with SessionLocal() as session:
+        session.commit()
+    db.query().filter().first()
+
+    def run():
+        db.commit()
+    return run
+
+def test_blocking_calls_are_flagged():
+    calls = [call for _, call in find_blocking_calls_in(_blocking_handler)]
+    assert calls == ['SessionLocal', 'db.query']
@@ -1,11 +1,8 @@
 from typing import Callable, Generic, Iterable, TypeVar
 from enum import Enum
-import csv
-import io
 from pydantic import BaseModel
 from fastapi.responses import StreamingResponse
-from sqlalchemy import ScalarResult
-from sqlalchemy.orm import Session
+from utils.export import csv_response, stream_csv, stream_query_chunks
 
 T = TypeVar("T")
 
@@ -61,19 +58,17 @@ class AdminQuery:
     #         pager=self.model.pager
     #     )
 
-    def get_csv_response(self, db: Session, formattings: dict = {}, fname: str = 'export.csv') -> StreamingResponse:
+    def get_csv_response(self, formattings: dict = {}, fname: str = 'export.csv') -> StreamingResponse:
         stmt = self.query_fn(self.model, self.params)
-        data_rows: ScalarResult = db.execute(stmt).scalars()
-        transformed_data = self.transform_fn(data_rows)
-        csv_data = self._generate_csv(transformed_data, formattings)
-
-        return StreamingResponse(
-            csv_data,
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename={fname}"}
+        # Rows are transformed chunk by chunk as they are read from the server side cursor
+        transformed_data = (
+            item
+            for chunk in stream_query_chunks(stmt, scalars=True)
+            for item in self.transform_fn(chunk)
         )
+        return csv_response(self._generate_csv(transformed_data, formattings), fname)
 
-    def _generate_csv(self, data: list[T], formattings: dict) -> Iterable[str]:
+    def _generate_csv(self, data: Iterable[T], formattings: dict) -> Iterable[str]:
         def format_data(id, item):
             data = getattr(item, id)
             if type(data) in formattings:
@@ -82,20 +77,6 @@ class AdminQuery:
                 return formattings[id](data)
             return str(data) if data is not None else ""
 
-        # Use StringIO buffer with csv.writer for proper escaping
-        buffer = io.StringIO()
-        writer = csv.writer(buffer, quoting=csv.QUOTE_MINIMAL)
-
-        # Write header
-        writer.writerow([col.name for col in self.model.columns])
-        buffer.seek(0)
-        yield buffer.read()
-
-        # Write data rows
-        for item in data:
-            buffer = io.StringIO()
-            writer = csv.writer(buffer, quoting=csv.QUOTE_MINIMAL)
-            row = [format_data(col.id, item) for col in self.model.columns]
-            writer.writerow(row)
-            buffer.seek(0)
-            yield buffer.read()
+        header = [col.name for col in self.model.columns]
+        rows = ([format_data(col.id, item) for col in self.model.columns] for item in data)
+        return stream_csv(header, rows)
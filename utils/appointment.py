@@ -1,32 +1,43 @@
 from models import OperatingHour, PublicHoliday, Blockoff, AppointmentBranchOperatingHours, AppointmentCount, Branch
 from models.appointment import Appointment
 from models.model_enums import AppointmentStatus, DayOfWeek
-from sqlalchemy import func, String
-from sqlalchemy.orm import Session, joinedload
-from datetime import date, datetime, timedelta
-from cachetools import cached, TTLCache, LRUCache
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from datetime import date, datetime, time, timedelta
+from dateutil.relativedelta import relativedelta
+from typing import Optional
+from cachetools import TTLCache
+import base64
 import math
+import numpy as np
+from utils.redis_cache import bump_version, get_json, get_versions, set_json
 from utils.sg_datetime import sgtz
 
 # This is to mock the date while some are time based on DayOfWeek for date operations to work
 DISCRETE_TIME_INTERVAL = 15
 MOCK_DATE = date(2025,1, 1)
+SLOT_SECONDS = DISCRETE_TIME_INTERVAL * 60
+SLOTS_PER_DAY = 24 * 60 // DISCRETE_TIME_INTERVAL
+UNLIMITED = -1 # max_per_session value for slots without a session limit
 
-# Global cache for operating hours - used to invalidate cache when appointments change
-_operating_hours_cache = None
+# Availability cache keyed by (branch id, month, config version), shared across workers via Redis
+AVAILABILITY_CACHE_TTL = 86400 # 1 day, stale versions simply expire
+AVAILABILITY_VERSION_KEY = 'appointment_availability:version'
+_availability_cache: TTLCache = TTLCache(maxsize=256, ttl=AVAILABILITY_CACHE_TTL)
 
-def _init_cache():
-    """Initialize the cache object for get_appointment_operating_hours."""
-    global _operating_hours_cache
-    if _operating_hours_cache is None:
-        _operating_hours_cache = TTLCache(maxsize=1024, ttl=600)
-    return _operating_hours_cache
+def _branch_availability_version_key(branch_id: str):
+    return f'{AVAILABILITY_VERSION_KEY}:{branch_id}'
 
-def clear_operating_hours_cache():
-    """Clear the operating hours cache to force refresh on next call."""
-    global _operating_hours_cache
-    if _operating_hours_cache is not None:
-        _operating_hours_cache.clear()
+def invalidate_appointment_availability(branch_ids: Optional[list[str]] = None):
+    '''
+    Invalidate cached availability after blockoff, operating hours or public holiday writes
+    Every branch is invalidated when no branch ids are given
+    '''
+    if branch_ids is None:
+        bump_version(AVAILABILITY_VERSION_KEY)
+        return
+    for branch_id in set(str(branch_id) for branch_id in branch_ids):
+        bump_version(_branch_availability_version_key(branch_id))
 
 def compute_time_changes(time_changes: dict[str, dict[datetime, int]], branch_id: str, calendar_id: str, start_time: datetime, end_time: datetime, cancelled: bool):
     '''
@@ -79,66 +90,142 @@ def update_time_changes(db: Session, time_changes: dict[str, dict[datetime, int]
         db.commit()
 
 
-@cached(cache=_init_cache())
-def get_appointment_operating_hours(db: Session, branch: Branch, start_date: datetime, end_date: datetime):
+class SlotGrid:
+    '''
+    Per-branch grid of DISCRETE_TIME_INTERVAL slots covering whole days from start (midnight)
+    Slot i starts at start + i * DISCRETE_TIME_INTERVAL minutes
+
+    is_open: Slot is within branch and appointment operating hours and not blocked off
+    max_bookings: SGiMed appointment count limit for each slot
+    max_per_session: Appointment limit for each slot, UNLIMITED when not set
+    '''
+    def __init__(self, start: datetime, is_open: np.ndarray, max_bookings: np.ndarray, max_per_session: np.ndarray):
+        self.start = start
+        self.is_open = is_open
+        self.max_bookings = max_bookings
+        self.max_per_session = max_per_session
+
+    def __len__(self):
+        return len(self.is_open)
+
+    @property
+    def start_ts(self) -> int:
+        return int(self.start.timestamp())
+
+    @property
+    def end(self) -> datetime:
+        return datetime.fromtimestamp(self.start_ts + len(self) * SLOT_SECONDS, sgtz)
+
+    def slot_times(self, indexes: np.ndarray) -> list[datetime]:
+        return [datetime.fromtimestamp(self.start_ts + int(index) * SLOT_SECONDS, sgtz) for index in indexes]
+
+    def slot_indexes(self, times: list[datetime]) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        Map datetimes onto slot indexes, returns (indexes, valid) where valid excludes
+        times outside the grid or not aligned to DISCRETE_TIME_INTERVAL
+        '''
+        offsets = np.array([int(dt.timestamp()) for dt in times], dtype=np.int64) - self.start_ts
+        indexes = offsets // SLOT_SECONDS
+        valid = (offsets % SLOT_SECONDS == 0) & (indexes >= 0) & (indexes < len(self))
+        return np.where(valid, indexes, 0), valid
+
+    def window(self, start_date: datetime, end_date: datetime) -> 'SlotGrid':
+        '''
+        Slice to the days between start_date and end_date, closing slots outside the exact range
+        '''
+        first_day = (start_date.astimezone(sgtz).date() - self.start.date()).days
+        last_day = (end_date.astimezone(sgtz).date() - self.start.date()).days
+        sliced = slice(max(first_day, 0) * SLOTS_PER_DAY, max(last_day + 1, 0) * SLOTS_PER_DAY)
+        grid = SlotGrid(
+            sgtz.localize(datetime.combine(self.start.date() + timedelta(days=max(first_day, 0)), time.min)),
+            self.is_open[sliced].copy(),
+            self.max_bookings[sliced],
+            self.max_per_session[sliced],
+        )
+        slot_ts = grid.start_ts + np.arange(len(grid), dtype=np.int64) * SLOT_SECONDS
+        grid.is_open &= (slot_ts >= start_date.timestamp()) & (slot_ts <= end_date.timestamp())
+        return grid
+
+    @staticmethod
+    def concat(grids: list['SlotGrid']) -> 'SlotGrid':
+        '''
+        Join grids covering consecutive days
+        '''
+        return SlotGrid(
+            grids[0].start,
+            np.concatenate([grid.is_open for grid in grids]),
+            np.concatenate([grid.max_bookings for grid in grids]),
+            np.concatenate([grid.max_per_session for grid in grids]),
+        )
+
+    def to_json(self) -> dict:
+        encode = lambda array: base64.b64encode(array.tobytes()).decode()
+        return {
+            'start': self.start_ts,
+            'open': encode(np.packbits(self.is_open)),
+            'max_bookings': encode(self.max_bookings.astype(np.int32)),
+            'max_per_session': encode(self.max_per_session.astype(np.int32)),
+        }
+
+    @staticmethod
+    def from_json(value: dict) -> 'SlotGrid':
+        decode = lambda key, dtype: np.frombuffer(base64.b64decode(value[key]), dtype=dtype)
+        max_bookings = decode('max_bookings', np.int32)
+        return SlotGrid(
+            datetime.fromtimestamp(value['start'], sgtz),
+            np.unpackbits(decode('open', np.uint8), count=len(max_bookings)).astype(bool),
+            max_bookings,
+            decode('max_per_session', np.int32),
+        )
+
+def _slot_range(start_time: time, end_time: time, cutoff_time: int = 0) -> slice:
+    '''
+    Slots of a day from start_time (rounded down to DISCRETE_TIME_INTERVAL) up to end_time less cutoff minutes
+    '''
+    start_secs = start_time.hour * 3600 + start_time.minute * 60 + start_time.second
+    end_us = (end_time.hour * 3600 + end_time.minute * 60 + end_time.second - cutoff_time * 60) * 1_000_000 + end_time.microsecond
+    start_slot = start_secs // SLOT_SECONDS
+    end_slot = -(-end_us // (SLOT_SECONDS * 1_000_000))
+    return slice(start_slot, min(max(end_slot, start_slot), SLOTS_PER_DAY))
+
+def get_appointment_slot_grid(db: Session, branch: Branch, start_date: datetime, end_date: datetime) -> SlotGrid:
     '''
-    1. Get Branch Operating Hours
-    2. Get Appointment Operating Hours
-    3. Combine operating hours and appointment operating hours
-    4. Get Public Holidays & Blockoffs
-    5. Convert to discrete times
-    6. Remove blockoffs from operating hours
+    1. Build DayOfWeek templates from Branch Operating Hours and Appointment Operating Hours
+    2. Get Public Holidays & Blockoffs
+    3. Lay out the day templates for each date in range
+    4. Remove blockoffs from operating hours
     '''
-    # Get Branch Operating Hours
-    # 1. Managing by DayOfWeek and Time
+    days = list(DayOfWeek)
+    branch_open = np.zeros((len(days), SLOTS_PER_DAY), dtype=bool)
+    appt_open = np.zeros((len(days), SLOTS_PER_DAY), dtype=bool)
+    day_max_bookings = np.zeros((len(days), SLOTS_PER_DAY), dtype=np.int32)
+    day_max_per_session = np.full((len(days), SLOTS_PER_DAY), UNLIMITED, dtype=np.int32)
+
     operating_hours = db.query(OperatingHour).filter(
         OperatingHour.branch_id == branch.id
     ).all()
-    branch_operating_hours_discrete: dict[DayOfWeek, list[datetime]] = {}
     for row in operating_hours:
-        start_time = sgtz.localize(datetime.combine(MOCK_DATE, row.start_time))
-        end_time = sgtz.localize(datetime.combine(MOCK_DATE, row.end_time)) - timedelta(minutes=row.cutoff_time)
-        discrete_times = convert_start_end_time_to_discrete(start_time, end_time, DISCRETE_TIME_INTERVAL)
-        if row.day not in branch_operating_hours_discrete:
-            branch_operating_hours_discrete[row.day] = []
-        branch_operating_hours_discrete[row.day].extend(discrete_times)
-    # Get Appointment Operating Hours
-    appt_operating_hours_discrete: dict[DayOfWeek, list[datetime]] = {}
-    appt_operating_hours_discrete_max_bookings: dict[DayOfWeek, list[tuple[datetime, int]]] = {}
-    appt_operating_hours_discrete_max_per_session: dict[DayOfWeek, list[tuple[datetime, int | None]]] = {}
+        branch_open[days.index(row.day), _slot_range(row.start_time, row.end_time, row.cutoff_time)] = True
+
+    # Later rows take precedence for overlapping hours
     appointment_operating_hours = db.query(AppointmentBranchOperatingHours).filter(
         AppointmentBranchOperatingHours.branch_id == branch.id
     ).all()
     for row in appointment_operating_hours:
-        start_time = sgtz.localize(datetime.combine(MOCK_DATE, row.start_time))
-        end_time = sgtz.localize(datetime.combine(MOCK_DATE, row.end_time)) - timedelta(minutes=row.cutoff_time)
-        discrete_times = convert_start_end_time_to_discrete(start_time, end_time, DISCRETE_TIME_INTERVAL)
-        if row.day not in appt_operating_hours_discrete:
-            appt_operating_hours_discrete[row.day] = []
-            appt_operating_hours_discrete_max_bookings[row.day] = []
-            appt_operating_hours_discrete_max_per_session[row.day] = []
-        appt_operating_hours_discrete[row.day].extend(discrete_times)
-        appt_operating_hours_discrete_max_bookings[row.day].extend((discrete_time, row.max_bookings) for discrete_time in discrete_times)
-        appt_operating_hours_discrete_max_per_session[row.day].extend((discrete_time, row.max_appointments_per_session) for discrete_time in discrete_times)
-        # This updates the max bookings for each discrete time
-    # Combine operating hours and appointment operating hours
-    for day in appt_operating_hours_discrete:
-        if day not in branch_operating_hours_discrete:
-            appt_operating_hours_discrete[day] = []
-            continue
-        appt_operating_hours_discrete[day] = list(set(appt_operating_hours_discrete[day]) & set(branch_operating_hours_discrete[day]))
-
-    # 2. Convert to dates
+        day, slots = days.index(row.day), _slot_range(row.start_time, row.end_time, row.cutoff_time)
+        appt_open[day, slots] = True
+        day_max_bookings[day, slots] = row.max_bookings
+        if row.max_appointments_per_session is not None:
+            day_max_per_session[day, slots] = row.max_appointments_per_session
+    day_open = branch_open & appt_open
+
     public_holidays = db.query(PublicHoliday.date).filter(
         PublicHoliday.date >= start_date,
         PublicHoliday.date <= end_date,
     ).all()
-    public_holidays = [row[0] for row in public_holidays]
+    public_holidays = set(row[0] for row in public_holidays)
 
-    blockoffs = db.query(Blockoff) \
-        .options(
-            joinedload(Blockoff.branches).load_only(Branch.id),
-        ) \
+    blockoffs = db.query(Blockoff.date, Blockoff.start_time, Blockoff.end_time) \
         .filter(
             Blockoff.branches.any(Branch.id == branch.id),
             Blockoff.date >= start_date,
@@ -146,133 +233,110 @@ def get_appointment_operating_hours(db: Session, branch: Branch, start_date: dat
             Blockoff.enabled == True,
             Blockoff.deleted == False
         ).all()
-    blockoffs_dict: dict[date, list[datetime]] = {}
-    for row in blockoffs:
-        if row.date not in blockoffs_dict:
-            blockoffs_dict[row.date] = []
-        blockoffs_dict[row.date] += convert_start_end_time_to_discrete(
-            sgtz.localize(datetime.combine(row.date, row.start_time)),
-            sgtz.localize(datetime.combine(row.date, row.end_time)),
-            DISCRETE_TIME_INTERVAL
-        )
 
-    operating_hours_discrete: set[datetime] = set()
-    operating_hours_max_bookings: dict[datetime, int] = {}
-    operating_hours_max_appts_per_session: dict[datetime, int] = {}
-    current_date = start_date
-    while current_date <= end_date:
-        curr_day = DayOfWeek[current_date.strftime("%A").upper()]
-        if current_date.date() in public_holidays:
-            curr_day = DayOfWeek.PUBLIC_HOLIDAY
-
-        hours = appt_operating_hours_discrete.get(curr_day, None)
-        if hours is None:
-            current_date += timedelta(days=1)
-            continue
-
-        # Remove any blockoffs
-        blockoffs = blockoffs_dict.get(current_date.date(), None)
-        hours = set([
-            sgtz.localize(datetime.combine(current_date, hour.time()))
-            for hour in hours
-        ])
-        if blockoffs:
-            hours -= set(blockoffs)
-
-        # Update the operating hours and max bookings
-        operating_hours_discrete.update(hours)
-        operating_hours_max_bookings.update({
-            sgtz.localize(datetime.combine(current_date, day_time.time())): max_bookings
-            for day_time, max_bookings in appt_operating_hours_discrete_max_bookings[curr_day]
-            if sgtz.localize(datetime.combine(current_date, day_time.time())) in hours
-        })
-        # Update max_appointments_per_session (only store slots that have a limit set)
-        operating_hours_max_appts_per_session.update({
-            sgtz.localize(datetime.combine(current_date, day_time.time())): max_per_session
-            for day_time, max_per_session in appt_operating_hours_discrete_max_per_session[curr_day]
-            if max_per_session is not None
-            and sgtz.localize(datetime.combine(current_date, day_time.time())) in hours
-        })
-
-        current_date += timedelta(days=1)
-
-    return operating_hours_discrete, operating_hours_max_bookings, operating_hours_max_appts_per_session
-
-@cached(cache=LRUCache(maxsize=32))
-def convert_start_end_time_to_discrete(start_dt: datetime, end_dt: datetime, interval: int) -> list[datetime]:
-    # Ensure start_dt is multiple of interval
-    start_dt_interval = start_dt - timedelta(minutes=start_dt.minute % interval, seconds=start_dt.second, microseconds=start_dt.microsecond)
-    discrete_times = []
-    while start_dt_interval < end_dt:
-        discrete_times.append(start_dt_interval)
-        start_dt_interval += timedelta(minutes=interval)
-    return discrete_times
-
-def get_appointment_booked_slots(db: Session, branch: Branch, start_date: datetime, end_date: datetime, available_slots: set[datetime], appt_operating_hours_discrete_max_bookings: dict[datetime, int], max_appts_per_session: dict[datetime, int] = {}):
-    booked_slots = db.query(AppointmentCount).filter(
+    first_date = start_date.date()
+    dates = [first_date + timedelta(days=i) for i in range((end_date.date() - first_date).days + 1)]
+    day_types = np.array([
+        days.index(DayOfWeek.PUBLIC_HOLIDAY) if curr_date in public_holidays else curr_date.weekday()
+        for curr_date in dates
+    ], dtype=np.intp)
+
+    is_open = day_open[day_types]
+    for blockoff_date, blockoff_start, blockoff_end in blockoffs:
+        day = (blockoff_date - first_date).days
+        if 0 <= day < len(dates):
+            is_open[day, _slot_range(blockoff_start, blockoff_end)] = False
+
+    is_open = is_open.ravel()
+    return SlotGrid(
+        sgtz.localize(datetime.combine(first_date, time.min)),
+        is_open,
+        np.where(is_open, day_max_bookings[day_types].ravel(), 0).astype(np.int32),
+        np.where(is_open, day_max_per_session[day_types].ravel(), UNLIMITED).astype(np.int32),
+    )
+
+def _get_month_slot_grid(db: Session, branch: Branch, month_start: datetime) -> SlotGrid:
+    '''
+    Retrieve the slot grid of a whole month from the availability cache
+    '''
+    global_version, branch_version = get_versions(AVAILABILITY_VERSION_KEY, _branch_availability_version_key(str(branch.id)))
+    key = f'appointment_availability:{branch.id}:{month_start.strftime("%Y-%m")}:{global_version}.{branch_version}'
+    grid = _availability_cache.get(key)
+    if grid is None:
+        value = get_json(key)
+        if value is not None:
+            grid = SlotGrid.from_json(value)
+    if grid is None:
+        month_end = month_start + relativedelta(months=1, seconds=-1)
+        grid = get_appointment_slot_grid(db, branch, month_start, month_end)
+        set_json(key, grid.to_json(), ttl=AVAILABILITY_CACHE_TTL)
+    _availability_cache[key] = grid
+    return grid
+
+def get_cached_appointment_slot_grid(db: Session, branch: Branch, start_date: datetime, end_date: datetime) -> SlotGrid:
+    '''
+    Cached version of get_appointment_slot_grid, with slots outside start_date and end_date closed
+    Whole months are cached so that the key does not depend on the booking window of each request
+    '''
+    grids = []
+    month_start = sgtz.localize(datetime.combine(start_date.astimezone(sgtz).date().replace(day=1), time.min))
+    while month_start <= end_date:
+        grids.append(_get_month_slot_grid(db, branch, month_start))
+        month_start = sgtz.localize(datetime.combine(month_start.date() + relativedelta(months=1), time.min))
+    return SlotGrid.concat(grids).window(start_date, end_date)
+
+def get_appointment_booked_slots(db: Session, branch: Branch, grid: SlotGrid) -> np.ndarray:
+    '''
+    Returns a mask of open slots which are fully booked, either by the SGiMed appointment counts
+    or by max_appointments_per_session
+    '''
+    full = np.zeros(len(grid), dtype=bool)
+    if not grid.is_open.any():
+        return full
+
+    booked_slots = db.query(AppointmentCount.time, AppointmentCount.count).filter(
         AppointmentCount.sgimed_branch_id == branch.sgimed_branch_id,
         AppointmentCount.sgimed_calendar_id == branch.sgimed_calendar_id,
-        AppointmentCount.time >= start_date,
-        AppointmentCount.time <= end_date,
-        AppointmentCount.count >= min(appt_operating_hours_discrete_max_bookings.values()),
+        AppointmentCount.time >= grid.start,
+        AppointmentCount.time < grid.end,
+        AppointmentCount.count >= int(grid.max_bookings[grid.is_open].min()),
     ).all()
-
-    # This is to check if the max bookings are different for different times
-    require_max_bookings_check = len(set(appt_operating_hours_discrete_max_bookings.values())) > 1
-    def filter_booked_slots(booked_slot: AppointmentCount):
-        if booked_slot.time not in available_slots:
-            return False
-
-        # This is to check if the booked slot is available within the available timeslots
-        if require_max_bookings_check:
-            if booked_slot.count < appt_operating_hours_discrete_max_bookings[booked_slot.time]:
-                return False
-
-        # This means the booked slot is not available within the available timeslots
-        return True
-
-    sgimed_full_slots = set([row.time for row in filter(filter_booked_slots, booked_slots)])
+    if booked_slots:
+        indexes, valid = grid.slot_indexes([row[0] for row in booked_slots])
+        counts = np.array([row[1] for row in booked_slots], dtype=np.int64)
+        full[indexes[valid & (counts >= grid.max_bookings[indexes])]] = True
 
     # Enforce max_appointments_per_session: count actual confirmed/completed appointments per slot
-    session_full_slots: set[datetime] = set()
-    if max_appts_per_session:
-        branch_id_str = str(branch.id)
-        # Get all active appointment counts per start_datetime for this branch in range
+    limited = grid.is_open & (grid.max_per_session != UNLIMITED)
+    if limited.any():
         appt_counts = db.query(
             Appointment.start_datetime,
             func.count(Appointment.id).label('count')
         ).filter(
-            Appointment.start_datetime >= start_date,
-            Appointment.start_datetime <= end_date,
+            Appointment.start_datetime >= grid.start,
+            Appointment.start_datetime < grid.end,
             Appointment.status.not_in([AppointmentStatus.CANCELLED, AppointmentStatus.PREPAYMENT, AppointmentStatus.PAYMENT_STARTED]),
-            func.cast(Appointment.branch['id'].astext, String) == branch_id_str,
+            Appointment.branch['id'].as_string() == str(branch.id),
         ).group_by(Appointment.start_datetime).all()
+        if appt_counts:
+            indexes, valid = grid.slot_indexes([row[0] for row in appt_counts])
+            counts = np.array([row[1] for row in appt_counts], dtype=np.int64)
+            full[indexes[valid & limited[indexes] & (counts >= grid.max_per_session[indexes])]] = True
 
-        for slot_dt, count in appt_counts:
-            if slot_dt in available_slots and slot_dt in max_appts_per_session:
-                if count >= max_appts_per_session[slot_dt]:
-                    session_full_slots.add(slot_dt)
-
-    return sgimed_full_slots | session_full_slots
-
-def get_available_slots(timings: set[datetime], duration_mins: int): # , spacing: Optional[int] = None):
-    interval = timedelta(minutes=DISCRETE_TIME_INTERVAL)
-    slots_needed = math.ceil(duration_mins / DISCRETE_TIME_INTERVAL)
-    # spacing_delta = timedelta(minutes=spacing) if spacing else None
-
-    valid_start_times = []
-    # prev_time = None
-    for start_time in sorted(timings):
-        # Check if all required slots exist using set operations
-        all_slots_exist = all(
-            start_time + interval * i in timings
-            for i in range(1, slots_needed)
-        )
-        if all_slots_exist:
-            # if spacing_delta:
-            #     if prev_time and start_time - prev_time < spacing_delta:
-            #         continue
-            valid_start_times.append(start_time)
-            # prev_time = start_time
-
-    return valid_start_times
+    return full & grid.is_open
+
+def get_available_slots(grid: SlotGrid, booked: np.ndarray, duration_mins: int) -> list[datetime]:
+    '''
+    Start times where every slot required for duration_mins is open and not booked
+    '''
+    free = grid.is_open & ~booked
+    slots_needed = max(math.ceil(duration_mins / DISCRETE_TIME_INTERVAL), 1)
+    if slots_needed > len(free):
+        return []
+    if slots_needed > 1:
+        # Window sums over the running count of free slots detect contiguous runs
+        runs = np.concatenate(([0], np.cumsum(free, dtype=np.int32)))
+        contiguous = np.zeros_like(free)
+        contiguous[:len(free) - slots_needed + 1] = (runs[slots_needed:] - runs[:-slots_needed]) == slots_needed
+        free = contiguous
+    return grid.slot_times(np.flatnonzero(free))
@@ -10,6 +10,7 @@ from models import AccountFirebase, FirebaseLoginType, Account
 from models.model_enums import PhoneCountryCode, SGiMedICType
 from sqlalchemy.orm import Session
 from firebase_admin import auth
+from utils.firebase_auth import revoke_sessions
 
 OTP_RESEND_WAIT_TIME = 600  # 10 minutes
 OTP_EXPIRE_TIME = 600 # 10 minutes
@@ -77,7 +78,7 @@ def generate_login_token(db: Session, session_id: str, account: Account) -> Opti
         return None
     
     token = auth.create_custom_token(firebase_uid).decode()
-    auth.revoke_refresh_tokens(firebase_uid) # Revoke any existing sessions
+    revoke_sessions(firebase_uid) # Revoke any existing sessions
     delete_login_state(session_id) # Delete login state from redis
     return token
 
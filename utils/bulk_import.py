@@ -0,0 +1,71 @@
+"""
+Bulk import helpers for admin uploads
+
+Uploads are read as a stream and validated row by row, valid rows are COPY'd into a temporary
+table in batches and the target table is updated from it with set-based SQL, all in the caller's
+transaction. Memory stays flat and the import is a handful of statements regardless of its size.
+"""
+import csv
+import io
+from typing import IO, Any, Callable, Iterable, Iterator, Optional
+from sqlalchemy.orm import Session
+
+IMPORT_BATCH_ROWS = 5000
+
+def read_csv_upload(file: IO[bytes]) -> csv.DictReader:
+    '''
+    DictReader over an uploaded file, decoded as it is read
+    '''
+    return csv.DictReader(io.TextIOWrapper(file, encoding='utf-8', newline=''))
+
+def validate_rows(rows: Iterable[dict], validate: Callable[[dict], list[Any]], failed_records: list[dict]) -> Iterator[list[Any]]:
+    '''
+    Values of the rows that pass validate, the others are added to failed_records with their error
+    '''
+    for row in rows:
+        try:
+            yield validate(row)
+        except Exception as e:
+            failed_records.append({
+                "row": row,
+                "error": str(e)
+            })
+
+def _copy_value(value: Optional[Any]) -> str:
+    # COPY text format, None is NULL and '' stays an empty string
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+def _copy_buffer(rows: list[list[Any]]) -> io.StringIO:
+    return io.StringIO(''.join('\t'.join(_copy_value(value) for value in row) + '\n' for row in rows))
+
+def get_cursor(db: Session):
+    '''
+    DBAPI cursor on the session's connection, statements run in the session's transaction
+    '''
+    return db.connection().connection.cursor()
+
+def create_temp_table(cursor, table_name: str, columns: str):
+    '''
+    Temporary table dropped when the transaction ends, columns is either a column list or LIKE <table>
+    '''
+    cursor.execute(f'CREATE TEMP TABLE {table_name} ({columns}) ON COMMIT DROP')
+
+def copy_rows(cursor, table_name: str, columns: list[str], rows: Iterable[list[Any]], batch_rows: int = IMPORT_BATCH_ROWS) -> int:
+    '''
+    COPY rows into a table, batch_rows at a time. Returns the number of rows copied
+    '''
+    copy_cmd = f"COPY {table_name} ({','.join(columns)}) FROM STDIN"
+    copied = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_rows:
+            cursor.copy_expert(copy_cmd, _copy_buffer(batch))
+            copied += len(batch)
+            batch = []
+    if batch:
+        cursor.copy_expert(copy_cmd, _copy_buffer(batch))
+        copied += len(batch)
+    return copied
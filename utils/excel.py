@@ -1,9 +1,22 @@
+from itertools import chain, islice
+from typing import Iterable
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Border, Side, Alignment
+from openpyxl.utils import get_column_letter
 import io
+import tempfile
 
+# Rows sampled to size the columns in write-only mode, where widths must be set before any row is written
+WIDTH_SAMPLE_ROWS = 500
+# Workbooks spill from memory to a temporary file past this size
+SPOOL_MAX_SIZE = 5 * 1024 * 1024 # 5MB
+
+
+def create_excel_with_styled_header(headers, data_rows, write_only: bool = False):
+    if write_only:
+        return _create_write_only_excel(headers, data_rows)
 
-def create_excel_with_styled_header(headers, data_rows):
     wb = Workbook()
     ws = wb.active
 
@@ -74,3 +87,65 @@ def create_excel_with_styled_header(headers, data_rows):
     wb.save(buffer)
     buffer.seek(0)
     return buffer
+
+
+def _create_write_only_excel(headers: list, data_rows: Iterable[list]):
+    '''
+    Same layout as create_excel_with_styled_header, with rows streamed into a write-only workbook
+    data_rows can be a generator, memory stays flat regardless of the number of rows
+    Column widths are sized from the first rows, and row heights are left to Excel to fit wrapped text
+    Returns a file object positioned at the start
+    '''
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+
+    bold_font = Font(bold=True, size=11)
+    normal_font = Font(size=11)
+    border_style = Border(
+        left=Side(style="thin"),
+        right=Side(style="thin"),
+        top=Side(style="thin"),
+        bottom=Side(style="thin"),
+    )
+    vertical_border = Border(left=Side(style="thin"), right=Side(style="thin"))
+    bottom_border = Border(
+        left=Side(style="thin"),
+        right=Side(style="thin"),
+        bottom=Side(style="thin"),
+    )
+    center_alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
+
+    # Column widths are sized from a sample of rows
+    data_rows = iter(data_rows)
+    sample_rows = list(islice(data_rows, WIDTH_SAMPLE_ROWS))
+    for col_num, header in enumerate(headers, start=1):
+        max_length = len(str(header))
+        for row_data in sample_rows:
+            if col_num <= len(row_data):
+                max_length = max(max_length, len(str(row_data[col_num - 1])))
+        ws.column_dimensions[get_column_letter(col_num)].width = max_length + 6
+
+    def styled_row(row_data, font, border):
+        cells = []
+        for value in row_data:
+            cell = WriteOnlyCell(ws, value=value)
+            cell.font = font
+            cell.border = border
+            cell.alignment = center_alignment
+            cells.append(cell)
+        return cells
+
+    ws.append(styled_row(headers, bold_font, border_style))
+    # Rows are written one behind so the last row can get the bottom border
+    prev_row = None
+    for row_data in chain(sample_rows, data_rows):
+        if prev_row is not None:
+            ws.append(styled_row(prev_row, normal_font, vertical_border))
+        prev_row = row_data
+    if prev_row is not None:
+        ws.append(styled_row(prev_row, normal_font, bottom_border))
+
+    buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    wb.save(buffer)
+    buffer.seek(0)
+    return buffer
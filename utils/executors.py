@@ -8,6 +8,9 @@ from concurrent.futures import ThreadPoolExecutor
 # Using 2 workers to limit concurrent email operations
 email_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="email_sender")
 
+# Thread pool for bulk push notification jobs (admin portal, health report generation)
+notification_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="notification_sender")
+
 
 def shutdown_executors() -> None:
     """
@@ -15,3 +18,4 @@ def shutdown_executors() -> None:
     Should be called during application shutdown
     """
     email_executor.shutdown(wait=True, cancel_futures=False)
+    notification_executor.shutdown(wait=True, cancel_futures=False)
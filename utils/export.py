@@ -0,0 +1,61 @@
+"""
+Streaming export helpers for admin reports
+
+Rows are read through a server side cursor in batches and written out as CSV chunks,
+so memory stays flat regardless of the date range exported.
+"""
+import csv
+import io
+from typing import IO, Any, Iterable, Iterator
+from fastapi.responses import StreamingResponse
+from models import SessionLocal
+
+EXPORT_CHUNK_ROWS = 1000
+FILE_CHUNK_SIZE = 64 * 1024 # 64KB
+
+def stream_query_chunks(stmt, chunk_rows: int = EXPORT_CHUNK_ROWS, scalars: bool = False) -> Iterator[list[Any]]:
+    '''
+    Yield the rows of a select statement in lists of chunk_rows, read with a server side cursor
+    Uses its own session since the response is streamed after the request session is closed
+    Joined eager loads must be many-to-one, collections cannot be loaded with yield_per
+    '''
+    with SessionLocal() as db:
+        result = db.execute(stmt.execution_options(yield_per=chunk_rows))
+        if scalars:
+            result = result.scalars()
+        for partition in result.partitions():
+            yield list(partition)
+
+def stream_query(stmt, chunk_rows: int = EXPORT_CHUNK_ROWS, scalars: bool = False) -> Iterator[Any]:
+    for chunk in stream_query_chunks(stmt, chunk_rows, scalars):
+        yield from chunk
+
+def stream_csv(header: list[str], rows: Iterable[Iterable[Any]], chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[str]:
+    '''
+    Write rows as CSV, yielding the text every chunk_rows rows
+    '''
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_MINIMAL)
+    writer.writerow(header)
+    for i, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if i % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+def iter_file(file: IO[bytes], chunk_size: int = FILE_CHUNK_SIZE) -> Iterator[bytes]:
+    '''
+    Read a file in chunks and close it once consumed
+    '''
+    with file:
+        while chunk := file.read(chunk_size):
+            yield chunk
+
+def csv_response(content: Iterable[str], filename: str) -> StreamingResponse:
+    return StreamingResponse(
+        content,
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
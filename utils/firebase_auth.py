@@ -0,0 +1,101 @@
+"""
+Cached verification of Firebase ID tokens for the patient app
+
+- Verified tokens are kept in process until the token's exp, keyed by the token hash
+- The firebase uid -> account id lookup is shared across workers through the Redis cache
+- Revoking a uid's sessions rejects every token issued before the revocation, cached or not
+"""
+import hashlib
+import logging
+import time
+from threading import Lock
+from typing import Optional
+from cachetools import TLRUCache
+from firebase_admin import auth
+from sqlalchemy.orm import Session
+from models import AccountFirebase
+from utils import redis_cache
+
+TOKEN_CACHE_SIZE = 10000
+UID_CACHE_TTL = 300 # 5 mins
+ID_TOKEN_MAX_AGE = 3600 # Firebase ID tokens expire after 1 hour
+
+class VerifiedToken:
+    def __init__(self, uid: str, issued_at: int, expires_at: int):
+        self.uid = uid
+        self.issued_at = issued_at
+        self.expires_at = expires_at
+
+_token_lock = Lock()
+_token_cache: TLRUCache = TLRUCache(maxsize=TOKEN_CACHE_SIZE, ttu=lambda _key, token, _now: token.expires_at, timer=time.time)
+
+def _token_key(id_token: str) -> str:
+    return hashlib.sha256(id_token.encode()).hexdigest()
+
+def _account_key(firebase_uid: str) -> str:
+    return f"firebase_uid:{firebase_uid}:account_id"
+
+def _valid_after_key(firebase_uid: str) -> str:
+    return f"firebase_uid:{firebase_uid}:valid_after"
+
+# The account id and the revocation time are kept under their own keys, so caching the account id
+# never overwrites a revocation made in between
+def _get_valid_after(firebase_uid: str) -> Optional[int]:
+    '''
+    Revocation time (ms) of a firebase uid, None if its sessions were not revoked
+    '''
+    return redis_cache.get_json(_valid_after_key(firebase_uid))
+
+def _set_valid_after(firebase_uid: str, valid_after: int):
+    # Keep the revocation time until every token issued before it has expired
+    ttl = max(UID_CACHE_TTL, int(valid_after / 1000 + ID_TOKEN_MAX_AGE - time.time()))
+    redis_cache.set_json(_valid_after_key(firebase_uid), valid_after, ttl=ttl)
+
+def verify_id_token(id_token: str) -> str:
+    '''
+    Returns the firebase uid of a valid ID token, raises on an invalid, expired or revoked token
+    '''
+    key = _token_key(id_token)
+    with _token_lock:
+        token = _token_cache.get(key)
+    if token is None:
+        decoded_token = auth.verify_id_token(id_token)
+        token = VerifiedToken(decoded_token['uid'], decoded_token['iat'], decoded_token['exp'])
+        with _token_lock:
+            _token_cache[key] = token
+
+    # Same check as verify_id_token(check_revoked=True), without a call to Firebase
+    valid_after = _get_valid_after(token.uid)
+    if valid_after and token.issued_at * 1000 < valid_after:
+        with _token_lock:
+            _token_cache.pop(key, None)
+        raise auth.RevokedIdTokenError('The Firebase ID token has been revoked.')
+    return token.uid
+
+def get_account_id(db: Session, firebase_uid: str) -> Optional[str]:
+    '''
+    Account id linked to a firebase uid, cached for UID_CACHE_TTL
+    '''
+    cached = redis_cache.get_json(_account_key(firebase_uid))
+    if cached:
+        return cached
+
+    account_id = db.query(AccountFirebase.account_id).filter(AccountFirebase.firebase_uid == firebase_uid).scalar()
+    if not account_id:
+        # Not cached, the record is created when the patient completes the login
+        return None
+    redis_cache.set_json(_account_key(firebase_uid), str(account_id), ttl=UID_CACHE_TTL)
+    return str(account_id)
+
+def revoke_sessions(firebase_uid: str):
+    '''
+    Revoke the refresh tokens of a firebase uid and reject its ID tokens issued before now
+    '''
+    auth.revoke_refresh_tokens(firebase_uid)
+    try:
+        # Firebase's own revocation time, so a token minted right after the login is not rejected by clock skew
+        valid_after = auth.get_user(firebase_uid).tokens_valid_after_timestamp
+    except Exception as e:
+        logging.error(f"Failed to get revocation time for firebase uid: {firebase_uid}. {e}")
+        valid_after = int(time.time()) * 1000
+    _set_valid_after(firebase_uid, valid_after)
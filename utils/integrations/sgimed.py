@@ -1,8 +1,9 @@
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 from datetime import date, datetime
 import logging
-from typing import Callable, Optional
+from typing import Optional
 from pydantic import BaseModel, field_validator
-import requests
 from models import Account, Payment, Teleconsult
 from models.model_enums import PhoneCountryCode, SGiMedGender, SGiMedICType, SGiMedLanguage, SGiMedNationality, WalkinQueueStatus
 from models.patient import FamilyNok
@@ -10,10 +11,9 @@ from models.payments import PaymentMethod
 from models.pinnacle import Branch
 from utils import sg_datetime
 import json
-from config import SGIMED_API_URL, SGIMED_API_KEY, SGIMED_DEFAULT_BRANCH_ID
-from tenacity import retry, stop_after_attempt, wait_random, retry_if_exception_type
+from config import SGIMED_DEFAULT_BRANCH_ID
+from utils.integrations.sgimed_client import ClientException, sgimed_client
 from sqlalchemy.orm import Session
-import jwt
 
 class Pager(BaseModel):
     p: int
@@ -79,6 +79,28 @@ def fetch_invoice_details(invoice_id: str) -> Optional[InvoiceDetails]:
             invoice_dict=invoice_dict,
         )
 
+# Invoices fetched in parallel, each fetch makes 4 sequential SGiMed calls paced by the shared rate limiter and the job's budget
+INVOICE_DETAIL_WORKERS = 8
+
+def fetch_invoices_details(invoice_ids: list[str], max_workers: int = INVOICE_DETAIL_WORKERS) -> dict[str, Optional[InvoiceDetails]]:
+    '''
+    Fetch invoice details for multiple invoices concurrently
+    Returns None for invoices that could not be fetched, so a single failure does not drop the batch
+    '''
+    def _fetch(invoice_id: str) -> Optional[InvoiceDetails]:
+        try:
+            return fetch_invoice_details(invoice_id)
+        except Exception as e:
+            logging.error(f'SGiMed: Failed to fetch invoice details. Invoice ID: {invoice_id}. Error: {e}')
+            return None
+
+    if not invoice_ids:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(invoice_ids)), thread_name_prefix="sgimed_invoice") as executor:
+        # Run each fetch in a copy of the caller's context so its SGiMed calls count towards the job run
+        futures = [executor.submit(contextvars.copy_context().run, _fetch, invoice_id) for invoice_id in invoice_ids]
+        return { invoice_id: future.result() for invoice_id, future in zip(invoice_ids, futures) }
+
 class EmployeeInfo(BaseModel):
     employee_id: str
     employee_company: str
@@ -271,62 +293,9 @@ def upsert_patient_in_sgimed(db: Session, user: Account, employee: Optional[Empl
 
     db.commit()
 
-def log_rate_limits(response: requests.Response):
-    rate_limit = response.headers.get('x-ratelimit-limit', '')
-    remaining_limit = response.headers.get('x-ratelimit-remaining')
-    if remaining_limit is not None:
-        # sentry_sdk.metrics.distribution(
-        #     key="sgimed_limit",
-        #     value=float(remaining_limit),
-        #     unit="remaining",
-        # )
-        print(f'SGiMed Remaining Rate Limit: {remaining_limit} / {rate_limit}')
-    else:
-        print('Rate limit information not available.')
-
-class ClientException(Exception):
-    pass
-
-token = None
-def get_bearer_token() -> str:
-    global token
-    if token:
-        decoded_token = jwt.decode(token, options={"verify_signature": False}, algorithms=["ES256"])
-        if (datetime.fromtimestamp(decoded_token["exp"]) - datetime.now()).total_seconds() < 1200: # 20 mins
-            token = get_sgimed_access_token()
-    else:
-        token = get_sgimed_access_token()
-
-    return token
-
-def get_sgimed_access_token():
-    response = requests.post(f"{SGIMED_API_URL}/token",
-        headers={ "accept": "application/json", "Content-Type": "application/x-www-form-urlencoded" },
-        data={ "grant_type": "refresh_token", "refresh_token": SGIMED_API_KEY }
-    )
-    return response.json()["access_token"]
-
-@retry(retry=retry_if_exception_type(ClientException), reraise=True, stop=stop_after_attempt(3), wait=wait_random(min=1, max=2))
-def send_request(req: Callable, endpoint: str, **kwargs):
-    headers = {'Authorization': f'Bearer {get_bearer_token()}'}
-    response = req(f'{SGIMED_API_URL}{endpoint}', headers=headers, **kwargs)
-    # # Only for debugging
-    # print(f"SGiMed Request: {req} {SGIMED_API_URL}{endpoint} {kwargs}")
-    if response.status_code != 200:
-        error = f'SGiMed Error: {endpoint}, {response.status_code}, {response.text}'
-        print(error)
-        # For 400, 404 errors, these are not server exceptions, thus no need to retry
-        if response.status_code in [400, 404]:
-            raise Exception(error)
-        else:
-            raise ClientException(error)
-    
-    log_rate_limits(response)
-    return response.json()
-
 def convert_bools_to_strings(params: dict) -> dict:
     '''
-    For requests.get, boolean values are sent raw as True / False. Thus need to convert to strings lowercase
+    For GET params, boolean values are sent raw as True / False. Thus need to convert to strings lowercase
     '''
     def convert_value(value):
         if isinstance(value, bool):
@@ -336,18 +305,32 @@ def convert_bools_to_strings(params: dict) -> dict:
     return {k: convert_value(v) for k, v in params.items()}
 
 def get(endpoint: str, params: dict = {}):
-    return send_request(requests.get, endpoint, params=convert_bools_to_strings(params))
+    return sgimed_client.request('GET', endpoint, params=convert_bools_to_strings(params))
 
 def post(endpoint: str, params: dict):
     json_data = json.dumps(params, default=str)
-    return send_request(requests.post, endpoint, data=json_data)
+    return sgimed_client.request('POST', endpoint, content=json_data)
 
 def put(endpoint: str, params: dict):
     json_data = json.dumps(params, default=str)
-    return send_request(requests.put, endpoint, data=json_data)
+    return sgimed_client.request('PUT', endpoint, content=json_data)
 
 def delete(endpoint: str):
-    return send_request(requests.delete, endpoint)
+    return sgimed_client.request('DELETE', endpoint)
+
+async def async_get(endpoint: str, params: dict = {}):
+    return await sgimed_client.async_request('GET', endpoint, params=convert_bools_to_strings(params))
+
+async def async_post(endpoint: str, params: dict):
+    json_data = json.dumps(params, default=str)
+    return await sgimed_client.async_request('POST', endpoint, content=json_data)
+
+async def async_put(endpoint: str, params: dict):
+    json_data = json.dumps(params, default=str)
+    return await sgimed_client.async_request('PUT', endpoint, content=json_data)
+
+async def async_delete(endpoint: str):
+    return await sgimed_client.async_request('DELETE', endpoint)
 
 def get_patient_by_sg_id(sg_id: str):
     data = get('/patient', {'nric': sg_id})
@@ -0,0 +1,244 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+import httpx
+import jwt
+from tenacity import retry, stop_after_attempt, wait_random, retry_if_exception_type
+from config import SGIMED_API_URL, SGIMED_API_KEY
+from utils.run_metrics import add_sgimed_call
+
+# Starting budget of the API key per window, used until the first response. The quota SGiMed applies to the key
+# is read from x-ratelimit-limit on every response and replaces it, so this only needs to be at most the real quota
+SGIMED_RATE_LIMIT = int(os.getenv('SGIMED_RATE_LIMIT', 60))
+SGIMED_RATE_LIMIT_WINDOW = int(os.getenv('SGIMED_RATE_LIMIT_WINDOW', 60)) # seconds
+# Share of the quota a caller with its own budget may use, e.g. each scheduler job with its worker pools,
+# so one job cannot take the whole quota from the other jobs and the request handlers
+SGIMED_CALLER_RATE_SHARE = float(os.getenv('SGIMED_CALLER_RATE_SHARE', 0.25))
+TOKEN_REFRESH_BEFORE_EXPIRY = 1200 # 20 mins
+# Transport errors raised before the request reached SGiMed, the only ones safe to retry for POST and PUT
+# Read and write errors can happen after SGiMed received the request, retrying them could duplicate records
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+class ClientException(Exception):
+    pass
+
+class RateLimiter:
+    '''
+    Token bucket refilled at limit / window per second
+    The bucket never holds more than the x-ratelimit-remaining reported by SGiMed, so the budget
+    is shared with every other worker and cron using the same API key
+    '''
+    def __init__(self, limit: int, window: int):
+        self.limit = limit
+        self.window = window
+        self.tokens = float(limit)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.limit, self.tokens + (now - self.updated_at) * self.limit / self.window)
+        self.updated_at = now
+
+    def _reserve(self) -> float:
+        '''
+        Take a token, returns the seconds to wait before the token is available
+        '''
+        with self.lock:
+            self._refill()
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens * self.window / self.limit
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def async_acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def update(self, headers: httpx.Headers):
+        rate_limit = headers.get('x-ratelimit-limit')
+        remaining_limit = headers.get('x-ratelimit-remaining')
+        if remaining_limit is None:
+            print('Rate limit information not available.')
+            return
+
+        print(f'SGiMed Remaining Rate Limit: {remaining_limit} / {rate_limit or ""}')
+        with self.lock:
+            self._refill()
+            if rate_limit and rate_limit.isdigit():
+                self.limit = max(int(rate_limit), 1)
+            if remaining_limit.isdigit():
+                self.tokens = min(self.tokens, float(remaining_limit))
+
+    def exhaust(self, retry_after: Optional[str]):
+        '''
+        SGiMed throttled the request, hold off every caller until the window resets
+        '''
+        wait = float(retry_after) if retry_after and retry_after.isdigit() else self.window
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, -wait * self.limit / self.window)
+
+_caller_budget: ContextVar[Optional[RateLimiter]] = ContextVar('sgimed_caller_budget', default=None)
+
+class SGiMedClient:
+    '''
+    Pooled HTTP client for the SGiMed API with sync and async faces
+    - Connections are kept alive across calls, one async pool per event loop
+    - The bearer token is cached and refreshed 20 mins before expiry
+    - Calls are paced by a token bucket fed by the SGiMed rate limit headers, and by the caller's own
+      bucket when running under rate_budget
+    '''
+    def __init__(self, url: Optional[str], api_key: Optional[str]):
+        self.url = url or ''
+        self.api_key = api_key
+        self.timeout = httpx.Timeout(60.0, connect=10.0)
+        self.limits = httpx.Limits(max_connections=20, max_keepalive_connections=10)
+        self.rate_limiter = RateLimiter(SGIMED_RATE_LIMIT, SGIMED_RATE_LIMIT_WINDOW)
+        self._client: Optional[httpx.Client] = None
+        self._async_clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient] = weakref.WeakKeyDictionary()
+        self._client_lock = threading.Lock()
+        self._token_lock = threading.Lock()
+        self._token: Optional[str] = None
+        self._token_expiry: float = 0
+
+    @property
+    def client(self) -> httpx.Client:
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = httpx.Client(base_url=self.url, timeout=self.timeout, limits=self.limits)
+        return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        # AsyncClient connections are bound to the event loop that opened them
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(base_url=self.url, timeout=self.timeout, limits=self.limits)
+            self._async_clients[loop] = client
+        return client
+
+    # Token Helpers
+
+    def _token_request(self) -> dict:
+        return {
+            'url': '/token',
+            'headers': { "accept": "application/json", "Content-Type": "application/x-www-form-urlencoded" },
+            'data': { "grant_type": "refresh_token", "refresh_token": self.api_key },
+        }
+
+    def _set_token(self, response: httpx.Response) -> str:
+        token = response.json()["access_token"]
+        decoded_token = jwt.decode(token, options={"verify_signature": False}, algorithms=["ES256"])
+        self._token = token
+        self._token_expiry = decoded_token["exp"] - TOKEN_REFRESH_BEFORE_EXPIRY
+        return token
+
+    def _valid_token(self) -> Optional[str]:
+        if self._token and time.time() < self._token_expiry:
+            return self._token
+        return None
+
+    def get_bearer_token(self) -> str:
+        token = self._valid_token()
+        if token:
+            return token
+        with self._token_lock:
+            token = self._valid_token()
+            if token:
+                return token
+            return self._set_token(self.client.post(**self._token_request()))
+
+    async def async_get_bearer_token(self) -> str:
+        token = self._valid_token()
+        if token:
+            return token
+        # Refresh through the locked sync path so concurrent coroutines share a single token request
+        return await asyncio.to_thread(self.get_bearer_token)
+
+    # Request Helpers
+
+    def _handle_response(self, endpoint: str, response: httpx.Response):
+        if response.status_code != 200:
+            error = f'SGiMed Error: {endpoint}, {response.status_code}, {response.text}'
+            print(error)
+            if response.status_code == 429:
+                self.rate_limiter.exhaust(response.headers.get('retry-after'))
+            # For 400, 404 errors, these are not server exceptions, thus no need to retry
+            if response.status_code in [400, 404]:
+                raise Exception(error)
+            else:
+                raise ClientException(error)
+
+        self.rate_limiter.update(response.headers)
+        return response.json()
+
+    @staticmethod
+    def _clean_params(kwargs: dict) -> dict:
+        # Match requests, which drops query params with None values
+        if kwargs.get('params'):
+            kwargs['params'] = {k: v for k, v in kwargs['params'].items() if v is not None}
+        return kwargs
+
+    @retry(retry=retry_if_exception_type((ClientException, *UNSENT_ERRORS)), reraise=True, stop=stop_after_attempt(3), wait=wait_random(min=1, max=2))
+    def request(self, method: str, endpoint: str, **kwargs):
+        budget = _caller_budget.get()
+        if budget:
+            budget.acquire()
+        self.rate_limiter.acquire()
+        add_sgimed_call()
+        headers = {'Authorization': f'Bearer {self.get_bearer_token()}'}
+        response = self.client.request(method, endpoint, headers=headers, **self._clean_params(kwargs))
+        return self._handle_response(endpoint, response)
+
+    @retry(retry=retry_if_exception_type((ClientException, *UNSENT_ERRORS)), reraise=True, stop=stop_after_attempt(3), wait=wait_random(min=1, max=2))
+    async def async_request(self, method: str, endpoint: str, **kwargs):
+        budget = _caller_budget.get()
+        if budget:
+            await budget.async_acquire()
+        await self.rate_limiter.async_acquire()
+        add_sgimed_call()
+        headers = {'Authorization': f'Bearer {await self.async_get_bearer_token()}'}
+        response = await self.async_client.request(method, endpoint, headers=headers, **self._clean_params(kwargs))
+        return self._handle_response(endpoint, response)
+
+    async def aclose(self):
+        '''
+        Close the connection pool of the running event loop
+        '''
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client:
+            await client.aclose()
+
+    def close(self):
+        if self._client:
+            self._client.close()
+            self._client = None
+
+    @contextmanager
+    def rate_budget(self, share: float = SGIMED_CALLER_RATE_SHARE) -> Iterator[RateLimiter]:
+        '''
+        Pace the calls made in this context with their own bucket of share of the current quota, on top of the shared bucket
+        Worker threads use the budget when their work is submitted with contextvars.copy_context().run
+        '''
+        budget = RateLimiter(max(int(self.rate_limiter.limit * share), 1), self.rate_limiter.window)
+        token = _caller_budget.set(budget)
+        try:
+            yield budget
+        finally:
+            _caller_budget.reset(token)
+
+sgimed_client = SGiMedClient(SGIMED_API_URL, SGIMED_API_KEY)
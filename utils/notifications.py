@@ -1,6 +1,8 @@
 import logging
-from typing import Literal
+from typing import Callable, Literal, Optional
+from pydantic import BaseModel
 import requests
+from sqlalchemy import insert
 from .integrations import smsdome, twilio_whatsapp
 from config import APNS_AUTH_KEY, APNS_KEY_ID, APNS_TEAM_ID, APNS_TOPIC, APNS_USE_SANDBOX, MOCK_SMS, EXPO_PATIENT_TOKEN, EXPO_DOCTOR_TOKEN
 from models.patient import Account
@@ -91,21 +93,125 @@ def send_voip_notification(user: Account, teleconsult: Teleconsult):
                 db.add(record)
                 db.commit()
 
+# Expo accepts up to 100 messages per push request
+EXPO_CHUNK_SIZE = 100
+
+class PushNotification(BaseModel):
+    account_id: str
+    push_tokens: list[str]
+    title: str
+    message: str
+    extra: Optional[dict] = None
+    priority: Optional[Literal['high']] = 'high'
+    critical: Optional[bool] = None
+
+    @classmethod
+    def from_account(cls, user: Account, title: str, message: str, extra: dict | None = None, priority: Literal['high'] | None = 'high', critical: bool | None = None):
+        return cls(
+            account_id=str(user.id),
+            push_tokens=[auth.push_token for auth in user.firebase_auths if auth.push_token],
+            title=title,
+            message=message,
+            extra=extra,
+            priority=priority,
+            critical=critical,
+        )
+
 def send_patient_notification(user: Account, title: str, message: str, extra: dict | None = None, priority: Literal['high'] | None = 'high', critical: bool | None = None):
     '''
     Send a push notification to the user.
     '''
-    auths = user.firebase_auths
-    for auth in auths:
-        if auth.push_token:
+    send_patient_notifications([PushNotification.from_account(user, title, message, extra, priority, critical)])
+
+def send_patient_notifications(
+    notifications: list[PushNotification],
+    on_progress: Optional[Callable[[int, int, int], None]] = None,
+    on_sent: Optional[Callable[[list[PushNotification]], None]] = None,
+) -> int:
+    '''
+    Send push notifications to many patients, chunked into Expo requests of up to 100 messages.
+    A NotificationLog is bulk inserted for every message accepted by Expo.
+    on_progress is called after each chunk with (processed, total, sent) messages.
+    on_sent is called after each chunk with the notifications that had a message accepted by Expo.
+    Returns the number of messages sent.
+    '''
+    messages = [
+        (notification, _push_message(token, notification.title, notification.message, notification.extra, notification.priority, notification.critical))
+        for notification in notifications
+        for token in notification.push_tokens
+    ]
+    if not messages:
+        return 0
+
+    client = PushClient(session=_expo_session(EXPO_PATIENT_TOKEN), timeout=10)
+    sent = 0
+    for start in range(0, len(messages), EXPO_CHUNK_SIZE):
+        chunk = messages[start:start + EXPO_CHUNK_SIZE]
+        try:
+            tickets = _publish_chunk(client, [msg for _, msg in chunk])
+        except Exception as err:
+            logging.error(f"Push Notifications (Patient): Failed to send {len(chunk)} messages. {err}", exc_info=True)
+            tickets = []
+
+        logs = []
+        accepted: list[PushNotification] = []
+        for (notification, _), ticket in zip(chunk, tickets):
             try:
-                _send_push_message(EXPO_PATIENT_TOKEN, auth.push_token, title, message, extra, priority, critical)
-                with SessionLocal() as db:
-                    record = NotificationLog(account_id=user.id, title=title, message=message)
-                    db.add(record)
-                    db.commit()
+                ticket.validate_response()
+                logs.append({ "account_id": notification.account_id, "title": notification.title, "message": notification.message })
+                if not any(notification is other for other in accepted):
+                    accepted.append(notification)
+            except DeviceNotRegisteredError:
+                logging.error(f"Push Notification: Inactive Token {ticket.push_message.to}")
             except Exception as err:
-                logging.error(f"Push Notifications (Patient): {err}", exc_info=True)
+                logging.error(f"Push Notifications (Patient): {err}")
+
+        if logs:
+            with SessionLocal() as db:
+                db.execute(insert(NotificationLog), logs)
+                db.commit()
+        sent += len(logs)
+        if on_sent and accepted:
+            on_sent(accepted)
+        if on_progress:
+            on_progress(min(start + EXPO_CHUNK_SIZE, len(messages)), len(messages), sent)
+
+    return sent
+
+@retry(reraise=True, stop=stop_after_attempt(3), wait=wait_random(min=1, max=2))
+def _publish_chunk(client: PushClient, messages: list[PushMessage]):
+    return client.publish_multiple(messages)
+
+def _expo_session(expo_token: str):
+    session = requests.Session()
+    session.headers.update(
+        {
+            "Authorization": f"Bearer {expo_token}",
+            "accept": "application/json",
+            "accept-encoding": "gzip, deflate",
+            "content-type": "application/json",
+        }
+    )
+    return session
+
+def _push_message(user_token: str, title: str, message: str, extra=None, priority=None, critical=None):
+    return PushMessage(
+        to=user_token,
+        title=title,
+        body=message,
+        data=extra,
+        priority=priority,
+        sound='default' if not critical else { 'critical': True },
+        # Prevent Error Message
+        ttl=None,
+        expiration=None,
+        badge=None,
+        category=None, 
+        display_in_foreground=None,
+        channel_id=None,
+        subtitle=None,
+        mutable_content=None
+    )
 
 def send_doctor_notification(user: PinnacleAccount, title: str, message: str, extra=None):
     if not user.enable_notifications:
@@ -120,34 +226,10 @@ def send_doctor_notification(user: PinnacleAccount, title: str, message: str, ex
 
 @retry(reraise=True, stop=stop_after_attempt(3), wait=wait_random(min=1, max=2))
 def _send_push_message(expo_token, user_token: str, title: str, message: str, extra=None, priority=None, critical=None):
-    session = requests.Session()
-    session.headers.update(
-        {
-            "Authorization": f"Bearer {expo_token}",
-            "accept": "application/json",
-            "accept-encoding": "gzip, deflate",
-            "content-type": "application/json",
-        }
-    )
+    session = _expo_session(expo_token)
 
     try:
-        msg = PushMessage(
-            to=user_token,
-            title=title,
-            body=message,
-            data=extra,
-            priority=priority,
-            sound='default' if not critical else { 'critical': True },
-            # Prevent Error Message
-            ttl=None,
-            expiration=None,
-            badge=None,
-            category=None, 
-            display_in_foreground=None,
-            channel_id=None,
-            subtitle=None,
-            mutable_content=None
-        )
+        msg = _push_message(user_token, title, message, extra, priority, critical)
         response = PushClient(session=session, timeout=5).publish(msg)
         response.validate_response()
     except DeviceNotRegisteredError:
@@ -157,36 +239,8 @@ def _send_push_message(expo_token, user_token: str, title: str, message: str, ex
 
 # @retry(reraise=True, stop=stop_after_attempt(3), wait=wait_random(min=1, max=2))
 def send_notification_messages(user_tokens: list[str], title: str, message: str, extra=None, priority='high', critical=None):
-    msges = [
-        PushMessage(
-            to=user_token,
-            title=title,
-            body=message,
-            data=extra,
-            priority=priority,
-            sound='default' if not critical else { 'critical': True },
-            # Prevent Error Message
-            ttl=None,
-            expiration=None,
-            badge=None,
-            category=None, 
-            display_in_foreground=None,
-            channel_id=None,
-            subtitle=None,
-            mutable_content=None
-        )
-        for user_token in user_tokens
-    ]
-
-    session = requests.Session()
-    session.headers.update(
-        {
-            "Authorization": f"Bearer {EXPO_PATIENT_TOKEN}",
-            "accept": "application/json",
-            "accept-encoding": "gzip, deflate",
-            "content-type": "application/json",
-        }
-    )
+    msges = [_push_message(user_token, title, message, extra, priority, critical) for user_token in user_tokens]
+    session = _expo_session(EXPO_PATIENT_TOKEN)
 
     responses = PushClient(session=session, timeout=10).publish_multiple(msges)
     for i, response in enumerate(responses):
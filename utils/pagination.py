@@ -1,8 +1,13 @@
-from typing import Generic, TypeVar, Optional
-from fastapi import Query
+import base64
+from datetime import date, datetime
+import json
+from typing import Any, Generic, TypeVar, Optional
+import uuid
+from fastapi import HTTPException, Query
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
-from sqlalchemy import func, select
+from sqlalchemy import ClauseElement, Executable, and_, func, or_, select, tuple_
+from sqlalchemy.ext.compiler import compiles
 
 T = TypeVar("T")
 MAX_RESULTS_PER_PAGE = 20
@@ -10,11 +15,17 @@ MAX_RESULTS_PER_PAGE = 20
 class PaginationInput(BaseModel):
     page: int = Field(default=1, ge=1, description="Requested page number")
 
+class KeysetPaginationInput(PaginationInput):
+    cursor: Optional[str] = Field(default=None, description="Cursor returned as next_cursor by the previous page, fetches the page after it without OFFSET")
+    estimate: bool = Field(default=False, description="Use planner statistics for rows and pages instead of an exact count")
+
 class Pager(BaseModel):
     p: int = Field(ge=0, description="Page number")
     n: int = Field(ge=0, description="Number of items per page")
     pages: int = Field(ge=0, description="Total number of pages")
     rows: int = Field(ge=0, description="Number of total items")
+    next_cursor: Optional[str] = Field(default=None, description="Cursor of the next page, None on the last page")
+    estimated: bool = Field(default=False, description="Rows and pages are planner estimates")
 
 class Page(BaseModel, Generic[T]):
     pager: Pager = Field(description="Pagination metadata")
@@ -27,15 +38,15 @@ def paginate(
 ) -> Page[T]:
     # Get total count
     total_items = db.scalar(select(func.count()).select_from(query.subquery()))
-    
+
     # Calculate pagination
     total_pages = max((total_items + MAX_RESULTS_PER_PAGE - 1) // MAX_RESULTS_PER_PAGE, 1)
     current_page = min(pagination_input.page, total_pages)
     offset = (current_page - 1) * MAX_RESULTS_PER_PAGE
-    
+
     # Apply pagination to query
     items = query.offset(offset).limit(MAX_RESULTS_PER_PAGE).all()
-    
+
     return Page[T](
         pager=Pager(
             p=current_page,
@@ -46,4 +57,117 @@ def paginate(
         data=items
     )
 
-PaginationDep = Query(...)
\ No newline at end of file
+class SortKey:
+    '''
+    Column of a keyset sort tuple, columns must be non nullable
+    The last key should be unique (e.g. the primary key) so the order is stable across pages
+    '''
+    def __init__(self, column, descending: bool = False):
+        self.column = column
+        self.descending = descending
+
+    def order_by(self):
+        return self.column.desc() if self.descending else self.column.asc()
+
+def paginate_keyset(
+    query,  # SQLAlchemy query without order_by
+    db: Session,
+    pagination_input: KeysetPaginationInput,
+    sort_keys: list[SortKey],
+) -> Page[T]:
+    '''
+    Paginate with a cursor on the sort tuple instead of OFFSET, so deep pages cost the same as the first
+    Without a cursor, the requested page is read with OFFSET to support jumping to a page
+    '''
+    if pagination_input.estimate:
+        total_items = estimate_count(db, query)
+    else:
+        total_items = db.scalar(select(func.count()).select_from(query.subquery()))
+    total_pages = max((total_items + MAX_RESULTS_PER_PAGE - 1) // MAX_RESULTS_PER_PAGE, 1)
+
+    paged_query = query.order_by(*[key.order_by() for key in sort_keys])
+    if pagination_input.cursor:
+        current_page = pagination_input.page
+        paged_query = paged_query.filter(_keyset_filter(sort_keys, decode_cursor(pagination_input.cursor, sort_keys)))
+    else:
+        current_page = min(pagination_input.page, total_pages)
+        paged_query = paged_query.offset((current_page - 1) * MAX_RESULTS_PER_PAGE)
+
+    # Read one extra row to know if there is a next page
+    items = paged_query.limit(MAX_RESULTS_PER_PAGE + 1).all()
+    next_cursor = None
+    if len(items) > MAX_RESULTS_PER_PAGE:
+        items = items[:MAX_RESULTS_PER_PAGE]
+        next_cursor = encode_cursor(items[-1], sort_keys)
+
+    return Page[T](
+        pager=Pager(
+            p=current_page,
+            n=0 if total_items == 0 else MAX_RESULTS_PER_PAGE,
+            pages=total_pages,
+            rows=total_items,
+            next_cursor=next_cursor,
+            estimated=pagination_input.estimate,
+        ),
+        data=items
+    )
+
+def _keyset_filter(sort_keys: list[SortKey], values: list):
+    # Row comparison uses composite indexes when every key is sorted the same way
+    if all(key.descending == sort_keys[0].descending for key in sort_keys):
+        columns, params = tuple_(*[key.column for key in sort_keys]), tuple_(*values)
+        return columns < params if sort_keys[0].descending else columns > params
+
+    clauses = []
+    for i, key in enumerate(sort_keys):
+        equals = [prev.column == value for prev, value in zip(sort_keys[:i], values[:i])]
+        clauses.append(and_(*equals, key.column < values[i] if key.descending else key.column > values[i]))
+    return or_(*clauses)
+
+def encode_cursor(item, sort_keys: list[SortKey]) -> str:
+    values = [getattr(item, key.column.key) for key in sort_keys]
+    values = [value.isoformat() if isinstance(value, (date, datetime)) else str(value) if isinstance(value, uuid.UUID) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor: str, sort_keys: list[SortKey]) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(values) != len(sort_keys):
+            raise ValueError("Cursor does not match sort keys")
+        return [_parse_cursor_value(key, value) for key, value in zip(sort_keys, values)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _parse_cursor_value(key: SortKey, value: Any):
+    python_type = key.column.type.python_type
+    if value is None:
+        raise ValueError("Cursor value cannot be null")
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    if python_type is uuid.UUID:
+        return uuid.UUID(value)
+    return value
+
+class _Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+@compiles(_Explain, 'postgresql')
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+def estimate_count(db: Session, query) -> int:
+    '''
+    Row estimate of the query plan, based on table statistics refreshed by ANALYZE
+    Avoids scanning every filtered row, but can be off for selective filters like ILIKE
+    '''
+    plan = db.execute(_Explain(query.order_by(None).statement)).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows']) # type: ignore
+
+PaginationDep = Query(...)
@@ -0,0 +1,88 @@
+"""
+Redis backed cache helpers shared across uvicorn workers
+
+Entries are stored as JSON under versioned keys. Writers invalidate by bumping a version
+counter instead of deleting keys, so stale entries are never read and simply expire.
+When Redis is unavailable, a process-local cache is used so callers do not need to care.
+"""
+import json
+import logging
+import time
+from threading import Lock
+from typing import Any, Optional
+from cachetools import TLRUCache
+from config import redis_client
+
+DEFAULT_TTL = 3600 # 1 hour
+
+_local_lock = Lock()
+# Values are stored with their expiry time, so each entry keeps the ttl it was set with
+_local_cache: TLRUCache = TLRUCache(maxsize=4096, ttu=lambda _key, entry, _now: entry[1], timer=time.monotonic)
+_local_versions: dict[str, int] = {}
+
+def get_versions(*keys: str) -> list[int]:
+    '''
+    Retrieve the current version counters for the given keys, defaults to 0
+    '''
+    if redis_client:
+        try:
+            values = redis_client.mget(keys)
+            return [int(value) if value else 0 for value in values] # type: ignore
+        except Exception as e:
+            logging.error(f"Redis Cache: Failed to get versions {keys}. {e}")
+    with _local_lock:
+        return [_local_versions.get(key, 0) for key in keys]
+
+def bump_version(key: str) -> int:
+    '''
+    Increment the version counter so every cache entry keyed by the previous version is ignored
+    '''
+    with _local_lock:
+        _local_versions[key] = _local_versions.get(key, 0) + 1
+        version = _local_versions[key]
+    if redis_client:
+        try:
+            return int(redis_client.incr(key)) # type: ignore
+        except Exception as e:
+            logging.error(f"Redis Cache: Failed to bump version {key}. {e}")
+    return version
+
+def get_json(key: str) -> Optional[Any]:
+    '''
+    Retrieve a cached JSON value, returns None on a miss
+    '''
+    if redis_client:
+        try:
+            value = redis_client.get(key)
+            return json.loads(str(value)) if value else None
+        except Exception as e:
+            logging.error(f"Redis Cache: Failed to get {key}. {e}")
+    with _local_lock:
+        entry = _local_cache.get(key)
+        return entry[0] if entry else None
+
+def set_json(key: str, value: Any, ttl: int = DEFAULT_TTL):
+    '''
+    Store a JSON serializable value with an expiry in seconds
+    '''
+    if redis_client:
+        try:
+            redis_client.set(key, json.dumps(value), ex=ttl)
+            return
+        except Exception as e:
+            logging.error(f"Redis Cache: Failed to set {key}. {e}")
+    with _local_lock:
+        _local_cache[key] = (value, time.monotonic() + ttl)
+
+def delete(*keys: str):
+    '''
+    Remove cached values, used when an entry is not covered by a version counter
+    '''
+    with _local_lock:
+        for key in keys:
+            _local_cache.pop(key, None)
+    if redis_client and keys:
+        try:
+            redis_client.delete(*keys)
+        except Exception as e:
+            logging.error(f"Redis Cache: Failed to delete {keys}. {e}")
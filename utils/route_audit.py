@@ -0,0 +1,163 @@
+"""
+Startup check for blocking calls inside coroutine routes
+
+`def` handlers and dependencies run in the threadpool, `async def` ones run on the event loop.
+A sync Session query, SGiMed request or Supabase storage call inside a coroutine stalls every
+other request and websocket on the worker, so blocking work belongs in a `def` handler or
+behind `run_in_threadpool`.
+"""
+import ast
+import inspect
+import os
+import textwrap
+from typing import Callable
+from fastapi import FastAPI
+from fastapi.routing import APIRoute, APIWebSocketRoute
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Receiver name -> blocking methods, None for every method
+BLOCKING_ATTRIBUTES: dict[str, set[str] | None] = {
+    'db': {'query', 'execute', 'scalar', 'scalars', 'get', 'add', 'add_all', 'delete', 'merge', 'flush', 'commit', 'rollback', 'refresh'},
+    'requests': None,
+    'supabase': None,
+    'sgimed_client': {'request', 'get_bearer_token'},
+    'time': {'sleep'},
+}
+BLOCKING_NAMES = {'SessionLocal'}
+# Sync functions of these modules make network calls
+BLOCKING_MODULES = {
+    'utils.integrations.sgimed',
+    'utils.supabase_s3',
+    'utils.notifications',
+    'utils.email',
+}
+
+def _is_project_function(func: Callable) -> bool:
+    try:
+        path = inspect.getsourcefile(func)
+    except TypeError:
+        return False
+    return bool(path) and path.startswith(PROJECT_ROOT) and 'site-packages' not in path # type: ignore
+
+def _call_root(node: ast.expr) -> tuple[str | None, str | None]:
+    '''
+    Name at the start of a call chain and the attribute called on it
+    e.g. supabase.storage.from_(bucket).upload -> (supabase, storage)
+    '''
+    attr = None
+    while True:
+        if isinstance(node, ast.Attribute):
+            attr = node.attr
+            node = node.value
+        elif isinstance(node, ast.Call):
+            node = node.func
+        elif isinstance(node, ast.Name):
+            return node.id, attr
+        else:
+            return None, None
+
+class _BlockingCallVisitor(ast.NodeVisitor):
+    def __init__(self, func: Callable):
+        self.globals = getattr(func, '__globals__', {})
+        self.awaited: set[int] = set()
+        self.calls: list[tuple[int, str]] = []
+
+    def visit_Await(self, node: ast.Await):
+        self.awaited.add(id(node.value))
+        self.generic_visit(node)
+
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        # Nested sync functions are handed to the threadpool
+        return
+
+    def visit_Lambda(self, node: ast.Lambda):
+        return
+
+    def visit_Call(self, node: ast.Call):
+        root, attr = _call_root(node.func)
+        if root is not None and id(node) not in self.awaited and self._is_blocking(node, root, attr):
+            # A chain like db.query().filter().first() is reported once
+            call = (node.lineno, f'{root}.{attr}' if attr else root)
+            if call not in self.calls:
+                self.calls.append(call)
+        self.generic_visit(node)
+
+    def _is_blocking(self, node: ast.Call, root: str, attr: str | None) -> bool:
+        if root in BLOCKING_NAMES and isinstance(node.func, ast.Name):
+            return True
+        if attr is not None:
+            if root not in BLOCKING_ATTRIBUTES:
+                return False
+            methods = BLOCKING_ATTRIBUTES[root]
+            return methods is None or attr in methods
+        target = self.globals.get(root)
+        return (
+            inspect.isfunction(target)
+            and not inspect.iscoroutinefunction(target)
+            and target.__module__ in BLOCKING_MODULES
+        )
+
+def find_blocking_calls_in(func: Callable) -> list[tuple[int, str]]:
+    '''
+    Line numbers and callees of blocking calls made directly in a coroutine function
+    '''
+    try:
+        source = textwrap.dedent(inspect.getsource(func))
+        lineno = inspect.getsourcelines(func)[1]
+    except (OSError, TypeError):
+        return []
+    visitor = _BlockingCallVisitor(func)
+    visitor.visit(ast.parse(source))
+    return [(lineno + line - 1, call) for line, call in visitor.calls]
+
+def _coroutine_calls(dependant) -> list[Callable]:
+    '''
+    Endpoint and dependencies of a route that run on the event loop
+    '''
+    calls = []
+    if dependant.call and inspect.iscoroutinefunction(dependant.call) and _is_project_function(dependant.call):
+        calls.append(dependant.call)
+    for sub_dependant in dependant.dependencies:
+        calls += _coroutine_calls(sub_dependant)
+    return calls
+
+def _uses_get_db(dependant) -> bool:
+    return any(sub.call is not None and sub.call.__name__ == 'get_db' for sub in dependant.dependencies)
+
+def _iter_routes(routes: list, prefix: str = ''):
+    '''
+    API routes with their full path, included routers are kept as nested routers
+    '''
+    for route in routes:
+        if isinstance(route, (APIRoute, APIWebSocketRoute)):
+            yield prefix + route.path, route
+        elif getattr(route, 'original_router', None) is not None:
+            yield from _iter_routes(route.original_router.routes, prefix + route.include_context.prefix)
+
+def find_blocking_calls(app: FastAPI) -> list[str]:
+    '''
+    Blocking calls made on the event loop by the routes of the app, one line per call
+    '''
+    issues: list[str] = []
+    seen: set[Callable] = set()
+    for path, route in _iter_routes(app.routes):
+        for func in _coroutine_calls(route.dependant):
+            if func in seen:
+                continue
+            seen.add(func)
+            location = f'{func.__module__}.{func.__qualname__}'
+            if func is route.dependant.call and _uses_get_db(route.dependant):
+                issues.append(f'{path} {location}: sync Session from get_db in async def')
+            for lineno, call in find_blocking_calls_in(func):
+                issues.append(f'{path} {location}:{lineno}: blocking call {call}()')
+    return issues
+
+def check_blocking_routes(app: FastAPI):
+    issues = find_blocking_calls(app)
+    if not issues:
+        print("✅ Startup: No blocking calls found in async routes.")
+        return
+    print(f"⚠️ Startup: {len(issues)} blocking calls found in async routes, use def or run_in_threadpool:")
+    for issue in issues:
+        print(f"   - {issue}")
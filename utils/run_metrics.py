@@ -0,0 +1,41 @@
+"""
+Counters of the scheduler job run in progress
+
+The job runner starts a run with track(), code running in the job adds to its counters.
+Outside of a job run the counters are ignored. Threads started by a job only count towards the run when
+their work is submitted with contextvars.copy_context().run.
+"""
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+class RunMetrics:
+    def __init__(self):
+        self.rows_processed = 0
+        self.sgimed_calls = 0
+        # Worker threads of the run add to the same counters
+        self.lock = threading.Lock()
+
+_current_run: ContextVar[Optional[RunMetrics]] = ContextVar('current_run', default=None)
+
+@contextmanager
+def track() -> Iterator[RunMetrics]:
+    metrics = RunMetrics()
+    token = _current_run.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current_run.reset(token)
+
+def add_rows(count: int):
+    metrics = _current_run.get()
+    if metrics:
+        with metrics.lock:
+            metrics.rows_processed += count
+
+def add_sgimed_call():
+    metrics = _current_run.get()
+    if metrics:
+        with metrics.lock:
+            metrics.sgimed_calls += 1
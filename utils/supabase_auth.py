@@ -1,38 +1,102 @@
 import logging
+from threading import Lock
+from typing import Optional
+from cachetools import TTLCache
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+import jwt
 from models import SessionLocal
 from models.model_enums import Role
 from pydantic import BaseModel
 from fastapi import Depends, HTTPException, status
 from jwt.exceptions import ExpiredSignatureError, PyJWTError
-from config import supabase
+from config import SUPABASE_JWT_SECRET, SUPABASE_URL, supabase
 from models.pinnacle import PinnacleAccount
+from utils import redis_cache
+
+JWKS_CACHE_TTL = 3600 # 1 hour
+ACCOUNT_CACHE_TTL = 600 # 10 mins
+ACCOUNTS_VERSION_KEY = 'supabase_accounts_version'
+SUPABASE_JWT_AUDIENCE = 'authenticated'
+SUPABASE_JWT_ALGORITHMS = ['HS256', 'RS256', 'ES256']
 
 class SupabaseUser(BaseModel):
     id: str
     supabase_uid: str
     role: Role
 
+# Signing keys of the project, refetched when a token is signed with an unknown key id
+_jwks_client = jwt.PyJWKClient(f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json", lifespan=JWKS_CACHE_TTL) if SUPABASE_URL else None
+_account_lock = Lock()
+_account_cache: TTLCache = TTLCache(maxsize=1024, ttl=ACCOUNT_CACHE_TTL)
+
+def verify_supabase_token(token: str) -> str:
+    '''
+    Verify a Supabase access token locally, returns the supabase uid
+    Falls back to the Supabase auth API for HS256 tokens when SUPABASE_JWT_SECRET is not set
+    '''
+    algorithm = jwt.get_unverified_header(token).get('alg')
+    if algorithm not in SUPABASE_JWT_ALGORITHMS:
+        raise jwt.InvalidAlgorithmError(f"Unsupported algorithm: {algorithm}")
+    if algorithm == 'HS256':
+        if not SUPABASE_JWT_SECRET:
+            user = supabase.auth.get_user(token)
+            if user is None:
+                raise jwt.InvalidTokenError("No User is found")
+            return user.user.id
+        key = SUPABASE_JWT_SECRET
+    else:
+        if not _jwks_client:
+            raise jwt.InvalidTokenError("SUPABASE_URL is not set")
+        key = _jwks_client.get_signing_key_from_jwt(token).key
+    payload = jwt.decode(token, key, algorithms=[algorithm], audience=SUPABASE_JWT_AUDIENCE)
+    return payload['sub']
+
+def get_supabase_account(supabase_uid: str) -> Optional[SupabaseUser]:
+    '''
+    Account id and role of an active admin portal user
+    Cached in process and in Redis under the accounts version, see invalidate_supabase_accounts
+    '''
+    version, = redis_cache.get_versions(ACCOUNTS_VERSION_KEY)
+    key = f"supabase_account:{supabase_uid}:v{version}"
+    with _account_lock:
+        user = _account_cache.get(key)
+    if user:
+        return user
+
+    cached = redis_cache.get_json(key)
+    if cached:
+        user = SupabaseUser.model_validate(cached)
+    else:
+        with SessionLocal() as db:
+            account = db.query(PinnacleAccount).filter(PinnacleAccount.supabase_uid == supabase_uid, PinnacleAccount.deleted == False).first()
+            if not account:
+                return None
+            user = SupabaseUser(id=str(account.id), supabase_uid=supabase_uid, role=account.role)
+        redis_cache.set_json(key, user.model_dump(mode='json'), ttl=ACCOUNT_CACHE_TTL)
+
+    with _account_lock:
+        _account_cache[key] = user
+    return user
+
+def invalidate_supabase_accounts():
+    '''
+    Drop every cached admin portal account, call after a role, deletion or supabase uid change
+    '''
+    redis_cache.bump_version(ACCOUNTS_VERSION_KEY)
+
 auth_scheme = HTTPBearer()
 def get_current_user(token: HTTPAuthorizationCredentials) -> SupabaseUser:
     try:
-        user = supabase.auth.get_user(token.credentials)
-        if user is None:
+        supabase_uid = verify_supabase_token(token.credentials)
+        account = get_supabase_account(supabase_uid)
+        if not account:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="No User is found",
+                detail="Invalid user",
             )
-
-        user = user.user
-        with SessionLocal() as db:
-            account = db.query(PinnacleAccount).filter(PinnacleAccount.supabase_uid == user.id).first()
-            if not account:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Invalid user",
-                )
-
-        return SupabaseUser(id=str(account.id), supabase_uid=user.id, role=account.role)
+        return account
+    except HTTPException:
+        raise
     except ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
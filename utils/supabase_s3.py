@@ -1,11 +1,19 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Iterator
 from fastapi import HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from config import supabase
 import io
+import logging
+import time
 import zipfile
 from models.model_enums import FileViewerType
 
+# Concurrent downloads per zip and the number of downloaded files held before they are written
+ZIP_DOWNLOAD_WORKERS = 8
+ZIP_PREFETCH_FILES = ZIP_DOWNLOAD_WORKERS * 2
+
 def upload_pdf(bucket: str, key: str, file_bytes: bytes):
     try:
         resp = supabase.storage.from_(bucket).upload(
@@ -78,21 +86,83 @@ class ZipFileRequest(BaseModel):
     key: str 
     filename: str
 
+class _ZipStream:
+    '''
+    Unseekable sink for zipfile, the bytes written are taken after each entry and yielded
+    Without tell() zipfile writes a streaming zip: sizes follow each entry in a data descriptor
+    '''
+    def __init__(self):
+        self.chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def _download_zip_file(key: ZipFileRequest, bucket_name: str) -> tuple[ZipFileRequest, bytes]:
+    return key, get_blob_data_from_s3(key.key, bucket_name)
+
+def _iter_zip_file_downloads(keys: list[ZipFileRequest], bucket_name: str) -> Iterator[tuple[ZipFileRequest, bytes]]:
+    '''
+    Download files concurrently, yielded as they complete with at most ZIP_PREFETCH_FILES held at once
+    '''
+    executor = ThreadPoolExecutor(max_workers=ZIP_DOWNLOAD_WORKERS, thread_name_prefix="zip_download")
+    remaining = iter(keys)
+    pending: set[Future] = set()
+    try:
+        for key in remaining:
+            pending.add(executor.submit(_download_zip_file, key, bucket_name))
+            if len(pending) >= ZIP_PREFETCH_FILES:
+                break
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+                next_key = next(remaining, None)
+                if next_key:
+                    pending.add(executor.submit(_download_zip_file, next_key, bucket_name))
+    finally:
+        # Client disconnected or a download failed, drop the queued downloads
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def stream_files_as_zip(keys: list[ZipFileRequest], bucket_name: str) -> Iterator[bytes]:
+    '''
+    Yield a zip of the files, each entry is written as soon as its download completes
+    Entries are in download completion order. Zip64 records are written when the archive needs them
+    '''
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as zip_file: # type: ignore
+        for key, file_data in _iter_zip_file_downloads(keys, bucket_name):
+            zip_info = zipfile.ZipInfo(key.filename, date_time=time.localtime()[:6])
+            zip_info.compress_type = zipfile.ZIP_DEFLATED
+            zip_file.writestr(zip_info, file_data)
+            yield stream.take()
+    # Central directory is written on close
+    yield stream.take()
+
 def download_files_as_zip(keys: list[ZipFileRequest], bucket_name: str, filename: str = "files.zip"):
     """
-    Download multiple files as a zip file
+    Download multiple files as a zip file, streamed while the files are downloaded
 
     Take note : keys should be distinct to each other in other to identify as different files
     """
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for key in keys:
-            file_data = get_blob_data_from_s3(key.key, bucket_name)
-            zip_file.writestr(key.filename, file_data)
-    zip_buffer.seek(0)
+    def content():
+        try:
+            yield from stream_files_as_zip(keys, bucket_name)
+        except Exception as e:
+            # Headers are already sent, the truncated zip fails to open instead of missing files silently
+            logging.error(f"Failed to stream zip {filename}: {e}", exc_info=True)
+            raise
 
     return StreamingResponse(
-        zip_buffer,
+        content(),
         media_type="application/x-zip-compressed",
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )